@@ -0,0 +1,225 @@
+"""Benchmarks of taskgraph hot paths.
+
+These use ``pytest-benchmark`` and aren't collected by a plain ``pytest``
+run. To record results and compare them with the previous saved run::
+
+    $ pytest benchmarks --benchmark-autosave --benchmark-compare
+
+Set the ``TASKGRAPH_BENCHMARK_SCALE`` environment variable to scale the
+number of tasks and bytes in each benchmark, e.g. 0.01 for a quick check
+that they run. Results are only comparable at the same scale.
+"""
+import importlib
+import os
+import tempfile
+import threading
+
+import pytest
+import taskgraph
+
+pytest.importorskip('pytest_benchmark')
+
+TASK_MODULE = importlib.import_module('taskgraph.Task')
+SCALE = float(os.environ.get('TASKGRAPH_BENCHMARK_SCALE', 1.0))
+
+
+def _scaled(value):
+    """Return ``value`` scaled by ``SCALE``, at least 1."""
+    return max(1, int(value * SCALE))
+
+
+def _empty_task(index):
+    """Do nothing, ``index`` keeps tasks from being duplicates."""
+    pass
+
+
+def _payload_length(payload):
+    """Return the length of ``payload`` once it reaches the worker."""
+    return len(payload)
+
+
+def _touch_file(target_path):
+    """Create an empty file at ``target_path``."""
+    with open(target_path, 'w'):
+        pass
+
+
+def _run_graph(workspace_dir, n_workers, add_tasks, **kwargs):
+    """Create a graph, call ``add_tasks`` on it, then close and join it."""
+    task_graph = taskgraph.TaskGraph(workspace_dir, n_workers, **kwargs)
+    add_tasks(task_graph)
+    task_graph.close()
+    task_graph.join()
+
+
+def _fresh_workspace_setup(tmp_path, *args, **kwargs):
+    """Return a ``pedantic`` setup that runs each round in a new workspace.
+
+    Otherwise every round after the first finds the tasks precalculated.
+
+    """
+    def _setup():
+        workspace_dir = tempfile.mkdtemp(dir=str(tmp_path))
+        return (workspace_dir,) + args, kwargs
+    return _setup
+
+
+def test_add_task_large_args(benchmark, tmp_path):
+    """Benchmark ``add_task`` with large nested arguments."""
+    n_tasks = _scaled(100)
+    large_arg = {
+        'values': list(range(10**4)),
+        'lookup': {str(index): [index] * 4 for index in range(10**3)},
+    }
+
+    task_graph_list = []
+
+    def _setup():
+        task_graph = taskgraph.TaskGraph(str(tmp_path), -1, plan_only=True)
+        task_graph_list.append(task_graph)
+        return (task_graph,), {}
+
+    def _add_tasks(task_graph):
+        for index in range(n_tasks):
+            task_graph.add_task(
+                func=_empty_task, args=(index, large_arg),
+                task_name='task %d' % index)
+
+    benchmark.pedantic(_add_tasks, setup=_setup, rounds=5)
+    for task_graph in task_graph_list:
+        task_graph.close()
+        task_graph.join()
+    benchmark.extra_info['tasks'] = n_tasks
+
+
+@pytest.mark.parametrize('n_workers', [-1, 0, 8])
+def test_empty_task_scheduling(benchmark, tmp_path, n_workers):
+    """Benchmark executing tasks that do nothing."""
+    n_tasks = _scaled(1000)
+
+    def _add_tasks(task_graph):
+        for index in range(n_tasks):
+            task_graph.add_task(
+                func=_empty_task, args=(index,), task_name='task %d' % index)
+
+    benchmark.pedantic(
+        _run_graph, setup=_fresh_workspace_setup(
+            tmp_path, n_workers, _add_tasks), rounds=3)
+    benchmark.extra_info['tasks'] = n_tasks
+    benchmark.extra_info['tasks_per_second'] = (
+        n_tasks / benchmark.stats.stats.mean)
+
+
+@pytest.fixture(scope='module')
+def cached_graph(tmp_path_factory):
+    """Run a graph of tasks once so they're all precalculated."""
+    n_tasks = _scaled(10**5)
+    workspace_dir = str(tmp_path_factory.mktemp('cached_graph'))
+    target_dir = os.path.join(workspace_dir, 'targets')
+    os.makedirs(target_dir)
+
+    def _add_tasks(task_graph):
+        for index in range(n_tasks):
+            task_graph.add_task(
+                func=_touch_file,
+                args=(os.path.join(target_dir, '%d.txt' % index),),
+                target_path_list=[
+                    os.path.join(target_dir, '%d.txt' % index)],
+                hash_algorithm='sizetimestamp',
+                task_name='task %d' % index)
+
+    _run_graph(workspace_dir, -1, _add_tasks)
+    return workspace_dir, n_tasks, _add_tasks
+
+
+def test_warm_rerun(benchmark, cached_graph):
+    """Benchmark validating a graph whose tasks are all precalculated."""
+    workspace_dir, n_tasks, add_tasks = cached_graph
+    benchmark.pedantic(
+        _run_graph, args=(workspace_dir, -1, add_tasks), rounds=3)
+    benchmark.extra_info['tasks'] = n_tasks
+    benchmark.extra_info['tasks_per_second'] = (
+        n_tasks / benchmark.stats.stats.mean)
+
+
+@pytest.fixture(scope='module')
+def hash_file_path(tmp_path_factory):
+    """Create a file of random bytes to hash."""
+    file_path = str(tmp_path_factory.mktemp('hash_file') / 'random.bin')
+    with open(file_path, 'wb') as random_file:
+        for _ in range(_scaled(256)):
+            random_file.write(os.urandom(2**20))
+    return file_path
+
+
+@pytest.mark.parametrize('hash_algorithm', [
+    'md5', 'sha1', 'sha256', 'sampled', 'sizetimestamp'] + sorted(
+        TASK_MODULE._HASH_ALGORITHM_REGISTRY))
+def test_hash_file(benchmark, hash_file_path, hash_algorithm):
+    """Benchmark ``_hash_file`` with each hash algorithm."""
+    benchmark(TASK_MODULE._hash_file, hash_file_path, hash_algorithm)
+    file_size = os.path.getsize(hash_file_path)
+    benchmark.extra_info['megabytes_per_second'] = (
+        file_size / 2**20 / benchmark.stats.stats.mean)
+
+
+@pytest.mark.parametrize('n_threads', [1, 4, 16])
+def test_execute_sqlite_contention(benchmark, tmp_path, n_threads):
+    """Benchmark threads writing and reading one database at once."""
+    n_writes = _scaled(200)
+    database_path = str(tmp_path / 'contention.db')
+    TASK_MODULE._execute_sqlite(
+        """
+        CREATE TABLE IF NOT EXISTS benchmark_data (
+            key TEXT NOT NULL,
+            value BLOB NOT NULL,
+            PRIMARY KEY (key)
+        );
+        """, database_path, mode='modify', execute='script')
+
+    def _write_and_read(thread_index):
+        for index in range(max(1, n_writes // n_threads)):
+            key = '%d:%d' % (thread_index, index)
+            TASK_MODULE._execute_sqlite(
+                'INSERT OR REPLACE INTO benchmark_data VALUES (?, ?)',
+                database_path, mode='modify',
+                argument_list=(key, b'x' * 1024))
+            TASK_MODULE._execute_sqlite(
+                'SELECT value FROM benchmark_data WHERE key = ?',
+                database_path, mode='read_only', argument_list=(key,),
+                fetch='one')
+
+    def _contend():
+        thread_list = [
+            threading.Thread(target=_write_and_read, args=(thread_index,))
+            for thread_index in range(n_threads)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+
+    benchmark.pedantic(_contend, rounds=3)
+    benchmark.extra_info['writes'] = max(1, n_writes // n_threads) * n_threads
+
+
+@pytest.mark.parametrize('payload_size', [2**20, 2**26])
+@pytest.mark.parametrize('shared_memory_threshold', [None, 2**20])
+def test_pool_ipc(benchmark, tmp_path, payload_size, shared_memory_threshold):
+    """Benchmark sending large arguments to worker processes."""
+    n_tasks = _scaled(8)
+    payload_size = _scaled(payload_size)
+
+    def _add_tasks(task_graph):
+        for index in range(n_tasks):
+            task_graph.add_task(
+                func=_payload_length,
+                args=(bytes([index % 256]) * payload_size,),
+                task_name='task %d' % index)
+
+    benchmark.pedantic(
+        _run_graph, setup=_fresh_workspace_setup(
+            tmp_path, 2, _add_tasks,
+            shared_memory_threshold=shared_memory_threshold),
+        rounds=3)
+    benchmark.extra_info['megabytes_per_second'] = (
+        n_tasks * payload_size / 2**20 / benchmark.stats.stats.mean)
@@ -13,7 +13,8 @@ LONG_DESCRIPTION = '%s\n\n%s' % (
 setup(
     name='taskgraph',
     use_scm_version={'version_scheme': 'post-release',
-                     'local_scheme': 'node-and-date'},
+                     'local_scheme': 'node-and-date',
+                     'write_to': 'taskgraph/version.py'},
     setup_requires=['setuptools_scm'],
     description='Parallel task graph framework.',
     long_description=LONG_DESCRIPTION,
@@ -26,6 +27,7 @@ setup(
     install_requires=_REQUIREMENTS,
     extras_require={
         'niced_processes': ['psutil'],
+        'fast_hashing': ['xxhash', 'blake3'],
         },
     classifiers=[
         'Intended Audience :: Developers',
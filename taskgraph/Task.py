@@ -1,1733 +1,5177 @@
-"""Task graph framework."""
-from pkg_resources import get_distribution
-import collections
-import hashlib
-import inspect
-import logging
-import logging.handlers
-import math
-import multiprocessing
-import multiprocessing.pool
-import os
-import pathlib
-import pickle
-import pprint
-import queue
-import shutil
-import sqlite3
-import threading
-import time
-
-import retrying
-
-__version__ = get_distribution('taskgraph').version
-
-
-_VALID_PATH_TYPES = (str, pathlib.Path)
-_TASKGRAPH_DATABASE_FILENAME = 'taskgraph_data.db'
-
-try:
-    import psutil
-    HAS_PSUTIL = True
-    if psutil.WINDOWS:
-        # Windows' scheduler doesn't use POSIX niceness.
-        PROCESS_LOW_PRIORITY = psutil.BELOW_NORMAL_PRIORITY_CLASS
-    else:
-        # On POSIX, use system niceness.
-        # -20 is high priority, 0 is normal priority, 19 is low priority.
-        # 10 here is an arbitrary selection that's probably nice enough.
-        PROCESS_LOW_PRIORITY = 10
-except ImportError:
-    HAS_PSUTIL = False
-
-LOGGER = logging.getLogger(__name__)
-_MAX_TIMEOUT = 5.0  # amount of time to wait for threads to terminate
-
-
-# We want our processing pool to be nondeamonic so that workers could use
-# multiprocessing if desired (deamonic processes cannot start new processes)
-# the following bit of code to do this was taken from
-# https://stackoverflow.com/a/8963618/42897
-class NoDaemonProcess(multiprocessing.Process):
-    """Make 'daemon' attribute always return False."""
-    @property
-    def daemon(self):
-        """Return False indicating not a daemon process."""
-        return False
-
-    @daemon.setter
-    def daemon(self, value):
-        """Do not allow daemon value to be overriden."""
-        pass
-
-
-class NoDaemonContext(type(multiprocessing.get_context('spawn'))):
-    """From https://stackoverflow.com/a/8963618/42897.
-
-    "As the current implementation of multiprocessing [3.7+] has been
-    extensively refactored to be based on contexts, we need to provide a
-    NoDaemonContext class that has our NoDaemonProcess as attribute.
-    [NonDaemonicPool] will then use that context instead of the default
-    one." "spawn" is chosen as default since that is the default and only
-    context option for Windows and is the default option for Mac OS as
-    well since 3.8.
-
-    """
-    Process = NoDaemonProcess
-
-
-class NonDaemonicPool(multiprocessing.pool.Pool):
-    """NonDaemonic Process Pool."""
-
-    def __init__(self, *args, **kwargs):
-        """Invoking super to set the context of Pool class explicitly."""
-        kwargs['context'] = NoDaemonContext()
-        super(NonDaemonicPool, self).__init__(*args, **kwargs)
-
-
-def _null_func():
-    """Used when func=None on add_task."""
-    return None
-
-
-def _initialize_logging_to_queue(logging_queue):
-    """Add a synchronized queue to a new process.
-
-    This is intended to be called as an initialization function to
-    ``multiprocessing.Pool`` to establish logging from a Pool worker to the
-    main python process via a multiprocessing Queue.
-
-    Args:
-        logging_queue (multiprocessing.Queue): The queue to use for passing
-            log records back to the main process.
-
-    Returns:
-        None
-
-    """
-    root_logger = logging.getLogger()
-
-    # By the time this function is called, `root_logger` has a copy of all of
-    # the logging handlers registered to it within the parent process, which
-    # leads to duplicate logging in some cases.  By removing all of the
-    # handlers here, we ensure that log messages can only be passed back to the
-    # parent process by the `logging_queue`, where they will be handled.
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-
-    root_logger.setLevel(logging.NOTSET)
-    handler = logging.handlers.QueueHandler(logging_queue)
-    root_logger.addHandler(handler)
-
-
-def _create_taskgraph_table_schema(taskgraph_database_path):
-    """Create database exists and/or ensures it is compatible and recreate.
-
-    Args:
-        taskgraph_database_path (str): path to an existing database or desired
-            location of a new database.
-
-    Returns:
-        None.
-
-    """
-    sql_create_projects_table_script = (
-        """
-        CREATE TABLE taskgraph_data (
-            task_reexecution_hash TEXT NOT NULL,
-            target_path_stats BLOB NOT NULL,
-            result BLOB NOT NULL,
-            PRIMARY KEY (task_reexecution_hash)
-        );
-        CREATE TABLE global_variables (
-            key TEXT NOT NULL,
-            value BLOB,
-            PRIMARY KEY (key)
-        );
-        """)
-
-    table_valid = True
-    expected_table_column_name_map = {
-        'taskgraph_data': [
-            'task_reexecution_hash', 'target_path_stats', 'result'],
-        'global_variables': ['key', 'value']}
-    if os.path.exists(taskgraph_database_path):
-        try:
-            # check that the tables exist and the column names are as expected
-            for expected_table_name in expected_table_column_name_map:
-                table_result = _execute_sqlite(
-                    '''
-                    SELECT name
-                    FROM sqlite_master
-                    WHERE type='table' AND name=?
-                    ''', taskgraph_database_path,
-                    argument_list=[expected_table_name],
-                    mode='read_only', execute='execute', fetch='all')
-                if not table_result:
-                    raise ValueError(f'missing table {expected_table_name}')
-
-                # this query returns a list of results of the form
-                # [(0, 'task_reexecution_hash', 'TEXT', 1, None, 1), ... ]
-                # we'll just check that the header names are the same, no
-                # need to be super aggressive, also need to construct the
-                # PRAGMA string directly since it doesn't take arguments
-                table_info_result = _execute_sqlite(
-                    f'PRAGMA table_info({expected_table_name})',
-                    taskgraph_database_path, mode='read_only',
-                    execute='execute', fetch='all')
-
-                expected_column_names = expected_table_column_name_map[
-                    expected_table_name]
-                header_count = 0
-                for header_line in table_info_result:
-                    column_name = header_line[1]
-                    if column_name not in expected_column_names:
-                        raise ValueError(
-                            f'expected {column_name} in table '
-                            f'{expected_table_name} but not found')
-                    header_count += 1
-                if header_count < len(expected_column_names):
-                    raise ValueError(
-                        f'found only {header_count} of an expected '
-                        f'{len(expected_column_names)} columns in table '
-                        f'{expected_table_name}')
-                if not table_info_result:
-                    raise ValueError(f'missing table {expected_table_name}')
-        except Exception:
-            # catch all "Exception"s because anything that goes wrong while
-            # checking the database should be considered a bad database and we
-            # should make a new one.
-            LOGGER.exception(
-                f'{taskgraph_database_path} exists, but is incompatible '
-                'somehow. Deleting and making a new one.')
-            os.remove(taskgraph_database_path)
-            table_valid = False
-    else:
-        # table does not exist
-        table_valid = False
-
-    if not table_valid:
-        # create the base table
-        _execute_sqlite(
-            sql_create_projects_table_script, taskgraph_database_path,
-            mode='modify', execute='script')
-        # set the database version
-        _execute_sqlite(
-            '''
-            INSERT OR REPLACE INTO global_variables
-            VALUES ("version", ?)
-            ''', taskgraph_database_path, mode='modify',
-            argument_list=(__version__,))
-
-
-class TaskGraph(object):
-    """Encapsulates the worker and tasks states for parallel processing."""
-
-    def __init__(
-            self, taskgraph_cache_dir_path, n_workers,
-            reporting_interval=None):
-        """Create a task graph.
-
-        Creates an object for building task graphs, executing them,
-        parallelizing independent work notes, and avoiding repeated calls.
-
-        Args:
-            taskgraph_cache_dir_path (string): path to a directory that
-                either contains a taskgraph cache from a previous instance or
-                will create a new one if none exists.
-            n_workers (int): number of parallel *subprocess* workers to allow
-                during task graph execution.  If set to 0, don't use
-                subprocesses.  If set to <0, use only the main thread for any
-                execution and scheduling. In the case of the latter,
-                ``add_task`` will be a blocking call.
-            reporting_interval (scalar): if not None, report status of task
-                graph every ``reporting_interval`` seconds.
-
-        """
-        try:
-            os.makedirs(taskgraph_cache_dir_path)
-        except OSError:
-            LOGGER.debug(
-                "%s already exists, no need to make it",
-                taskgraph_cache_dir_path)
-
-        self._taskgraph_cache_dir_path = taskgraph_cache_dir_path
-
-        # this variable is used to print accurate representation of how many
-        # tasks have been completed in the logging output.
-        self._added_task_count = 0
-
-        # use this to keep track of all the tasks added to the graph by their
-        # task hashes. Used to determine if an identical task has been added
-        # to the taskgraph during `add_task`
-        self._task_hash_map = dict()
-
-        # use this to keep track of all the tasks added to the graph by their
-        # task names. Used to map a unique task name to the task object it
-        # represents
-        self._task_name_map = dict()
-
-        # used to remember if task_graph has been closed
-        self._closed = False
-
-        # keep track if the task graph has been forcibly terminated
-        self._terminated = False
-
-        # if n_workers > 0 this will be a multiprocessing pool used to execute
-        # the __call__ functions in Tasks
-        self._worker_pool = None
-
-        # If n_workers > 0 this will be a threading.Thread used to propagate
-        # log records from another process into the current process.
-        self._logging_monitor_thread = None
-
-        # If n_workers > 0, this will be a multiprocessing.Queue used to pass
-        # log records from the process pool to the parent process.
-        self._logging_queue = None
-
-        # keeps track of the tasks currently being processed for logging.
-        self._active_task_list = []
-
-        # keeps track of how many tasks have all their dependencies satisfied
-        # and are waiting for a worker
-        self._task_waiting_count = 0
-
-        # this might hold the threads to execute tasks if n_workers >= 0
-        self._task_executor_thread_list = []
-
-        # executor threads wait on this event that gets set when new tasks are
-        # added to the queue. If the queue is empty an executor will clear
-        # the event to halt other executors
-        self._executor_ready_event = threading.Event()
-
-        # tasks that have all their dependencies satisfied go in this queue
-        # and can be executed immediately
-        self._task_ready_priority_queue = queue.PriorityQueue()
-
-        # maps a list of task names that need to be executed before the key
-        # task can
-        self._task_dependent_map = collections.defaultdict(set)
-
-        # maps a list of task names that are dependent to a task
-        self._dependent_task_map = collections.defaultdict(set)
-
-        # tasks that complete are added to this set
-        self._completed_task_names = set()
-
-        self._task_database_path = os.path.join(
-            self._taskgraph_cache_dir_path, _TASKGRAPH_DATABASE_FILENAME)
-
-        # create new table if needed
-        _create_taskgraph_table_schema(self._task_database_path)
-
-        # check the version of the database and warn if a problem
-        local_version = _execute_sqlite(
-            '''
-            SELECT value
-            FROM global_variables
-            WHERE key=?
-            ''', self._task_database_path, mode='read_only',
-            fetch='one', argument_list=['version'])[0]
-        if local_version != __version__:
-            LOGGER.warning(
-                f'the database located at {self._task_database_path} was '
-                f'created with TaskGraph version {local_version} but the '
-                f'current version is {__version__}')
-
-        # no need to set up schedulers if n_workers is single threaded
-        self._n_workers = n_workers
-        if n_workers < 0:
-            return
-
-        # start concurrent reporting of taskgraph if reporting interval is set
-        self._reporting_interval = reporting_interval
-        if reporting_interval is not None:
-            self._execution_monitor_wait_event = threading.Event()
-            self._execution_monitor_thread = threading.Thread(
-                target=self._execution_monitor,
-                args=(self._execution_monitor_wait_event,),
-                name='_execution_monitor')
-            # make it a daemon so we don't have to figure out how to
-            # close it when execution complete
-            self._execution_monitor_thread.daemon = True
-            self._execution_monitor_thread.start()
-
-        # launch executor threads
-        self._executor_thread_count = max(0, n_workers)
-        for thread_id in range(max(1, n_workers)):
-            task_executor_thread = threading.Thread(
-                target=self._task_executor,
-                name='task_executor_%s' % thread_id)
-            # make daemons in case there's a catastrophic error the main
-            # thread won't hang
-            task_executor_thread.daemon = True
-            task_executor_thread.start()
-            self._task_executor_thread_list.append(task_executor_thread)
-
-        # set up multiprocessing if n_workers > 0
-        if n_workers > 0:
-            self._logging_queue = multiprocessing.Queue()
-            self._worker_pool = NonDaemonicPool(
-                n_workers, initializer=_initialize_logging_to_queue,
-                initargs=(self._logging_queue,))
-            self._logging_monitor_thread = threading.Thread(
-                target=self._handle_logs_from_processes,
-                args=(self._logging_queue,))
-
-            self._logging_monitor_thread.daemon = True
-            self._logging_monitor_thread.start()
-            if HAS_PSUTIL:
-                parent = psutil.Process()
-                parent.nice(PROCESS_LOW_PRIORITY)
-                for child in parent.children():
-                    try:
-                        child.nice(PROCESS_LOW_PRIORITY)
-                    except psutil.NoSuchProcess:
-                        LOGGER.warning(
-                            "NoSuchProcess exception encountered when trying "
-                            "to nice %s. This might be a bug in `psutil` so "
-                            "it should be okay to ignore.")
-
-    def __del__(self):
-        """Ensure all threads have been joined for cleanup."""
-        try:
-            # it's possible the global state is not well defined, so just in
-            # case we'll wrap it all up in a try/except
-            self._terminated = True
-            if self._executor_ready_event is not None:
-                # alert executors to check that _terminated is True
-                self._executor_ready_event.set()
-            LOGGER.debug("shutting down workers")
-            if self._worker_pool is not None:
-                self._worker_pool.close()
-                self._worker_pool.terminate()
-                self._worker_pool = None
-
-            if self._logging_queue is not None:
-                # Close down the logging monitor thread.
-                self._logging_queue.put(None)
-                self._logging_monitor_thread.join(_MAX_TIMEOUT)
-                # drain the queue if anything is left
-                while True:
-                    try:
-                        x = self._logging_queue.get_nowait()
-                        LOGGER.debug(
-                            "the logging queue had this in it: %s", x)
-                    except queue.Empty:
-                        break
-                    except Exception:
-                        LOGGER.exception(
-                            "Expected an empty logging queue, but if the "
-                            "TaskGraph were being terminated it's possible "
-                            "this object is corrupt and we'd get a different "
-                            "kind of exception like EOF. In any case we "
-                            "should always stop trying to drain the queue "
-                            "in the case of an Exception.")
-                        break
-
-            if self._n_workers >= 0:
-                self._executor_ready_event.set()
-                for executor_thread in self._task_executor_thread_list:
-                    try:
-                        executor_thread.join(_MAX_TIMEOUT)
-                        timedout = executor_thread.is_alive()
-                        if timedout:
-                            LOGGER.debug(
-                                'task executor thread timed out %s',
-                                executor_thread)
-                    except Exception:
-                        LOGGER.warning(
-                            f'Joining executor thread {executor_thread} '
-                            f'would have caused a deadlock, skipping.')
-                if self._reporting_interval is not None:
-                    LOGGER.debug("joining _monitor_thread.")
-                    if self._logging_queue:
-                        self._logging_queue.put(None)
-                    self._execution_monitor_wait_event.set()
-                    try:
-                        self._execution_monitor_thread.join(_MAX_TIMEOUT)
-                        timedout = self._execution_monitor_thread.is_alive()
-                        if timedout:
-                            LOGGER.debug(
-                                '_monitor_thread %s timed out',
-                                self._execution_monitor_thread)
-                    except Exception:
-                        LOGGER.warning(
-                            'joining execution monitor thread '
-                            f'{self._execution_monitor_thread} would have '
-                            'caused a deadlock, skipping.')
-                    for task in self._task_hash_map.values():
-                        # shortcut to get the tasks to mark as joined
-                        task.task_done_executing_event.set()
-
-            # drain the task ready queue if there's anything left
-            while True:
-                try:
-                    x = self._task_ready_priority_queue.get_nowait()
-                    LOGGER.debug(
-                        "task_ready_priority_queue not empty contains: %s", x)
-                except queue.Empty:
-                    break
-            LOGGER.debug('taskgraph terminated')
-        except Exception:
-            LOGGER.exception('exception occurred during __del__')
-
-    def _task_executor(self):
-        """Worker that executes Tasks that have satisfied dependencies."""
-        while True:
-            # this event blocks until the task graph has signaled it wants
-            # the executors to read the state of the queue or a stop event or
-            # a timeout exceeded just to protect against a worst case deadlock
-            self._executor_ready_event.wait(_MAX_TIMEOUT)
-            # this lock synchronizes changes between the queue and
-            # executor_ready_event
-            if self._terminated:
-                LOGGER.debug(
-                    "taskgraph is terminated, ending %s",
-                    threading.currentThread())
-                break
-            task = None
-            try:
-                task = self._task_ready_priority_queue.get_nowait()
-                self._task_waiting_count -= 1
-                task_name_time_tuple = (task.task_name, time.time())
-                self._active_task_list.append(task_name_time_tuple)
-            except queue.Empty:
-                # no tasks are waiting could be because the taskgraph is
-                # closed or because the queue is just empty.
-                if (self._closed and len(self._completed_task_names) ==
-                        self._added_task_count):
-                    # the graph is closed and there are as many completed tasks
-                    # as there are added tasks, so none left. The executor can
-                    # terminate.
-                    self._executor_thread_count -= 1
-                    if self._executor_thread_count == 0 and self._worker_pool:
-                        # only the last executor should terminate the worker
-                        # pool, because otherwise who knows if it's still
-                        # executing anything
-                        try:
-                            self._worker_pool.close()
-                            self._worker_pool.terminate()
-                            self._worker_pool = None
-                        except Exception:
-                            # there's the possibility for a race condition here
-                            # where another thread already closed the worker
-                            # pool, so just guard against it
-                            LOGGER.warning('worker pool was already closed')
-                    LOGGER.debug(
-                        "no tasks are pending and taskgraph closed, normally "
-                        "terminating executor %s." % threading.currentThread())
-                    break
-                else:
-                    # there's still the possibility for work to be added or
-                    # still work in the pipeline
-                    self._executor_ready_event.clear()
-            if task is None:
-                continue
-            try:
-                task._call()
-                task.task_done_executing_event.set()
-            except Exception as e:
-                # An error occurred on a call, terminate the taskgraph
-                task.exception_object = e
-                LOGGER.exception(
-                    'A taskgraph _task_executor failed on Task '
-                    '%s. Terminating taskgraph.', task.task_name)
-                self._terminate()
-                break
-
-            LOGGER.debug(
-                "task %s is complete, checking to see if any dependent "
-                "tasks can be executed now", task.task_name)
-            self._completed_task_names.add(task.task_name)
-            self._active_task_list.remove(task_name_time_tuple)
-            for waiting_task_name in (
-                    self._task_dependent_map[task.task_name]):
-                # remove `task` from the set of tasks that
-                # `waiting_task` was waiting on.
-                self._dependent_task_map[waiting_task_name].remove(
-                    task.task_name)
-                # if there aren't any left, we can push `waiting_task`
-                # to the work queue
-                if not self._dependent_task_map[waiting_task_name]:
-                    # if we removed the last task we can put it to the
-                    # work queue
-                    LOGGER.debug(
-                        "Task %s is ready for processing, sending to "
-                        "task_ready_priority_queue",
-                        waiting_task_name)
-                    del self._dependent_task_map[waiting_task_name]
-                    self._task_ready_priority_queue.put(
-                        self._task_name_map[waiting_task_name])
-                    self._task_waiting_count += 1
-                    # indicate to executors there is work to do
-                    self._executor_ready_event.set()
-            del self._task_dependent_map[task.task_name]
-            # this extra set ensures that recently emptied map won't get
-            # ignored by the executor if no work is left to do and the graph is
-            # closed
-            self._executor_ready_event.set()
-            LOGGER.debug("task %s done processing", task.task_name)
-        LOGGER.debug("task executor shutting down")
-
-    def add_task(
-            self, func=None, args=None, kwargs=None, task_name=None,
-            target_path_list=None, ignore_path_list=None,
-            hash_target_files=True, dependent_task_list=None,
-            ignore_directories=True, priority=0,
-            hash_algorithm='sizetimestamp', copy_duplicate_artifact=False,
-            hardlink_allowed=False, transient_run=False, store_result=False):
-        """Add a task to the task graph.
-
-        Args:
-            func (callable): target function
-            args (list): argument list for ``func``
-            kwargs (dict): keyword arguments for ``func``
-            target_path_list (list): if not None, a list of file paths that
-                are expected to be output by ``func``.  If any of these paths
-                don't exist, or their timestamp is earlier than an input
-                arg or work token, func will be executed.
-
-                If ``None``, any identical calls to ``add_task`` will be
-                skipped for the TaskGraph object. A future TaskGraph object
-                will re-run an exact call once for its lifetime. The reasoning
-                is that it is likely the user wishes to run a target-less task
-                once for the lifetime of a task-graph, but would otherwise not
-                have a transient result that could be re-used in a future
-                instantiation of a TaskGraph object.
-
-            task_name (string): if not None, this value is used to identify
-                the task in logging messages.
-            ignore_path_list (list): list of file paths that could be in
-                args/kwargs that should be ignored when considering timestamp
-                hashes.
-            hash_target_files (bool): If True, the hash value of the target
-                files will be recorded to determine if a future run of this
-                function is precalculated. If False, this function only notes
-                the existence of the target files before determining if
-                a function call is precalculated.
-            dependent_task_list (list): list of ``Task``s that this task must
-                ``join`` before executing.
-            ignore_directories (boolean): if the existence/timestamp of any
-                directories discovered in args or kwargs is used as part
-                of the work token hash.
-            priority (numeric): the priority of a task is considered when
-                there is more than one task whose dependencies have been
-                met and are ready for scheduling. Tasks are inserted into the
-                work queue in order of decreasing priority value
-                (priority 10 is higher than priority 1). This value can be
-                positive, negative, and/or floating point.
-            hash_algorithm (string): either a hash function id that
-                exists in hashlib.algorithms_available or 'sizetimestamp'.
-                Any paths to actual files in the arguments will be digested
-                with this algorithm. If value is 'sizetimestamp' the digest
-                will only use the normed path, size, and timestamp of any
-                files found in the arguments. This value is used when
-                determining whether a task is precalculated or its target
-                files can be copied to an equivalent task. Note if
-                ``hash_algorithm`` is 'sizetimestamp' the task will require the
-                same base path files to determine equality. If it is a
-                ``hashlib`` algorithm only file contents will be considered.
-            copy_duplicate_artifact (bool): if True and the Tasks'
-                argument signature matches a previous Tasks without direct
-                comparison of the target path files in the arguments other
-                than their positions in the target path list, the target
-                artifacts from a previously successful Task execution will
-                be copied to the new one.
-            hardlink_allowed (bool): if ``copy_duplicate_artifact`` is True,
-                this will allow a hardlink rather than a copy when needed.
-            transient_run (bool): if True, this Task will be reexecuted
-                even if it was successfully executed in a previous TaskGraph
-                instance. If False, this Task will be skipped if it was
-                executed successfully in a previous TaskGraph instance. One
-                might wish to set `transient_run` to True on a Task that does
-                some sort of initialization that's needed every time a
-                TaskGraph is instantiated. Perhaps to acquire dynamic resources
-                or authenticate permissions.
-            store_result (bool): If True, the result of ``func`` will be stored
-                in the TaskGraph database and retrievable with a call to
-                ``.get()`` on a ``Task`` object.
-
-        Returns:
-            Task which was just added to the graph or an existing Task that
-            has the same signature and has already been added to the
-            TaskGraph.
-
-        Raises:
-            ValueError if objects are passed to the dependent task list that
-                are not Tasks.
-            ValueError if ``add_task`` is invoked after the ``TaskGraph`` is
-                closed.
-            RuntimeError if ``add_task`` is invoked after ``TaskGraph`` has
-                reached a terminate state.
-
-        """
-        try:
-            if self._terminated:
-                raise RuntimeError(
-                    "add_task when Taskgraph is terminated.")
-            if self._closed:
-                raise ValueError(
-                    "The task graph is closed and cannot accept more "
-                    "tasks.")
-            self._added_task_count += 1
-            if args is None:
-                args = []
-            if kwargs is None:
-                kwargs = {}
-            if task_name is None:
-                task_name = 'UNNAMED TASK'
-            if dependent_task_list is None:
-                dependent_task_list = []
-            if target_path_list is None:
-                target_path_list = []
-            if ignore_path_list is None:
-                ignore_path_list = []
-            if func is None:
-                func = _null_func
-
-            # this is a pretty common error to accidentally not pass a
-            # Task to the dependent task list.
-            if any(not isinstance(task, Task)
-                   for task in dependent_task_list):
-                raise ValueError(
-                    "Objects passed to dependent task list that are not "
-                    "tasks: %s", dependent_task_list)
-
-            task_name = '%s (%d)' % (task_name, len(self._task_hash_map))
-            new_task = Task(
-                task_name, func, args, kwargs, target_path_list,
-                ignore_path_list, hash_target_files, ignore_directories,
-                transient_run, self._worker_pool,
-                self._taskgraph_cache_dir_path, priority, hash_algorithm,
-                copy_duplicate_artifact, hardlink_allowed, store_result,
-                self._task_database_path)
-
-            self._task_name_map[new_task.task_name] = new_task
-            # it may be this task was already created in an earlier call,
-            # use that object in its place
-            if new_task in self._task_hash_map:
-                duplicate_task = self._task_hash_map[new_task]
-                new_task_target_set = set(new_task._target_path_list)
-                duplicate_task_target_set = set(
-                    duplicate_task._target_path_list)
-                if new_task_target_set == duplicate_task_target_set:
-                    LOGGER.warning(
-                        "A duplicate task was submitted: %s original: %s",
-                        new_task, self._task_hash_map[new_task])
-                    return duplicate_task
-                disjoint_target_set = (
-                    new_task_target_set.symmetric_difference(
-                        duplicate_task_target_set))
-                if len(disjoint_target_set) == (
-                        len(new_task_target_set) +
-                        len(duplicate_task_target_set)):
-                    if duplicate_task not in dependent_task_list:
-                        LOGGER.info(
-                            "A task was created that had an identical "
-                            "args signature sans target paths, but a "
-                            "different target_path_list of the same "
-                            "length. To avoid recomputation, dynamically "
-                            "adding previous Task (%s) as a dependent "
-                            "task to this one (%s).",
-                            duplicate_task.task_name, task_name)
-                        dependent_task_list = (
-                            dependent_task_list + [duplicate_task])
-                else:
-                    raise RuntimeError(
-                        "A task was created that has the same arguments "
-                        "as another task, but only partially different "
-                        "expected target paths. This runs the risk of "
-                        "unpredictably overwriting output so treating as "
-                        "a runtime error: submitted task: %s, existing "
-                        "task: %s" % (new_task, duplicate_task))
-            self._task_hash_map[new_task] = new_task
-            if self._n_workers < 0:
-                # call directly if single threaded
-                new_task._call()
-            else:
-                # determine if task is ready or is dependent on other
-                # tasks
-                LOGGER.debug(
-                    "multithreaded: %s sending to new task queue.",
-                    task_name)
-                outstanding_dep_task_name_list = [
-                    dep_task.task_name for dep_task in dependent_task_list
-                    if dep_task.task_name
-                    not in self._completed_task_names]
-                if not outstanding_dep_task_name_list:
-                    LOGGER.debug(
-                        "sending task %s right away", new_task.task_name)
-                    self._task_ready_priority_queue.put(new_task)
-                    self._task_waiting_count += 1
-                    self._executor_ready_event.set()
-                else:
-                    # there are unresolved tasks that the waiting
-                    # process scheduler has not been notified of.
-                    # Record dependencies.
-                    for dep_task_name in outstanding_dep_task_name_list:
-                        # record tasks that are dependent on dep_task_name
-                        self._task_dependent_map[dep_task_name].add(
-                            new_task.task_name)
-                        # record tasks that new_task depends on
-                        self._dependent_task_map[new_task.task_name].add(
-                            dep_task_name)
-            return new_task
-
-        except Exception:
-            # something went wrong, shut down the taskgraph
-            LOGGER.exception(
-                "Something went wrong when adding task %s, "
-                "terminating taskgraph.", task_name)
-            self._terminate()
-            raise
-
-    def _handle_logs_from_processes(self, queue_):
-        LOGGER.debug('Starting logging worker')
-        while True:
-            record = queue_.get()
-            if record is None:
-                break
-            logger = logging.getLogger(record.name)
-            logger.handle(record)
-        LOGGER.debug('_handle_logs_from_processes shutting down')
-
-    def _execution_monitor(self, monitor_wait_event):
-        """Log state of taskgraph every ``self._reporting_interval`` seconds.
-
-        Args:
-            monitor_wait_event (threading.Event): used to sleep the monitor
-                for``self._reporting_interval`` seconds, or to wake up to
-                terminate for shutdown.
-
-        Returns:
-            None.
-
-        """
-        start_time = time.time()
-        while True:
-            if self._terminated:
-                break
-            active_task_count = len(self._active_task_list)
-            queue_length = self._task_ready_priority_queue.qsize()
-            active_task_message = '\n'.join(
-                ['\t%s: executing for %.2fs' % (
-                    task_name, time.time() - task_time)
-                 for task_name, task_time in self._active_task_list])
-
-            completed_tasks = len(self._completed_task_names)
-            percent_complete = 0.0
-            if self._added_task_count > 0:
-                percent_complete = 100.0 * (
-                    float(completed_tasks) / self._added_task_count)
-
-            LOGGER.info(
-                "\n\ttaskgraph execution status: tasks added: %d \n"
-                "\ttasks complete: %d (%.1f%%) \n"
-                "\ttasks waiting for a free worker: %d (qsize: %d)\n"
-                "\ttasks executing (%d): graph is %s\n%s",
-                self._added_task_count, completed_tasks, percent_complete,
-                self._task_waiting_count, queue_length, active_task_count,
-                'closed' if self._closed else 'open',
-                active_task_message)
-
-            monitor_wait_event.wait(
-                timeout=self._reporting_interval - (
-                    (time.time() - start_time)) % self._reporting_interval)
-        LOGGER.debug("_execution monitor shutting down")
-
-    def join(self, timeout=None):
-        """Join all threads in the graph.
-
-        Args:
-            timeout (float): if not none will attempt to join subtasks with
-                this value. If a subtask times out, the whole function will
-                timeout.
-
-        Returns:
-            True if successful join, False if timed out.
-
-        """
-        LOGGER.debug("joining taskgraph")
-        if self._n_workers < 0 or self._terminated:
-            return True
-        try:
-            LOGGER.debug("attempting to join threads")
-            timedout = False
-            for task in self._task_hash_map.values():
-                LOGGER.debug("attempting to join task %s", task.task_name)
-                timedout = not task.join(timeout)
-                LOGGER.debug("task %s was joined", task.task_name)
-                # if the last task timed out then we want to timeout for all
-                # of the task graph
-                if timedout:
-                    LOGGER.info(
-                        "task %s timed out in graph join", task.task_name)
-                    return False
-            if self._closed and self._logging_queue:
-                # Close down the taskgraph
-                self._terminate()
-            return True
-        except Exception:
-            # If there's an exception on a join it means that a task failed
-            # to execute correctly. Print a helpful message then terminate the
-            # taskgraph object.
-            LOGGER.exception(
-                "Exception raised when joining task %s. It's possible "
-                "that this task did not cause the exception, rather another "
-                "exception terminated the task_graph. Check the log to see "
-                "if there are other exceptions.", task)
-            self._terminate()
-            raise
-
-    def close(self):
-        """Prevent future tasks from being added to the work queue."""
-        LOGGER.debug("Closing taskgraph.")
-        if self._closed:
-            return
-        self._closed = True
-        # this wakes up all the executors and any that wouldn't otherwise
-        # have work to do will see there are no tasks left and terminate
-        self._executor_ready_event.set()
-        LOGGER.debug("taskgraph closed")
-
-    def _terminate(self):
-        """Immediately terminate remaining task graph computation."""
-        LOGGER.debug(
-            "Invoking terminate. already terminated? %s", self._terminated)
-        if self._terminated:
-            return
-        self._terminated = True
-
-        if self._logging_queue:
-            self._logging_queue.put(None)
-
-        for task in self._task_hash_map.values():
-            LOGGER.debug("setting task done for %s", task.task_name)
-            task.task_done_executing_event.set()
-
-        if self._worker_pool:
-            self._worker_pool.close()
-            self._worker_pool.terminate()
-
-        self._executor_ready_event.set()
-
-
-class Task(object):
-    """Encapsulates work/task state for multiprocessing."""
-
-    def __init__(
-            self, task_name, func, args, kwargs, target_path_list,
-            ignore_path_list, hash_target_files, ignore_directories,
-            transient_run, worker_pool, cache_dir, priority, hash_algorithm,
-            copy_duplicate_artifact, hardlink_allowed, store_result,
-            task_database_path):
-        """Make a Task.
-
-        Args:
-            task_name (int): unique task id from the task graph.
-            func (function): a function that takes the argument list
-               ``args``
-            args (tuple): a list of arguments to pass to ``func``.  Can be
-                None.
-            kwargs (dict): keyword arguments to pass to ``func``.  Can be
-                None.
-            target_path_list (list): a list of filepaths that this task
-                should generate.
-            ignore_path_list (list): list of file paths that could be in
-                args/kwargs that should be ignored when considering timestamp
-                hashes.
-            hash_target_files (bool): If True, the hash value of the target
-                files will be recorded to determine if a future run of this
-                function is precalculated. If False, this function only notes
-                the existence of the target files before determining if
-                a function call is precalculated.
-            ignore_directories (bool): if the existence/timestamp of any
-                directories discovered in args or kwargs is used as part
-                of the work token hash.
-            transient_run (bool): if True a call with an identical execution
-                hash will be reexecuted on a subsequent instantiation of a
-                future TaskGraph object. If a duplicate task is submitted
-                to the same object it will not be re-run in any scenario.
-                Otherwise if False, subsequent tasks with an identical
-                execution hash will be skipped.
-            worker_pool (multiprocessing.Pool): if not None, is a
-                multiprocessing pool that can be used for ``_call`` execution.
-            cache_dir (string): path to a directory to both write and expect
-                data recorded from a previous Taskgraph run.
-            priority (numeric): the priority of a task is considered when
-                there is more than one task whose dependencies have been
-                met and are ready for scheduling. Tasks are inserted into the
-                work queue in order of decreasing priority. This value can be
-                positive, negative, and/or floating point.
-            hash_algorithm (string): either a hash function id that
-                exists in hashlib.algorithms_available or 'sizetimestamp'.
-                Any paths to actual files in the arguments will be digested
-                with this algorithm. If value is 'sizetimestamp' the digest
-                will only use the normed path, size, and timestamp of any
-                files found in the arguments.
-            copy_duplicate_artifact (bool): if true and the Tasks'
-                argument signature matches a previous Tasks without direct
-                comparison of the target path files in the arguments other
-                than their positions in the target path list, the target
-                artifacts from a previously successful Task execution will
-                be copied to the new one.
-            hardlink_allowed (bool): if ``copy_duplicate_artifact`` is True,
-                this allows taskgraph to create a hardlink rather than make a
-                direct copy.
-            store_result (bool): If true, the result of ``func`` will be
-                stored in the TaskGraph database and retrievable with a call
-                to ``.get()`` on the Task object.
-            task_database_path (str): path to an SQLITE database that has
-                table named "taskgraph_data" with the three fields:
-                    task_hash TEXT NOT NULL,
-                    target_path_stats BLOB NOT NULL
-                    result BLOB NOT NULL
-                If a call is successful its hash is inserted/updated in the
-                table, the target_path_stats stores the base/target stats
-                for the target files created by the call and listed in
-                ``target_path_list``, and the result of ``func`` is stored in
-                ``result``.
-
-        """
-        # it is a common error to accidentally pass a non string as to the
-        # target path list, this terminates early if so
-        if any([not (isinstance(path, _VALID_PATH_TYPES))
-                for path in target_path_list]):
-            raise ValueError(
-                "Values passed to target_path_list are not strings: %s",
-                target_path_list)
-
-        # sort the target path list because the order doesn't matter for
-        # a result, but it would cause a task to be reexecuted if the only
-        # difference was a different order.
-        self._target_path_list = sorted([
-            _normalize_path(path) for path in target_path_list])
-        self.task_name = task_name
-        self._func = func
-        self._args = args
-        self._kwargs = kwargs
-        self._cache_dir = cache_dir
-        self._ignore_path_list = [
-            _normalize_path(path) for path in ignore_path_list]
-        self._hash_target_files = hash_target_files
-        self._ignore_directories = ignore_directories
-        self._transient_run = transient_run
-        self._worker_pool = worker_pool
-        self._task_database_path = task_database_path
-        self._hash_algorithm = hash_algorithm
-        self._copy_duplicate_artifact = copy_duplicate_artifact
-        self._hardlink_allowed = hardlink_allowed
-        self._store_result = store_result
-        self.exception_object = None
-
-        # invert the priority since sorting goes smallest to largest and we
-        # want more positive priority values to be executed first.
-        self._priority = -priority
-
-        # Used to ensure only one attempt at executing and also a mechanism
-        # to see when Task is complete. This can be set if a Task finishes
-        # a _call and there are no more attempts at reexecution.
-        self.task_done_executing_event = threading.Event()
-
-        # These are used to store and later access the result of the call.
-        self._result = None
-
-        # Calculate a hash based only on argument inputs.
-        try:
-            if not hasattr(Task, 'func_source_map'):
-                Task.func_source_map = {}
-            # memoize func source code because it's likely we'll import
-            # the same func many times and reflection is slow
-            if self._func not in Task.func_source_map:
-                Task.func_source_map[self._func] = (
-                    inspect.getsource(self._func))
-            source_code = Task.func_source_map[self._func]
-        except (IOError, TypeError):
-            # many reasons for this, for example, frozen Python code won't
-            # have source code, so just leave blank
-            source_code = ''
-
-        if not hasattr(self._func, '__name__'):
-            LOGGER.warning(
-                "function does not have a __name__ which means it will not "
-                "be considered when calculating a successive input has "
-                "been changed with another function without __name__.")
-            self._func.__name__ = ''
-
-        args_clean = []
-        for index, arg in enumerate(self._args):
-            try:
-                scrubbed_value = _scrub_task_args(arg, self._target_path_list)
-                _ = pickle.dumps(scrubbed_value)
-                args_clean.append(scrubbed_value)
-            except TypeError:
-                LOGGER.warning(
-                    "could not pickle argument at index %d (%s). "
-                    "Skipping argument which means it will not be considered "
-                    "when calculating whether inputs have been changed "
-                    "on a successive run.", index, arg)
-
-        kwargs_clean = {}
-        # iterate through sorted order so we get the same hash result with the
-        # same set of kwargs irrespective of the item dict order.
-        for key, arg in sorted(self._kwargs.items()):
-            try:
-                scrubbed_value = _scrub_task_args(arg, self._target_path_list)
-                _ = pickle.dumps(scrubbed_value)
-                kwargs_clean[key] = scrubbed_value
-            except TypeError:
-                LOGGER.warning(
-                    "could not pickle kw argument %s (%s) scrubbed to %s. "
-                    "Skipping argument which means it will not be considered "
-                    "when calculating whether inputs have been changed "
-                    "on a successive run.", key, arg, scrubbed_value)
-
-        self._reexecution_info = {
-            'func_name': self._func.__name__,
-            'args_clean': args_clean,
-            'kwargs_clean': kwargs_clean,
-            'source_code_hash': hashlib.sha1(
-                source_code.encode('utf-8')).hexdigest(),
-        }
-
-        argument_hash_string = ':'.join([
-            repr(self._reexecution_info[key])
-            for key in sorted(self._reexecution_info.keys())])
-
-        self._task_id_hash = hashlib.sha1(
-            argument_hash_string.encode('utf-8')).hexdigest()
-
-        # this will get calculated when ``is_precalculated`` is invoked.
-        self._task_reexecution_hash = None
-
-    def __eq__(self, other):
-        """Two tasks are equal if their hashes are equal."""
-        return (
-            isinstance(self, other.__class__) and
-            (self._task_id_hash == other._task_id_hash))
-
-    def __hash__(self):
-        """Return the base-16 integer hash of this hash string."""
-        return int(self._task_id_hash, 16)
-
-    def __ne__(self, other):
-        """Inverse of __eq__."""
-        return not self.__eq__(other)
-
-    def __lt__(self, other):
-        """Less than based on priority."""
-        return self._priority < other._priority
-
-    def __repr__(self):
-        """Create a string representation of a Task."""
-        return "Task object %s:\n\n" % (id(self)) + pprint.pformat(
-            {
-                "task_name": self.task_name,
-                "priority": self._priority,
-                "ignore_path_list": self._ignore_path_list,
-                "ignore_directories": self._ignore_directories,
-                "target_path_list": self._target_path_list,
-                "task_id_hash": self._task_id_hash,
-                "task_reexecution_hash": self._task_reexecution_hash,
-                "exception_object": self.exception_object,
-                "self._reexecution_info": self._reexecution_info,
-                "self._result": self._result,
-            })
-
-    def _call(self):
-        """Invoke this method to execute task.
-
-        Precondition is that the Task dependencies are satisfied.
-
-        Sets the ``self.task_done_executing_event`` flag if execution is
-        successful.
-
-        Raises:
-            RuntimeError if any target paths are not generated after the
-                function call is complete.
-
-        """
-        LOGGER.debug("_call check if precalculated %s", self.task_name)
-        if not self._transient_run and self.is_precalculated():
-            self.task_done_executing_event.set()
-            return
-        LOGGER.debug("not precalculated %s", self.task_name)
-        artifact_copied = False
-        if self._copy_duplicate_artifact:
-            # try to see if we can copy old files
-            database_result = _execute_sqlite(
-                """
-                SELECT target_path_stats from taskgraph_data
-                WHERE (task_reexecution_hash == ?)
-                """,
-                self._task_database_path, mode='read_only',
-                argument_list=(self._task_reexecution_hash,),
-                execute='execute', fetch='one')
-            try:
-                if database_result:
-                    result_target_path_stats = pickle.loads(database_result[0])
-                    LOGGER.debug(
-                        'duplicate artifact db results: %s',
-                        result_target_path_stats)
-                    if (len(result_target_path_stats) ==
-                            len(self._target_path_list)):
-                        if all([
-                            file_fingerprint == _hash_file(
-                                path, hash_algorithm)
-                            for path, hash_algorithm, file_fingerprint in (
-                                result_target_path_stats)]):
-                            LOGGER.debug(
-                                "copying stored artifacts to target path "
-                                "list. \n\tstored artifacts: %s\n\t"
-                                "target_path_list: %s\n",
-                                [x[0] for x in result_target_path_stats],
-                                self._target_path_list)
-                            for artifact_target, new_target in zip(
-                                    result_target_path_stats,
-                                    self._target_path_list):
-                                if artifact_target != new_target:
-                                    target_linked = False
-                                    if self._hardlink_allowed:
-                                        # some OSes may not allow hardlinks
-                                        # but we don't know unless we try
-                                        try:
-                                            os.link(
-                                                artifact_target[0], new_target)
-                                            target_linked = True
-                                        except Exception:
-                                            LOGGER.exception(
-                                                f'failed to os.link '
-                                                f'{artifact_target[0]} to '
-                                                f'{new_target}')
-                                    # this is the default if either no hardlink
-                                    # allowed or a hardlink failed
-                                    if not target_linked:
-                                        shutil.copyfile(
-                                            artifact_target[0], new_target)
-                                else:
-                                    # This is a bug if this ever happens, and
-                                    # so bad if it does I want to stop and
-                                    # report a helpful error message
-                                    raise RuntimeError(
-                                        "duplicate copy artifact and target "
-                                        "path: %s, result_path_stats: %s, "
-                                        "target_path_list: %s" % (
-                                            artifact_target,
-                                            result_target_path_stats,
-                                            self._target_path_list))
-                            artifact_copied = True
-            except IOError as e:
-                LOGGER.warning(
-                    "IOError encountered when hashing original source "
-                    "files.\n%s" % e)
-        if not artifact_copied:
-            if self._worker_pool is not None:
-                result = self._worker_pool.apply_async(
-                    func=self._func, args=self._args, kwds=self._kwargs)
-                # the following blocks and raises an exception if result
-                # raised an exception
-                LOGGER.debug("apply_async for task %s", self.task_name)
-                payload = result.get()
-            else:
-                LOGGER.debug("direct _func for task %s", self.task_name)
-                payload = self._func(*self._args, **self._kwargs)
-            if self._store_result:
-                self._result = payload
-
-        # check that the target paths exist and record stats for later
-        if not self._hash_target_files:
-            target_hash_algorithm = 'exists'
-        else:
-            target_hash_algorithm = self._hash_algorithm
-        result_target_path_stats = list(
-            _get_file_stats(
-                self._target_path_list, target_hash_algorithm, [], False))
-        result_target_path_set = set(
-            [x[0] for x in result_target_path_stats])
-        target_path_set = set(self._target_path_list)
-        if target_path_set != result_target_path_set:
-            raise RuntimeError(
-                "In Task: %s\nMissing expected target path results.\n"
-                "Expected: %s\nObserved: %s\n" % (
-                    self.task_name, self._target_path_list,
-                    result_target_path_set))
-
-        # this step will only record the run if there is an expected
-        # target file. Otherwise we infer the result of this call is
-        # transient between taskgraph executions and we should expect to
-        # run it again.
-        if not self._transient_run:
-            _execute_sqlite(
-                "INSERT OR REPLACE INTO taskgraph_data VALUES (?, ?, ?)",
-                self._task_database_path, mode='modify',
-                argument_list=(
-                    self._task_reexecution_hash,
-                    pickle.dumps(result_target_path_stats),
-                    pickle.dumps(self._result)))
-        self.task_done_executing_event.set()
-        LOGGER.debug("successful run on task %s", self.task_name)
-
-    def is_precalculated(self):
-        """Return true if _call need not be invoked.
-
-        If the task has been precalculated it will fetch the return result from
-        the previous run.
-
-        Returns:
-            True if the Task's target paths exist in the same state as the
-            last recorded run at the time this function is called. It is
-            possible this value could change without running the Task if
-            input parameter file stats change. False otherwise.
-
-        """
-        # This gets a list of the files and their file stats that can be found
-        # in args and kwargs but ignores anything specifically targeted or
-        # an expected result. This will allow a task to change its hash in
-        # case a different version of a file was passed in.
-        # these are the stats of the files that exist that aren't ignored
-        if not self._hash_target_files:
-            target_hash_algorithm = 'exists'
-        else:
-            target_hash_algorithm = self._hash_algorithm
-        file_stat_list = list(_get_file_stats(
-            [self._args, self._kwargs],
-            target_hash_algorithm,
-            self._target_path_list+self._ignore_path_list,
-            self._ignore_directories))
-
-        other_arguments = _filter_non_files(
-            [self._reexecution_info['args_clean'],
-             self._reexecution_info['kwargs_clean']],
-            self._target_path_list,
-            self._ignore_path_list,
-            self._ignore_directories)
-
-        LOGGER.debug("file_stat_list: %s", file_stat_list)
-        LOGGER.debug("other_arguments: %s", other_arguments)
-
-        # add the file stat list to the already existing reexecution info
-        # dictionary that contains stats that should not change whether
-        # files have been created/updated/or not.
-        self._reexecution_info['file_stat_list'] = file_stat_list
-        self._reexecution_info['other_arguments'] = other_arguments
-
-        reexecution_string = '%s:%s:%s:%s:%s' % (
-            self._reexecution_info['func_name'],
-            self._reexecution_info['source_code_hash'],
-            self._reexecution_info['other_arguments'],
-            self._store_result,
-            # the x[2] is to only take the *hash* part of the 'file_stat'
-            str([x[2] for x in file_stat_list]))
-
-        self._task_reexecution_hash = hashlib.sha1(
-            reexecution_string.encode('utf-8')).hexdigest()
-        try:
-            database_result = _execute_sqlite(
-                """SELECT target_path_stats, result from taskgraph_data
-                    WHERE (task_reexecution_hash == ?)""",
-                self._task_database_path, mode='read_only',
-                argument_list=(self._task_reexecution_hash,), fetch='one')
-            if database_result is None:
-                LOGGER.debug(
-                    "not precalculated, Task hash does not "
-                    "exist (%s)", self.task_name)
-                LOGGER.debug("is_precalculated full task info: %s", self)
-                return False
-            result_target_path_stats = pickle.loads(database_result[0])
-            mismatched_target_file_list = []
-            for path, hash_algorithm, hash_string in result_target_path_stats:
-                if path not in self._target_path_list:
-                    mismatched_target_file_list.append(
-                        'Recorded path not in target path list %s' % path)
-                if not os.path.exists(path):
-                    mismatched_target_file_list.append(
-                        'Path not found: %s' % path)
-                    continue
-                elif hash_algorithm == 'exists':
-                    # this is the case where hash_algorithm == 'exists' but
-                    # we already know the file exists so we do nothing
-                    continue
-                if hash_algorithm == 'sizetimestamp':
-                    size, modified_time, actual_path = [
-                        x for x in hash_string.split('::')]
-                    if actual_path != path:
-                        mismatched_target_file_list.append(
-                            "Path names don't match\n"
-                            "cached: (%s)\nactual (%s)" % (path, actual_path))
-                    target_modified_time = os.path.getmtime(path)
-                    if not math.isclose(
-                            float(modified_time), target_modified_time):
-                        mismatched_target_file_list.append(
-                            "Modified times don't match "
-                            "cached: (%f) actual: (%f)" % (
-                                float(modified_time), target_modified_time))
-                        continue
-                    target_size = os.path.getsize(path)
-                    if float(size) != target_size:
-                        mismatched_target_file_list.append(
-                            "File sizes don't match "
-                            "cached: (%s) actual: (%s)" % (
-                                size, target_size))
-                else:
-                    target_hash = _hash_file(path, hash_algorithm)
-                    if hash_string != target_hash:
-                        mismatched_target_file_list.append(
-                            "File hashes are different. cached: (%s) "
-                            "actual: (%s)" % (hash_string, target_hash))
-            if mismatched_target_file_list:
-                LOGGER.info(
-                    "not precalculated (%s), Task hash exists, "
-                    "but there are these mismatches: %s",
-                    self.task_name, '\n'.join(mismatched_target_file_list))
-                return False
-            if self._store_result:
-                self._result = pickle.loads(database_result[1])
-            LOGGER.debug("precalculated (%s)" % self)
-            return True
-        except EOFError:
-            LOGGER.exception("not precalculated %s, EOFError", self.task_name)
-            return False
-
-    def join(self, timeout=None):
-        """Block until task is complete, raise exception if runtime failed."""
-        LOGGER.debug(
-            "joining %s done executing: %s", self.task_name,
-            self.task_done_executing_event)
-        successful_wait = self.task_done_executing_event.wait(timeout)
-        if self.exception_object:
-            raise self.exception_object
-        return successful_wait
-
-    def get(self, timeout=None):
-        """Return the result of the ``func`` once it is ready.
-
-        If ``timeout`` is None, this call blocks until the task is complete
-        determined by a call to ``.join()``. Otherwise will wait up to
-        ``timeout`` seconds before raising a``RuntimeError`` if exceeded.
-
-        Args:
-            timeout (float): if not None this parameter is a floating point
-                number specifying a timeout for the operation in seconds.
-
-        Returns:
-            value of the result
-
-        Raises:
-            RuntimeError when ``timeout`` exceeded.
-            ValueError if ``store_result`` was set to ``False`` when the task
-                was created.
-
-        """
-        if not self._store_result:
-            raise ValueError(
-                'must set `store_result` to True in `add_task` to invoke this '
-                'function')
-        timeout = not self.join(timeout)
-        if timeout:
-            raise RuntimeError('call to get timed out')
-        return self._result
-
-
-def _get_file_stats(
-        base_value, hash_algorithm, ignore_list,
-        ignore_directories):
-    """Return fingerprints of any filepaths in ``base_value``.
-
-    Args:
-        base_value: any python value. Any file paths in ``base_value``
-            should be processed with `_normalize_path`.
-        hash_algorithm (string): either a hash function id that
-            exists in hashlib.algorithms_available, 'exists', or
-            'sizetimestamp'. Any paths to actual files in the arguments will be
-            digested with this algorithm. If value is 'sizetimestamp' the
-            digest will only use the normed path, size, and timestamp of any
-            files found in the arguments. This value is used when
-            determining whether a task is precalculated or its target
-            files can be copied to an equivalent task. Note if
-            ``hash_algorithm`` is 'sizetimestamp' the task will require the
-            same base path files to determine equality. If it is a
-            ``hashlib`` algorithm only file contents will be considered. If
-            this value is 'exists' the value of the hash will be 'exists'.
-        ignore_list (list): any paths found in this list are not included
-            as part of the file stats. All paths in this list should be
-            "os.path.norm"ed.
-        ignore_directories (boolean): If True directories are not
-            considered for filestats.
-
-
-    Return:
-        list of (path, hash_algorithm, hash) tuples for any filepaths found in
-            base_value or nested in base value that are not otherwise
-            ignored by the input parameters.
-
-    """
-    if isinstance(base_value, _VALID_PATH_TYPES):
-        try:
-            norm_path = _normalize_path(base_value)
-            if norm_path not in ignore_list and (
-                    not os.path.isdir(norm_path) or
-                    not ignore_directories) and os.path.exists(norm_path):
-                if hash_algorithm == 'exists':
-                    yield (norm_path, 'exists', 'exists')
-                else:
-                    yield (
-                        norm_path, hash_algorithm,
-                        _hash_file(norm_path, hash_algorithm))
-        except (OSError, ValueError):
-            # I ran across a ValueError when one of the os.path functions
-            # interpreted the value as a path that was too long.
-            # OSErrors could happen if there's coincidentally a directory we
-            # can't read or it's not a file or something else out of our
-            # control
-            LOGGER.exception(
-                "base_value couldn't be analyzed somehow '%s'", base_value)
-    elif isinstance(base_value, dict):
-        for key in base_value.keys():
-            value = base_value[key]
-            for stat in _get_file_stats(
-                    value, hash_algorithm, ignore_list, ignore_directories):
-                yield stat
-    elif isinstance(base_value, (list, set, tuple)):
-        for value in base_value:
-            for stat in _get_file_stats(
-                    value, hash_algorithm, ignore_list, ignore_directories):
-                yield stat
-
-
-def _filter_non_files(
-        base_value, keep_list, ignore_list, keep_directories):
-    """Remove any values that are files not in ignore list or directories.
-
-    Args:
-        base_value: any python value. Any file paths in ``base_value``
-            should be "os.path.norm"ed before this function is called.
-            contains filepaths in any nested structure.
-        keep_list (list): any paths found in this list are not filtered.
-            All paths in this list should be "os.path.norm"ed.
-        ignore_list (list): any paths found in this list are filtered.
-        keep_directories (boolean): If True directories are not filtered
-            out.
-
-    Return:
-        original ``base_value`` with any nested file paths for files that
-        exist in the os.exists set to ``None``.
-
-    """
-    if isinstance(base_value, _VALID_PATH_TYPES):
-        try:
-            norm_path = _normalize_path(base_value)
-            if norm_path not in ignore_list and (
-                    norm_path in keep_list or ((
-                        os.path.isdir(norm_path) and keep_directories) or (
-                        not os.path.isfile(norm_path) and
-                        not os.path.isdir(norm_path)))):
-                return norm_path
-            return None
-        except (OSError, ValueError):
-            # I ran across a ValueError when one of the os.path functions
-            # interpreted the value as a path that was too long.
-            # OSErrors could happen if there's coincidentally a directory we
-            # can't read or it's not a file or something else out of our
-            # control
-            LOGGER.exception(
-                "base_value couldn't be analyzed somehow '%s'", base_value)
-    elif isinstance(base_value, dict):
-        return {
-            key: _filter_non_files(
-                value, keep_list, ignore_list, keep_directories)
-            for key, value in base_value.items()
-        }
-    elif isinstance(base_value, (list, set, tuple)):
-        return type(base_value)([
-            _filter_non_files(
-                value, keep_list, ignore_list, keep_directories)
-            for value in base_value])
-    else:
-        return base_value
-
-
-def _scrub_task_args(base_value, target_path_list):
-    """Attempt to convert ``base_value`` to canonical values.
-
-    Any paths in ``base_value`` are normalized, any paths that are also in
-    the``target_path_list`` are replaced with a placeholder so that if
-    all other arguments are the same in ``base_value`` except target path
-    name the function will hash to the same.
-
-    This function can be called before the Task dependencies are satisfied
-    since it doesn't inspect any file stats on disk.
-
-    Args:
-        base_value: any python value
-        target_path_list (list): a list of strings that if found in
-            ``base_value`` should be replaced with 'in_target_path' so
-
-    Returns:
-        base_value with any functions replaced as strings and paths in
-            ``target_path_list`` with a 'target_path_list[n]' placeholder.
-
-    """
-    if callable(base_value):
-        try:
-            if not hasattr(Task, 'func_source_map'):
-                Task.func_source_map = {}
-            # memoize func source code because it's likely we'll import
-            # the same func many times and reflection is slow
-            if base_value not in Task.func_source_map:
-                Task.func_source_map[base_value] = (
-                    inspect.getsource(base_value)).replace(
-                        ' ', '').replace('\t', '')
-            source_code = Task.func_source_map[base_value]
-        except (IOError, TypeError):
-            # many reasons for this, for example, frozen Python code won't
-            # have source code, so just leave blank
-            source_code = ''
-        return '%s:%s' % (base_value.__name__, source_code)
-    elif isinstance(base_value, dict):
-        result_dict = {}
-        for key in base_value.keys():
-            result_dict[key] = _scrub_task_args(
-                base_value[key], target_path_list)
-        return result_dict
-    elif isinstance(base_value, (list, set, tuple)):
-        result_list = []
-        for value in base_value:
-            result_list.append(_scrub_task_args(value, target_path_list))
-        return type(base_value)(result_list)
-    elif isinstance(base_value, _VALID_PATH_TYPES):
-        normalized_path = _normalize_path(base_value)
-        if normalized_path in target_path_list:
-            return 'in_target_path_list'
-        else:
-            return normalized_path
-    else:
-        return base_value
-
-
-def _hash_file(file_path, hash_algorithm, buf_size=2**20):
-    """Return a hex digest of ``file_path``.
-
-    Args:
-        file_path (string): path to file to hash.
-        hash_algorithm (string): a hash function id that exists in
-            hashlib.algorithms_available or 'sizetimestamp'. If function id
-            is in hashlib.algorithms_available, the file contents are hashed
-            with that function and the fingerprint is returned. If value is
-            'sizetimestamp' the size and timestamp of the file are returned
-            in a string of the form
-            '[sizeinbytes]:[lastmodifiedtime]'.
-        buf_size (int): number of bytes to read from ``file_path`` at a time
-            for digesting.
-
-    Returns:
-        a hash hex digest computed with hash algorithm ``hash_algorithm``
-        of the binary contents of the file located at ``file_path``.
-
-    """
-    if hash_algorithm == 'sizetimestamp':
-        norm_path = _normalize_path(file_path)
-        return '%d::%f::%s' % (
-            os.path.getsize(norm_path), os.path.getmtime(norm_path),
-            norm_path)
-    hash_func = hashlib.new(hash_algorithm)
-    with open(file_path, 'rb') as f:
-        binary_data = f.read(buf_size)
-        while binary_data:
-            hash_func.update(binary_data)
-            binary_data = f.read(buf_size)
-    return hash_func.hexdigest()
-
-
-def _normalize_path(path):
-    """Convert ``path`` into normalized, normcase, absolute filepath."""
-    norm_path = os.path.normpath(path)
-    try:
-        abs_path = os.path.abspath(norm_path)
-    except TypeError:
-        # this occurs when encountering VERY long strings that might be
-        # interpreted as paths
-        LOGGER.warning(
-            "failed to abspath %s so returning normalized path instead")
-        abs_path = norm_path
-    return os.path.normcase(abs_path)
-
-
-@retrying.retry(
-    wait_exponential_multiplier=500, wait_exponential_max=3200,
-    stop_max_attempt_number=100)
-def _execute_sqlite(
-        sqlite_command, database_path, argument_list=None,
-        mode='read_only', execute='execute', fetch=None):
-    """Execute SQLite command and attempt retries on a failure.
-
-    Args:
-        sqlite_command (str): a well formatted SQLite command.
-        database_path (str): path to the SQLite database to operate on.
-        argument_list (list): ``execute == 'execute'`` then this list is passed
-            to the internal sqlite3 ``execute`` call.
-        mode (str): must be either 'read_only' or 'modify'.
-        execute (str): must be either 'execute' or 'script'.
-        fetch (str): if not ``None`` can be either 'all' or 'one'.
-            If not None the result of a fetch will be returned by this
-            function.
-
-    Returns:
-        result of fetch if ``fetch`` is not None.
-
-    """
-    cursor = None
-    connection = None
-    try:
-        if mode == 'read_only':
-            ro_uri = r'%s?mode=ro' % pathlib.Path(
-                os.path.abspath(database_path)).as_uri()
-            LOGGER.debug(
-                '%s exists: %s', ro_uri, os.path.exists(os.path.abspath(
-                    database_path)))
-            connection = sqlite3.connect(ro_uri, uri=True)
-        elif mode == 'modify':
-            connection = sqlite3.connect(database_path)
-        else:
-            raise ValueError('Unknown mode: %s' % mode)
-
-        if execute == 'execute':
-            if argument_list is None:
-                cursor = connection.execute(sqlite_command)
-            else:
-                cursor = connection.execute(sqlite_command, argument_list)
-        elif execute == 'script':
-            cursor = connection.executescript(sqlite_command)
-        else:
-            raise ValueError('Unknown execute mode: %s' % execute)
-
-        result = None
-        payload = None
-        if fetch == 'all':
-            payload = (cursor.fetchall())
-        elif fetch == 'one':
-            payload = (cursor.fetchone())
-        elif fetch is not None:
-            raise ValueError('Unknown fetch mode: %s' % fetch)
-        if payload is not None:
-            result = list(payload)
-        cursor.close()
-        connection.commit()
-        connection.close()
-        cursor = None
-        connection = None
-        return result
-    except sqlite3.OperationalError:
-        LOGGER.warning(
-            'TaskGraph database is locked because another process is using '
-            'it, waiting for a bit of time to try again')
-        raise
-    except Exception:
-        LOGGER.exception('Exception on _execute_sqlite: %s', sqlite_command)
-        raise
-    finally:
-        if cursor is not None:
-            cursor.close()
-        if connection is not None:
-            connection.commit()
-            connection.close()
+"""Task graph framework."""
+import collections
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import multiprocessing.util
+import os
+import pathlib
+import pickle
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import retrying
+
+# Modules that are only needed by some features, such as ``sqlite3``,
+# ``inspect``, ``multiprocessing.pool`` and ``cProfile``, are imported in the
+# functions that use them, and ``http.server`` by the ``_metrics_server``
+# module, so that ``import taskgraph`` stays fast. ``test_import_time``
+# checks they aren't imported with taskgraph.
+try:
+    # written by setuptools_scm when the package is built or installed
+    from .version import version as __version__
+except ImportError:
+    try:
+        # only available in Python 3.8+
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        from pkg_resources import get_distribution
+        __version__ = get_distribution('taskgraph').version
+    else:
+        __version__ = importlib_metadata.version('taskgraph')
+
+
+_VALID_PATH_TYPES = (str, pathlib.Path)
+_TASKGRAPH_DATABASE_FILENAME = 'taskgraph_data.db'
+_TASKGRAPH_RESULT_STORE_DIRNAME = 'taskgraph_result_store'
+_TASKGRAPH_ARTIFACT_STORE_DIRNAME = 'taskgraph_artifact_store'
+# fingerprints with these "hash algorithms" don't identify file contents
+_NON_CONTENT_HASH_ALGORITHMS = ('sizetimestamp', 'exists', 'sampled')
+# the 'sampled' algorithm hashes the file size, the first and last blocks,
+# and this many evenly spaced interior blocks of this size
+_SAMPLED_HASH_BLOCK_SIZE = 2**16
+_SAMPLED_HASH_N_INTERIOR_BLOCKS = 16
+# ``store_result`` results that pickle to at least this many bytes are
+# written to the result store rather than the database by default
+_DEFAULT_RESULT_STORE_THRESHOLD = 2**16
+# prefix of a ``taskgraph_data.result`` value that refers to a result in the
+# result store. Pickled values always start with the PROTO opcode b'\x80'
+# so this can't be mistaken for an inline result.
+_RESULT_STORE_REFERENCE_PREFIX = b'taskgraph_result_store:'
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+    if psutil.WINDOWS:
+        # Windows' scheduler doesn't use POSIX niceness.
+        PROCESS_LOW_PRIORITY = psutil.BELOW_NORMAL_PRIORITY_CLASS
+    else:
+        # On POSIX, use system niceness.
+        # -20 is high priority, 0 is normal priority, 19 is low priority.
+        # 10 here is an arbitrary selection that's probably nice enough.
+        PROCESS_LOW_PRIORITY = 10
+except ImportError:
+    HAS_PSUTIL = False
+
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+
+try:
+    import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+try:
+    # not available on Windows
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+try:
+    # not available on Windows
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+try:
+    # only available in Python 3.8+
+    from multiprocessing import shared_memory
+    HAS_SHARED_MEMORY = True
+except ImportError:
+    HAS_SHARED_MEMORY = False
+
+try:
+    # inotify is only available on Linux, there's no wrapper for it in the
+    # standard library so it's called from libc directly
+    # the symbols of the running process include libc, this avoids
+    # ``ctypes.util.find_library`` which runs ldconfig in a subprocess
+    import ctypes
+    _LIBC = ctypes.CDLL(None, use_errno=True)
+    _LIBC.inotify_init1
+    _LIBC.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    HAS_INOTIFY = True
+except (ImportError, OSError, AttributeError, TypeError):
+    HAS_INOTIFY = False
+
+LOGGER = logging.getLogger(__name__)
+_MAX_TIMEOUT = 5.0  # amount of time to wait for threads to terminate
+
+# function fingerprints are memoized because it's likely we'll see the same
+# function many times and ``inspect.getsource`` reads and tokenizes the whole
+# source file. Entries are keyed by code object identity rather than function
+# object so lambdas and closures created in a loop share one entry, and the
+# least recently used entries are evicted past this size.
+_MAX_FUNC_FINGERPRINT_CACHE_SIZE = 1024
+_FUNC_FINGERPRINT_CACHE = collections.OrderedDict()
+_FUNC_FINGERPRINT_CACHE_LOCK = threading.Lock()
+_VALID_FUNC_FINGERPRINT_MODES = ('source', 'bytecode')
+
+# 'self' fingerprints a directory argument like a file, and 'tree'
+# fingerprints everything under it with ``_hash_directory``
+_VALID_DIRECTORY_FINGERPRINT_MODES = ('self', 'tree')
+# fingerprints of files found while fingerprinting directory trees, keyed
+# by (path, hash_algorithm) and reused while the file's stat is unchanged.
+# The least recently used entries are evicted past this size.
+_MAX_DIRECTORY_FILE_CACHE_SIZE = 2**16
+_DIRECTORY_FILE_CACHE = collections.OrderedDict()
+_DIRECTORY_FILE_CACHE_LOCK = threading.Lock()
+_MAX_DIRECTORY_WALK_THREADS = min(8, (os.cpu_count() or 1) * 2)
+
+# protocol 5 (Python 3.8+) allows large buffers such as numpy arrays to be
+# pickled out-of-band rather than copied into the pickle stream
+_PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+_OUT_OF_BAND_PICKLE = _PICKLE_PROTOCOL >= 5
+
+# ``copy_strategy`` values in the order they fall back to each other. A
+# reflink is a copy-on-write clone that shares blocks with the original on
+# filesystems that support it (btrfs, XFS), 'kernel' copies within the kernel
+# with ``os.copy_file_range`` or ``os.sendfile``, and 'buffered' reads and
+# writes through Python. 'auto' is the same as 'reflink'.
+_COPY_STRATEGY_LIST = ['reflink', 'kernel', 'buffered']
+_VALID_COPY_STRATEGIES = ['auto'] + _COPY_STRATEGY_LIST
+# ioctl request number to clone a file on Linux, from linux/fs.h
+_FICLONE = 0x40049409
+# files are copied in chunks of this many bytes, chunks of all the files in
+# a copy are processed concurrently with up to ``_MAX_COPY_THREADS`` threads
+_COPY_CHUNK_SIZE = 2**26
+_MAX_COPY_THREADS = min(8, os.cpu_count() or 1)
+
+# a buffer that has been copied to a ``shared_memory.SharedMemory`` block so
+# only this handle needs to be sent through the worker pool pipe
+_SharedMemoryHandle = collections.namedtuple(
+    '_SharedMemoryHandle', ['name', 'size'])
+
+# a pickled ``func`` result returned from a worker, ``payload`` and the
+# elements of ``buffer_list`` may be ``_SharedMemoryHandle``s
+_SerializedResult = collections.namedtuple(
+    '_SerializedResult', ['payload', 'buffer_list'])
+
+# a file fingerprint algorithm usable as a ``hash_algorithm``. ``new`` takes
+# no arguments and returns an object with ``hashlib``'s ``update`` and
+# ``hexdigest`` methods. ``hash_file`` is None or a function that takes a
+# path and returns the same hex digest as ``new`` would for its contents,
+# for example by reading in parallel.
+_HashAlgorithm = collections.namedtuple(
+    '_HashAlgorithm', ['new', 'hash_file'])
+# maps ``hash_algorithm`` names to ``_HashAlgorithm``s, names not in here
+# are passed to ``hashlib.new``
+_HASH_ALGORITHM_REGISTRY = {}
+# leaf size of the 'blake2b_tree' hash, leaves are hashed in parallel
+_BLAKE2B_TREE_LEAF_SIZE = 2**23
+
+# inotify event flags from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_UNMOUNT = 0x00002000
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+# any of these events on a file in a watched directory may change its
+# fingerprint
+_FILE_WATCHER_EVENT_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+    _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+# struct inotify_event is followed by a null padded name of length ``len``
+_INOTIFY_EVENT_STRUCT = struct.Struct('iIII')
+# the watcher is shared by every TaskGraph in the process so its cache
+# survives a graph being rebuilt
+_FILE_WATCHER = None
+_FILE_WATCHER_LOCK = threading.Lock()
+
+# the ``func`` result, target fingerprints recorded by ``open_target``, the
+# ``time.time`` ``func`` started, seconds spent in ``func``, the worker's
+# process id, and the ``_ResourceUsage`` of ``func`` or None returned from a
+# worker by ``_call_in_worker``
+_TrackedResult = collections.namedtuple(
+    '_TrackedResult', [
+        'result', 'target_fingerprint_map', 'func_start_timestamp',
+        'func_time', 'pid', 'resource_usage'])
+
+# resources used by a ``func`` call in a worker process: seconds of user and
+# system CPU time, the peak resident set size in bytes or None if it can't be
+# measured per call, and the number of block input and output operations
+_RESOURCE_USAGE_FIELD_LIST = [
+    'user_time', 'system_time', 'max_rss', 'block_input', 'block_output']
+_ResourceUsage = collections.namedtuple(
+    '_ResourceUsage', _RESOURCE_USAGE_FIELD_LIST)
+# writing this to /proc/self/clear_refs resets the peak resident set size of
+# the process on Linux so it can be measured for each call in a worker. Only
+# ``VmHWM`` in /proc/self/status is reset, ``ru_maxrss`` is not, and a
+# spawned worker's ``ru_maxrss`` starts at the peak of its parent
+_CLEAR_REFS_RESET_PEAK_RSS = b'5'
+
+# in a worker process of a TaskGraph with ``profile_workers`` set this is the
+# queue each ``func`` call's profile is sent to, see
+# ``_initialize_worker_profiling``
+_WORKER_PROFILE_QUEUE = None
+_PROFILE_SORT_KEY_LIST = ['ncalls', 'tottime', 'cumtime']
+
+# in a worker process this is the ``_BatchingQueueHandler`` that forwards log
+# records to the main process, it's flushed after every ``func`` call
+_WORKER_LOG_HANDLER = None
+# a worker sends its log records once this many are buffered or the oldest
+# has been buffered this many seconds, whichever comes first
+_LOG_BATCH_SIZE = 64
+_LOG_BATCH_INTERVAL = 0.5
+# must run before the finalizer that closes the logging queue's feeder
+# thread in an exiting worker, which has an exit priority of 10
+_LOG_FLUSH_EXIT_PRIORITY = 20
+
+# upper bounds in seconds of the buckets of the task time histograms in
+# ``_TaskGraphMetrics``
+_METRICS_HISTOGRAM_BUCKET_LIST = [
+    0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0, 1800.0, 3600.0,
+    float('inf')]
+# the runtimes of this many of the most recent executions of a task are kept
+# in the ``task_runtime_history`` table, estimates use their median
+_RUNTIME_HISTORY_LENGTH = 9
+# an executing task is reported as a straggler by ``_execution_monitor`` if
+# it has run for this many times its median historical runtime, and at
+# least ``_STRAGGLER_MIN_RUNTIME`` seconds
+_STRAGGLER_RUNTIME_FACTOR = 3.0
+_STRAGGLER_MIN_RUNTIME = 1.0
+# seconds between writes of ``metrics_textfile_path``
+_METRICS_TEXTFILE_INTERVAL = 5.0
+# number of times ``_execute_sqlite`` found the database locked and retried,
+# across all TaskGraphs in the process
+_SQLITE_RETRY_COUNT = 0
+_SQLITE_RETRY_COUNT_LOCK = threading.Lock()
+
+# phases of a Task's life that are timed, in the order they occur:
+#   queue_wait: waiting for an executor thread once dependencies are met
+#   input_fingerprint: fingerprinting input files in ``is_precalculated``
+#   db_lookup: looking up the previous run in the database
+#   target_verify: checking targets against the previous run
+#   artifact_copy: copying duplicate artifacts
+#   execute: calling ``func``, including any worker pool round trip
+#   func: time spent in ``func`` itself, part of ``execute``
+#   target_fingerprint: fingerprinting targets after ``func`` returns
+#   artifact_ingest: adding targets to the artifact store
+#   db_write: recording the run in the database
+_TASK_PHASE_LIST = [
+    'queue_wait', 'input_fingerprint', 'db_lookup', 'target_verify',
+    'artifact_copy', 'execute', 'func', 'target_fingerprint',
+    'artifact_ingest', 'db_write']
+
+# ``open_target`` reads the hash algorithm of the ``Task`` being executed by
+# the current thread from here
+_TASK_CONTEXT = threading.local()
+
+# these types are always picklable so there's no need to pickle them to
+# find out
+_TRIVIALLY_PICKLABLE_TYPES = (
+    type(None), bool, int, float, complex, str, bytes, bytearray)
+
+
+# We want our processing pool to be nondeamonic so that workers could use
+# multiprocessing if desired (deamonic processes cannot start new processes)
+# the following bit of code to do this was taken from
+# https://stackoverflow.com/a/8963618/42897
+class NoDaemonProcess(multiprocessing.Process):
+    """Make 'daemon' attribute always return False."""
+    @property
+    def daemon(self):
+        """Return False indicating not a daemon process."""
+        return False
+
+    @daemon.setter
+    def daemon(self, value):
+        """Do not allow daemon value to be overriden."""
+        pass
+
+
+class NoDaemonContext(type(multiprocessing.get_context('spawn'))):
+    """From https://stackoverflow.com/a/8963618/42897.
+
+    "As the current implementation of multiprocessing [3.7+] has been
+    extensively refactored to be based on contexts, we need to provide a
+    NoDaemonContext class that has our NoDaemonProcess as attribute.
+    [NonDaemonicPool] will then use that context instead of the default
+    one." "spawn" is chosen as default since that is the default and only
+    context option for Windows and is the default option for Mac OS as
+    well since 3.8.
+
+    """
+    Process = NoDaemonProcess
+
+
+class NonDaemonicPool(object):
+    """NonDaemonic Process Pool.
+
+    Wraps a ``multiprocessing.pool.Pool`` of ``NoDaemonProcess`` workers,
+    whose methods are available on this object, so ``multiprocessing.pool``
+    is only imported if a pool is created.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Create the wrapped pool with the ``NoDaemonContext``."""
+        import multiprocessing.pool
+        kwargs['context'] = NoDaemonContext()
+        self._pool = multiprocessing.pool.Pool(*args, **kwargs)
+
+    def __getattr__(self, name):
+        """Return the ``name`` attribute of the wrapped pool."""
+        if name == '_pool':
+            # not created yet, don't recurse looking for it
+            raise AttributeError(name)
+        return getattr(self._pool, name)
+
+    def __enter__(self):
+        """Enter the wrapped pool's context."""
+        self._pool.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Terminate the wrapped pool."""
+        self._pool.__exit__(exc_type, exc_value, traceback)
+
+
+def _null_func():
+    """Used when func=None on add_task."""
+    return None
+
+
+def register_hash_algorithm(name, new_hash_func, hash_file_func=None):
+    """Register a file fingerprint algorithm for use as ``hash_algorithm``.
+
+    Algorithms must be registered when a module is imported, not only in a
+    ``__main__`` block, to be available to ``open_target`` in worker
+    processes. Targets are still fingerprinted correctly if not, they are
+    just read again after the function returns.
+
+    Args:
+        name (str): value to pass as ``hash_algorithm`` to ``add_task``.
+            This overrides ``hashlib`` algorithms with the same name.
+        new_hash_func (callable): takes no arguments and returns a new
+            object with ``update(bytes)`` and ``hexdigest()`` methods like
+            ``hashlib`` hash objects.
+        hash_file_func (callable): optional function that takes a file path
+            and returns the same hex digest ``new_hash_func`` would produce
+            for the file's contents. Use this to provide a faster whole
+            file implementation, for example one that reads in parallel.
+
+    Returns:
+        None.
+
+    """
+    _HASH_ALGORITHM_REGISTRY[name] = _HashAlgorithm(
+        new_hash_func, hash_file_func)
+
+
+def _new_hash(hash_algorithm):
+    """Return a new hash object for a registered or ``hashlib`` algorithm.
+
+    Raises:
+        ValueError if ``hash_algorithm`` is unknown.
+
+    """
+    if hash_algorithm in _HASH_ALGORITHM_REGISTRY:
+        return _HASH_ALGORITHM_REGISTRY[hash_algorithm].new()
+    return hashlib.new(hash_algorithm)
+
+
+def _is_content_hash_algorithm(hash_algorithm):
+    """Return True if ``hash_algorithm`` is a known content hash."""
+    return (
+        hash_algorithm in _HASH_ALGORITHM_REGISTRY or
+        hash_algorithm in hashlib.algorithms_available)
+
+
+class _Blake2bTreeHash(object):
+    """Sequential implementation of the 'blake2b_tree' hash.
+
+    The input is split into ``_BLAKE2B_TREE_LEAF_SIZE`` byte leaves that are
+    each hashed with BLAKE2b using its tree hashing parameters, then the
+    concatenated leaf digests are hashed as the root node. Since the leaves
+    are independent ``_hash_file_blake2b_tree`` can hash them in parallel,
+    which is much faster on large files than a sequential hash.
+
+    """
+
+    def __init__(self):
+        """Create an empty hash."""
+        self._leaf_digest_list = []
+        self._buffer = bytearray()
+
+    def update(self, data):
+        """Add ``data`` to the hash."""
+        self._buffer += data
+        # always keep the last leaf buffered since it has to be flagged as
+        # the last node, and only ``hexdigest`` knows it's the last
+        while len(self._buffer) > _BLAKE2B_TREE_LEAF_SIZE:
+            self._leaf_digest_list.append(_blake2b_tree_leaf(
+                self._buffer[:_BLAKE2B_TREE_LEAF_SIZE],
+                len(self._leaf_digest_list), False))
+            del self._buffer[:_BLAKE2B_TREE_LEAF_SIZE]
+
+    def hexdigest(self):
+        """Return the hex digest of the data added so far."""
+        return _blake2b_tree_root(self._leaf_digest_list + [
+            _blake2b_tree_leaf(
+                self._buffer, len(self._leaf_digest_list), True)])
+
+
+def _blake2b_tree_leaf(data, node_offset, last_node):
+    """Return the digest of a 'blake2b_tree' leaf node."""
+    return hashlib.blake2b(
+        data, digest_size=32, fanout=0, depth=2,
+        leaf_size=_BLAKE2B_TREE_LEAF_SIZE, node_offset=node_offset,
+        node_depth=0, inner_size=32, last_node=last_node).digest()
+
+
+def _blake2b_tree_root(leaf_digest_list):
+    """Return the hex digest of a 'blake2b_tree' from its leaf digests."""
+    return hashlib.blake2b(
+        b''.join(leaf_digest_list), digest_size=32, fanout=0, depth=2,
+        leaf_size=_BLAKE2B_TREE_LEAF_SIZE, node_offset=0, node_depth=1,
+        inner_size=32, last_node=True).hexdigest()
+
+
+def _hash_file_blake2b_tree(file_path):
+    """Return the 'blake2b_tree' hex digest of a file.
+
+    Leaves are read and hashed in parallel threads, ``hashlib`` releases the
+    GIL while hashing so this uses multiple cores.
+
+    """
+    import concurrent.futures
+    file_size = os.path.getsize(file_path)
+    n_leaves = max(1, math.ceil(file_size / _BLAKE2B_TREE_LEAF_SIZE))
+
+    def _hash_leaf(node_offset):
+        with open(file_path, 'rb') as leaf_file:
+            leaf_file.seek(node_offset * _BLAKE2B_TREE_LEAF_SIZE)
+            return _blake2b_tree_leaf(
+                leaf_file.read(_BLAKE2B_TREE_LEAF_SIZE), node_offset,
+                node_offset == n_leaves-1)
+
+    if n_leaves == 1:
+        return _blake2b_tree_root([_hash_leaf(0)])
+    with concurrent.futures.ThreadPoolExecutor(
+            min(n_leaves, os.cpu_count() or 1)) as executor:
+        return _blake2b_tree_root(
+            list(executor.map(_hash_leaf, range(n_leaves))))
+
+
+register_hash_algorithm(
+    'blake2b_tree', _Blake2bTreeHash, _hash_file_blake2b_tree)
+if HAS_XXHASH:
+    register_hash_algorithm('xxh3_64', xxhash.xxh3_64)
+    register_hash_algorithm('xxh3_128', xxhash.xxh3_128)
+if HAS_BLAKE3:
+    # blake3 can hash large updates with multiple threads itself
+    register_hash_algorithm(
+        'blake3', lambda: blake3.blake3(max_threads=blake3.blake3.AUTO))
+
+
+def open_target(path, mode='wb', **kwargs):
+    """Open a ``Task`` target file for writing and fingerprint it as written.
+
+    When called from a function executing as a ``Task``, the returned file
+    hashes the bytes written to it with the ``Task``'s ``hash_algorithm``
+    and reports the fingerprint to ``TaskGraph`` when it is closed. The
+    ``Task`` then doesn't need to read the whole file again to fingerprint
+    it after the function returns. If the file is written anywhere other
+    than sequentially from the start, or is modified after it is closed,
+    the ``Task`` fingerprints it normally. Otherwise, for example when not
+    called from a ``Task`` or when the ``Task`` uses 'sizetimestamp', this
+    is the same as ``open``.
+
+    Only the thread that executes the ``Task`` function is tracked, files
+    opened in other threads or processes it starts are fingerprinted
+    normally.
+
+    Args:
+        path (str): path to the target file to write.
+        mode (str): one of 'w', 'wb', 'x', or 'xb'.
+        **kwargs: passed to ``io.TextIOWrapper`` in text mode (e.g.
+            ``encoding``, ``newline``) or ``open``.
+
+    Returns:
+        a writable file object.
+
+    """
+    hash_algorithm = getattr(_TASK_CONTEXT, 'hash_algorithm', None)
+    if (hash_algorithm is None or
+            not _is_content_hash_algorithm(hash_algorithm) or
+            mode not in ('w', 'wb', 'x', 'xb')):
+        return open(path, mode, **kwargs)
+    buffered_writer = io.BufferedWriter(_HashingWriter(
+        path, mode.replace('b', ''), hash_algorithm,
+        _TASK_CONTEXT.target_fingerprint_map))
+    if 'b' in mode:
+        return buffered_writer
+    return io.TextIOWrapper(buffered_writer, **kwargs)
+
+
+class _HashingWriter(io.RawIOBase):
+    """Raw file writer that fingerprints the bytes written to it."""
+
+    def __init__(self, path, mode, hash_algorithm, target_fingerprint_map):
+        """Open ``path`` for writing.
+
+        Args:
+            path (str): path to the file to write.
+            mode (str): either 'w' or 'x'.
+            hash_algorithm (str): a registered or ``hashlib`` algorithm
+                name.
+            target_fingerprint_map (dict): the fingerprint of the file is
+                recorded here when it is closed, see
+                ``_call_with_target_tracking``.
+
+        """
+        super(_HashingWriter, self).__init__()
+        self._path = _normalize_path(path)
+        self._hash_algorithm = hash_algorithm
+        self._target_fingerprint_map = target_fingerprint_map
+        self._hash_func = _new_hash(hash_algorithm)
+        self._file = io.FileIO(path, mode)
+
+    def writable(self):
+        """Return True, this is a writer."""
+        return True
+
+    def seekable(self):
+        """Return False since the hash requires sequential writes."""
+        return False
+
+    def fileno(self):
+        """Return the underlying file descriptor."""
+        return self._file.fileno()
+
+    def write(self, buffer):
+        """Write and hash ``buffer``."""
+        n_bytes = self._file.write(buffer)
+        self._hash_func.update(memoryview(buffer)[:n_bytes])
+        return n_bytes
+
+    def close(self):
+        """Close the file and record its fingerprint."""
+        if self.closed:
+            return
+        try:
+            self._file.close()
+            file_stat = os.stat(self._path)
+            self._target_fingerprint_map[self._path] = (
+                self._hash_algorithm, self._hash_func.hexdigest(),
+                file_stat.st_size, file_stat.st_mtime_ns)
+        finally:
+            super(_HashingWriter, self).close()
+
+
+def _call_with_target_tracking(
+        target_hash_algorithm, func, args, kwargs):
+    """Call ``func`` so ``open_target`` uses ``target_hash_algorithm``.
+
+    Args:
+        target_hash_algorithm (str): hash algorithm of the calling ``Task``'s
+            targets.
+        func (callable): function to call.
+        args (list): arguments for ``func``.
+        kwargs (dict): keyword arguments for ``func``.
+
+    Returns:
+        tuple of the result of ``func(*args, **kwargs)`` and a dict mapping
+        the normalized paths of files written with ``open_target`` during
+        the call to (hash_algorithm, fingerprint, size, mtime_ns) tuples.
+        The dict belongs to this call so nothing outlives it, even if
+        ``func`` raises an exception.
+
+    """
+    target_fingerprint_map = {}
+    _TASK_CONTEXT.hash_algorithm = target_hash_algorithm
+    _TASK_CONTEXT.target_fingerprint_map = target_fingerprint_map
+    try:
+        return func(*args, **kwargs), target_fingerprint_map
+    finally:
+        _TASK_CONTEXT.hash_algorithm = None
+        _TASK_CONTEXT.target_fingerprint_map = None
+
+
+def _call_serialized(
+        payload, buffer_list, shared_memory_threshold=None,
+        return_result=True, target_hash_algorithm=None):
+    """Unpickle and invoke a payload made by ``_serialize_payload``.
+
+    This is dispatched to the worker pool when large buffers of the call are
+    passed through shared memory, so the pool only pickles their handles.
+
+    Args:
+        payload (bytes or _SharedMemoryHandle): pickled
+            ``(func, args, kwargs)`` tuple.
+        buffer_list (list): out-of-band buffers referenced by ``payload``,
+            any of which may be a ``_SharedMemoryHandle``.
+        shared_memory_threshold, return_result, target_hash_algorithm: see
+            ``_call_in_worker``.
+
+    Returns:
+        see ``_call_in_worker``.
+
+    """
+    payload = _read_shared_buffer(payload)
+    buffer_list = [_read_shared_buffer(buffer) for buffer in buffer_list]
+    if _OUT_OF_BAND_PICKLE:
+        func, args, kwargs = pickle.loads(payload, buffers=buffer_list)
+    else:
+        func, args, kwargs = pickle.loads(payload)
+    # drop references to the inputs as soon as they're not needed
+    payload = None
+    buffer_list = None
+    return _call_in_worker(
+        func, args, kwargs, shared_memory_threshold, return_result,
+        target_hash_algorithm)
+
+
+def _call_in_worker(
+        func, args, kwargs, shared_memory_threshold=None, return_result=True,
+        target_hash_algorithm=None):
+    """Invoke ``func`` in a worker process and prepare its result.
+
+    Args:
+        func (callable): function to call.
+        args (list): arguments for ``func``.
+        kwargs (dict): keyword arguments for ``func``.
+        shared_memory_threshold (int): if not None, the result of ``func``
+            is returned as a ``_SerializedResult`` and any part of it at
+            least this many bytes is placed in shared memory.
+        return_result (bool): if False, the result of ``func`` is discarded
+            rather than sent back to the parent process.
+        target_hash_algorithm (str): if not None, ``func`` is called so that
+            targets written with ``open_target`` are fingerprinted with
+            this algorithm, and the return value is a ``_TrackedResult``
+            that includes those fingerprints.
+
+    Returns:
+        result of ``func(*args, **kwargs)``, a ``_SerializedResult`` of it
+        if ``shared_memory_threshold`` is not None, or None if
+        ``return_result`` is False. This is wrapped in a ``_TrackedResult``
+        if ``target_hash_algorithm`` is not None.
+
+    """
+    if target_hash_algorithm is None:
+        return _call_and_measure(
+            func, args, kwargs, shared_memory_threshold, return_result)[0]
+    measured_result, target_fingerprint_map = _call_with_target_tracking(
+        target_hash_algorithm, _call_and_measure,
+        (func, args, kwargs, shared_memory_threshold, return_result), {})
+    result, func_start_timestamp, func_time, resource_usage = (
+        measured_result)
+    return _TrackedResult(
+        result, target_fingerprint_map, func_start_timestamp, func_time,
+        os.getpid(), resource_usage)
+
+
+def _call_and_measure(
+        func, args, kwargs, shared_memory_threshold, return_result):
+    """Invoke ``func`` for ``_call_in_worker`` and prepare its result.
+
+    Returns:
+        tuple of the result for ``_call_in_worker``, the ``time.time``
+        ``func`` was called, the number of seconds spent in ``func``, and
+        the ``_ResourceUsage`` of ``func`` or None if it can't be measured.
+
+    """
+    start_usage = None
+    peak_rss_reset = False
+    if HAS_RESOURCE:
+        peak_rss_reset = _reset_peak_rss()
+        start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    func_start_timestamp = time.time()
+    start_time = time.perf_counter()
+    try:
+        if _WORKER_PROFILE_QUEUE is None:
+            result = func(*args, **kwargs)
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _WORKER_PROFILE_QUEUE.put(
+                    _get_function_profile_map(profiler))
+    finally:
+        # send whatever ``func`` logged now rather than when the batch is due
+        if _WORKER_LOG_HANDLER is not None:
+            _WORKER_LOG_HANDLER.flush()
+    func_time = time.perf_counter() - start_time
+    resource_usage = None
+    if start_usage is not None:
+        end_usage = resource.getrusage(resource.RUSAGE_SELF)
+        resource_usage = _ResourceUsage(
+            end_usage.ru_utime - start_usage.ru_utime,
+            end_usage.ru_stime - start_usage.ru_stime,
+            _read_peak_rss() if peak_rss_reset else None,
+            end_usage.ru_inblock - start_usage.ru_inblock,
+            end_usage.ru_oublock - start_usage.ru_oublock)
+    if not return_result:
+        return None, func_start_timestamp, func_time, resource_usage
+    if shared_memory_threshold is None:
+        return result, func_start_timestamp, func_time, resource_usage
+
+    result_payload, result_buffer_list = _serialize_payload(
+        result, out_of_band_threshold=shared_memory_threshold)
+    result = None
+    shared_memory_list = []
+    try:
+        serialized_result = _SerializedResult(
+            _share_buffer(
+                result_payload, shared_memory_threshold,
+                shared_memory_list),
+            [_share_buffer(
+                buffer, shared_memory_threshold, shared_memory_list)
+             for buffer in result_buffer_list])
+        return (
+            serialized_result, func_start_timestamp, func_time,
+            resource_usage)
+    except BaseException:
+        # the parent never gets handles to these blocks so free them here
+        for shared_memory_block in shared_memory_list:
+            shared_memory_block.unlink()
+        raise
+    finally:
+        # the blocks stay allocated until the parent unlinks them in
+        # ``_load_serialized_result``
+        for shared_memory_block in shared_memory_list:
+            shared_memory_block.close()
+
+
+def _reset_peak_rss():
+    """Reset the peak resident set size reported by ``_read_peak_rss``.
+
+    This is only possible on Linux.
+
+    Returns:
+        True if the peak was reset, False otherwise.
+
+    """
+    try:
+        with open('/proc/self/clear_refs', 'wb') as clear_refs_file:
+            clear_refs_file.write(_CLEAR_REFS_RESET_PEAK_RSS)
+        return True
+    except OSError:
+        return False
+
+
+def _read_peak_rss():
+    """Read the peak resident set size since ``_reset_peak_rss``.
+
+    Returns:
+        ``VmHWM`` of /proc/self/status in bytes, or None if it can't be
+        read.
+
+    """
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    # reported in kB
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _serialize_payload(*payload_tuple, out_of_band_threshold=None):
+    """Pickle ``payload_tuple`` once for dispatch.
+
+    Args:
+        payload_tuple: values to pickle, typically ``func``, ``args``, and
+            ``kwargs`` or a single ``func`` result.
+        out_of_band_threshold (int): if not None, only buffers of at least
+            this many bytes are kept out of band, smaller ones are pickled
+            into ``payload``.
+
+    Returns:
+        tuple of (payload, buffer_list). If there is more than one value in
+        ``payload_tuple`` ``payload`` unpickles to a tuple of them, otherwise
+        to the single value. ``buffer_list`` contains memoryviews of any
+        out-of-band buffers (e.g. large numpy arrays) if the Python version
+        supports pickle protocol 5, otherwise it is empty.
+
+    Raises:
+        any exception raised by ``pickle`` if the payload is not picklable.
+
+    """
+    if len(payload_tuple) == 1:
+        payload_tuple = payload_tuple[0]
+    if not _OUT_OF_BAND_PICKLE:
+        return pickle.dumps(payload_tuple, _PICKLE_PROTOCOL), []
+    buffer_list = []
+
+    def _buffer_callback(pickle_buffer):
+        """Return True to pickle ``pickle_buffer`` in band."""
+        buffer = pickle_buffer.raw()
+        if (out_of_band_threshold is not None and
+                buffer.nbytes < out_of_band_threshold):
+            return True
+        buffer_list.append(buffer)
+        return False
+
+    payload = pickle.dumps(
+        payload_tuple, _PICKLE_PROTOCOL, buffer_callback=_buffer_callback)
+    return payload, buffer_list
+
+
+def _share_buffer(buffer, shared_memory_threshold, shared_memory_list):
+    """Prepare ``buffer`` to be sent through a worker pool pipe.
+
+    Args:
+        buffer (bytes-like): contiguous buffer to send.
+        shared_memory_threshold (int): if not None and ``buffer`` is at least
+            this many bytes it is copied to a new shared memory block and
+            a handle is returned instead.
+        shared_memory_list (list): any shared memory block created by this
+            call is appended here so the caller can close or unlink it.
+
+    Returns:
+        ``buffer`` as ``bytes`` or a ``_SharedMemoryHandle`` to its copy.
+        ``PickleBuffer`` memoryviews can only be pickled with protocol 5 but
+        the worker pool uses the default protocol, so they are converted.
+        ``_serialize_payload`` keeps buffers under the threshold in band so
+        this only happens when shared memory is unavailable.
+
+    """
+    size = memoryview(buffer).nbytes
+    if (not HAS_SHARED_MEMORY or shared_memory_threshold is None or
+            size == 0 or size < shared_memory_threshold):
+        if isinstance(buffer, bytes):
+            return buffer
+        return memoryview(buffer).tobytes()
+    shared_memory_block = shared_memory.SharedMemory(create=True, size=size)
+    shared_memory_list.append(shared_memory_block)
+    shared_memory_block.buf[:size] = memoryview(buffer).cast('B')
+    return _SharedMemoryHandle(shared_memory_block.name, size)
+
+
+def _read_shared_buffer(buffer, unlink=False):
+    """Return the contents of a buffer prepared by ``_share_buffer``.
+
+    Args:
+        buffer (bytes-like or _SharedMemoryHandle): if a handle, its shared
+            memory block is mapped and a view of it is returned without
+            copying, otherwise ``buffer`` is returned as is.
+        unlink (bool): if True the shared memory block is unlinked once it
+            is mapped. Its memory is freed when the last view of it, which
+            may be held by objects unpickled from it, is released.
+
+    Returns:
+        bytes-like contents of ``buffer``.
+
+    """
+    if not isinstance(buffer, _SharedMemoryHandle):
+        return buffer
+    import mmap
+    shared_memory_block = shared_memory.SharedMemory(name=buffer.name)
+    try:
+        # map the block separately from ``shared_memory_block`` since that
+        # can't be closed while unpickled objects still reference its
+        # memory, this mapping is closed when the last view is released
+        if os.name == 'nt':
+            block_mmap = mmap.mmap(-1, buffer.size, tagname=buffer.name)
+        else:
+            block_mmap = mmap.mmap(shared_memory_block._fd, buffer.size)
+    finally:
+        shared_memory_block.close()
+        if unlink:
+            shared_memory_block.unlink()
+    return memoryview(block_mmap)
+
+
+def _free_shared_buffer(buffer):
+    """Unlink the shared memory block of ``buffer`` if it still exists.
+
+    Args:
+        buffer (bytes-like or _SharedMemoryHandle): buffer prepared by
+            ``_share_buffer``.
+
+    Returns:
+        None.
+
+    """
+    if not isinstance(buffer, _SharedMemoryHandle):
+        return
+    try:
+        shared_memory_block = shared_memory.SharedMemory(name=buffer.name)
+    except FileNotFoundError:
+        return
+    shared_memory_block.close()
+    shared_memory_block.unlink()
+
+
+def _load_serialized_result(serialized_result):
+    """Unpickle a ``_SerializedResult`` and free its shared memory.
+
+    Args:
+        serialized_result (_SerializedResult): result returned by
+            ``_call_in_worker``.
+
+    Returns:
+        the original ``func`` result.
+
+    """
+    buffer_list = [serialized_result.payload] + list(
+        serialized_result.buffer_list)
+    view_list = []
+    try:
+        for buffer in buffer_list:
+            view_list.append(_read_shared_buffer(buffer, unlink=True))
+    finally:
+        # don't leave blocks behind if mapping an earlier one failed
+        for buffer in buffer_list[len(view_list):]:
+            _free_shared_buffer(buffer)
+    payload = view_list.pop(0)
+    if _OUT_OF_BAND_PICKLE:
+        return pickle.loads(payload, buffers=view_list)
+    return pickle.loads(payload)
+
+
+class _NullWriter(object):
+    """File-like object that discards anything written to it."""
+
+    def write(self, data):
+        """Discard ``data``."""
+        pass
+
+
+def _is_picklable(base_value):
+    """Return True if ``base_value`` can be pickled.
+
+    Values composed only of builtin scalars, strings, and builtin
+    containers are checked without pickling. Anything else is pickled to a
+    writer that discards the output so large arguments aren't duplicated in
+    memory just to check them.
+
+    Args:
+        base_value: any python value.
+
+    Returns:
+        True if ``base_value`` can be pickled, False otherwise.
+
+    """
+    # containers are tracked by id so shared references are only visited
+    # once and self-referencing containers don't recurse forever
+    visited_id_set = set()
+    value_stack = [base_value]
+    trivial = True
+    while value_stack:
+        value = value_stack.pop()
+        value_type = type(value)
+        if value_type in _TRIVIALLY_PICKLABLE_TYPES:
+            continue
+        if value_type not in (list, tuple, set, frozenset, dict):
+            trivial = False
+            break
+        if id(value) in visited_id_set:
+            continue
+        visited_id_set.add(id(value))
+        if value_type is dict:
+            value_stack.extend(value.keys())
+            value_stack.extend(value.values())
+        else:
+            value_stack.extend(value)
+    if trivial:
+        return True
+    try:
+        pickle.Pickler(_NullWriter(), _PICKLE_PROTOCOL).dump(base_value)
+        return True
+    except (TypeError, AttributeError, pickle.PicklingError):
+        return False
+
+
+class _BatchingQueueHandler(logging.Handler):
+    """Put log records on a queue in batches rather than one at a time.
+
+    Records are formatted when they're logged, as ``QueueHandler`` does, and
+    put on the queue as a list once ``_LOG_BATCH_SIZE`` are buffered, when a
+    record of level WARNING or higher is logged, or when ``flush`` is
+    called. A background thread flushes the buffer once its oldest record
+    has waited ``_LOG_BATCH_INTERVAL`` seconds, even if nothing else is
+    logged. This keeps the cost of chatty loggers in workers to a list
+    append for most records.
+
+    """
+
+    def __init__(self, queue_):
+        """Create a handler that puts lists of records on ``queue_``."""
+        import logging.handlers
+        super().__init__()
+        # formats and enqueues records, ``logging.handlers`` is only
+        # imported by worker processes
+        self._queue_handler = logging.handlers.QueueHandler(queue_)
+        self._record_list = []
+        # set while records are buffered, guarded by the handler lock
+        self._record_event = threading.Event()
+        self._flush_thread = None
+
+    def setFormatter(self, fmt):
+        """Set the formatter of the records put on the queue."""
+        super().setFormatter(fmt)
+        self._queue_handler.setFormatter(fmt)
+
+    def emit(self, record):
+        """Buffer ``record`` and send the buffer if it's due."""
+        try:
+            self._record_list.append(self._queue_handler.prepare(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if (len(self._record_list) >= _LOG_BATCH_SIZE or
+                record.levelno >= logging.WARNING):
+            self.flush()
+            return
+        if len(self._record_list) == 1:
+            self._record_event.set()
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(
+                    target=self._flush_periodically,
+                    name='_flush_periodically', daemon=True)
+                self._flush_thread.start()
+
+    def flush(self):
+        """Put any buffered records on the queue."""
+        self.acquire()
+        try:
+            if self._record_list:
+                record_list = self._record_list
+                self._record_list = []
+                self._record_event.clear()
+                self._queue_handler.enqueue(record_list)
+        finally:
+            self.release()
+
+    def _flush_periodically(self):
+        """Flush records ``_LOG_BATCH_INTERVAL`` seconds after buffering.
+
+        A flush may come early if the records it waited for were already
+        sent and more were buffered, but never late.
+
+        """
+        while True:
+            self._record_event.wait()
+            time.sleep(_LOG_BATCH_INTERVAL)
+            self.flush()
+
+
+def _initialize_logging_to_queue(
+        logging_queue, worker_log_level=logging.NOTSET):
+    """Add a synchronized queue to a new process.
+
+    This is intended to be called as an initialization function to
+    ``multiprocessing.Pool`` to establish logging from a Pool worker to the
+    main python process via a multiprocessing Queue.
+
+    Args:
+        logging_queue (multiprocessing.Queue): The queue to use for passing
+            log records back to the main process, in lists.
+        worker_log_level (int): records below this level are dropped in the
+            worker rather than sent to the main process.
+
+    Returns:
+        None
+
+    """
+    global _WORKER_LOG_HANDLER
+    root_logger = logging.getLogger()
+
+    # By the time this function is called, `root_logger` has a copy of all of
+    # the logging handlers registered to it within the parent process, which
+    # leads to duplicate logging in some cases.  By removing all of the
+    # handlers here, we ensure that log messages can only be passed back to the
+    # parent process by the `logging_queue`, where they will be handled.
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+
+    # the root logger's level keeps records below ``worker_log_level`` from
+    # being created by loggers without a level and the handler's drops the
+    # rest before they're formatted or pickled
+    root_logger.setLevel(worker_log_level)
+    handler = _BatchingQueueHandler(logging_queue)
+    handler.setLevel(worker_log_level)
+    root_logger.addHandler(handler)
+    _WORKER_LOG_HANDLER = handler
+    multiprocessing.util.Finalize(
+        handler, handler.flush, exitpriority=_LOG_FLUSH_EXIT_PRIORITY)
+
+
+def _initialize_worker_profiling(
+        logging_queue, worker_log_level, profile_queue):
+    """Set up logging and profiling in a new worker process.
+
+    This is the ``multiprocessing.Pool`` initializer of a TaskGraph with
+    ``profile_workers`` set. Every ``func`` the worker calls is profiled
+    with ``cProfile`` and its profile is put on ``profile_queue``.
+
+    Args:
+        logging_queue (multiprocessing.Queue): passed to
+            ``_initialize_logging_to_queue``.
+        worker_log_level (int): passed to ``_initialize_logging_to_queue``.
+        profile_queue (multiprocessing.SimpleQueue): queue to pass the
+            result of ``_get_function_profile_map`` for each ``func`` call
+            back to the main process.
+
+    Returns:
+        None
+
+    """
+    global _WORKER_PROFILE_QUEUE
+    _initialize_logging_to_queue(logging_queue, worker_log_level)
+    _WORKER_PROFILE_QUEUE = profile_queue
+
+
+def _get_function_profile_map(profiler):
+    """Summarize a profile by function.
+
+    Args:
+        profiler (cProfile.Profile): a disabled profiler.
+
+    Returns:
+        dictionary mapping (filename, line number, function name) tuples to
+        lists of [primitive call count, call count, seconds spent in the
+        function excluding subcalls, seconds including subcalls]. Callers
+        are dropped to keep the profile small.
+
+    """
+    profiler.create_stats()
+    return {
+        function_key: [
+            primitive_calls, n_calls, total_time, cumulative_time]
+        for function_key, (
+            primitive_calls, n_calls, total_time, cumulative_time, _) in (
+            profiler.stats.items())}
+
+
+def _create_taskgraph_table_schema(taskgraph_database_path):
+    """Create database exists and/or ensures it is compatible and recreate.
+
+    Args:
+        taskgraph_database_path (str): path to an existing database or desired
+            location of a new database.
+
+    Returns:
+        None.
+
+    """
+    sql_create_projects_table_script = (
+        """
+        CREATE TABLE taskgraph_data (
+            task_reexecution_hash TEXT NOT NULL,
+            target_path_stats BLOB NOT NULL,
+            result BLOB NOT NULL,
+            PRIMARY KEY (task_reexecution_hash)
+        );
+        CREATE TABLE global_variables (
+            key TEXT NOT NULL,
+            value BLOB,
+            PRIMARY KEY (key)
+        );
+        """)
+
+    table_valid = True
+    expected_table_column_name_map = {
+        'taskgraph_data': [
+            'task_reexecution_hash', 'target_path_stats', 'result'],
+        'global_variables': ['key', 'value']}
+    if os.path.exists(taskgraph_database_path):
+        try:
+            # check that the tables exist and the column names are as expected
+            for expected_table_name in expected_table_column_name_map:
+                table_result = _execute_sqlite(
+                    '''
+                    SELECT name
+                    FROM sqlite_master
+                    WHERE type='table' AND name=?
+                    ''', taskgraph_database_path,
+                    argument_list=[expected_table_name],
+                    mode='read_only', execute='execute', fetch='all')
+                if not table_result:
+                    raise ValueError(f'missing table {expected_table_name}')
+
+                # this query returns a list of results of the form
+                # [(0, 'task_reexecution_hash', 'TEXT', 1, None, 1), ... ]
+                # we'll just check that the header names are the same, no
+                # need to be super aggressive, also need to construct the
+                # PRAGMA string directly since it doesn't take arguments
+                table_info_result = _execute_sqlite(
+                    f'PRAGMA table_info({expected_table_name})',
+                    taskgraph_database_path, mode='read_only',
+                    execute='execute', fetch='all')
+
+                expected_column_names = expected_table_column_name_map[
+                    expected_table_name]
+                header_count = 0
+                for header_line in table_info_result:
+                    column_name = header_line[1]
+                    if column_name not in expected_column_names:
+                        raise ValueError(
+                            f'expected {column_name} in table '
+                            f'{expected_table_name} but not found')
+                    header_count += 1
+                if header_count < len(expected_column_names):
+                    raise ValueError(
+                        f'found only {header_count} of an expected '
+                        f'{len(expected_column_names)} columns in table '
+                        f'{expected_table_name}')
+                if not table_info_result:
+                    raise ValueError(f'missing table {expected_table_name}')
+        except Exception:
+            # catch all "Exception"s because anything that goes wrong while
+            # checking the database should be considered a bad database and we
+            # should make a new one.
+            LOGGER.exception(
+                f'{taskgraph_database_path} exists, but is incompatible '
+                'somehow. Deleting and making a new one.')
+            os.remove(taskgraph_database_path)
+            table_valid = False
+    else:
+        # table does not exist
+        table_valid = False
+
+    if not table_valid:
+        # create the base table
+        _execute_sqlite(
+            sql_create_projects_table_script, taskgraph_database_path,
+            mode='modify', execute='script')
+        # set the database version
+        _execute_sqlite(
+            '''
+            INSERT OR REPLACE INTO global_variables
+            VALUES ("version", ?)
+            ''', taskgraph_database_path, mode='modify',
+            argument_list=(__version__,))
+
+    # this table was added after the others so it's created separately
+    # rather than invalidating databases that don't have it. Each row is
+    # one execution of a task, with its worker resource usage if it was
+    # measured, and the trigger keeps only the most recent
+    # ``_RUNTIME_HISTORY_LENGTH`` executions of each task.
+    _execute_sqlite(
+        """
+        CREATE TABLE IF NOT EXISTS task_runtime_history (
+            runtime_history_key TEXT NOT NULL,
+            task_name TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            runtime REAL NOT NULL,
+            user_time REAL,
+            system_time REAL,
+            max_rss INTEGER,
+            block_input INTEGER,
+            block_output INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS task_runtime_history_key_index
+            ON task_runtime_history (runtime_history_key);
+        CREATE TRIGGER IF NOT EXISTS task_runtime_history_trim
+            AFTER INSERT ON task_runtime_history
+        BEGIN
+            DELETE FROM task_runtime_history
+            WHERE runtime_history_key == NEW.runtime_history_key
+                AND rowid NOT IN (
+                    SELECT rowid FROM task_runtime_history
+                    WHERE runtime_history_key == NEW.runtime_history_key
+                    ORDER BY rowid DESC LIMIT %d);
+        END;
+        """ % _RUNTIME_HISTORY_LENGTH, taskgraph_database_path,
+        mode='modify', execute='script')
+
+
+def _load_runtime_history(taskgraph_database_path):
+    """Return a dict mapping runtime history keys to median runtimes."""
+    import statistics
+    runtime_list_map = collections.defaultdict(list)
+    for runtime_history_key, runtime in _execute_sqlite(
+            "SELECT runtime_history_key, runtime FROM task_runtime_history",
+            taskgraph_database_path, mode='read_only', fetch='all'):
+        runtime_list_map[runtime_history_key].append(runtime)
+    return {
+        runtime_history_key: statistics.median(runtime_list)
+        for runtime_history_key, runtime_list in runtime_list_map.items()}
+
+
+class _ResultStore(object):
+    """Content-addressed store of compressed ``func`` results.
+
+    Results that pickle to at least ``threshold`` bytes are written to
+    zlib-compressed files named by the sha1 digest of their pickled bytes
+    rather than stored inline in the ``taskgraph_data.result`` column. This
+    keeps the database small so cache-hit queries stay fast, and identical
+    results share one file. File modification times track last access so
+    the least recently used results can be evicted if ``max_size`` is set.
+
+    """
+
+    def __init__(self, store_dir, threshold, max_size):
+        """Create a result store.
+
+        Args:
+            store_dir (str): path to the directory to write results to. It is
+                created on the first write.
+            threshold (int): results that pickle to fewer than this many
+                bytes are stored inline. If None, all results are inline.
+            max_size (int): if not None, the least recently used results
+                are deleted once the compressed size of the store exceeds
+                this many bytes.
+
+        """
+        self._store_dir = store_dir
+        self._threshold = threshold
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._store_size = None
+        if max_size is not None:
+            self._store_size = sum(
+                entry.stat().st_size for entry in self._scan())
+
+    def dump(self, result):
+        """Return the ``taskgraph_data.result`` value for ``result``.
+
+        Args:
+            result: the picklable result of a ``func`` call.
+
+        Returns:
+            either the pickled ``result`` or a reference to it in the store.
+
+        """
+        result_pickle = pickle.dumps(result)
+        if self._threshold is None or len(result_pickle) < self._threshold:
+            return result_pickle
+        digest = hashlib.sha1(result_pickle).hexdigest()
+        result_path = self._result_path(digest)
+        with self._lock:
+            if os.path.exists(result_path):
+                # identical result already stored
+                os.utime(result_path)
+            else:
+                os.makedirs(os.path.dirname(result_path), exist_ok=True)
+                compressed_result = zlib.compress(result_pickle, 1)
+                # write to a temporary file first so a concurrent reader
+                # never sees a partially written result
+                tmp_path = '%s.%d.%d.tmp' % (
+                    result_path, os.getpid(), threading.get_ident())
+                with open(tmp_path, 'wb') as result_file:
+                    result_file.write(compressed_result)
+                os.replace(tmp_path, result_path)
+                if self._store_size is not None:
+                    self._store_size += len(compressed_result)
+                    if self._store_size > self._max_size:
+                        self._evict(result_path)
+        return _RESULT_STORE_REFERENCE_PREFIX + digest.encode('utf-8')
+
+    def is_available(self, result_blob):
+        """Return True if the result in ``result_blob`` can be loaded.
+
+        Inline results are always available, a stored result might have
+        been evicted. Available stored results are marked as accessed.
+
+        """
+        if not result_blob.startswith(_RESULT_STORE_REFERENCE_PREFIX):
+            return True
+        try:
+            os.utime(self._result_path(self._digest(result_blob)))
+            return True
+        except OSError:
+            return False
+
+    def load(self, result_blob):
+        """Return the result recorded in ``result_blob``.
+
+        Args:
+            result_blob (bytes): a value previously returned by ``dump``.
+
+        Returns:
+            the unpickled result.
+
+        Raises:
+            OSError if the result was stored but has since been evicted.
+
+        """
+        if not result_blob.startswith(_RESULT_STORE_REFERENCE_PREFIX):
+            return pickle.loads(result_blob)
+        result_path = self._result_path(self._digest(result_blob))
+        with open(result_path, 'rb') as result_file:
+            compressed_result = result_file.read()
+        return pickle.loads(zlib.decompress(compressed_result))
+
+    def _digest(self, result_blob):
+        """Return the digest string referenced by ``result_blob``."""
+        return result_blob[len(_RESULT_STORE_REFERENCE_PREFIX):].decode(
+            'utf-8')
+
+    def _result_path(self, digest):
+        """Return the path to the file that stores ``digest``."""
+        # split on the first two characters to avoid huge directories
+        return os.path.join(self._store_dir, digest[:2], digest)
+
+    def _scan(self):
+        """Yield ``os.DirEntry`` objects for every stored result."""
+        if not os.path.isdir(self._store_dir):
+            return
+        for prefix_entry in os.scandir(self._store_dir):
+            if not prefix_entry.is_dir():
+                continue
+            for entry in os.scandir(prefix_entry.path):
+                if not entry.name.endswith('.tmp'):
+                    yield entry
+
+    def _evict(self, keep_path):
+        """Delete least recently used results until under ``max_size``.
+
+        Must be called while holding ``self._lock``.
+
+        Args:
+            keep_path (str): path to a result that should not be evicted,
+                usually the one that was just written.
+
+        """
+        entry_list = []
+        for entry in self._scan():
+            try:
+                entry_list.append((entry.stat(), entry.path))
+            except OSError:
+                # deleted by another process
+                pass
+        self._store_size = sum(stat.st_size for stat, _ in entry_list)
+        for stat, path in sorted(
+                entry_list, key=lambda stat_path: stat_path[0].st_mtime):
+            if self._store_size <= self._max_size:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                self._store_size -= stat.st_size
+                LOGGER.debug('evicted %s from result store', path)
+            except OSError:
+                LOGGER.exception('unable to evict %s from result store', path)
+
+
+class _ArtifactStore(object):
+    """Content-addressed store of target files.
+
+    Target files are stored under the content fingerprint that was already
+    recorded for them, so files can be restored to any path without
+    recomputing or rehashing them, even if the original file was deleted.
+    Files are ingested as a copy-on-write reflink when the filesystem
+    supports it, otherwise as a hardlink, otherwise as a copy. A hardlinked
+    entry shares its contents with the original target, so its size and
+    modification time are recorded in a ``.stat`` file next to it and the
+    entry is discarded if the original is later modified in place. Files
+    are never hardlinked out of the store, so restored targets can't change
+    an entry. The modification time of an entry, or of its ``.stat`` file
+    if it has one, tracks last access so the least recently used entries
+    can be evicted if ``max_size`` is set.
+
+    """
+
+    def __init__(self, store_dir, max_size=None):
+        """Create an artifact store.
+
+        Args:
+            store_dir (str): path to the directory to store files in. It is
+                created on the first write.
+            max_size (int): if not None, the least recently used entries are
+                deleted once the size of the store exceeds this many bytes.
+                Hardlinked entries are counted even though they share their
+                space with the original target.
+
+        """
+        self._store_dir = store_dir
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._store_size = None
+        if max_size is not None:
+            self._store_size = sum(size for _, size, _ in self._scan())
+
+    def ingest(self, path, hash_algorithm, fingerprint):
+        """Add the file at ``path`` to the store if it's not already there.
+
+        Args:
+            path (str): path to a file that was just fingerprinted.
+            hash_algorithm (str): algorithm that produced ``fingerprint``.
+                Files with non-content fingerprints are not stored.
+            fingerprint (str): fingerprint of ``path``'s contents.
+
+        Returns:
+            None.
+
+        """
+        if hash_algorithm in _NON_CONTENT_HASH_ALGORITHMS:
+            return
+        if self.get_path(hash_algorithm, fingerprint) is not None:
+            return
+        entry_path = self._entry_path(hash_algorithm, fingerprint)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # build the entry at a temporary path and move it in place so a
+        # concurrent reader never sees a partial file
+        tmp_path = '%s.%d.%d.tmp' % (
+            entry_path, os.getpid(), threading.get_ident())
+        try:
+            if not _reflink(path, tmp_path):
+                # ``_reflink`` doesn't create the file where fcntl is
+                # missing
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                try:
+                    os.link(path, tmp_path)
+                    link_stat = os.stat(tmp_path)
+                    with open(f'{entry_path}.stat', 'w') as stat_file:
+                        stat_file.write(
+                            f'{link_stat.st_size} {link_stat.st_mtime_ns}')
+                except OSError:
+                    _copy_files([(path, tmp_path)], 'kernel', False)
+            os.replace(tmp_path, entry_path)
+        except OSError:
+            LOGGER.exception(
+                'unable to add %s to the artifact store', path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        if self._store_size is not None:
+            with self._lock:
+                self._store_size += os.path.getsize(entry_path)
+                if self._store_size > self._max_size:
+                    self._evict(entry_path)
+
+    def get_path(self, hash_algorithm, fingerprint):
+        """Return the path to a stored file with ``fingerprint``.
+
+        Args:
+            hash_algorithm (str): algorithm that produced ``fingerprint``.
+            fingerprint (str): content fingerprint of the desired file.
+
+        Returns:
+            path to a file in the store with the same contents, or None if
+            there isn't one.
+
+        """
+        if hash_algorithm in _NON_CONTENT_HASH_ALGORITHMS:
+            return None
+        entry_path = self._entry_path(hash_algorithm, fingerprint)
+        try:
+            entry_stat = os.stat(entry_path)
+        except OSError:
+            return None
+        try:
+            with open(f'{entry_path}.stat', 'r') as stat_file:
+                size, mtime_ns = [int(x) for x in stat_file.read().split()]
+        except OSError:
+            # not a hardlink so it can't have been changed
+            self._mark_accessed(entry_path)
+            return entry_path
+        if (entry_stat.st_size, entry_stat.st_mtime_ns) != (size, mtime_ns):
+            LOGGER.info(
+                '%s was modified through a hardlink, removing it from the '
+                'artifact store', entry_path)
+            try:
+                os.remove(entry_path)
+                os.remove(f'{entry_path}.stat')
+            except OSError:
+                LOGGER.exception('unable to remove %s', entry_path)
+            return None
+        # touching a hardlinked entry would change the original target, so
+        # its ``.stat`` file records the access instead
+        self._mark_accessed(f'{entry_path}.stat')
+        return entry_path
+
+    def _mark_accessed(self, path):
+        """Touch ``path`` to record an access if entries can be evicted."""
+        if self._max_size is None:
+            return
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted by another process
+            pass
+
+    def _entry_path(self, hash_algorithm, fingerprint):
+        """Return the path that stores ``fingerprint``."""
+        return os.path.join(
+            self._store_dir, hash_algorithm, fingerprint[:2], fingerprint)
+
+    def _scan(self):
+        """Yield (path, size, last access time) of every stored file."""
+        if not os.path.isdir(self._store_dir):
+            return
+        for algorithm_entry in os.scandir(self._store_dir):
+            if not algorithm_entry.is_dir():
+                continue
+            for prefix_entry in os.scandir(algorithm_entry.path):
+                if not prefix_entry.is_dir():
+                    continue
+                for entry in os.scandir(prefix_entry.path):
+                    if entry.name.endswith(('.tmp', '.stat')):
+                        continue
+                    try:
+                        access_stat = entry_stat = entry.stat()
+                        if os.path.exists(f'{entry.path}.stat'):
+                            access_stat = os.stat(f'{entry.path}.stat')
+                    except OSError:
+                        # deleted by another process
+                        continue
+                    yield (
+                        entry.path, entry_stat.st_size,
+                        access_stat.st_mtime)
+
+    def _evict(self, keep_path):
+        """Delete least recently used entries until under ``max_size``.
+
+        Must be called while holding ``self._lock``.
+
+        Args:
+            keep_path (str): path to an entry that should not be evicted,
+                usually the one that was just added.
+
+        """
+        entry_list = list(self._scan())
+        self._store_size = sum(size for _, size, _ in entry_list)
+        for path, size, _ in sorted(entry_list, key=lambda entry: entry[2]):
+            if self._store_size <= self._max_size:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                self._store_size -= size
+                LOGGER.debug('evicted %s from artifact store', path)
+            except OSError:
+                LOGGER.exception(
+                    'unable to evict %s from artifact store', path)
+                continue
+            if os.path.exists(f'{path}.stat'):
+                try:
+                    os.remove(f'{path}.stat')
+                except OSError:
+                    LOGGER.exception('unable to remove %s.stat', path)
+
+
+class _FileWatcher(object):
+    """Cache of file fingerprints that are invalidated by inotify events.
+
+    The parent directory of every file fingerprinted through
+    ``hash_file`` is watched with inotify, and a fingerprint is cached until
+    an event reports the file was modified, touched, moved, or deleted. A
+    cached fingerprint costs no reads or stats to return. Pending events are
+    read before each lookup, and the kernel queues an event before the
+    system call that caused it returns, so a change made before the lookup
+    is never missed.
+
+    Changes inotify doesn't report are not detected, these are writes
+    through ``mmap``, writes on network filesystems from other hosts,
+    writes through a hardlink in an unwatched directory, and renames of an
+    ancestor directory above the nearest watched one. If a directory can't
+    be watched, for example because the inotify watch limit was reached,
+    files in it are fingerprinted normally each time.
+
+    """
+
+    def __init__(self):
+        """Create a watcher.
+
+        Raises:
+            OSError if inotify is not available.
+
+        """
+        if not HAS_INOTIFY:
+            raise OSError('inotify is not available on this platform')
+        self._fd = _LIBC.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._lock = threading.Lock()
+        # maps watch descriptors to the directories they watch and back
+        self._wd_to_dir_map = {}
+        self._dir_to_wd_map = {}
+        # maps paths to a dict of hash_algorithm: fingerprint
+        self._fingerprint_map = {}
+        # incremented on each event in a watched directory so a fingerprint
+        # computed while the directory changed isn't cached
+        self._generation_map = collections.defaultdict(int)
+        # incremented if the event queue overflows and all are invalid
+        self._epoch = 0
+
+    def hash_file(self, path, hash_algorithm):
+        """Return ``_hash_file(path, hash_algorithm)``, cached if possible.
+
+        Args:
+            path (str): normalized path to a regular file.
+            hash_algorithm (str): any ``_hash_file`` algorithm.
+
+        Returns:
+            the fingerprint of ``path``.
+
+        """
+        dir_path = os.path.dirname(path)
+        with self._lock:
+            self._read_events()
+            fingerprint = self._fingerprint_map.get(path, {}).get(
+                hash_algorithm)
+            if fingerprint is not None:
+                return fingerprint
+            wd = self._watch(dir_path)
+            generation = (self._epoch, self._generation_map[wd])
+        fingerprint = _hash_file(path, hash_algorithm)
+        if wd is None:
+            return fingerprint
+        with self._lock:
+            self._read_events()
+            if wd in self._wd_to_dir_map and generation == (
+                    self._epoch, self._generation_map[wd]):
+                self._fingerprint_map.setdefault(path, {})[
+                    hash_algorithm] = fingerprint
+        return fingerprint
+
+    def _watch(self, dir_path):
+        """Watch ``dir_path`` and return its watch descriptor or None."""
+        if dir_path in self._dir_to_wd_map:
+            return self._dir_to_wd_map[dir_path]
+        wd = _LIBC.inotify_add_watch(
+            self._fd, os.fsencode(dir_path),
+            _FILE_WATCHER_EVENT_MASK | _IN_ONLYDIR)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            LOGGER.debug(
+                'unable to watch %s, fingerprinting files in it every time: '
+                '%s', dir_path, os.strerror(errno))
+            return None
+        if wd in self._wd_to_dir_map:
+            # the same directory through another path, e.g. a symlink,
+            # events only name one of them so don't cache either
+            LOGGER.debug(
+                '%s is already watched as %s, not caching fingerprints in it',
+                dir_path, self._wd_to_dir_map[wd])
+            return None
+        self._wd_to_dir_map[wd] = dir_path
+        self._dir_to_wd_map[dir_path] = wd
+        return wd
+
+    def _read_events(self):
+        """Invalidate fingerprints of paths with pending events."""
+        while True:
+            try:
+                event_buffer = os.read(self._fd, 2**16)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(event_buffer):
+                wd, mask, _, name_length = (
+                    _INOTIFY_EVENT_STRUCT.unpack_from(event_buffer, offset))
+                offset += _INOTIFY_EVENT_STRUCT.size
+                name = os.fsdecode(
+                    event_buffer[offset:offset+name_length].rstrip(b'\0'))
+                offset += name_length
+                self._handle_event(wd, mask, name)
+
+    def _handle_event(self, wd, mask, name):
+        """Invalidate fingerprints affected by a single inotify event."""
+        if mask & _IN_Q_OVERFLOW:
+            LOGGER.debug('inotify queue overflowed, clearing all fingerprints')
+            self._fingerprint_map.clear()
+            self._epoch += 1
+            return
+        if wd not in self._wd_to_dir_map:
+            return
+        dir_path = self._wd_to_dir_map[wd]
+        self._generation_map[wd] += 1
+        if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_UNMOUNT |
+                   _IN_IGNORED):
+            # the watched directory is gone or now at another path
+            self._invalidate_tree(dir_path)
+            del self._wd_to_dir_map[wd]
+            del self._dir_to_wd_map[dir_path]
+            del self._generation_map[wd]
+            if not mask & _IN_IGNORED:
+                _LIBC.inotify_rm_watch(self._fd, wd)
+            return
+        path = os.path.join(dir_path, name)
+        self._fingerprint_map.pop(path, None)
+        if mask & _IN_ISDIR:
+            self._invalidate_tree(path)
+
+    def _invalidate_tree(self, dir_path):
+        """Invalidate fingerprints of every file under ``dir_path``."""
+        prefix = os.path.join(dir_path, '')
+        for path in [
+                path for path in self._fingerprint_map
+                if path.startswith(prefix)]:
+            del self._fingerprint_map[path]
+
+
+def _get_file_watcher():
+    """Return the process' ``_FileWatcher``, or None if unavailable."""
+    global _FILE_WATCHER
+    with _FILE_WATCHER_LOCK:
+        if _FILE_WATCHER is None:
+            try:
+                _FILE_WATCHER = _FileWatcher()
+            except OSError:
+                LOGGER.warning(
+                    'unable to watch files for changes, fingerprinting them '
+                    'every time instead', exc_info=True)
+                return None
+        return _FILE_WATCHER
+
+
+class _TaskGraphMetrics(object):
+    """Counters and histograms of the tasks a ``TaskGraph`` has executed.
+
+    Tasks are recorded as they finish in constant time so this is always
+    enabled, ``render`` formats the metrics in the Prometheus text
+    exposition format.
+
+    """
+
+    def __init__(self):
+        """Create metrics with every counter at zero."""
+        self._lock = threading.Lock()
+        self._counter_map = {
+            'completed': 0, 'failed': 0, 'precalculated': 0,
+            'artifacts_copied': 0}
+        # maps histogram names to a (bucket count list, sum, count) list
+        self._histogram_map = {
+            name: [[0] * len(_METRICS_HISTOGRAM_BUCKET_LIST), 0.0, 0]
+            for name in ['hash', 'execute']}
+
+    def record_task(self, task):
+        """Record a ``Task`` that has successfully finished ``_call``."""
+        hash_time = sum(
+            task._phase_time_map.get(phase, 0.0) for phase in [
+                'input_fingerprint', 'target_verify', 'target_fingerprint'])
+        with self._lock:
+            self._counter_map['completed'] += 1
+            if task._precalculated:
+                self._counter_map['precalculated'] += 1
+            if task._artifact_copied:
+                self._counter_map['artifacts_copied'] += 1
+            self._observe('hash', hash_time)
+            if 'execute' in task._phase_time_map:
+                self._observe('execute', task._phase_time_map['execute'])
+
+    def get_counter_map(self):
+        """Return a copy of the counters, keyed by name."""
+        with self._lock:
+            return dict(self._counter_map)
+
+    def record_failure(self):
+        """Record a ``Task`` whose ``_call`` raised an exception."""
+        with self._lock:
+            self._counter_map['failed'] += 1
+
+    def _observe(self, name, value):
+        """Add ``value`` to a histogram, ``self._lock`` must be held."""
+        histogram = self._histogram_map[name]
+        for index, upper_bound in enumerate(_METRICS_HISTOGRAM_BUCKET_LIST):
+            if value <= upper_bound:
+                histogram[0][index] += 1
+                break
+        histogram[1] += value
+        histogram[2] += 1
+
+    def render(self, gauge_list):
+        """Return the metrics in the Prometheus text exposition format.
+
+        Args:
+            gauge_list (list): (name, help, value) tuples of gauges to
+                include with the counters and histograms.
+
+        Returns:
+            string of metrics, all prefixed with ``taskgraph_``.
+
+        """
+        with _SQLITE_RETRY_COUNT_LOCK:
+            sqlite_retry_count = _SQLITE_RETRY_COUNT
+        with self._lock:
+            counter_map = dict(self._counter_map)
+            histogram_map = {
+                name: (list(bucket_list), value_sum, count)
+                for name, (bucket_list, value_sum, count) in (
+                    self._histogram_map.items())}
+        line_list = []
+
+        def _add_metric(name, metric_type, help_text, sample_list):
+            line_list.append('# HELP taskgraph_%s %s' % (name, help_text))
+            line_list.append('# TYPE taskgraph_%s %s' % (name, metric_type))
+            for suffix, value in sample_list:
+                line_list.append('taskgraph_%s%s %s' % (
+                    name, suffix, repr(float(value))))
+
+        for name, help_text, value in gauge_list:
+            _add_metric(name, 'gauge', help_text, [('', value)])
+        for name, help_text in [
+                ('tasks_completed', 'Tasks that finished successfully.'),
+                ('tasks_failed', 'Tasks that raised an exception.'),
+                ('tasks_precalculated',
+                 'Tasks that finished without executing because they were '
+                 'precalculated.'),
+                ('tasks_artifacts_copied',
+                 'Tasks whose targets were copied from a duplicate task.')]:
+            _add_metric(
+                '%s_total' % name, 'counter', help_text,
+                [('', counter_map[name[len('tasks_'):]])])
+        _add_metric(
+            'sqlite_retries_total', 'counter',
+            'Times the TaskGraph database was locked and access was '
+            'retried, by all TaskGraphs in the process.',
+            [('', sqlite_retry_count)])
+        for name, help_text in [
+                ('hash', 'Seconds tasks spent fingerprinting files.'),
+                ('execute', 'Seconds tasks spent executing func.')]:
+            bucket_list, value_sum, count = histogram_map[name]
+            sample_list = []
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(
+                    _METRICS_HISTOGRAM_BUCKET_LIST, bucket_list):
+                cumulative_count += bucket_count
+                sample_list.append((
+                    '_bucket{le="%s"}' % (
+                        '+Inf' if math.isinf(upper_bound) else
+                        repr(upper_bound)), cumulative_count))
+            sample_list.extend([('_sum', value_sum), ('_count', count)])
+            _add_metric(
+                'task_%s_seconds' % name, 'histogram', help_text,
+                sample_list)
+        return '\n'.join(line_list) + '\n'
+
+
+class TaskGraph(object):
+    """Encapsulates the worker and tasks states for parallel processing."""
+
+    def __init__(
+            self, taskgraph_cache_dir_path, n_workers,
+            reporting_interval=None, shared_memory_threshold=None,
+            result_store_threshold=_DEFAULT_RESULT_STORE_THRESHOLD,
+            result_store_max_size=None, artifact_store=False,
+            artifact_store_max_size=None, watch_files=False,
+            plan_only=False, trace_path=None, metrics_port=None,
+            metrics_textfile_path=None, profile_workers=False,
+            worker_log_level=logging.NOTSET):
+        """Create a task graph.
+
+        Creates an object for building task graphs, executing them,
+        parallelizing independent work notes, and avoiding repeated calls.
+
+        Args:
+            taskgraph_cache_dir_path (string): path to a directory that
+                either contains a taskgraph cache from a previous instance or
+                will create a new one if none exists.
+            n_workers (int): number of parallel *subprocess* workers to allow
+                during task graph execution.  If set to 0, don't use
+                subprocesses.  If set to <0, use only the main thread for any
+                execution and scheduling. In the case of the latter,
+                ``add_task`` will be a blocking call.
+            reporting_interval (scalar): if not None, report status of task
+                graph every ``reporting_interval`` seconds.
+            shared_memory_threshold (int): if not None and ``n_workers > 0``,
+                any pickled argument buffer or ``store_result`` result
+                buffer of at least this many bytes is passed between the
+                parent and worker processes through shared memory rather
+                than the worker pool pipe. Requires Python 3.8+, otherwise
+                this value is ignored. Large numpy arrays pickle to a
+                single buffer, so a value around ``2**20`` keeps small
+                arguments on the pipe and moves large arrays to shared
+                memory.
+            result_store_threshold (int): ``store_result`` results that
+                pickle to at least this many bytes are compressed and stored
+                in files under ``taskgraph_cache_dir_path`` rather than in
+                the TaskGraph database. Identical results are only stored
+                once. If None, all results are stored in the database.
+            result_store_max_size (int): if not None, the least recently used
+                results in the result store are deleted once their
+                compressed size exceeds this many bytes. A ``Task`` whose
+                result was deleted will reexecute.
+            artifact_store (bool): if True, the target files of tasks with
+                ``copy_duplicate_artifact`` set and a content
+                ``hash_algorithm`` are added to a content-addressed store
+                under ``taskgraph_cache_dir_path``. Duplicate tasks copy
+                their targets from the store, even if the original targets
+                have been deleted, rather than rehashing the originals.
+            artifact_store_max_size (int): if not None, the least recently
+                used files in the artifact store are deleted once their size
+                exceeds this many bytes. Otherwise the store grows without
+                limit, it can be cleared by deleting its
+                ``taskgraph_artifact_store`` directory under
+                ``taskgraph_cache_dir_path`` while no TaskGraph is using it.
+            watch_files (bool): if True, files are watched for changes with
+                Linux inotify after they are fingerprinted and their
+                fingerprints are reused until they change, so checking
+                whether unchanged files invalidate a task costs nothing.
+                The cache is shared by every ``TaskGraph`` in the process,
+                which is useful for long running processes that rebuild the
+                same graph repeatedly. Files are fingerprinted every time if
+                watching isn't possible. See ``_FileWatcher`` for changes
+                that aren't detected.
+            plan_only (bool): if True, no task is executed. ``add_task``
+                only records tasks and ``plan`` reports which would
+                execute. No worker processes or threads are started.
+            trace_path (str): if not None, a Chrome Trace Event JSON file
+                of the execution is written here once, when ``join``
+                completes after ``close`` or the graph terminates. It can
+                be opened in Perfetto (ui.perfetto.dev) or chrome://tracing.
+                Each task is a span on the executor thread that called it,
+                with a nested span for ``func`` on the worker process that
+                executed it, flow arrows from each task to the tasks that
+                depend on it, and markers for precalculated tasks and copied
+                artifacts.
+            metrics_port (int): if not None, ``metrics`` are served over
+                HTTP on this port of localhost for Prometheus to scrape. If
+                0 a free port is chosen, it's in ``metrics_address``.
+            metrics_textfile_path (str): if not None, ``metrics`` are
+                written to this file every few seconds and when ``join``
+                completes, for the node_exporter textfile collector, which
+                requires the file name to end in '.prom'.
+            profile_workers (bool): if True and ``n_workers`` > 0 every
+                ``func`` executed by a worker process is profiled with
+                ``cProfile`` and the profiles are added up by function, see
+                ``profile_stats`` and ``export_profile``. This slows down
+                Python heavy functions noticeably so it's meant for finding
+                out why tasks are slow rather than for every run.
+            worker_log_level (int): log records below this level, such as
+                ``logging.INFO``, are dropped in worker processes rather
+                than sent to this process. Records are sent in batches, so
+                records from a worker may be logged up to
+                ``_LOG_BATCH_INTERVAL`` seconds late, unless they are
+                WARNING or above or the ``func`` that logged them returned.
+
+        """
+        try:
+            os.makedirs(taskgraph_cache_dir_path)
+        except OSError:
+            LOGGER.debug(
+                "%s already exists, no need to make it",
+                taskgraph_cache_dir_path)
+
+        self._taskgraph_cache_dir_path = taskgraph_cache_dir_path
+
+        if shared_memory_threshold is not None and not HAS_SHARED_MEMORY:
+            LOGGER.warning(
+                'shared_memory_threshold was set to %s but shared memory is '
+                'not available in this version of Python, ignoring',
+                shared_memory_threshold)
+            shared_memory_threshold = None
+        self._shared_memory_threshold = shared_memory_threshold
+
+        # this variable is used to print accurate representation of how many
+        # tasks have been completed in the logging output.
+        self._added_task_count = 0
+
+        # use this to keep track of all the tasks added to the graph by their
+        # task hashes. Used to determine if an identical task has been added
+        # to the taskgraph during `add_task`
+        self._task_hash_map = dict()
+
+        # use this to keep track of all the tasks added to the graph by their
+        # task names. Used to map a unique task name to the task object it
+        # represents
+        self._task_name_map = dict()
+
+        # used to remember if task_graph has been closed
+        self._closed = False
+
+        # keep track if the task graph has been forcibly terminated
+        self._terminated = False
+
+        # if n_workers > 0 this will be a multiprocessing pool used to execute
+        # the __call__ functions in Tasks
+        self._worker_pool = None
+
+        # If n_workers > 0 this will be a threading.Thread used to propagate
+        # log records from another process into the current process.
+        self._logging_monitor_thread = None
+
+        # If n_workers > 0, this will be a multiprocessing.Queue used to pass
+        # log records from the process pool to the parent process.
+        self._logging_queue = None
+
+        # if ``profile_workers`` is set and n_workers > 0 these are the
+        # multiprocessing.SimpleQueue worker profiles are passed through and
+        # the thread that adds them to ``_profile_map``, which maps
+        # functions to [primitive calls, calls, tottime, cumtime]. A
+        # SimpleQueue writes before ``put`` returns so a profile is always
+        # ahead of the result of its ``func`` and of the None that stops the
+        # thread.
+        self._profile_queue = None
+        self._profile_monitor_thread = None
+        self._profile_map = {}
+        self._profile_lock = threading.Lock()
+
+        # maps ``id(task)`` to (task, start time) of the tasks currently
+        # being executed for monitoring
+        self._active_task_map = {}
+        self._active_task_lock = threading.Lock()
+
+        # the execution monitor estimates the time remaining from these
+        # rather than visiting every task. ``_runtime_history_map`` maps
+        # task runtime history keys to median runtimes if the monitor is
+        # running, the pending totals are of the tasks added to the graph
+        # that haven't started executing and are guarded by
+        # ``_active_task_lock``
+        self._runtime_history_map = {}
+        self._pending_runtime = 0.0
+        self._pending_unknown_runtime_count = 0
+
+        # keeps track of how many tasks have all their dependencies satisfied
+        # and are waiting for a worker
+        self._task_waiting_count = 0
+
+        # this might hold the threads to execute tasks if n_workers >= 0
+        self._task_executor_thread_list = []
+
+        # executor threads wait on this event that gets set when new tasks are
+        # added to the queue. If the queue is empty an executor will clear
+        # the event to halt other executors
+        self._executor_ready_event = threading.Event()
+
+        # tasks that have all their dependencies satisfied go in this queue
+        # and can be executed immediately
+        self._task_ready_priority_queue = queue.PriorityQueue()
+
+        # maps a list of task names that need to be executed before the key
+        # task can
+        self._task_dependent_map = collections.defaultdict(set)
+
+        # maps a list of task names that are dependent to a task
+        self._dependent_task_map = collections.defaultdict(set)
+
+        # tasks that complete are added to this set
+        self._completed_task_names = set()
+
+        self._task_database_path = os.path.join(
+            self._taskgraph_cache_dir_path, _TASKGRAPH_DATABASE_FILENAME)
+
+        self._result_store = _ResultStore(
+            os.path.join(
+                self._taskgraph_cache_dir_path,
+                _TASKGRAPH_RESULT_STORE_DIRNAME),
+            result_store_threshold, result_store_max_size)
+
+        self._artifact_store = None
+        if artifact_store:
+            self._artifact_store = _ArtifactStore(
+                os.path.join(
+                    self._taskgraph_cache_dir_path,
+                    _TASKGRAPH_ARTIFACT_STORE_DIRNAME),
+                artifact_store_max_size)
+
+        self._file_watcher = None
+        if watch_files:
+            self._file_watcher = _get_file_watcher()
+
+        self._metrics = _TaskGraphMetrics()
+        self.metrics_address = None
+        self._metrics_server = None
+        if metrics_port is not None:
+            # only imported if it's used since ``http.server`` is slow to
+            # import
+            from ._metrics_server import _MetricsServer
+            self._metrics_server = _MetricsServer(
+                ('localhost', metrics_port), self.metrics)
+            self.metrics_address = self._metrics_server.server_address
+            metrics_server_thread = threading.Thread(
+                target=self._metrics_server.serve_forever,
+                name='_metrics_server')
+            metrics_server_thread.daemon = True
+            metrics_server_thread.start()
+        self._metrics_textfile_path = metrics_textfile_path
+        self._metrics_textfile_stop_event = threading.Event()
+        if metrics_textfile_path is not None:
+            metrics_textfile_thread = threading.Thread(
+                target=self._write_metrics_textfile_periodically,
+                name='_metrics_textfile_writer')
+            metrics_textfile_thread.daemon = True
+            metrics_textfile_thread.start()
+
+        # create new table if needed
+        _create_taskgraph_table_schema(self._task_database_path)
+
+        # check the version of the database and warn if a problem
+        local_version = _execute_sqlite(
+            '''
+            SELECT value
+            FROM global_variables
+            WHERE key=?
+            ''', self._task_database_path, mode='read_only',
+            fetch='one', argument_list=['version'])[0]
+        if local_version != __version__:
+            LOGGER.warning(
+                f'the database located at {self._task_database_path} was '
+                f'created with TaskGraph version {local_version} but the '
+                f'current version is {__version__}')
+
+        # if ``trace_path`` is not None, (task, dependent_task_list) tuples
+        # in the order they were added to draw dependencies in the trace
+        self._trace_path = trace_path
+        self._traced_task_list = []
+        self._trace_written = False
+        self._trace_start_timestamp = time.time()
+
+        # if ``plan_only``, (task, dependent_task_list) tuples in the order
+        # they were added
+        self._plan_only = plan_only
+        self._planned_task_list = []
+
+        # tasks that executed since ``_write_task_history`` last recorded
+        # their runtimes
+        self._executed_task_list = []
+        self._executed_task_lock = threading.Lock()
+        # total runtime and count of the tasks executed by this graph
+        self._executed_runtime = 0.0
+        self._executed_count = 0
+
+        # no need to set up schedulers if n_workers is single threaded
+        self._n_workers = n_workers
+        if profile_workers and n_workers <= 0:
+            LOGGER.warning(
+                'profile_workers is set but n_workers is %d so there are no '
+                'worker processes to profile', n_workers)
+        # set before returning for ``plan_only`` so ``__del__`` doesn't
+        # look for an execution monitor that was never started
+        self._reporting_interval = None
+        if n_workers < 0 or plan_only:
+            return
+
+        # start concurrent reporting of taskgraph if reporting interval is set
+        self._reporting_interval = reporting_interval
+        if reporting_interval is not None:
+            try:
+                self._runtime_history_map = _load_runtime_history(
+                    self._task_database_path)
+            except Exception:
+                LOGGER.exception('unable to load task runtime history')
+            self._execution_monitor_wait_event = threading.Event()
+            self._execution_monitor_thread = threading.Thread(
+                target=self._execution_monitor,
+                args=(self._execution_monitor_wait_event,),
+                name='_execution_monitor')
+            # make it a daemon so we don't have to figure out how to
+            # close it when execution complete
+            self._execution_monitor_thread.daemon = True
+            self._execution_monitor_thread.start()
+
+        # launch executor threads
+        self._executor_thread_count = max(0, n_workers)
+        for thread_id in range(max(1, n_workers)):
+            task_executor_thread = threading.Thread(
+                target=self._task_executor,
+                name='task_executor_%s' % thread_id)
+            # make daemons in case there's a catastrophic error the main
+            # thread won't hang
+            task_executor_thread.daemon = True
+            task_executor_thread.start()
+            self._task_executor_thread_list.append(task_executor_thread)
+
+        # set up multiprocessing if n_workers > 0
+        if n_workers > 0:
+            self._logging_queue = multiprocessing.Queue()
+            if profile_workers:
+                self._profile_queue = multiprocessing.SimpleQueue()
+                self._worker_pool = NonDaemonicPool(
+                    n_workers, initializer=_initialize_worker_profiling,
+                    initargs=(
+                        self._logging_queue, worker_log_level,
+                        self._profile_queue))
+                self._profile_monitor_thread = threading.Thread(
+                    target=self._handle_profiles_from_processes,
+                    name='_profile_monitor')
+                self._profile_monitor_thread.daemon = True
+                self._profile_monitor_thread.start()
+            else:
+                self._worker_pool = NonDaemonicPool(
+                    n_workers, initializer=_initialize_logging_to_queue,
+                    initargs=(self._logging_queue, worker_log_level))
+            self._logging_monitor_thread = threading.Thread(
+                target=self._handle_logs_from_processes,
+                args=(self._logging_queue,))
+
+            self._logging_monitor_thread.daemon = True
+            self._logging_monitor_thread.start()
+            if HAS_PSUTIL:
+                parent = psutil.Process()
+                parent.nice(PROCESS_LOW_PRIORITY)
+                for child in parent.children():
+                    try:
+                        child.nice(PROCESS_LOW_PRIORITY)
+                    except psutil.NoSuchProcess:
+                        LOGGER.warning(
+                            "NoSuchProcess exception encountered when trying "
+                            "to nice %s. This might be a bug in `psutil` so "
+                            "it should be okay to ignore.")
+
+    def __del__(self):
+        """Ensure all threads have been joined for cleanup."""
+        try:
+            # it's possible the global state is not well defined, so just in
+            # case we'll wrap it all up in a try/except
+            self._terminated = True
+            if self._executor_ready_event is not None:
+                # alert executors to check that _terminated is True
+                self._executor_ready_event.set()
+            LOGGER.debug("shutting down workers")
+            if self._worker_pool is not None:
+                self._worker_pool.close()
+                self._worker_pool.terminate()
+                self._worker_pool = None
+
+            if self._logging_queue is not None:
+                # Close down the logging monitor thread.
+                self._logging_queue.put(None)
+                self._logging_monitor_thread.join(_MAX_TIMEOUT)
+                # drain the queue if anything is left
+                while True:
+                    try:
+                        x = self._logging_queue.get_nowait()
+                        LOGGER.debug(
+                            "the logging queue had this in it: %s", x)
+                    except queue.Empty:
+                        break
+                    except Exception:
+                        LOGGER.exception(
+                            "Expected an empty logging queue, but if the "
+                            "TaskGraph were being terminated it's possible "
+                            "this object is corrupt and we'd get a different "
+                            "kind of exception like EOF. In any case we "
+                            "should always stop trying to drain the queue "
+                            "in the case of an Exception.")
+                        break
+
+            if self._profile_queue is not None:
+                self._profile_queue.put(None)
+                self._profile_monitor_thread.join(_MAX_TIMEOUT)
+
+            if self._n_workers >= 0:
+                self._executor_ready_event.set()
+                for executor_thread in self._task_executor_thread_list:
+                    try:
+                        executor_thread.join(_MAX_TIMEOUT)
+                        timedout = executor_thread.is_alive()
+                        if timedout:
+                            LOGGER.debug(
+                                'task executor thread timed out %s',
+                                executor_thread)
+                    except Exception:
+                        LOGGER.warning(
+                            f'Joining executor thread {executor_thread} '
+                            f'would have caused a deadlock, skipping.')
+                if self._reporting_interval is not None:
+                    LOGGER.debug("joining _monitor_thread.")
+                    if self._logging_queue:
+                        self._logging_queue.put(None)
+                    self._execution_monitor_wait_event.set()
+                    try:
+                        self._execution_monitor_thread.join(_MAX_TIMEOUT)
+                        timedout = self._execution_monitor_thread.is_alive()
+                        if timedout:
+                            LOGGER.debug(
+                                '_monitor_thread %s timed out',
+                                self._execution_monitor_thread)
+                    except Exception:
+                        LOGGER.warning(
+                            'joining execution monitor thread '
+                            f'{self._execution_monitor_thread} would have '
+                            'caused a deadlock, skipping.')
+                    for task in self._task_hash_map.values():
+                        # shortcut to get the tasks to mark as joined
+                        task.task_done_executing_event.set()
+
+            # drain the task ready queue if there's anything left
+            while True:
+                try:
+                    x = self._task_ready_priority_queue.get_nowait()
+                    LOGGER.debug(
+                        "task_ready_priority_queue not empty contains: %s", x)
+                except queue.Empty:
+                    break
+            LOGGER.debug('taskgraph terminated')
+        except Exception:
+            LOGGER.exception('exception occurred during __del__')
+
+    def _task_executor(self):
+        """Worker that executes Tasks that have satisfied dependencies."""
+        while True:
+            # this event blocks until the task graph has signaled it wants
+            # the executors to read the state of the queue or a stop event or
+            # a timeout exceeded just to protect against a worst case deadlock
+            self._executor_ready_event.wait(_MAX_TIMEOUT)
+            # this lock synchronizes changes between the queue and
+            # executor_ready_event
+            if self._terminated:
+                LOGGER.debug(
+                    "taskgraph is terminated, ending %s",
+                    threading.currentThread())
+                break
+            task = None
+            try:
+                task = self._task_ready_priority_queue.get_nowait()
+                task._add_phase_time('queue_wait', task._ready_time)
+                self._task_waiting_count -= 1
+                with self._active_task_lock:
+                    self._active_task_map[id(task)] = (task, time.time())
+                    self._update_pending_runtime(task, -1)
+            except queue.Empty:
+                # no tasks are waiting could be because the taskgraph is
+                # closed or because the queue is just empty.
+                if (self._closed and len(self._completed_task_names) ==
+                        self._added_task_count):
+                    # the graph is closed and there are as many completed tasks
+                    # as there are added tasks, so none left. The executor can
+                    # terminate.
+                    self._executor_thread_count -= 1
+                    if self._executor_thread_count == 0 and self._worker_pool:
+                        # only the last executor should terminate the worker
+                        # pool, because otherwise who knows if it's still
+                        # executing anything
+                        try:
+                            self._worker_pool.close()
+                            self._worker_pool.terminate()
+                            self._worker_pool = None
+                        except Exception:
+                            # there's the possibility for a race condition here
+                            # where another thread already closed the worker
+                            # pool, so just guard against it
+                            LOGGER.warning('worker pool was already closed')
+                    LOGGER.debug(
+                        "no tasks are pending and taskgraph closed, normally "
+                        "terminating executor %s." % threading.currentThread())
+                    break
+                else:
+                    # there's still the possibility for work to be added or
+                    # still work in the pipeline
+                    self._executor_ready_event.clear()
+            if task is None:
+                continue
+            try:
+                task._call()
+                self._record_task(task)
+                task.task_done_executing_event.set()
+            except Exception as e:
+                # An error occurred on a call, terminate the taskgraph
+                with self._active_task_lock:
+                    self._active_task_map.pop(id(task), None)
+                self._metrics.record_failure()
+                task.exception_object = e
+                LOGGER.exception(
+                    'A taskgraph _task_executor failed on Task '
+                    '%s. Terminating taskgraph.', task.task_name)
+                self._terminate()
+                break
+
+            LOGGER.debug(
+                "task %s is complete, checking to see if any dependent "
+                "tasks can be executed now", task.task_name)
+            self._completed_task_names.add(task.task_name)
+            with self._active_task_lock:
+                del self._active_task_map[id(task)]
+            for waiting_task_name in (
+                    self._task_dependent_map[task.task_name]):
+                # remove `task` from the set of tasks that
+                # `waiting_task` was waiting on.
+                self._dependent_task_map[waiting_task_name].remove(
+                    task.task_name)
+                # if there aren't any left, we can push `waiting_task`
+                # to the work queue
+                if not self._dependent_task_map[waiting_task_name]:
+                    # if we removed the last task we can put it to the
+                    # work queue
+                    LOGGER.debug(
+                        "Task %s is ready for processing, sending to "
+                        "task_ready_priority_queue",
+                        waiting_task_name)
+                    del self._dependent_task_map[waiting_task_name]
+                    self._task_name_map[waiting_task_name]._ready_time = (
+                        time.perf_counter())
+                    self._task_ready_priority_queue.put(
+                        self._task_name_map[waiting_task_name])
+                    self._task_waiting_count += 1
+                    # indicate to executors there is work to do
+                    self._executor_ready_event.set()
+            del self._task_dependent_map[task.task_name]
+            # this extra set ensures that recently emptied map won't get
+            # ignored by the executor if no work is left to do and the graph is
+            # closed
+            self._executor_ready_event.set()
+            LOGGER.debug("task %s done processing", task.task_name)
+        LOGGER.debug("task executor shutting down")
+
+    def add_task(
+            self, func=None, args=None, kwargs=None, task_name=None,
+            target_path_list=None, ignore_path_list=None,
+            hash_target_files=True, dependent_task_list=None,
+            ignore_directories=True, priority=0,
+            hash_algorithm='sizetimestamp', copy_duplicate_artifact=False,
+            hardlink_allowed=False, transient_run=False, store_result=False,
+            func_fingerprint_mode='source', copy_strategy='auto',
+            directory_fingerprint_mode='self',
+            reuse_upstream_fingerprints=False):
+        """Add a task to the task graph.
+
+        Args:
+            func (callable): target function
+            args (list): argument list for ``func``
+            kwargs (dict): keyword arguments for ``func``
+            target_path_list (list): if not None, a list of file paths that
+                are expected to be output by ``func``.  If any of these paths
+                don't exist, or their timestamp is earlier than an input
+                arg or work token, func will be executed.
+
+                If ``None``, any identical calls to ``add_task`` will be
+                skipped for the TaskGraph object. A future TaskGraph object
+                will re-run an exact call once for its lifetime. The reasoning
+                is that it is likely the user wishes to run a target-less task
+                once for the lifetime of a task-graph, but would otherwise not
+                have a transient result that could be re-used in a future
+                instantiation of a TaskGraph object.
+
+            task_name (string): if not None, this value is used to identify
+                the task in logging messages.
+            ignore_path_list (list): list of file paths that could be in
+                args/kwargs that should be ignored when considering timestamp
+                hashes.
+            hash_target_files (bool): If True, the hash value of the target
+                files will be recorded to determine if a future run of this
+                function is precalculated. If False, this function only notes
+                the existence of the target files before determining if
+                a function call is precalculated.
+            dependent_task_list (list): list of ``Task``s that this task must
+                ``join`` before executing.
+            ignore_directories (boolean): if the existence/timestamp of any
+                directories discovered in args or kwargs is used as part
+                of the work token hash.
+            directory_fingerprint_mode (str): how directories in args or
+                kwargs are fingerprinted if ``ignore_directories`` is False.
+                If 'self' (default) only the directory itself is
+                fingerprinted, so with 'sizetimestamp' the task only
+                reexecutes if files are added to or removed from it. Any
+                other ``hash_algorithm`` fails to read the directory as a
+                file, which is logged as an error and leaves the directory
+                out of the task's hash. If 'tree' the directory is walked
+                in parallel and the names and ``hash_algorithm``
+                fingerprints of every file under it are combined into a
+                Merkle digest, so any change in the tree reexecutes the
+                task. File fingerprints are cached and only recomputed if
+                a file's size or modification time changes.
+            reuse_upstream_fingerprints (bool): if True, files in args or
+                kwargs that are targets of a task in
+                ``dependent_task_list`` are not fingerprinted again, the
+                fingerprints that task recorded or just verified are used
+                instead. This avoids reading intermediate files twice when
+                validating long chains of tasks, but a file modified by
+                something other than its task after that task completes
+                won't cause this task to reexecute. Only used if both tasks
+                have the same ``hash_algorithm``.
+            priority (numeric): the priority of a task is considered when
+                there is more than one task whose dependencies have been
+                met and are ready for scheduling. Tasks are inserted into the
+                work queue in order of decreasing priority value
+                (priority 10 is higher than priority 1). This value can be
+                positive, negative, and/or floating point.
+            hash_algorithm (string): either a hash function id that
+                exists in hashlib.algorithms_available, a fingerprint
+                algorithm added with ``register_hash_algorithm``, or
+                'sizetimestamp', or 'sampled'. 'blake2b_tree' is always
+                available and hashes large files with multiple cores, and
+                'xxh3_64', 'xxh3_128', and 'blake3' are available if the
+                ``xxhash`` or ``blake3`` packages are installed. These are
+                all much faster than 'md5' or 'sha1' on large files.
+                'sampled' hashes only the size and 18 64KB blocks spread
+                evenly through each file, so its cost doesn't grow with
+                file size. Unlike 'sizetimestamp' it detects changes to
+                files copied with their timestamps preserved, but a change
+                to a large file that doesn't touch a sampled block or
+                change its size is not detected and the task will not be
+                reexecuted, so only use it for files that are replaced
+                wholesale rather than edited in place. Files smaller than
+                the sampled blocks are hashed completely.
+                Any paths to actual files in the arguments will be digested
+                with this algorithm. If value is 'sizetimestamp' the digest
+                will only use the normed path, size, and timestamp of any
+                files found in the arguments. This value is used when
+                determining whether a task is precalculated or its target
+                files can be copied to an equivalent task. Note if
+                ``hash_algorithm`` is 'sizetimestamp' the task will require the
+                same base path files to determine equality. If it is a
+                ``hashlib`` algorithm only file contents will be considered.
+            copy_duplicate_artifact (bool): if True and the Tasks'
+                argument signature matches a previous Tasks without direct
+                comparison of the target path files in the arguments other
+                than their positions in the target path list, the target
+                artifacts from a previously successful Task execution will
+                be copied to the new one.
+            hardlink_allowed (bool): if ``copy_duplicate_artifact`` is True,
+                this will allow a hardlink rather than a copy when needed.
+            copy_strategy (str): if ``copy_duplicate_artifact`` is True, how
+                artifacts are copied when a hardlink is not allowed or
+                fails. One of 'auto' or 'reflink' to first try a
+                copy-on-write clone, 'kernel' to first try
+                ``os.copy_file_range``/``os.sendfile``, or 'buffered' for
+                an ordinary read/write copy. Methods that are not supported
+                fall back to the next one in that order. Unlike a hardlink,
+                a reflink is safe if downstream tasks modify the copy.
+            transient_run (bool): if True, this Task will be reexecuted
+                even if it was successfully executed in a previous TaskGraph
+                instance. If False, this Task will be skipped if it was
+                executed successfully in a previous TaskGraph instance. One
+                might wish to set `transient_run` to True on a Task that does
+                some sort of initialization that's needed every time a
+                TaskGraph is instantiated. Perhaps to acquire dynamic resources
+                or authenticate permissions.
+            store_result (bool): If True, the result of ``func`` will be stored
+                in the TaskGraph database and retrievable with a call to
+                ``.get()`` on a ``Task`` object.
+            func_fingerprint_mode (str): determines how ``func`` and any
+                callables in ``args``/``kwargs`` are fingerprinted when
+                deciding if a Task has changed. If 'source' (default) the
+                source code is used, falling back to the bytecode if source
+                is not available such as in frozen deployments. If
+                'bytecode' the function bytecode and constants are always
+                used, which avoids reading source files but means a change
+                in Python version will cause Tasks to reexecute.
+
+        Returns:
+            Task which was just added to the graph or an existing Task that
+            has the same signature and has already been added to the
+            TaskGraph.
+
+        Raises:
+            ValueError if objects are passed to the dependent task list that
+                are not Tasks.
+            ValueError if ``add_task`` is invoked after the ``TaskGraph`` is
+                closed.
+            RuntimeError if ``add_task`` is invoked after ``TaskGraph`` has
+                reached a terminate state.
+
+        """
+        try:
+            if self._terminated:
+                raise RuntimeError(
+                    "add_task when Taskgraph is terminated.")
+            if self._closed:
+                raise ValueError(
+                    "The task graph is closed and cannot accept more "
+                    "tasks.")
+            self._added_task_count += 1
+            if args is None:
+                args = []
+            if kwargs is None:
+                kwargs = {}
+            if task_name is None:
+                task_name = 'UNNAMED TASK'
+            if dependent_task_list is None:
+                dependent_task_list = []
+            if target_path_list is None:
+                target_path_list = []
+            if ignore_path_list is None:
+                ignore_path_list = []
+            if func is None:
+                func = _null_func
+
+            # this is a pretty common error to accidentally not pass a
+            # Task to the dependent task list.
+            if any(not isinstance(task, Task)
+                   for task in dependent_task_list):
+                raise ValueError(
+                    "Objects passed to dependent task list that are not "
+                    "tasks: %s", dependent_task_list)
+
+            task_name = '%s (%d)' % (task_name, len(self._task_hash_map))
+            new_task = Task(
+                task_name, func, args, kwargs, target_path_list,
+                ignore_path_list, hash_target_files, ignore_directories,
+                transient_run, self._worker_pool,
+                self._taskgraph_cache_dir_path, priority, hash_algorithm,
+                copy_duplicate_artifact, hardlink_allowed, store_result,
+                self._task_database_path,
+                func_fingerprint_mode=func_fingerprint_mode,
+                directory_fingerprint_mode=directory_fingerprint_mode,
+                upstream_task_list=(
+                    dependent_task_list if reuse_upstream_fingerprints
+                    else None),
+                shared_memory_threshold=self._shared_memory_threshold,
+                result_store=self._result_store,
+                copy_strategy=copy_strategy,
+                artifact_store=self._artifact_store,
+                file_watcher=self._file_watcher)
+
+            self._task_name_map[new_task.task_name] = new_task
+            # it may be this task was already created in an earlier call,
+            # use that object in its place
+            if new_task in self._task_hash_map:
+                duplicate_task = self._task_hash_map[new_task]
+                new_task_target_set = set(new_task._target_path_list)
+                duplicate_task_target_set = set(
+                    duplicate_task._target_path_list)
+                if new_task_target_set == duplicate_task_target_set:
+                    LOGGER.warning(
+                        "A duplicate task was submitted: %s original: %s",
+                        new_task, self._task_hash_map[new_task])
+                    return duplicate_task
+                disjoint_target_set = (
+                    new_task_target_set.symmetric_difference(
+                        duplicate_task_target_set))
+                if len(disjoint_target_set) == (
+                        len(new_task_target_set) +
+                        len(duplicate_task_target_set)):
+                    if duplicate_task not in dependent_task_list:
+                        LOGGER.info(
+                            "A task was created that had an identical "
+                            "args signature sans target paths, but a "
+                            "different target_path_list of the same "
+                            "length. To avoid recomputation, dynamically "
+                            "adding previous Task (%s) as a dependent "
+                            "task to this one (%s).",
+                            duplicate_task.task_name, task_name)
+                        dependent_task_list = (
+                            dependent_task_list + [duplicate_task])
+                else:
+                    raise RuntimeError(
+                        "A task was created that has the same arguments "
+                        "as another task, but only partially different "
+                        "expected target paths. This runs the risk of "
+                        "unpredictably overwriting output so treating as "
+                        "a runtime error: submitted task: %s, existing "
+                        "task: %s" % (new_task, duplicate_task))
+            self._task_hash_map[new_task] = new_task
+            if self._trace_path is not None:
+                self._traced_task_list.append(
+                    (new_task, dependent_task_list))
+            if self._plan_only:
+                self._planned_task_list.append(
+                    (new_task, dependent_task_list))
+            elif self._n_workers < 0:
+                # call directly if single threaded
+                try:
+                    new_task._call()
+                except Exception:
+                    self._metrics.record_failure()
+                    raise
+                self._record_task(new_task)
+            else:
+                # determine if task is ready or is dependent on other
+                # tasks
+                LOGGER.debug(
+                    "multithreaded: %s sending to new task queue.",
+                    task_name)
+                with self._active_task_lock:
+                    self._update_pending_runtime(new_task, 1)
+                outstanding_dep_task_name_list = [
+                    dep_task.task_name for dep_task in dependent_task_list
+                    if dep_task.task_name
+                    not in self._completed_task_names]
+                if not outstanding_dep_task_name_list:
+                    LOGGER.debug(
+                        "sending task %s right away", new_task.task_name)
+                    new_task._ready_time = time.perf_counter()
+                    self._task_ready_priority_queue.put(new_task)
+                    self._task_waiting_count += 1
+                    self._executor_ready_event.set()
+                else:
+                    # there are unresolved tasks that the waiting
+                    # process scheduler has not been notified of.
+                    # Record dependencies.
+                    for dep_task_name in outstanding_dep_task_name_list:
+                        # record tasks that are dependent on dep_task_name
+                        self._task_dependent_map[dep_task_name].add(
+                            new_task.task_name)
+                        # record tasks that new_task depends on
+                        self._dependent_task_map[new_task.task_name].add(
+                            dep_task_name)
+            return new_task
+
+        except Exception:
+            # something went wrong, shut down the taskgraph
+            LOGGER.exception(
+                "Something went wrong when adding task %s, "
+                "terminating taskgraph.", task_name)
+            self._terminate()
+            raise
+
+    def _handle_logs_from_processes(self, queue_):
+        LOGGER.debug('Starting logging worker')
+        while True:
+            record_list = queue_.get()
+            if record_list is None:
+                break
+            for record in record_list:
+                logger = logging.getLogger(record.name)
+                logger.handle(record)
+        LOGGER.debug('_handle_logs_from_processes shutting down')
+
+    def _handle_profiles_from_processes(self):
+        """Add worker profiles to ``_profile_map`` until None is received."""
+        while True:
+            function_profile_map = self._profile_queue.get()
+            if function_profile_map is None:
+                break
+            with self._profile_lock:
+                for function_key, profile_list in (
+                        function_profile_map.items()):
+                    if function_key in self._profile_map:
+                        self._profile_map[function_key] = [
+                            total + value for total, value in zip(
+                                self._profile_map[function_key],
+                                profile_list)]
+                    else:
+                        self._profile_map[function_key] = profile_list
+        LOGGER.debug('_handle_profiles_from_processes shutting down')
+
+    def _execution_monitor(self, monitor_wait_event):
+        """Log state of taskgraph every ``self._reporting_interval`` seconds.
+
+        Args:
+            monitor_wait_event (threading.Event): used to sleep the monitor
+                for``self._reporting_interval`` seconds, or to wake up to
+                terminate for shutdown.
+
+        Returns:
+            None.
+
+        """
+        start_time = time.time()
+        while True:
+            if self._terminated:
+                break
+            status = self._monitor_status(start_time)
+            percent_complete = 0.0
+            if status['added'] > 0:
+                percent_complete = 100.0 * (
+                    float(status['completed']) / status['added'])
+            straggler_message = '\n'.join(
+                '\t%s: executing for %.2fs, median runtime %.2fs' % (
+                    task_name, elapsed_time, median_runtime)
+                for task_name, elapsed_time, median_runtime in (
+                    status['straggler_list']))
+
+            LOGGER.info(
+                "\n\ttaskgraph execution status: tasks added: %d \n"
+                "\ttasks complete: %d (%.1f%%) \n"
+                "\ttasks waiting for a free worker: %d (qsize: %d)\n"
+                "\ttasks executing (%d): graph is %s\n"
+                "\tthroughput: %.2f tasks/s, precalculated: %s\n"
+                "\testimated time remaining: %s\n"
+                "\tstragglers (%d):\n%s",
+                status['added'], status['completed'], percent_complete,
+                self._task_waiting_count, status['queue_length'],
+                status['active'], 'closed' if self._closed else 'open',
+                status['throughput'],
+                'n/a' if status['cache_hit_rate'] is None else
+                '%.1f%%' % (100.0 * status['cache_hit_rate']),
+                'unknown' if status['eta'] is None else
+                '%.1fs' % status['eta'],
+                len(status['straggler_list']), straggler_message)
+
+            monitor_wait_event.wait(
+                timeout=self._reporting_interval - (
+                    (time.time() - start_time)) % self._reporting_interval)
+        LOGGER.debug("_execution monitor shutting down")
+
+    def _monitor_status(self, start_time):
+        """Summarize the progress of the graph for ``_execution_monitor``.
+
+        This only visits the executing tasks, everything else comes from
+        running totals so it's cheap for large graphs.
+
+        Args:
+            start_time (float): ``time.time`` the monitor started.
+
+        Returns:
+            a dictionary with the keys 'added', 'completed', 'active', and
+            'queue_length' task counts, 'throughput' in completed tasks per
+            second, 'cache_hit_rate' (fraction of completed tasks that
+            were precalculated or None if none are complete), 'eta' (the
+            estimated seconds until all added tasks complete or None if
+            there's no basis for an estimate), and 'straggler_list', a list
+            of (task_name, seconds executing, median runtime) tuples of the
+            executing tasks that have run much longer than usual.
+
+        """
+        import statistics
+        now = time.time()
+        with self._active_task_lock:
+            active_list = list(self._active_task_map.values())
+            pending_runtime = max(0.0, self._pending_runtime)
+            pending_unknown_runtime_count = (
+                self._pending_unknown_runtime_count)
+        with self._executed_task_lock:
+            executed_runtime = self._executed_runtime
+            executed_count = self._executed_count
+        counter_map = self._metrics.get_counter_map()
+        completed_count = len(self._completed_task_names)
+        cache_hit_rate = None
+        if counter_map['completed'] > 0:
+            cache_hit_rate = (
+                counter_map['precalculated'] / counter_map['completed'])
+
+        # tasks without history are estimated with the mean runtime of the
+        # tasks that have executed so far, or of the history
+        default_runtime = None
+        if executed_count > 0:
+            default_runtime = executed_runtime / executed_count
+        elif self._runtime_history_map:
+            default_runtime = statistics.mean(
+                self._runtime_history_map.values())
+
+        straggler_list = []
+        remaining_runtime = pending_runtime
+        if default_runtime is not None:
+            remaining_runtime += (
+                pending_unknown_runtime_count * default_runtime)
+        for task, task_start_time in active_list:
+            median_runtime = self._runtime_history_map.get(
+                task._task_id_hash)
+            elapsed_time = now - task_start_time
+            if median_runtime is not None and elapsed_time > max(
+                    _STRAGGLER_MIN_RUNTIME,
+                    _STRAGGLER_RUNTIME_FACTOR * median_runtime):
+                straggler_list.append(
+                    (task.task_name, elapsed_time, median_runtime))
+            if median_runtime is None:
+                median_runtime = default_runtime
+            if median_runtime is not None:
+                remaining_runtime += max(0.0, median_runtime - elapsed_time)
+
+        eta = None
+        if default_runtime is not None:
+            # precalculated tasks take almost no time, assume the rest of
+            # the graph is precalculated as often as it has been so far
+            if cache_hit_rate is not None:
+                remaining_runtime *= 1.0 - cache_hit_rate
+            eta = remaining_runtime / max(1, self._n_workers)
+
+        return {
+            'added': self._added_task_count,
+            'completed': completed_count,
+            'active': len(active_list),
+            'queue_length': self._task_ready_priority_queue.qsize(),
+            'throughput': completed_count / max(now - start_time, 1e-9),
+            'cache_hit_rate': cache_hit_rate,
+            'eta': eta,
+            'straggler_list': straggler_list,
+        }
+
+    def _update_pending_runtime(self, task, count):
+        """Add ``count`` of ``task`` to the totals of unstarted tasks.
+
+        ``self._active_task_lock`` must be held.
+
+        """
+        runtime = self._runtime_history_map.get(task._task_id_hash)
+        if runtime is None:
+            self._pending_unknown_runtime_count += count
+        else:
+            self._pending_runtime += count * runtime
+
+    def join(self, timeout=None):
+        """Join all threads in the graph.
+
+        Args:
+            timeout (float): if not none will attempt to join subtasks with
+                this value. If a subtask times out, the whole function will
+                timeout.
+
+        Returns:
+            True if successful join, False if timed out.
+
+        """
+        LOGGER.debug("joining taskgraph")
+        if self._plan_only:
+            return True
+        if self._n_workers < 0 or self._terminated:
+            self._write_task_history()
+            if self._closed:
+                self._write_trace()
+                self._stop_metrics()
+            return True
+        try:
+            LOGGER.debug("attempting to join threads")
+            timedout = False
+            for task in self._task_hash_map.values():
+                LOGGER.debug("attempting to join task %s", task.task_name)
+                timedout = not task.join(timeout)
+                LOGGER.debug("task %s was joined", task.task_name)
+                # if the last task timed out then we want to timeout for all
+                # of the task graph
+                if timedout:
+                    LOGGER.info(
+                        "task %s timed out in graph join", task.task_name)
+                    self._write_task_history()
+                    return False
+            if self._closed and self._logging_queue:
+                # Close down the taskgraph
+                self._terminate()
+            self._write_task_history()
+            if self._closed:
+                self._write_trace()
+                self._stop_metrics()
+            return True
+        except Exception:
+            # If there's an exception on a join it means that a task failed
+            # to execute correctly. Print a helpful message then terminate the
+            # taskgraph object.
+            LOGGER.exception(
+                "Exception raised when joining task %s. It's possible "
+                "that this task did not cause the exception, rather another "
+                "exception terminated the task_graph. Check the log to see "
+                "if there are other exceptions.", task)
+            self._terminate()
+            self._write_task_history()
+            raise
+
+    def _record_task(self, task):
+        """Record a ``Task`` that has successfully finished ``_call``."""
+        self._metrics.record_task(task)
+        if task._precalculated is False:
+            with self._executed_task_lock:
+                self._executed_task_list.append(task)
+                self._executed_runtime += task._total_time
+                self._executed_count += 1
+
+    def _write_task_history(self):
+        """Record the runtimes and resource usage of newly executed tasks.
+
+        These are written in one batch when the graph is joined rather than
+        as each task completes to keep database writes off the execution
+        path. They're only used for estimates so a failure is just logged.
+
+        Returns:
+            None.
+
+        """
+        with self._executed_task_lock:
+            executed_task_list = self._executed_task_list
+            self._executed_task_list = []
+        if not executed_task_list:
+            return
+        try:
+            _execute_sqlite(
+                "INSERT INTO task_runtime_history "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._task_database_path, mode='modify', execute='many',
+                argument_list=[
+                    (task._task_id_hash, task.task_name,
+                     task._call_start_timestamp, task._total_time) + (
+                        tuple(task._resource_usage)
+                        if task._resource_usage is not None
+                        else (None,) * len(_RESOURCE_USAGE_FIELD_LIST))
+                    for task in executed_task_list])
+        except Exception:
+            LOGGER.exception('unable to record task runtimes')
+
+    def metrics(self):
+        """Return live metrics in the Prometheus text exposition format.
+
+        These are the number of tasks added, ready, waiting, and executing,
+        counters of completed, failed, precalculated, and copied tasks and
+        of database retries, and histograms of the time tasks spent
+        fingerprinting files and executing.
+
+        Returns:
+            string of metrics, all prefixed with ``taskgraph_``.
+
+        """
+        return self._metrics.render([
+            ('tasks_added', 'Tasks added to the graph.',
+             self._added_task_count),
+            ('ready_queue_depth',
+             'Tasks whose dependencies are met queued for an executor.',
+             self._task_ready_priority_queue.qsize()),
+            ('tasks_waiting',
+             'Tasks whose dependencies are met waiting for an executor.',
+             self._task_waiting_count),
+            ('tasks_active', 'Tasks being executed.',
+             len(self._active_task_map)),
+        ])
+
+    def _write_metrics_textfile(self):
+        """Write ``metrics`` to ``metrics_textfile_path`` if it's set."""
+        if self._metrics_textfile_path is None:
+            return
+        # write and move so the collector never reads a partial file
+        tmp_path = '%s.%d.tmp' % (
+            self._metrics_textfile_path, threading.get_ident())
+        try:
+            with open(tmp_path, 'w') as metrics_file:
+                metrics_file.write(self.metrics())
+            os.replace(tmp_path, self._metrics_textfile_path)
+        except OSError:
+            LOGGER.exception(
+                'unable to write metrics to %s', self._metrics_textfile_path)
+
+    def _stop_metrics(self):
+        """Write the final metrics and stop the metrics threads.
+
+        The threads reference this object, so they must be stopped for it
+        to be garbage collected.
+
+        """
+        self._write_metrics_textfile()
+        self._metrics_textfile_stop_event.set()
+        if self._metrics_server is not None:
+            # ``shutdown`` blocks until ``serve_forever`` stops, and this
+            # may be called from a thread the server is waiting on
+            threading.Thread(target=self._metrics_server.stop).start()
+            self._metrics_server = None
+
+    def _write_metrics_textfile_periodically(self):
+        """Write the metrics textfile until the graph terminates."""
+        while not self._metrics_textfile_stop_event.wait(
+                _METRICS_TEXTFILE_INTERVAL):
+            self._write_metrics_textfile()
+
+    def stats(self):
+        """Return how long each task spent in each phase of its execution.
+
+        Phases are described in ``_TASK_PHASE_LIST``. Summing a phase over
+        all tasks shows whether a run was dominated by hashing
+        ('input_fingerprint', 'target_verify', 'target_fingerprint'), the
+        database ('db_lookup', 'db_write'), worker pool overhead ('execute'
+        minus 'func'), or computation ('func').
+
+        Returns:
+            a dictionary with these keys:
+                'phase_total_map': dictionary mapping each phase to the total
+                    seconds spent in it by all tasks.
+                'task_list': list of dictionaries, one per task in the order
+                    they were added, with the keys 'task_name',
+                    'precalculated' (True, False, or None if it hasn't
+                    been called), 'total' (seconds from the start of the
+                    call to completion, not including 'queue_wait', or
+                    None), each phase mapped to seconds or None if the
+                    task didn't go through that phase, and the
+                    ``_RESOURCE_USAGE_FIELD_LIST`` fields mapped to the
+                    resources used by ``func`` if it executed in a worker
+                    process, otherwise None. 'max_rss' is the peak resident
+                    set size in bytes during the call, which is only
+                    measured on Linux and is None elsewhere.
+
+        """
+        task_stats_list = []
+        for task in self._task_name_map.values():
+            task_stats = {
+                'task_name': task.task_name,
+                'precalculated': task._precalculated,
+                'total': task._total_time,
+            }
+            for phase in _TASK_PHASE_LIST:
+                task_stats[phase] = task._phase_time_map.get(phase)
+            for index, field in enumerate(_RESOURCE_USAGE_FIELD_LIST):
+                task_stats[field] = (
+                    None if task._resource_usage is None
+                    else task._resource_usage[index])
+            task_stats_list.append(task_stats)
+        return {
+            'phase_total_map': {
+                phase: sum(
+                    task_stats[phase] for task_stats in task_stats_list
+                    if task_stats[phase] is not None)
+                for phase in _TASK_PHASE_LIST},
+            'task_list': task_stats_list,
+        }
+
+    def export_stats(self, target_path, file_format='json'):
+        """Write ``stats`` to a file.
+
+        Args:
+            target_path (str): path to the file to write.
+            file_format (str): 'json' to write the whole ``stats``
+                dictionary, or 'csv' to write one row per task with a
+                column for each key in the ``stats`` 'task_list'
+                dictionaries.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError if ``file_format`` is unknown.
+
+        """
+        import csv
+        if file_format not in ('json', 'csv'):
+            raise ValueError(
+                'Unknown file_format: %s, expected json or csv' % (
+                    file_format))
+        stats = self.stats()
+        if file_format == 'json':
+            with open(target_path, 'w') as target_file:
+                json.dump(stats, target_file, indent=2)
+            return
+        with open(target_path, 'w', newline='') as target_file:
+            writer = csv.DictWriter(
+                target_file, fieldnames=[
+                    'task_name', 'precalculated', 'total'] +
+                _TASK_PHASE_LIST + _RESOURCE_USAGE_FIELD_LIST)
+            writer.writeheader()
+            writer.writerows(stats['task_list'])
+
+    def profile_stats(self, sort_key='cumtime', limit=None):
+        """Return the worker profiles of ``profile_workers`` by function.
+
+        The profiles of every ``func`` call are added up, so the functions
+        that took the most time across the whole run are first when sorted
+        by 'tottime' or 'cumtime'. Profiles are complete once ``join``
+        has returned on a closed graph.
+
+        Args:
+            sort_key (str): one of 'ncalls', 'tottime', or 'cumtime' to sort
+                the functions by, largest first.
+            limit (int): if not None, at most this many functions are
+                returned.
+
+        Returns:
+            list of dictionaries with the keys 'function' (in the
+            'filename:lineno(function)' format of ``pstats``), 'ncalls',
+            'tottime' (seconds in the function excluding subcalls), and
+            'cumtime' (seconds including subcalls). Empty if
+            ``profile_workers`` isn't set.
+
+        Raises:
+            ValueError if ``sort_key`` is unknown.
+
+        """
+        import pstats
+        if sort_key not in _PROFILE_SORT_KEY_LIST:
+            raise ValueError(
+                'Unknown sort_key: %s, expected one of %s' % (
+                    sort_key, _PROFILE_SORT_KEY_LIST))
+        self._join_profile_monitor()
+        with self._profile_lock:
+            profile_list = [
+                {
+                    'function': pstats.func_std_string(function_key),
+                    'ncalls': n_calls,
+                    'tottime': total_time,
+                    'cumtime': cumulative_time,
+                } for function_key, (_, n_calls, total_time, cumulative_time)
+                in self._profile_map.items()]
+        profile_list.sort(key=lambda profile: profile[sort_key], reverse=True)
+        return profile_list[:limit]
+
+    def export_profile(self, target_path):
+        """Write the worker profiles of ``profile_workers`` to a file.
+
+        The file can be loaded with ``pstats.Stats(target_path)`` or
+        visualized with tools that read ``cProfile`` output, such as
+        snakeviz. Caller information isn't recorded so call graphs are
+        not available.
+
+        Args:
+            target_path (str): path to the file to write.
+
+        Returns:
+            None.
+
+        """
+        import marshal
+        self._join_profile_monitor()
+        with self._profile_lock:
+            stats = {
+                function_key: tuple(profile_list) + ({},)
+                for function_key, profile_list in self._profile_map.items()}
+        with open(target_path, 'wb') as target_file:
+            marshal.dump(stats, target_file)
+
+    def _join_profile_monitor(self):
+        """Wait for the queued profiles if the graph has terminated."""
+        if self._terminated and self._profile_monitor_thread is not None:
+            self._profile_monitor_thread.join(_MAX_TIMEOUT)
+
+    def plan(self):
+        """Determine which of the added tasks would execute.
+
+        Tasks are checked with ``Task.is_precalculated`` in the order they
+        were added, which is a topological order since dependent tasks
+        must be added first. A task that depends on a task that would
+        execute would execute too, so it's not checked since its inputs
+        might not exist yet. No ``func`` is called.
+
+        Returns:
+            a dictionary with these keys:
+                'task_count': number of tasks added.
+                'execute_count': number of tasks that would execute.
+                'precalculated_count': number of tasks that would not.
+                'estimated_runtime': sum of the median runtimes, in
+                    seconds, of the recent executions of each task that
+                    would execute, for those that have executed before.
+                'unknown_runtime_count': number of tasks that would execute
+                    that have no runtime history.
+                'task_list': list of dictionaries in the order tasks were
+                    added with the keys 'task_name', 'will_execute',
+                    'reason' (why it would execute or None), and
+                    'estimated_runtime' (seconds or None).
+
+        Raises:
+            ValueError if the TaskGraph wasn't created with ``plan_only``.
+
+        """
+        if not self._plan_only:
+            raise ValueError(
+                'plan is only available if the TaskGraph is created with '
+                'plan_only=True')
+        runtime_history_map = _load_runtime_history(self._task_database_path)
+        execute_task_set = set()
+        task_report_list = []
+        for task, dependent_task_list in self._planned_task_list:
+            reason = None
+            stale_dependent_task_list = [
+                dependent_task for dependent_task in dependent_task_list
+                if dependent_task in execute_task_set]
+            if stale_dependent_task_list:
+                reason = 'depends on tasks that will execute: %s' % (
+                    ', '.join(
+                        dependent_task.task_name
+                        for dependent_task in stale_dependent_task_list))
+            elif task._transient_run:
+                reason = 'transient_run is True'
+            elif not task.is_precalculated():
+                reason = task._stale_reason
+            estimated_runtime = None
+            if reason is not None:
+                execute_task_set.add(task)
+                estimated_runtime = runtime_history_map.get(
+                    task._task_id_hash)
+            task_report_list.append({
+                'task_name': task.task_name,
+                'will_execute': reason is not None,
+                'reason': reason,
+                'estimated_runtime': estimated_runtime,
+            })
+
+        execute_report_list = [
+            task_report for task_report in task_report_list
+            if task_report['will_execute']]
+        plan_report = {
+            'task_count': len(task_report_list),
+            'execute_count': len(execute_report_list),
+            'precalculated_count': (
+                len(task_report_list) - len(execute_report_list)),
+            'estimated_runtime': sum(
+                task_report['estimated_runtime']
+                for task_report in execute_report_list
+                if task_report['estimated_runtime'] is not None),
+            'unknown_runtime_count': len([
+                task_report for task_report in execute_report_list
+                if task_report['estimated_runtime'] is None]),
+            'task_list': task_report_list,
+        }
+        LOGGER.info(
+            'plan: %d of %d tasks would execute, estimated runtime %.1fs '
+            'for %d of them', plan_report['execute_count'],
+            plan_report['task_count'], plan_report['estimated_runtime'],
+            plan_report['execute_count'] -
+            plan_report['unknown_runtime_count'])
+        return plan_report
+
+    def close(self):
+        """Prevent future tasks from being added to the work queue."""
+        LOGGER.debug("Closing taskgraph.")
+        if self._closed:
+            return
+        self._closed = True
+        # this wakes up all the executors and any that wouldn't otherwise
+        # have work to do will see there are no tasks left and terminate
+        self._executor_ready_event.set()
+        LOGGER.debug("taskgraph closed")
+
+    def _terminate(self):
+        """Immediately terminate remaining task graph computation."""
+        LOGGER.debug(
+            "Invoking terminate. already terminated? %s", self._terminated)
+        if self._terminated:
+            return
+        self._terminated = True
+
+        if self._logging_queue:
+            self._logging_queue.put(None)
+        if self._profile_queue is not None:
+            self._profile_queue.put(None)
+
+        for task in self._task_hash_map.values():
+            LOGGER.debug("setting task done for %s", task.task_name)
+            task.task_done_executing_event.set()
+
+        if self._worker_pool:
+            self._worker_pool.close()
+            self._worker_pool.terminate()
+
+        self._executor_ready_event.set()
+        self._write_trace()
+        self._stop_metrics()
+
+    def _write_trace(self):
+        """Write the Chrome Trace Event file if it's set and not written."""
+        if self._trace_path is None or self._trace_written:
+            return
+        self._trace_written = True
+        try:
+            with open(self._trace_path, 'w') as trace_file:
+                json.dump(self._build_trace(), trace_file)
+        except Exception:
+            LOGGER.exception('unable to write trace to %s', self._trace_path)
+
+    def _build_trace(self):
+        """Return Chrome Trace Event format events of the executed tasks.
+
+        Returns:
+            dictionary with a 'traceEvents' list in the JSON Object Format
+            described in the Trace Event Format specification.
+
+        """
+        def _microseconds(timestamp):
+            return (timestamp - self._trace_start_timestamp) * 1e6
+
+        parent_pid = os.getpid()
+        # trace viewers expect integer thread ids, these are named with
+        # metadata events
+        thread_id_map = {}
+        event_list = [{
+            'name': 'process_name', 'ph': 'M', 'pid': parent_pid,
+            'args': {'name': 'TaskGraph'}}]
+        worker_pid_set = set()
+        # maps tasks to the (pid, tid, start, end) of their span
+        span_map = {}
+        for task, _ in self._traced_task_list:
+            if task._call_start_timestamp is None:
+                # not called, e.g. the graph terminated first
+                continue
+            if task._executor_thread_name not in thread_id_map:
+                thread_id_map[task._executor_thread_name] = len(thread_id_map)
+                event_list.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': parent_pid,
+                    'tid': thread_id_map[task._executor_thread_name],
+                    'args': {'name': task._executor_thread_name}})
+            tid = thread_id_map[task._executor_thread_name]
+            start = _microseconds(task._call_start_timestamp)
+            end = start
+            if task._total_time is not None:
+                end = start + task._total_time * 1e6
+            span_map[task] = (parent_pid, tid, start, end)
+            event_list.append({
+                'name': task.task_name, 'cat': 'task', 'ph': 'X',
+                'ts': start, 'dur': end - start, 'pid': parent_pid,
+                'tid': tid, 'args': {
+                    'precalculated': task._precalculated,
+                    'artifact_copied': task._artifact_copied}})
+            if task._precalculated:
+                event_list.append({
+                    'name': 'precalculated', 'cat': 'cache', 'ph': 'i',
+                    's': 't', 'ts': end, 'pid': parent_pid, 'tid': tid})
+            if task._artifact_copied:
+                event_list.append({
+                    'name': 'artifact copied', 'cat': 'cache', 'ph': 'i',
+                    's': 't', 'ts': end, 'pid': parent_pid, 'tid': tid})
+            if task._func_start_timestamp is not None:
+                func_pid, func_tid = parent_pid, tid
+                if task._worker_pid is not None:
+                    func_pid, func_tid = task._worker_pid, 0
+                    if func_pid not in worker_pid_set:
+                        worker_pid_set.add(func_pid)
+                        event_list.append({
+                            'name': 'process_name', 'ph': 'M',
+                            'pid': func_pid,
+                            'args': {'name': 'worker %d' % func_pid}})
+                event_list.append({
+                    'name': task.task_name, 'cat': 'func', 'ph': 'X',
+                    'ts': _microseconds(task._func_start_timestamp),
+                    'dur': task._phase_time_map.get('func', 0.0) * 1e6,
+                    'pid': func_pid, 'tid': func_tid})
+
+        flow_id = 0
+        for task, dependent_task_list in self._traced_task_list:
+            if task not in span_map:
+                continue
+            pid, tid, start, _ = span_map[task]
+            for dependent_task in dependent_task_list:
+                if dependent_task not in span_map:
+                    continue
+                (dependent_pid, dependent_tid, dependent_start,
+                 dependent_end) = span_map[dependent_task]
+                flow_id += 1
+                event_list.append({
+                    'name': 'dependency', 'cat': 'dependency', 'ph': 's',
+                    'id': flow_id, 'pid': dependent_pid,
+                    'tid': dependent_tid,
+                    'ts': max(dependent_start, dependent_end - 1)})
+                event_list.append({
+                    'name': 'dependency', 'cat': 'dependency', 'ph': 'f',
+                    'bp': 'e', 'id': flow_id, 'pid': pid, 'tid': tid,
+                    'ts': start})
+        return {'traceEvents': event_list, 'displayTimeUnit': 'ms'}
+
+
+class Task(object):
+    """Encapsulates work/task state for multiprocessing."""
+
+    def __init__(
+            self, task_name, func, args, kwargs, target_path_list,
+            ignore_path_list, hash_target_files, ignore_directories,
+            transient_run, worker_pool, cache_dir, priority, hash_algorithm,
+            copy_duplicate_artifact, hardlink_allowed, store_result,
+            task_database_path, func_fingerprint_mode='source',
+            directory_fingerprint_mode='self', upstream_task_list=None,
+            shared_memory_threshold=None, result_store=None,
+            copy_strategy='auto', artifact_store=None, file_watcher=None):
+        """Make a Task.
+
+        Args:
+            task_name (int): unique task id from the task graph.
+            func (function): a function that takes the argument list
+               ``args``
+            args (tuple): a list of arguments to pass to ``func``.  Can be
+                None.
+            kwargs (dict): keyword arguments to pass to ``func``.  Can be
+                None.
+            target_path_list (list): a list of filepaths that this task
+                should generate.
+            ignore_path_list (list): list of file paths that could be in
+                args/kwargs that should be ignored when considering timestamp
+                hashes.
+            hash_target_files (bool): If True, the hash value of the target
+                files will be recorded to determine if a future run of this
+                function is precalculated. If False, this function only notes
+                the existence of the target files before determining if
+                a function call is precalculated.
+            ignore_directories (bool): if the existence/timestamp of any
+                directories discovered in args or kwargs is used as part
+                of the work token hash.
+            transient_run (bool): if True a call with an identical execution
+                hash will be reexecuted on a subsequent instantiation of a
+                future TaskGraph object. If a duplicate task is submitted
+                to the same object it will not be re-run in any scenario.
+                Otherwise if False, subsequent tasks with an identical
+                execution hash will be skipped.
+            worker_pool (multiprocessing.Pool): if not None, is a
+                multiprocessing pool that can be used for ``_call`` execution.
+            cache_dir (string): path to a directory to both write and expect
+                data recorded from a previous Taskgraph run.
+            priority (numeric): the priority of a task is considered when
+                there is more than one task whose dependencies have been
+                met and are ready for scheduling. Tasks are inserted into the
+                work queue in order of decreasing priority. This value can be
+                positive, negative, and/or floating point.
+            hash_algorithm (string): either a hash function id that
+                exists in hashlib.algorithms_available, an algorithm added
+                with ``register_hash_algorithm``, or 'sizetimestamp'.
+                Any paths to actual files in the arguments will be digested
+                with this algorithm. If value is 'sizetimestamp' the digest
+                will only use the normed path, size, and timestamp of any
+                files found in the arguments.
+            copy_duplicate_artifact (bool): if true and the Tasks'
+                argument signature matches a previous Tasks without direct
+                comparison of the target path files in the arguments other
+                than their positions in the target path list, the target
+                artifacts from a previously successful Task execution will
+                be copied to the new one.
+            hardlink_allowed (bool): if ``copy_duplicate_artifact`` is True,
+                this allows taskgraph to create a hardlink rather than make a
+                direct copy.
+            store_result (bool): If true, the result of ``func`` will be
+                stored in the TaskGraph database and retrievable with a call
+                to ``.get()`` on the Task object.
+            task_database_path (str): path to an SQLITE database that has
+                table named "taskgraph_data" with the three fields:
+                    task_hash TEXT NOT NULL,
+                    target_path_stats BLOB NOT NULL
+                    result BLOB NOT NULL
+                If a call is successful its hash is inserted/updated in the
+                table, the target_path_stats stores the base/target stats
+                for the target files created by the call and listed in
+                ``target_path_list``, and the result of ``func`` is stored in
+                ``result``.
+            func_fingerprint_mode (str): either 'source' or 'bytecode',
+                determines how ``func`` and callables in ``args`` and
+                ``kwargs`` are fingerprinted. See ``_get_func_fingerprint``.
+            directory_fingerprint_mode (str): either 'self' or 'tree',
+                determines how directories in ``args`` and ``kwargs`` are
+                fingerprinted if ``ignore_directories`` is False. See
+                ``_get_file_stats``.
+            upstream_task_list (list): if not None, a list of Tasks that
+                are complete before this one is called. Fingerprints of
+                their targets are used for any of those targets in ``args``
+                and ``kwargs`` rather than fingerprinting the files again.
+            shared_memory_threshold (int): if not None, buffers of at least
+                this many bytes are passed to and from ``worker_pool``
+                through shared memory.
+            result_store (_ResultStore): if not None, used to record the
+                result of ``func`` if ``store_result`` is True, otherwise
+                results are pickled directly into the database.
+            copy_strategy (str): one of 'auto', 'reflink', 'kernel', or
+                'buffered'. The first method tried to copy artifacts if
+                ``copy_duplicate_artifact`` is True, see ``_copy_files``.
+            artifact_store (_ArtifactStore): if not None and
+                ``copy_duplicate_artifact`` is True, target files are added
+                to this store and duplicate artifacts are copied from it.
+            file_watcher (_FileWatcher): if not None, files are
+                fingerprinted through this to reuse the fingerprints of
+                files that haven't changed.
+
+        """
+        if copy_strategy not in _VALID_COPY_STRATEGIES:
+            raise ValueError(
+                'Unknown copy_strategy: %s, expected one of %s' % (
+                    copy_strategy, _VALID_COPY_STRATEGIES))
+        if (directory_fingerprint_mode not in
+                _VALID_DIRECTORY_FINGERPRINT_MODES):
+            raise ValueError(
+                'Unknown directory_fingerprint_mode: %s, expected one of '
+                '%s' % (directory_fingerprint_mode,
+                        _VALID_DIRECTORY_FINGERPRINT_MODES))
+
+        # it is a common error to accidentally pass a non string as to the
+        # target path list, this terminates early if so
+        if any([not (isinstance(path, _VALID_PATH_TYPES))
+                for path in target_path_list]):
+            raise ValueError(
+                "Values passed to target_path_list are not strings: %s",
+                target_path_list)
+
+        # sort the target path list because the order doesn't matter for
+        # a result, but it would cause a task to be reexecuted if the only
+        # difference was a different order.
+        self._target_path_list = sorted([
+            _normalize_path(path) for path in target_path_list])
+        self.task_name = task_name
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._cache_dir = cache_dir
+        self._ignore_path_list = [
+            _normalize_path(path) for path in ignore_path_list]
+        self._hash_target_files = hash_target_files
+        self._ignore_directories = ignore_directories
+        self._directory_fingerprint_mode = directory_fingerprint_mode
+        if upstream_task_list is None:
+            upstream_task_list = []
+        self._upstream_task_list = list(upstream_task_list)
+        # why the last ``is_precalculated`` returned False, None if it didn't
+        self._stale_reason = None
+        # maps ``_TASK_PHASE_LIST`` phases to the seconds spent in them
+        self._phase_time_map = {}
+        # ``time.perf_counter`` when the task was put in the ready queue
+        self._ready_time = None
+        # set by ``_call``
+        self._precalculated = None
+        self._total_time = None
+        self._artifact_copied = False
+        # when and where ``_call`` and ``func`` executed, for tracing
+        self._call_start_timestamp = None
+        self._executor_thread_name = None
+        self._func_start_timestamp = None
+        self._worker_pid = None
+        # ``_ResourceUsage`` of ``func`` if it executed in a worker process
+        self._resource_usage = None
+        self._transient_run = transient_run
+        self._worker_pool = worker_pool
+        self._task_database_path = task_database_path
+        self._hash_algorithm = hash_algorithm
+        self._copy_duplicate_artifact = copy_duplicate_artifact
+        self._hardlink_allowed = hardlink_allowed
+        self._copy_strategy = copy_strategy
+        self._artifact_store = artifact_store
+        self._file_watcher = file_watcher
+        self._store_result = store_result
+        self._shared_memory_threshold = shared_memory_threshold
+        if result_store is None:
+            result_store = _ResultStore(None, None, None)
+        self._result_store = result_store
+        self.exception_object = None
+
+        # invert the priority since sorting goes smallest to largest and we
+        # want more positive priority values to be executed first.
+        self._priority = -priority
+
+        # Used to ensure only one attempt at executing and also a mechanism
+        # to see when Task is complete. This can be set if a Task finishes
+        # a _call and there are no more attempts at reexecution.
+        self.task_done_executing_event = threading.Event()
+
+        # These are used to store and later access the result of the call.
+        self._result = None
+        # False if ``self._result`` must be loaded from ``self._result_blob``
+        # before it is valid
+        self._result_loaded = True
+        # if not None, this is the ``taskgraph_data.result`` value the result
+        # can be loaded from with ``self._result_store``
+        self._result_blob = None
+        # (path, hash_algorithm, hash) tuples of the targets once they have
+        # been recorded or verified by ``_call``
+        self._target_path_stats = None
+
+        # Calculate a hash based only on argument inputs.
+        source_code = _get_func_fingerprint(
+            self._func, func_fingerprint_mode, False)
+
+        if not hasattr(self._func, '__name__'):
+            LOGGER.warning(
+                "function does not have a __name__ which means it will not "
+                "be considered when calculating a successive input has "
+                "been changed with another function without __name__.")
+            self._func.__name__ = ''
+
+        args_clean = []
+        for index, arg in enumerate(self._args):
+            try:
+                scrubbed_value = _scrub_task_args(
+                    arg, self._target_path_list, func_fingerprint_mode)
+                if not _is_picklable(scrubbed_value):
+                    raise TypeError('argument is not picklable')
+                args_clean.append(scrubbed_value)
+            except TypeError:
+                LOGGER.warning(
+                    "could not pickle argument at index %d (%s). "
+                    "Skipping argument which means it will not be considered "
+                    "when calculating whether inputs have been changed "
+                    "on a successive run.", index, arg)
+
+        kwargs_clean = {}
+        # iterate through sorted order so we get the same hash result with the
+        # same set of kwargs irrespective of the item dict order.
+        for key, arg in sorted(self._kwargs.items()):
+            try:
+                scrubbed_value = _scrub_task_args(
+                    arg, self._target_path_list, func_fingerprint_mode)
+                if not _is_picklable(scrubbed_value):
+                    raise TypeError('argument is not picklable')
+                kwargs_clean[key] = scrubbed_value
+            except TypeError:
+                LOGGER.warning(
+                    "could not pickle kw argument %s (%s) scrubbed to %s. "
+                    "Skipping argument which means it will not be considered "
+                    "when calculating whether inputs have been changed "
+                    "on a successive run.", key, arg, scrubbed_value)
+
+        self._reexecution_info = {
+            'func_name': self._func.__name__,
+            'args_clean': args_clean,
+            'kwargs_clean': kwargs_clean,
+            'source_code_hash': hashlib.sha1(
+                source_code.encode('utf-8')).hexdigest(),
+        }
+
+        argument_hash_string = ':'.join([
+            repr(self._reexecution_info[key])
+            for key in sorted(self._reexecution_info.keys())])
+
+        self._task_id_hash = hashlib.sha1(
+            argument_hash_string.encode('utf-8')).hexdigest()
+
+        # this will get calculated when ``is_precalculated`` is invoked.
+        self._task_reexecution_hash = None
+
+    def __eq__(self, other):
+        """Two tasks are equal if their hashes are equal."""
+        return (
+            isinstance(self, other.__class__) and
+            (self._task_id_hash == other._task_id_hash))
+
+    def __hash__(self):
+        """Return the base-16 integer hash of this hash string."""
+        return int(self._task_id_hash, 16)
+
+    def __ne__(self, other):
+        """Inverse of __eq__."""
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        """Less than based on priority."""
+        return self._priority < other._priority
+
+    def __repr__(self):
+        """Create a string representation of a Task."""
+        import pprint
+        return "Task object %s:\n\n" % (id(self)) + pprint.pformat(
+            {
+                "task_name": self.task_name,
+                "priority": self._priority,
+                "ignore_path_list": self._ignore_path_list,
+                "ignore_directories": self._ignore_directories,
+                "target_path_list": self._target_path_list,
+                "task_id_hash": self._task_id_hash,
+                "task_reexecution_hash": self._task_reexecution_hash,
+                "exception_object": self.exception_object,
+                "self._reexecution_info": self._reexecution_info,
+                "self._result": self._result,
+            })
+
+    def _add_phase_time(self, phase, start_time):
+        """Add the time since ``start_time`` to ``phase``.
+
+        Args:
+            phase (str): one of ``_TASK_PHASE_LIST``.
+            start_time (float): ``time.perf_counter`` at the phase start, or
+                None if it wasn't recorded.
+
+        Returns:
+            None.
+
+        """
+        if start_time is None:
+            return
+        self._phase_time_map[phase] = self._phase_time_map.get(
+            phase, 0.0) + time.perf_counter() - start_time
+
+    def _call(self):
+        """Invoke this method to execute task.
+
+        Precondition is that the Task dependencies are satisfied.
+
+        Sets the ``self.task_done_executing_event`` flag if execution is
+        successful.
+
+        Raises:
+            RuntimeError if any target paths are not generated after the
+                function call is complete.
+
+        """
+        LOGGER.debug("_call check if precalculated %s", self.task_name)
+        call_start_time = time.perf_counter()
+        self._call_start_timestamp = time.time()
+        self._executor_thread_name = threading.current_thread().name
+        if not self._transient_run and self.is_precalculated():
+            self._precalculated = True
+            self._total_time = time.perf_counter() - call_start_time
+            self.task_done_executing_event.set()
+            return
+        self._precalculated = False
+        LOGGER.debug("not precalculated %s", self.task_name)
+        if not self._hash_target_files:
+            target_hash_algorithm = 'exists'
+        else:
+            target_hash_algorithm = self._hash_algorithm
+        # if artifacts are copied this is set to their stats so they don't
+        # need to be fingerprinted again
+        copied_target_path_stats = None
+        if self._copy_duplicate_artifact:
+            phase_start_time = time.perf_counter()
+            # try to see if we can copy old files
+            database_result = _execute_sqlite(
+                """
+                SELECT target_path_stats from taskgraph_data
+                WHERE (task_reexecution_hash == ?)
+                """,
+                self._task_database_path, mode='read_only',
+                argument_list=(self._task_reexecution_hash,),
+                execute='execute', fetch='one')
+            try:
+                if database_result:
+                    result_target_path_stats = pickle.loads(database_result[0])
+                    LOGGER.debug(
+                        'duplicate artifact db results: %s',
+                        result_target_path_stats)
+                    copied_target_path_stats = _copy_verified_artifacts(
+                        result_target_path_stats, self._target_path_list,
+                        self._copy_strategy, self._hardlink_allowed,
+                        self._artifact_store)
+            except IOError as e:
+                LOGGER.warning(
+                    "IOError encountered when hashing original source "
+                    "files.\n%s" % e)
+            self._add_phase_time('artifact_copy', phase_start_time)
+        artifact_copied = copied_target_path_stats is not None
+        self._artifact_copied = artifact_copied
+        # targets fingerprinted by ``open_target`` while ``func`` executed
+        target_fingerprint_map = {}
+        if not artifact_copied:
+            phase_start_time = time.perf_counter()
+            if self._worker_pool is not None:
+                shared_memory_list = []
+                try:
+                    if self._shared_memory_threshold is None:
+                        result = self._worker_pool.apply_async(
+                            func=_call_in_worker, args=(
+                                self._func, self._args, self._kwargs, None,
+                                self._store_result, target_hash_algorithm))
+                    else:
+                        # only buffers that go to shared memory are kept
+                        # out of band, so the pool just pickles handles to
+                        # them and the rest of the payload
+                        payload, buffer_list = _serialize_payload(
+                            self._func, self._args, self._kwargs,
+                            out_of_band_threshold=(
+                                self._shared_memory_threshold))
+                        result = self._worker_pool.apply_async(
+                            func=_call_serialized, args=(
+                                _share_buffer(
+                                    payload, self._shared_memory_threshold,
+                                    shared_memory_list),
+                                [_share_buffer(
+                                    buffer, self._shared_memory_threshold,
+                                    shared_memory_list)
+                                 for buffer in buffer_list],
+                                self._shared_memory_threshold,
+                                self._store_result, target_hash_algorithm))
+                        payload = None
+                        buffer_list = None
+                    # the following blocks and raises an exception if
+                    # result raised an exception
+                    LOGGER.debug("apply_async for task %s", self.task_name)
+                    payload = result.get()
+                finally:
+                    # the worker is done with its arguments whether or not
+                    # it succeeded
+                    for shared_memory_block in shared_memory_list:
+                        shared_memory_block.close()
+                        shared_memory_block.unlink()
+                if isinstance(payload, _TrackedResult):
+                    target_fingerprint_map = payload.target_fingerprint_map
+                    self._phase_time_map['func'] = payload.func_time
+                    self._func_start_timestamp = payload.func_start_timestamp
+                    self._worker_pid = payload.pid
+                    self._resource_usage = payload.resource_usage
+                    payload = payload.result
+                if isinstance(payload, _SerializedResult):
+                    payload = _load_serialized_result(payload)
+            else:
+                LOGGER.debug("direct _func for task %s", self.task_name)
+                self._func_start_timestamp = time.time()
+                payload, target_fingerprint_map = (
+                    _call_with_target_tracking(
+                        target_hash_algorithm, self._func, self._args,
+                        self._kwargs))
+                self._add_phase_time('func', phase_start_time)
+            self._add_phase_time('execute', phase_start_time)
+            if self._store_result:
+                self._result = payload
+                self._result_loaded = True
+
+        # check that the target paths exist and record stats for later
+        if artifact_copied and all(
+                hash_algorithm == target_hash_algorithm
+                for _, hash_algorithm, _ in copied_target_path_stats):
+            result_target_path_stats = copied_target_path_stats
+        else:
+            phase_start_time = time.perf_counter()
+            result_target_path_stats = _get_target_file_stats(
+                self._target_path_list, target_hash_algorithm,
+                target_fingerprint_map, self._file_watcher)
+            self._add_phase_time('target_fingerprint', phase_start_time)
+        result_target_path_set = set(
+            [x[0] for x in result_target_path_stats])
+        target_path_set = set(self._target_path_list)
+        if target_path_set != result_target_path_set:
+            raise RuntimeError(
+                "In Task: %s\nMissing expected target path results.\n"
+                "Expected: %s\nObserved: %s\n" % (
+                    self.task_name, self._target_path_list,
+                    result_target_path_set))
+
+        if self._artifact_store is not None and (
+                self._copy_duplicate_artifact):
+            phase_start_time = time.perf_counter()
+            for path, hash_algorithm, fingerprint in (
+                    result_target_path_stats):
+                self._artifact_store.ingest(path, hash_algorithm, fingerprint)
+            self._add_phase_time('artifact_ingest', phase_start_time)
+
+        # this step will only record the run if there is an expected
+        # target file. Otherwise we infer the result of this call is
+        # transient between taskgraph executions and we should expect to
+        # run it again.
+        phase_start_time = time.perf_counter()
+        if not self._transient_run:
+            if self._store_result:
+                result_blob = self._result_store.dump(self._result)
+                # remember this in case the caller drops the loaded result
+                self._result_blob = result_blob
+            else:
+                # nothing will ever read this
+                result_blob = b''
+            _execute_sqlite(
+                "INSERT OR REPLACE INTO taskgraph_data VALUES (?, ?, ?)",
+                self._task_database_path, mode='modify',
+                argument_list=(
+                    self._task_reexecution_hash,
+                    pickle.dumps(result_target_path_stats),
+                    result_blob))
+        self._target_path_stats = result_target_path_stats
+        self._add_phase_time('db_write', phase_start_time)
+        self._total_time = time.perf_counter() - call_start_time
+        self.task_done_executing_event.set()
+        LOGGER.debug("successful run on task %s", self.task_name)
+
+    def is_precalculated(self):
+        """Return true if _call need not be invoked.
+
+        If the task has been precalculated it will fetch the return result from
+        the previous run.
+
+        Returns:
+            True if the Task's target paths exist in the same state as the
+            last recorded run at the time this function is called. It is
+            possible this value could change without running the Task if
+            input parameter file stats change. False otherwise.
+
+        """
+        # This gets a list of the files and their file stats that can be found
+        # in args and kwargs but ignores anything specifically targeted or
+        # an expected result. This will allow a task to change its hash in
+        # case a different version of a file was passed in.
+        # these are the stats of the files that exist that aren't ignored
+        if not self._hash_target_files:
+            target_hash_algorithm = 'exists'
+        else:
+            target_hash_algorithm = self._hash_algorithm
+        # targets of upstream tasks were just fingerprinted by those tasks
+        upstream_fingerprint_map = {
+            path: (hash_algorithm, fingerprint)
+            for upstream_task in self._upstream_task_list
+            if upstream_task._target_path_stats is not None
+            for path, hash_algorithm, fingerprint in (
+                upstream_task._target_path_stats)
+            if hash_algorithm == target_hash_algorithm}
+        phase_start_time = time.perf_counter()
+        file_stat_list = list(_get_file_stats(
+            [self._args, self._kwargs],
+            target_hash_algorithm,
+            self._target_path_list+self._ignore_path_list,
+            self._ignore_directories, self._file_watcher,
+            self._directory_fingerprint_mode, upstream_fingerprint_map))
+        self._add_phase_time('input_fingerprint', phase_start_time)
+
+        other_arguments = _filter_non_files(
+            [self._reexecution_info['args_clean'],
+             self._reexecution_info['kwargs_clean']],
+            self._target_path_list,
+            self._ignore_path_list,
+            self._ignore_directories)
+
+        LOGGER.debug("file_stat_list: %s", file_stat_list)
+        LOGGER.debug("other_arguments: %s", other_arguments)
+
+        # add the file stat list to the already existing reexecution info
+        # dictionary that contains stats that should not change whether
+        # files have been created/updated/or not.
+        self._reexecution_info['file_stat_list'] = file_stat_list
+        self._reexecution_info['other_arguments'] = other_arguments
+
+        reexecution_string = '%s:%s:%s:%s:%s' % (
+            self._reexecution_info['func_name'],
+            self._reexecution_info['source_code_hash'],
+            self._reexecution_info['other_arguments'],
+            self._store_result,
+            # the x[2] is to only take the *hash* part of the 'file_stat'
+            str([x[2] for x in file_stat_list]))
+
+        self._task_reexecution_hash = hashlib.sha1(
+            reexecution_string.encode('utf-8')).hexdigest()
+        try:
+            phase_start_time = time.perf_counter()
+            database_result = _execute_sqlite(
+                """SELECT target_path_stats, result from taskgraph_data
+                    WHERE (task_reexecution_hash == ?)""",
+                self._task_database_path, mode='read_only',
+                argument_list=(self._task_reexecution_hash,), fetch='one')
+            self._add_phase_time('db_lookup', phase_start_time)
+            if database_result is None:
+                LOGGER.debug(
+                    "not precalculated, Task hash does not "
+                    "exist (%s)", self.task_name)
+                LOGGER.debug("is_precalculated full task info: %s", self)
+                self._stale_reason = (
+                    'no previous run with the same function, arguments, and '
+                    'input files')
+                return False
+            result_target_path_stats = pickle.loads(database_result[0])
+            phase_start_time = time.perf_counter()
+            mismatched_target_file_list = []
+            for path, hash_algorithm, hash_string in result_target_path_stats:
+                if path not in self._target_path_list:
+                    mismatched_target_file_list.append(
+                        'Recorded path not in target path list %s' % path)
+                if not os.path.exists(path):
+                    mismatched_target_file_list.append(
+                        'Path not found: %s' % path)
+                    continue
+                elif hash_algorithm == 'exists':
+                    # this is the case where hash_algorithm == 'exists' but
+                    # we already know the file exists so we do nothing
+                    continue
+                if hash_algorithm == 'sizetimestamp':
+                    size, modified_time, actual_path = [
+                        x for x in hash_string.split('::')]
+                    if actual_path != path:
+                        mismatched_target_file_list.append(
+                            "Path names don't match\n"
+                            "cached: (%s)\nactual (%s)" % (path, actual_path))
+                    target_modified_time = os.path.getmtime(path)
+                    if not math.isclose(
+                            float(modified_time), target_modified_time):
+                        mismatched_target_file_list.append(
+                            "Modified times don't match "
+                            "cached: (%f) actual: (%f)" % (
+                                float(modified_time), target_modified_time))
+                        continue
+                    target_size = os.path.getsize(path)
+                    if float(size) != target_size:
+                        mismatched_target_file_list.append(
+                            "File sizes don't match "
+                            "cached: (%s) actual: (%s)" % (
+                                size, target_size))
+                else:
+                    if self._file_watcher is not None:
+                        target_hash = self._file_watcher.hash_file(
+                            path, hash_algorithm)
+                    else:
+                        target_hash = _hash_file(path, hash_algorithm)
+                    if hash_string != target_hash:
+                        mismatched_target_file_list.append(
+                            "File hashes are different. cached: (%s) "
+                            "actual: (%s)" % (hash_string, target_hash))
+            self._add_phase_time('target_verify', phase_start_time)
+            if mismatched_target_file_list:
+                LOGGER.info(
+                    "not precalculated (%s), Task hash exists, "
+                    "but there are these mismatches: %s",
+                    self.task_name, '\n'.join(mismatched_target_file_list))
+                self._stale_reason = (
+                    'targets changed since the last run: %s' % '; '.join(
+                        mismatched_target_file_list))
+                return False
+            if self._store_result:
+                result_blob = database_result[1]
+                if not self._result_store.is_available(result_blob):
+                    LOGGER.info(
+                        "not precalculated (%s), Task hash exists, but its "
+                        "result was evicted from the result store",
+                        self.task_name)
+                    self._stale_reason = (
+                        'stored result was evicted from the result store')
+                    return False
+                # defer unpickling until ``get`` is called since the result
+                # may never be read
+                self._result = None
+                self._result_blob = result_blob
+                self._result_loaded = False
+            self._target_path_stats = result_target_path_stats
+            self._stale_reason = None
+            LOGGER.debug("precalculated (%s)" % self)
+            return True
+        except EOFError:
+            LOGGER.exception("not precalculated %s, EOFError", self.task_name)
+            self._stale_reason = 'unable to read the record of the last run'
+            return False
+
+    def join(self, timeout=None):
+        """Block until task is complete, raise exception if runtime failed."""
+        LOGGER.debug(
+            "joining %s done executing: %s", self.task_name,
+            self.task_done_executing_event)
+        successful_wait = self.task_done_executing_event.wait(timeout)
+        if self.exception_object:
+            raise self.exception_object
+        return successful_wait
+
+    def get(self, timeout=None, keep_result=True):
+        """Return the result of the ``func`` once it is ready.
+
+        If ``timeout`` is None, this call blocks until the task is complete
+        determined by a call to ``.join()``. Otherwise will wait up to
+        ``timeout`` seconds before raising a``RuntimeError`` if exceeded.
+
+        If the Task was precalculated the result is loaded from the TaskGraph
+        database or result store on the first call to ``get``.
+
+        Args:
+            timeout (float): if not None this parameter is a floating point
+                number specifying a timeout for the operation in seconds.
+            keep_result (bool): if False, and the result was recorded in the
+                TaskGraph database, the ``Task`` will not hold a reference to
+                the result after this call returns. A later call to ``get``
+                loads it again. This is useful to release memory for large
+                results that are only read once.
+
+        Returns:
+            value of the result
+
+        Raises:
+            RuntimeError when ``timeout`` exceeded.
+            ValueError if ``store_result`` was set to ``False`` when the task
+                was created.
+            OSError if the result was precalculated but was evicted from the
+                result store before it was read.
+
+        """
+        if not self._store_result:
+            raise ValueError(
+                'must set `store_result` to True in `add_task` to invoke this '
+                'function')
+        timeout = not self.join(timeout)
+        if timeout:
+            raise RuntimeError('call to get timed out')
+        result = self._result
+        if not self._result_loaded:
+            result = self._result_store.load(self._result_blob)
+            self._result = result
+            self._result_loaded = True
+        if not keep_result and self._result_blob is not None:
+            self._result = None
+            self._result_loaded = False
+        return result
+
+
+def _copy_verified_artifacts(
+        artifact_stats_list, target_path_list, copy_strategy,
+        hardlink_allowed, artifact_store):
+    """Copy previously recorded artifacts to new targets if unchanged.
+
+    Artifacts with content fingerprints are verified with
+    ``_copy_and_verify``, and the verified fingerprint is reused for the new
+    target. Artifacts with 'sizetimestamp' fingerprints are verified by
+    their file stats before they are copied.
+
+    Args:
+        artifact_stats_list (list): (path, hash_algorithm, fingerprint)
+            tuples recorded for the targets of a previous run, in the same
+            order as ``target_path_list``.
+        target_path_list (list): paths to copy the artifacts to.
+        copy_strategy (str): passed to ``_copy_files`` and
+            ``_copy_and_verify``.
+        hardlink_allowed (bool): if True, a hardlink is attempted before any
+            copy of a verified artifact.
+        artifact_store (_ArtifactStore): if not None and it has a copy of
+            every artifact, the artifacts are copied from the store without
+            verification. These are never hardlinked.
+
+    Returns:
+        list of (path, hash_algorithm, fingerprint) tuples for the new
+        targets, or None if any artifact is missing or has changed in which
+        case the target files may have been partially written.
+
+    Raises:
+        IOError if an artifact can't be read.
+
+    """
+    import concurrent.futures
+    if len(artifact_stats_list) != len(target_path_list):
+        return None
+    target_stats_list = [
+        (target_path, hash_algorithm, fingerprint)
+        for target_path, (_, hash_algorithm, fingerprint) in zip(
+            target_path_list, artifact_stats_list)]
+
+    if artifact_store is not None:
+        # copies in the store are known to match the recorded fingerprints
+        # so there's no need to hash anything
+        store_path_list = [
+            artifact_store.get_path(hash_algorithm, fingerprint)
+            for _, hash_algorithm, fingerprint in artifact_stats_list]
+        if None not in store_path_list:
+            LOGGER.debug(
+                "copying artifacts from store to target path list. \n\t"
+                "stored artifacts: %s\n\ttarget_path_list: %s\n",
+                store_path_list, target_path_list)
+            # never hardlink out of the store, an in place change to the
+            # target would change the stored file under its old fingerprint
+            _copy_files(
+                list(zip(store_path_list, target_path_list)), copy_strategy,
+                False)
+            return target_stats_list
+
+    verify_copy_list = []
+    path_pair_list = []
+    for (artifact_path, hash_algorithm, fingerprint), target_path in zip(
+            artifact_stats_list, target_path_list):
+        if artifact_path == target_path:
+            # the recorded artifact is this target, and since the Task
+            # wasn't precalculated it must have changed, it can't be copied
+            # onto itself
+            return None
+        if hash_algorithm == 'exists':
+            if not os.path.exists(artifact_path):
+                return None
+            path_pair_list.append((artifact_path, target_path))
+        elif hash_algorithm in _NON_CONTENT_HASH_ALGORITHMS:
+            if _hash_file(artifact_path, hash_algorithm) != fingerprint:
+                return None
+            path_pair_list.append((artifact_path, target_path))
+        else:
+            verify_copy_list.append(
+                (artifact_path, target_path, hash_algorithm, fingerprint))
+
+    LOGGER.debug(
+        "copying stored artifacts to target path list. \n\tstored "
+        "artifacts: %s\n\ttarget_path_list: %s\n",
+        [x[0] for x in artifact_stats_list], target_path_list)
+    if verify_copy_list:
+        with concurrent.futures.ThreadPoolExecutor(
+                min(_MAX_COPY_THREADS, len(verify_copy_list))) as executor:
+            verified_list = list(executor.map(
+                lambda args: _copy_and_verify(
+                    *args, copy_strategy, hardlink_allowed),
+                verify_copy_list))
+        if not all(verified_list):
+            LOGGER.info(
+                "artifacts changed since they were recorded, not copying")
+            return None
+    _copy_files(path_pair_list, copy_strategy, hardlink_allowed)
+
+    # sizetimestamp fingerprints include the path so must be recomputed,
+    # this only needs a stat
+    return [
+        (target_path, hash_algorithm, _hash_file(target_path, hash_algorithm))
+        if hash_algorithm == 'sizetimestamp' else
+        (target_path, hash_algorithm, fingerprint)
+        for target_path, hash_algorithm, fingerprint in target_stats_list]
+
+
+def _copy_and_verify(
+        source_path, target_path, hash_algorithm, fingerprint, copy_strategy,
+        hardlink_allowed):
+    """Copy ``source_path`` to ``target_path`` if it matches ``fingerprint``.
+
+    Args:
+        source_path (str): path to file to copy.
+        target_path (str): path to copy to, overwritten if it exists.
+        hash_algorithm (str): content hash algorithm for ``_hash_file``.
+        fingerprint (str): expected ``hash_algorithm`` digest of
+            ``source_path``.
+        copy_strategy (str): one of ``_VALID_COPY_STRATEGIES``. A reflink
+            or buffered copy is verified as it's made, otherwise
+            ``source_path`` is verified first and then copied with
+            ``_copy_files``.
+        hardlink_allowed (bool): if True, a hardlink is tried before any
+            copy once ``source_path`` is verified.
+
+    Returns:
+        True if the file was copied and its contents match ``fingerprint``.
+
+    """
+    if copy_strategy == 'auto':
+        copy_strategy = _COPY_STRATEGY_LIST[0]
+    if not hardlink_allowed and copy_strategy == 'reflink':
+        if _reflink(source_path, target_path):
+            # the new target shares blocks with the source so hashing it is
+            # the only read needed, and writing to it won't touch the source
+            return _hash_file(target_path, hash_algorithm) == fingerprint
+        copy_strategy = 'kernel'
+    if hardlink_allowed or copy_strategy != 'buffered':
+        # hardlinks and in kernel copies can't be hashed as they're made.
+        # A hardlink in particular must not be made to a changed artifact
+        # since the task reexecutes and would overwrite it through the link
+        if _hash_file(source_path, hash_algorithm) != fingerprint:
+            return False
+        _copy_files(
+            [(source_path, target_path)], copy_strategy, hardlink_allowed)
+        return True
+    hash_func = _new_hash(hash_algorithm)
+    with open(source_path, 'rb') as source_file, open(
+            target_path, 'wb') as target_file:
+        while True:
+            buffer = source_file.read(2**20)
+            if not buffer:
+                break
+            hash_func.update(buffer)
+            target_file.write(buffer)
+    return hash_func.hexdigest() == fingerprint
+
+
+def _copy_files(path_pair_list, copy_strategy, hardlink_allowed):
+    """Copy many files concurrently with the fastest method available.
+
+    Args:
+        path_pair_list (list): list of (source path, destination path)
+            tuples. Destination files are overwritten.
+        copy_strategy (str): one of ``_VALID_COPY_STRATEGIES``. Each file is
+            copied with this method if possible, falling back to the next
+            methods in ``_COPY_STRATEGY_LIST`` if it's not supported.
+        hardlink_allowed (bool): if True, a hardlink is attempted before any
+            copy.
+
+    Returns:
+        None.
+
+    Raises:
+        OSError if any file could not be copied.
+
+    """
+    import concurrent.futures
+    if copy_strategy == 'auto':
+        copy_strategy = _COPY_STRATEGY_LIST[0]
+    strategy_list = _COPY_STRATEGY_LIST[
+        _COPY_STRATEGY_LIST.index(copy_strategy):]
+    chunk_list = []
+    for source_path, target_path in path_pair_list:
+        if hardlink_allowed:
+            # some OSes may not allow hardlinks but we don't know unless we
+            # try
+            try:
+                os.link(source_path, target_path)
+                continue
+            except Exception:
+                LOGGER.exception(
+                    f'failed to os.link {source_path} to {target_path}')
+        if 'reflink' in strategy_list and _reflink(source_path, target_path):
+            continue
+        # make the target the final size so chunks can be written to it in
+        # any order
+        file_size = os.path.getsize(source_path)
+        with open(target_path, 'wb') as target_file:
+            target_file.truncate(file_size)
+        for offset in range(0, file_size, _COPY_CHUNK_SIZE):
+            chunk_list.append((
+                source_path, target_path, offset,
+                min(_COPY_CHUNK_SIZE, file_size-offset),
+                'kernel' in strategy_list))
+
+    if len(chunk_list) == 1:
+        _copy_chunk(*chunk_list[0])
+    elif chunk_list:
+        with concurrent.futures.ThreadPoolExecutor(
+                min(_MAX_COPY_THREADS, len(chunk_list))) as executor:
+            # list forces any exception to be raised here
+            list(executor.map(lambda chunk: _copy_chunk(*chunk), chunk_list))
+
+
+def _reflink(source_path, target_path):
+    """Try to make ``target_path`` a copy-on-write clone of ``source_path``.
+
+    Args:
+        source_path (str): path to existing file.
+        target_path (str): path to clone to, overwritten if it exists.
+
+    Returns:
+        True if the clone succeeded, False if it's not supported, for
+        example because the filesystem doesn't support it or the files are
+        on different filesystems.
+
+    """
+    if not HAS_FCNTL:
+        return False
+    with open(source_path, 'rb') as source_file, open(
+            target_path, 'wb') as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), _FICLONE, source_file.fileno())
+            return True
+        except OSError:
+            return False
+
+
+def _copy_chunk(source_path, target_path, offset, length, kernel_copy):
+    """Copy ``length`` bytes at ``offset`` from source to target file.
+
+    Args:
+        source_path (str): path to file to read from.
+        target_path (str): path to an existing file to write to.
+        offset (int): byte offset of the chunk in both files.
+        length (int): number of bytes to copy.
+        kernel_copy (bool): if True, ``os.copy_file_range`` or
+            ``os.sendfile`` is attempted before a buffered copy.
+
+    Returns:
+        None.
+
+    """
+    with open(source_path, 'rb') as source_file, open(
+            target_path, 'r+b') as target_file:
+        source_fd = source_file.fileno()
+        target_fd = target_file.fileno()
+        if kernel_copy:
+            copied = 0
+            try:
+                if hasattr(os, 'copy_file_range'):
+                    while copied < length:
+                        n_bytes = os.copy_file_range(
+                            source_fd, target_fd, length-copied,
+                            offset_src=offset+copied,
+                            offset_dst=offset+copied)
+                        if n_bytes == 0:
+                            break
+                        copied += n_bytes
+                elif hasattr(os, 'sendfile'):
+                    # sendfile writes at the current target position
+                    os.lseek(target_fd, offset, os.SEEK_SET)
+                    while copied < length:
+                        n_bytes = os.sendfile(
+                            target_fd, source_fd, offset+copied,
+                            length-copied)
+                        if n_bytes == 0:
+                            break
+                        copied += n_bytes
+            except OSError:
+                # not supported between these files, buffered copy the rest
+                LOGGER.debug(
+                    'kernel copy failed for %s, falling back to buffered '
+                    'copy', source_path)
+            offset += copied
+            length -= copied
+        source_file.seek(offset)
+        target_file.seek(offset)
+        while length > 0:
+            buffer = source_file.read(min(length, 2**20))
+            if not buffer:
+                raise IOError(
+                    f'{source_path} was shorter than expected when copying')
+            target_file.write(buffer)
+            length -= len(buffer)
+
+
+def _get_target_file_stats(
+        target_path_list, hash_algorithm, target_fingerprint_map,
+        file_watcher=None):
+    """Return fingerprints of target files, reusing any already computed.
+
+    Args:
+        target_path_list (list): normalized target paths.
+        hash_algorithm (str): algorithm to fingerprint the targets with, see
+            ``_get_file_stats``.
+        target_fingerprint_map (dict): maps target paths to
+            (hash_algorithm, fingerprint, size, mtime_ns) tuples recorded by
+            ``open_target``. A fingerprint is used if its algorithm
+            matches and the file's size and modification time haven't
+            changed since it was recorded.
+        file_watcher (_FileWatcher): passed to ``_get_file_stats``.
+
+    Returns:
+        list of (path, hash_algorithm, hash) tuples for the target paths
+        that exist, in the same order as ``target_path_list``.
+
+    """
+    target_stats_list = []
+    for target_path in target_path_list:
+        if target_path in target_fingerprint_map:
+            (recorded_algorithm, fingerprint, size,
+             mtime_ns) = target_fingerprint_map[target_path]
+            try:
+                target_stat = os.stat(target_path)
+                if recorded_algorithm == hash_algorithm and (
+                        target_stat.st_size, target_stat.st_mtime_ns) == (
+                            size, mtime_ns):
+                    target_stats_list.append(
+                        (target_path, hash_algorithm, fingerprint))
+                    continue
+            except OSError:
+                pass
+        target_stats_list.extend(
+            _get_file_stats(
+                target_path, hash_algorithm, [], False, file_watcher))
+    return target_stats_list
+
+
+def _get_file_stats(
+        base_value, hash_algorithm, ignore_list,
+        ignore_directories, file_watcher=None,
+        directory_fingerprint_mode='self', fingerprint_map=None):
+    """Return fingerprints of any filepaths in ``base_value``.
+
+    Args:
+        base_value: any python value. Any file paths in ``base_value``
+            should be processed with `_normalize_path`.
+        hash_algorithm (string): either a hash function id that
+            exists in hashlib.algorithms_available, 'exists',
+            'sampled', or 'sizetimestamp'. Any paths to actual files in the
+            arguments will be digested with this algorithm. If value is
+            'sizetimestamp' the digest will only use the normed path, size,
+            and timestamp of any files found in the arguments. This value
+            is used when determining whether a task is precalculated or its
+            target files can be copied to an equivalent task. Note if
+            ``hash_algorithm`` is 'sizetimestamp' the task will require the
+            same base path files to determine equality. If it is a
+            ``hashlib`` algorithm only file contents will be considered. If
+            this value is 'exists' the value of the hash will be 'exists'.
+        ignore_list (list): any paths found in this list are not included
+            as part of the file stats. All paths in this list should be
+            "os.path.norm"ed.
+        ignore_directories (boolean): If True directories are not
+            considered for filestats.
+        file_watcher (_FileWatcher): if not None, files are fingerprinted
+            through this so unchanged files needn't be read again.
+        directory_fingerprint_mode (str): if 'self' directories are
+            fingerprinted like files with ``_hash_file``, which only works
+            for 'sizetimestamp', otherwise the ``OSError`` is logged and the
+            directory is skipped. If 'tree' they are fingerprinted with
+            ``_hash_directory``.
+        fingerprint_map (dict): if not None, maps normalized paths to
+            (hash_algorithm, hash) tuples that are used for those paths
+            without checking the file system.
+
+    Return:
+        list of (path, hash_algorithm, hash) tuples for any filepaths found in
+            base_value or nested in base value that are not otherwise
+            ignored by the input parameters.
+
+    """
+    if isinstance(base_value, _VALID_PATH_TYPES):
+        try:
+            norm_path = _normalize_path(base_value)
+            if (fingerprint_map and norm_path in fingerprint_map and
+                    norm_path not in ignore_list):
+                yield (norm_path,) + fingerprint_map[norm_path]
+                return
+            is_dir = os.path.isdir(norm_path)
+            if norm_path not in ignore_list and (
+                    not is_dir or
+                    not ignore_directories) and os.path.exists(norm_path):
+                if hash_algorithm == 'exists':
+                    yield (norm_path, 'exists', 'exists')
+                elif file_watcher is not None and not is_dir:
+                    yield (
+                        norm_path, hash_algorithm,
+                        file_watcher.hash_file(norm_path, hash_algorithm))
+                elif is_dir and directory_fingerprint_mode == 'tree':
+                    yield (
+                        norm_path, hash_algorithm,
+                        _hash_directory(norm_path, hash_algorithm))
+                else:
+                    yield (
+                        norm_path, hash_algorithm,
+                        _hash_file(norm_path, hash_algorithm))
+        except (OSError, ValueError):
+            # I ran across a ValueError when one of the os.path functions
+            # interpreted the value as a path that was too long.
+            # OSErrors could happen if there's coincidentally a directory we
+            # can't read or it's not a file or something else out of our
+            # control
+            LOGGER.exception(
+                "base_value couldn't be analyzed somehow '%s'", base_value)
+    elif isinstance(base_value, dict):
+        for key in base_value.keys():
+            value = base_value[key]
+            for stat in _get_file_stats(
+                    value, hash_algorithm, ignore_list, ignore_directories,
+                    file_watcher, directory_fingerprint_mode,
+                    fingerprint_map):
+                yield stat
+    elif isinstance(base_value, (list, set, tuple)):
+        for value in base_value:
+            for stat in _get_file_stats(
+                    value, hash_algorithm, ignore_list, ignore_directories,
+                    file_watcher, directory_fingerprint_mode,
+                    fingerprint_map):
+                yield stat
+
+
+def _filter_non_files(
+        base_value, keep_list, ignore_list, keep_directories):
+    """Remove any values that are files not in ignore list or directories.
+
+    Args:
+        base_value: any python value. Any file paths in ``base_value``
+            should be "os.path.norm"ed before this function is called.
+            contains filepaths in any nested structure.
+        keep_list (list): any paths found in this list are not filtered.
+            All paths in this list should be "os.path.norm"ed.
+        ignore_list (list): any paths found in this list are filtered.
+        keep_directories (boolean): If True directories are not filtered
+            out.
+
+    Return:
+        original ``base_value`` with any nested file paths for files that
+        exist in the os.exists set to ``None``.
+
+    """
+    if isinstance(base_value, _VALID_PATH_TYPES):
+        try:
+            norm_path = _normalize_path(base_value)
+            if norm_path not in ignore_list and (
+                    norm_path in keep_list or ((
+                        os.path.isdir(norm_path) and keep_directories) or (
+                        not os.path.isfile(norm_path) and
+                        not os.path.isdir(norm_path)))):
+                return norm_path
+            return None
+        except (OSError, ValueError):
+            # I ran across a ValueError when one of the os.path functions
+            # interpreted the value as a path that was too long.
+            # OSErrors could happen if there's coincidentally a directory we
+            # can't read or it's not a file or something else out of our
+            # control
+            LOGGER.exception(
+                "base_value couldn't be analyzed somehow '%s'", base_value)
+    elif isinstance(base_value, dict):
+        return {
+            key: _filter_non_files(
+                value, keep_list, ignore_list, keep_directories)
+            for key, value in base_value.items()
+        }
+    elif isinstance(base_value, (list, set, tuple)):
+        return type(base_value)([
+            _filter_non_files(
+                value, keep_list, ignore_list, keep_directories)
+            for value in base_value])
+    else:
+        return base_value
+
+
+def _scrub_task_args(
+        base_value, target_path_list, func_fingerprint_mode='source'):
+    """Attempt to convert ``base_value`` to canonical values.
+
+    Any paths in ``base_value`` are normalized, any paths that are also in
+    the``target_path_list`` are replaced with a placeholder so that if
+    all other arguments are the same in ``base_value`` except target path
+    name the function will hash to the same.
+
+    This function can be called before the Task dependencies are satisfied
+    since it doesn't inspect any file stats on disk.
+
+    Args:
+        base_value: any python value
+        target_path_list (list): a list of strings that if found in
+            ``base_value`` should be replaced with 'in_target_path' so
+        func_fingerprint_mode (str): either 'source' or 'bytecode', passed
+            to ``_get_func_fingerprint`` for any callables in
+            ``base_value``.
+
+    Returns:
+        base_value with any functions replaced as strings and paths in
+            ``target_path_list`` with a 'target_path_list[n]' placeholder.
+
+    """
+    if callable(base_value):
+        source_code = _get_func_fingerprint(
+            base_value, func_fingerprint_mode, True)
+        return '%s:%s' % (base_value.__name__, source_code)
+    elif isinstance(base_value, dict):
+        result_dict = {}
+        for key in base_value.keys():
+            result_dict[key] = _scrub_task_args(
+                base_value[key], target_path_list, func_fingerprint_mode)
+        return result_dict
+    elif isinstance(base_value, (list, set, tuple)):
+        result_list = []
+        for value in base_value:
+            result_list.append(_scrub_task_args(
+                value, target_path_list, func_fingerprint_mode))
+        return type(base_value)(result_list)
+    elif isinstance(base_value, _VALID_PATH_TYPES):
+        normalized_path = _normalize_path(base_value)
+        if normalized_path in target_path_list:
+            return 'in_target_path_list'
+        else:
+            return normalized_path
+    else:
+        return base_value
+
+
+def _get_func_fingerprint(func, func_fingerprint_mode, strip_whitespace):
+    """Return a string that identifies the implementation of ``func``.
+
+    Args:
+        func (callable): function to fingerprint.
+        func_fingerprint_mode (str): either 'source' or 'bytecode'. If
+            'source' the fingerprint is the source code of ``func`` as
+            reported by ``inspect.getsource``, falling back to a bytecode
+            fingerprint if the source is not available (e.g. frozen
+            code). If 'bytecode' the fingerprint is always computed from
+            ``func.__code__`` which never touches the filesystem but is only
+            stable across runs of the same Python version.
+        strip_whitespace (bool): if True, spaces and tabs are removed from
+            source code fingerprints.
+
+    Returns:
+        fingerprint string, or '' if ``func`` has neither available source
+        nor a code object.
+
+    """
+    import inspect
+    code = getattr(func, '__code__', None)
+    if func_fingerprint_mode == 'bytecode':
+        if code is None:
+            return ''
+        return _code_fingerprint(code)
+    if func_fingerprint_mode != 'source':
+        raise ValueError(
+            'Unknown func_fingerprint_mode: %s, expected one of %s' % (
+                func_fingerprint_mode, _VALID_FUNC_FINGERPRINT_MODES))
+
+    if code is not None:
+        # the bytecode alone doesn't cover constants or names so code that
+        # only differs in those, e.g. exec'd from '<string>' or reloaded
+        # after changing a constant, would share a key
+        cache_key = (
+            code.co_filename, code.co_firstlineno, _code_fingerprint(code),
+            strip_whitespace)
+    else:
+        cache_key = (func, strip_whitespace)
+    try:
+        with _FUNC_FINGERPRINT_CACHE_LOCK:
+            _FUNC_FINGERPRINT_CACHE.move_to_end(cache_key)
+            return _FUNC_FINGERPRINT_CACHE[cache_key]
+    except KeyError:
+        pass
+    except TypeError:
+        # ``func`` is not hashable so it can't be memoized
+        cache_key = None
+
+    try:
+        source_code = inspect.getsource(func)
+        if strip_whitespace:
+            source_code = source_code.replace(' ', '').replace('\t', '')
+    except (IOError, TypeError):
+        # many reasons for this, for example, frozen Python code won't
+        # have source code, so use the bytecode if there is any
+        if code is not None:
+            source_code = _code_fingerprint(code)
+        else:
+            source_code = ''
+
+    if cache_key is not None:
+        with _FUNC_FINGERPRINT_CACHE_LOCK:
+            _FUNC_FINGERPRINT_CACHE[cache_key] = source_code
+            while (len(_FUNC_FINGERPRINT_CACHE) >
+                    _MAX_FUNC_FINGERPRINT_CACHE_SIZE):
+                _FUNC_FINGERPRINT_CACHE.popitem(last=False)
+    return source_code
+
+
+def _code_fingerprint(code):
+    """Return a hex digest of the bytecode, constants, and names of ``code``.
+
+    Nested code objects (e.g. inner functions, lambdas, comprehensions) are
+    fingerprinted recursively so the result does not depend on memory
+    addresses that appear in their ``repr``.
+
+    Args:
+        code (types.CodeType): a code object, usually ``func.__code__``.
+
+    Returns:
+        sha1 hex digest string.
+
+    """
+    import inspect
+    hash_func = hashlib.sha1()
+    hash_func.update(code.co_code)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            const_repr = _code_fingerprint(const)
+        elif isinstance(const, frozenset):
+            # set iteration order changes between runs with string hashing
+            # randomization so sort it first
+            const_repr = repr(sorted(const, key=repr))
+        else:
+            const_repr = repr(const)
+        hash_func.update(const_repr.encode('utf-8'))
+    hash_func.update(repr(code.co_names).encode('utf-8'))
+    return hash_func.hexdigest()
+
+
+def _hash_file(file_path, hash_algorithm, buf_size=2**20):
+    """Return a hex digest of ``file_path``.
+
+    Args:
+        file_path (string): path to file to hash.
+        hash_algorithm (string): a hash function id that exists in
+            hashlib.algorithms_available, an algorithm added with
+            ``register_hash_algorithm``, 'sampled', or 'sizetimestamp'. If
+            function id is in hashlib.algorithms_available or registered,
+            the file contents are hashed with that function and the
+            fingerprint is returned. If value is 'sampled' the size and
+            a fixed set of blocks of the file are hashed. If value is
+            'sizetimestamp' the size and timestamp of the file are returned
+            in a string of the form
+            '[sizeinbytes]:[lastmodifiedtime]'.
+        buf_size (int): number of bytes to read from ``file_path`` at a time
+            for digesting.
+
+    Returns:
+        a hash hex digest computed with hash algorithm ``hash_algorithm``
+        of the binary contents of the file located at ``file_path``.
+
+    """
+    if hash_algorithm == 'sizetimestamp':
+        norm_path = _normalize_path(file_path)
+        return '%d::%f::%s' % (
+            os.path.getsize(norm_path), os.path.getmtime(norm_path),
+            norm_path)
+    if hash_algorithm == 'sampled':
+        return _hash_file_sampled(file_path)
+    if hash_algorithm in _HASH_ALGORITHM_REGISTRY:
+        hash_file_func = _HASH_ALGORITHM_REGISTRY[hash_algorithm].hash_file
+        if hash_file_func is not None:
+            return hash_file_func(file_path)
+    hash_func = _new_hash(hash_algorithm)
+    with open(file_path, 'rb') as f:
+        binary_data = f.read(buf_size)
+        while binary_data:
+            hash_func.update(binary_data)
+            binary_data = f.read(buf_size)
+    return hash_func.hexdigest()
+
+
+def _hash_directory(dir_path, hash_algorithm):
+    """Return a Merkle digest of the directory tree under ``dir_path``.
+
+    The tree is scanned breadth first with each level's directories scanned
+    in parallel threads, then files are fingerprinted in parallel with
+    ``_hash_file``. The digest of a directory is the SHA-256 of the sorted
+    names, types, and fingerprints of its entries, where a subdirectory's
+    fingerprint is its own digest. Symlinks to files are followed, symlinks
+    to directories and other special files are ignored.
+
+    Args:
+        dir_path (str): path to a directory.
+        hash_algorithm (str): any ``_hash_file`` algorithm except 'exists'
+            used to fingerprint the files in the tree. With
+            'sizetimestamp' a file's fingerprint is its size and
+            modification time.
+
+    Returns:
+        hex digest of the tree.
+
+    """
+    import concurrent.futures
+    # maps directory paths to a list of their (name, is_dir, stat) entries
+    dir_entry_map = {}
+    file_stat_list = []
+    with concurrent.futures.ThreadPoolExecutor(
+            _MAX_DIRECTORY_WALK_THREADS) as executor:
+        scan_path_list = [dir_path]
+        while scan_path_list:
+            entry_list_list = list(
+                executor.map(_scan_directory, scan_path_list))
+            next_scan_path_list = []
+            for scan_path, entry_list in zip(
+                    scan_path_list, entry_list_list):
+                dir_entry_map[scan_path] = entry_list
+                for name, is_dir, entry_stat in entry_list:
+                    entry_path = os.path.join(scan_path, name)
+                    if is_dir:
+                        next_scan_path_list.append(entry_path)
+                    else:
+                        file_stat_list.append((entry_path, entry_stat))
+            scan_path_list = next_scan_path_list
+        file_fingerprint_map = dict(zip(
+            [path for path, _ in file_stat_list],
+            executor.map(
+                lambda path_stat: _hash_directory_file(
+                    *path_stat, hash_algorithm), file_stat_list)))
+
+    # directories are scanned in breadth first order, so digesting them in
+    # reverse digests every subdirectory before its parent
+    dir_digest_map = {}
+    for scan_path in reversed(list(dir_entry_map)):
+        hash_func = hashlib.sha256()
+        for name, is_dir, _ in sorted(dir_entry_map[scan_path]):
+            entry_path = os.path.join(scan_path, name)
+            if is_dir:
+                entry_fingerprint = dir_digest_map.pop(entry_path)
+            else:
+                entry_fingerprint = file_fingerprint_map[entry_path]
+            hash_func.update(('%s:%s:%s\n' % (
+                'd' if is_dir else 'f', name,
+                entry_fingerprint)).encode('utf-8'))
+        dir_digest_map[scan_path] = hash_func.hexdigest()
+    return dir_digest_map[dir_path]
+
+
+def _scan_directory(dir_path):
+    """Return a list of (name, is_dir, stat) entries in ``dir_path``.
+
+    ``stat`` is None for directories. Entries that are neither regular files
+    (or symlinks to them) nor directories, or that disappear during the
+    scan, are skipped.
+
+    """
+    entry_list = []
+    with os.scandir(dir_path) as scandir_iterator:
+        for entry in scandir_iterator:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    entry_list.append((entry.name, True, None))
+                elif entry.is_file():
+                    entry_list.append((entry.name, False, entry.stat()))
+            except OSError:
+                LOGGER.debug(
+                    'unable to stat %s, skipping it', entry.path)
+    return entry_list
+
+
+def _hash_directory_file(file_path, file_stat, hash_algorithm):
+    """Return the fingerprint of a file found by ``_hash_directory``.
+
+    Fingerprints are cached in ``_DIRECTORY_FILE_CACHE`` and reused while the
+    file's size, modification time, and inode are the same as
+    ``file_stat``.
+
+    """
+    if hash_algorithm == 'sizetimestamp':
+        # the path is already part of the directory digest
+        return '%d::%d' % (file_stat.st_size, file_stat.st_mtime_ns)
+    cache_key = (file_path, hash_algorithm)
+    stat_key = (
+        file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino,
+        file_stat.st_dev)
+    with _DIRECTORY_FILE_CACHE_LOCK:
+        if cache_key in _DIRECTORY_FILE_CACHE:
+            cached_stat_key, fingerprint = _DIRECTORY_FILE_CACHE[cache_key]
+            if cached_stat_key == stat_key:
+                _DIRECTORY_FILE_CACHE.move_to_end(cache_key)
+                return fingerprint
+    fingerprint = _hash_file(file_path, hash_algorithm)
+    with _DIRECTORY_FILE_CACHE_LOCK:
+        _DIRECTORY_FILE_CACHE[cache_key] = (stat_key, fingerprint)
+        _DIRECTORY_FILE_CACHE.move_to_end(cache_key)
+        while len(_DIRECTORY_FILE_CACHE) > _MAX_DIRECTORY_FILE_CACHE_SIZE:
+            _DIRECTORY_FILE_CACHE.popitem(last=False)
+    return fingerprint
+
+
+def _hash_file_sampled(file_path):
+    """Return a 'sampled' fingerprint of ``file_path``.
+
+    The fingerprint is a BLAKE2b digest of the file size, its first and last
+    ``_SAMPLED_HASH_BLOCK_SIZE`` bytes, and ``_SAMPLED_HASH_N_INTERIOR_BLOCKS``
+    blocks spaced evenly between them, so only a constant number of bytes
+    are read no matter how large the file is. Files no larger than the
+    sampled blocks are hashed completely.
+
+    Args:
+        file_path (string): path to file to fingerprint.
+
+    Returns:
+        a string of the form '[sizeinbytes]:[hexdigest]'.
+
+    """
+    hash_func = hashlib.blake2b(digest_size=16)
+    n_blocks = _SAMPLED_HASH_N_INTERIOR_BLOCKS + 2
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size <= n_blocks * _SAMPLED_HASH_BLOCK_SIZE:
+            offset_list = range(0, file_size, _SAMPLED_HASH_BLOCK_SIZE)
+        else:
+            # blocks start evenly spaced from 0 to the start of the last
+            # block, so the first and last blocks are the head and tail
+            last_offset = file_size - _SAMPLED_HASH_BLOCK_SIZE
+            offset_list = [
+                index * last_offset // (n_blocks - 1)
+                for index in range(n_blocks)]
+        for offset in offset_list:
+            if hasattr(os, 'pread'):
+                # doesn't move the file position so doesn't need a seek
+                # syscall per block
+                block = os.pread(
+                    f.fileno(), _SAMPLED_HASH_BLOCK_SIZE, offset)
+            else:
+                # pread isn't available on Windows
+                f.seek(offset)
+                block = f.read(_SAMPLED_HASH_BLOCK_SIZE)
+            hash_func.update(block)
+    return '%d:%s' % (file_size, hash_func.hexdigest())
+
+
+def _normalize_path(path):
+    """Convert ``path`` into normalized, normcase, absolute filepath."""
+    norm_path = os.path.normpath(path)
+    try:
+        abs_path = os.path.abspath(norm_path)
+    except TypeError:
+        # this occurs when encountering VERY long strings that might be
+        # interpreted as paths
+        LOGGER.warning(
+            "failed to abspath %s so returning normalized path instead")
+        abs_path = norm_path
+    return os.path.normcase(abs_path)
+
+
+@retrying.retry(
+    wait_exponential_multiplier=500, wait_exponential_max=3200,
+    stop_max_attempt_number=100)
+def _execute_sqlite(
+        sqlite_command, database_path, argument_list=None,
+        mode='read_only', execute='execute', fetch=None):
+    """Execute SQLite command and attempt retries on a failure.
+
+    Args:
+        sqlite_command (str): a well formatted SQLite command.
+        database_path (str): path to the SQLite database to operate on.
+        argument_list (list): ``execute == 'execute'`` then this list is passed
+            to the internal sqlite3 ``execute`` call. If ``execute == 'many'``
+            a list of these is passed to ``executemany`` and they're all
+            committed together.
+        mode (str): must be either 'read_only' or 'modify'.
+        execute (str): must be either 'execute', 'many', or 'script'.
+        fetch (str): if not ``None`` can be either 'all' or 'one'.
+            If not None the result of a fetch will be returned by this
+            function.
+
+    Returns:
+        result of fetch if ``fetch`` is not None.
+
+    """
+    import sqlite3
+    cursor = None
+    connection = None
+    try:
+        if mode == 'read_only':
+            ro_uri = r'%s?mode=ro' % pathlib.Path(
+                os.path.abspath(database_path)).as_uri()
+            LOGGER.debug(
+                '%s exists: %s', ro_uri, os.path.exists(os.path.abspath(
+                    database_path)))
+            connection = sqlite3.connect(ro_uri, uri=True)
+        elif mode == 'modify':
+            connection = sqlite3.connect(database_path)
+        else:
+            raise ValueError('Unknown mode: %s' % mode)
+
+        if execute == 'execute':
+            if argument_list is None:
+                cursor = connection.execute(sqlite_command)
+            else:
+                cursor = connection.execute(sqlite_command, argument_list)
+        elif execute == 'many':
+            cursor = connection.executemany(sqlite_command, argument_list)
+        elif execute == 'script':
+            cursor = connection.executescript(sqlite_command)
+        else:
+            raise ValueError('Unknown execute mode: %s' % execute)
+
+        result = None
+        payload = None
+        if fetch == 'all':
+            payload = (cursor.fetchall())
+        elif fetch == 'one':
+            payload = (cursor.fetchone())
+        elif fetch is not None:
+            raise ValueError('Unknown fetch mode: %s' % fetch)
+        if payload is not None:
+            result = list(payload)
+        cursor.close()
+        connection.commit()
+        connection.close()
+        cursor = None
+        connection = None
+        return result
+    except sqlite3.OperationalError:
+        LOGGER.warning(
+            'TaskGraph database is locked because another process is using '
+            'it, waiting for a bit of time to try again')
+        global _SQLITE_RETRY_COUNT
+        with _SQLITE_RETRY_COUNT_LOCK:
+            _SQLITE_RETRY_COUNT += 1
+        raise
+    except Exception:
+        LOGGER.exception('Exception on _execute_sqlite: %s', sqlite_command)
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if connection is not None:
+            connection.commit()
+            connection.close()
@@ -4,5 +4,9 @@ from .Task import TaskGraph
 from .Task import Task
 from .Task import _TASKGRAPH_DATABASE_FILENAME
 from .Task import __version__
+from .Task import open_target
+from .Task import register_hash_algorithm
 
-__all__ = ['__version__', 'TaskGraph', 'Task', '_TASKGRAPH_DATABASE_FILENAME']
+__all__ = [
+    '__version__', 'TaskGraph', 'Task', '_TASKGRAPH_DATABASE_FILENAME',
+    'open_target', 'register_hash_algorithm']
@@ -0,0 +1,54 @@
+"""HTTP server for ``TaskGraph`` metrics.
+
+This is a separate module so ``http.server``, which is slow to import, is
+only imported by ``TaskGraph`` when ``metrics_port`` is set.
+"""
+import http.server
+import logging
+import socketserver
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Respond to GET requests with ``TaskGraph.metrics``."""
+
+    def do_GET(self):
+        """Send the metrics."""
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header(
+            'Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Log requests at debug level rather than to stderr."""
+        LOGGER.debug('metrics request: ' + format, *args)
+
+
+class _MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server for ``_MetricsRequestHandler``."""
+
+    daemon_threads = True
+
+    def __init__(self, server_address, render_metrics):
+        """Bind the server.
+
+        Args:
+            server_address (tuple): (host, port) to listen on.
+            render_metrics (callable): returns the metrics text to serve.
+
+        """
+        http.server.HTTPServer.__init__(
+            self, server_address, _MetricsRequestHandler)
+        self.render_metrics = render_metrics
+
+    def stop(self):
+        """Stop ``serve_forever`` and close the socket."""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,299 @@
+"""Synthetic task graphs for load testing TaskGraph.
+
+Graphs of a few common shapes are built with ``TaskGraph.add_task``, run
+once from scratch ("cold") and again with every task precalculated
+("warm"), and the makespan, scheduling overhead and worker utilization of
+each run are reported. This gives a standard way to compare changes to the
+scheduler and the cache. It can be run from the command line, see
+``python -m taskgraph.loadtest --help``.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import time
+
+from .Task import TaskGraph
+
+LOGGER = logging.getLogger(__name__)
+
+DAG_SHAPE_LIST = ['chain', 'fan_out', 'diamond', 'random']
+# bytes read or written at a time by ``_synthetic_task``
+_IO_BLOCK_SIZE = 2**20
+_TARGET_DIRNAME = 'load_test_targets'
+_TASKGRAPH_CACHE_DIRNAME = 'load_test_taskgraph_cache'
+
+
+def build_dag(shape, n_tasks, seed=0, width=4, max_in_degree=3):
+    """Build the dependencies of a synthetic task graph.
+
+    Args:
+        shape (str): one of ``DAG_SHAPE_LIST``. 'chain' is a single line of
+            tasks each depending on the last. 'fan_out' is one task that
+            every other task depends on. 'diamond' is a chain of diamonds,
+            a task that ``width`` tasks depend on which a single task
+            depends on, which is the top of the next diamond. 'random'
+            connects each task to up to ``max_in_degree`` random earlier
+            tasks.
+        n_tasks (int): number of tasks in the graph.
+        seed (int): seed of the random connections of a 'random' graph.
+        width (int): number of tasks in the middle of each 'diamond'.
+        max_in_degree (int): most tasks a task in a 'random' graph depends
+            on.
+
+    Returns:
+        list with an entry for each task that is a list of the indexes of
+        the tasks it depends on. Tasks only depend on tasks with smaller
+        indexes, so the list is in a topological order.
+
+    Raises:
+        ValueError if ``shape`` is unknown.
+
+    """
+    if shape not in DAG_SHAPE_LIST:
+        raise ValueError(
+            'Unknown shape: %s, expected one of %s' % (shape, DAG_SHAPE_LIST))
+    dependency_list = []
+    if shape == 'chain':
+        for index in range(n_tasks):
+            dependency_list.append([index-1] if index > 0 else [])
+    elif shape == 'fan_out':
+        for index in range(n_tasks):
+            dependency_list.append([0] if index > 0 else [])
+    elif shape == 'diamond':
+        # the bottom of each diamond is the top of the next
+        top_index = 0
+        middle_index_list = []
+        for index in range(n_tasks):
+            if index == 0:
+                dependency_list.append([])
+            elif len(middle_index_list) < width:
+                dependency_list.append([top_index])
+                middle_index_list.append(index)
+            else:
+                dependency_list.append(middle_index_list)
+                top_index = index
+                middle_index_list = []
+    else:
+        rng = random.Random(seed)
+        for index in range(n_tasks):
+            in_degree = min(index, rng.randint(0, max_in_degree))
+            dependency_list.append(sorted(rng.sample(range(index), in_degree)))
+    return dependency_list
+
+
+def _synthetic_task(
+        task_index, input_path_list, target_path, duration, file_size,
+        cpu_bound):
+    """Read inputs, take ``duration`` seconds, and write a target.
+
+    Args:
+        task_index (int): not used, but target paths are left out of a
+            task's reexecution hash, so without it tasks with the same
+            inputs and duration would be duplicates of each other.
+        input_path_list (list): paths of files to read completely.
+        target_path (str): path of a file of ``file_size`` bytes to write.
+        duration (float): seconds to take, not including I/O.
+        file_size (int): size of ``target_path`` in bytes.
+        cpu_bound (bool): if True the task busy waits for ``duration``
+            seconds, holding the GIL, otherwise it sleeps.
+
+    Returns:
+        None.
+
+    """
+    for input_path in input_path_list:
+        with open(input_path, 'rb') as input_file:
+            while input_file.read(_IO_BLOCK_SIZE):
+                pass
+    if cpu_bound:
+        end_time = time.perf_counter() + duration
+        while time.perf_counter() < end_time:
+            pass
+    elif duration > 0:
+        time.sleep(duration)
+    with open(target_path, 'wb') as target_file:
+        bytes_left = file_size
+        while bytes_left > 0:
+            target_file.write(bytes(min(bytes_left, _IO_BLOCK_SIZE)))
+            bytes_left -= _IO_BLOCK_SIZE
+
+
+def _run_graph(
+        workspace_dir, dependency_list, duration_list, n_workers, file_size,
+        cpu_bound, hash_algorithm):
+    """Run a synthetic graph once and measure it.
+
+    Returns:
+        dictionary of the measurements described in ``run_load_test``.
+
+    """
+    target_dir = os.path.join(workspace_dir, _TARGET_DIRNAME)
+    os.makedirs(target_dir, exist_ok=True)
+    target_path_list = [
+        os.path.join(target_dir, '%d.bin' % index)
+        for index in range(len(dependency_list))]
+
+    start_time = time.perf_counter()
+    task_graph = TaskGraph(
+        os.path.join(workspace_dir, _TASKGRAPH_CACHE_DIRNAME), n_workers)
+    startup_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    task_list = []
+    for index, (upstream_index_list, duration) in enumerate(
+            zip(dependency_list, duration_list)):
+        task_list.append(task_graph.add_task(
+            func=_synthetic_task,
+            args=(
+                index,
+                [target_path_list[upstream_index]
+                 for upstream_index in upstream_index_list],
+                target_path_list[index], duration, file_size, cpu_bound),
+            target_path_list=[target_path_list[index]],
+            dependent_task_list=[
+                task_list[upstream_index]
+                for upstream_index in upstream_index_list],
+            hash_algorithm=hash_algorithm,
+            task_name='task %d' % index))
+    task_graph.close()
+    task_graph.join()
+    makespan = time.perf_counter() - start_time
+
+    task_stats_list = task_graph.stats()['task_list']
+    func_time_list = [
+        task_stats['func'] or 0.0 for task_stats in task_stats_list]
+    # the longest path through the graph if tasks only took ``func`` time
+    finish_time_list = []
+    for upstream_index_list, func_time in zip(
+            dependency_list, func_time_list):
+        finish_time_list.append(func_time + max(
+            [finish_time_list[upstream_index]
+             for upstream_index in upstream_index_list], default=0.0))
+    critical_path_time = max(finish_time_list, default=0.0)
+    task_time = sum(func_time_list)
+    n_parallel = max(1, n_workers)
+    return {
+        'startup_time': startup_time,
+        'makespan': makespan,
+        'task_time': task_time,
+        'critical_path_time': critical_path_time,
+        'scheduling_overhead': makespan - max(
+            critical_path_time, task_time / n_parallel),
+        'worker_utilization': task_time / (makespan * n_parallel),
+        'executed_count': sum(
+            1 for task_stats in task_stats_list
+            if task_stats['precalculated'] is False),
+        'precalculated_count': sum(
+            1 for task_stats in task_stats_list
+            if task_stats['precalculated']),
+    }
+
+
+def run_load_test(
+        workspace_dir, shape='random', n_tasks=100, n_workers=0,
+        task_duration=0.0, duration_jitter=0.0, file_size=0,
+        cpu_bound=False, hash_algorithm='sizetimestamp', seed=0):
+    """Run a synthetic task graph cold then warm and measure both runs.
+
+    Args:
+        workspace_dir (str): directory for the targets and the TaskGraph
+            cache. Anything left from an earlier load test is deleted
+            first so the first run is cold.
+        shape (str): shape of the graph, see ``build_dag``.
+        n_tasks (int): number of tasks in the graph.
+        n_workers (int): passed to ``TaskGraph``.
+        task_duration (float): mean seconds each task takes, not including
+            reading its inputs and writing its target.
+        duration_jitter (float): task durations are uniformly distributed
+            within this fraction of ``task_duration``, so 0 means every
+            task takes ``task_duration`` seconds.
+        file_size (int): bytes each task writes to its target. Each task
+            reads the targets of the tasks it depends on.
+        cpu_bound (bool): if True tasks busy wait rather than sleep.
+        hash_algorithm (str): passed to ``add_task``.
+        seed (int): seed for the graph and the task durations.
+
+    Returns:
+        dictionary with the keys 'cold' and 'warm' mapped to dictionaries of
+        the measurements of each run:
+            'startup_time': seconds to create the ``TaskGraph``.
+            'makespan': seconds from adding the first task until ``join``
+                returned.
+            'task_time': seconds spent in the task functions, summed.
+            'critical_path_time': seconds of task functions on the longest
+                path through the graph.
+            'scheduling_overhead': 'makespan' less the best possible
+                makespan given 'task_time', 'critical_path_time', and the
+                number of workers.
+            'worker_utilization': fraction of the workers' time in
+                'makespan' spent in task functions.
+            'executed_count': number of tasks that executed.
+            'precalculated_count': number of tasks that were precalculated.
+
+    """
+    for dirname in (_TARGET_DIRNAME, _TASKGRAPH_CACHE_DIRNAME):
+        shutil.rmtree(os.path.join(workspace_dir, dirname), ignore_errors=True)
+    dependency_list = build_dag(shape, n_tasks, seed=seed)
+    rng = random.Random(seed)
+    duration_list = [
+        task_duration * (1 + duration_jitter * rng.uniform(-1, 1))
+        for _ in range(n_tasks)]
+    result = {}
+    for run_name in ('cold', 'warm'):
+        LOGGER.info('starting %s run', run_name)
+        result[run_name] = _run_graph(
+            workspace_dir, dependency_list, duration_list, n_workers,
+            file_size, cpu_bound, hash_algorithm)
+    return result
+
+
+def main(args=None):
+    """Run a load test from the command line and print the results."""
+    parser = argparse.ArgumentParser(
+        prog='python -m taskgraph.loadtest', description=(
+            'Run a synthetic task graph cold then warm and report makespan, '
+            'scheduling overhead, and worker utilization.'))
+    parser.add_argument(
+        'workspace_dir', help='directory for targets and the taskgraph cache')
+    parser.add_argument('--shape', choices=DAG_SHAPE_LIST, default='random')
+    parser.add_argument('--n-tasks', type=int, default=100)
+    parser.add_argument('--n-workers', type=int, default=0)
+    parser.add_argument(
+        '--task-duration', type=float, default=0.0,
+        help='mean seconds each task takes')
+    parser.add_argument(
+        '--duration-jitter', type=float, default=0.0,
+        help='fraction of --task-duration that durations vary by')
+    parser.add_argument(
+        '--file-size', type=int, default=0,
+        help='bytes each task writes to its target')
+    parser.add_argument(
+        '--cpu-bound', action='store_true',
+        help='busy wait in tasks rather than sleep')
+    parser.add_argument('--hash-algorithm', default='sizetimestamp')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--json', dest='json_path', help='also write the results here')
+    parsed_args = parser.parse_args(args)
+
+    result = run_load_test(
+        parsed_args.workspace_dir, shape=parsed_args.shape,
+        n_tasks=parsed_args.n_tasks, n_workers=parsed_args.n_workers,
+        task_duration=parsed_args.task_duration,
+        duration_jitter=parsed_args.duration_jitter,
+        file_size=parsed_args.file_size, cpu_bound=parsed_args.cpu_bound,
+        hash_algorithm=parsed_args.hash_algorithm, seed=parsed_args.seed)
+    for run_name, run_result in result.items():
+        print(run_name)
+        for key, value in run_result.items():
+            print('    %-20s %s' % (
+                key, '%.4f' % value if isinstance(value, float) else value))
+    if parsed_args.json_path is not None:
+        with open(parsed_args.json_path, 'w') as json_file:
+            json.dump(result, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
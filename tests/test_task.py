@@ -1,1588 +1,3030 @@
-"""Tests for taskgraph."""
-import hashlib
-import logging
-import logging.handlers
-import multiprocessing
-import os
-import pickle
-import pathlib
-import re
-import shutil
-import sqlite3
-import tempfile
-import time
-import unittest
-
-import retrying
-import taskgraph
-
-LOGGER = logging.getLogger(__name__)
-
-N_TEARDOWN_RETRIES = 5
-MAX_TRY_WAIT_MS = 500
-
-
-def _return_value_once(value):
-    """Return the value passed to it only once."""
-    if hasattr(_return_value_once, 'executed'):
-        raise RuntimeError("this function was called twice")
-    _return_value_once.executed = True
-    return value
-
-
-def _noop_function(**kwargs):
-    """Do nothing except allow kwargs to be passed."""
-    pass
-
-
-def _long_running_function(delay):
-    """Wait for ``delay`` seconds."""
-    time.sleep(delay)
-
-
-def _create_two_files_on_disk(value, target_a_path, target_b_path):
-    """Create two files and write ``value`` and append if possible."""
-    with open(target_a_path, 'a') as a_file:
-        a_file.write(value)
-
-    with open(target_b_path, 'a') as b_file:
-        b_file.write(value)
-
-
-def _merge_and_append_files(base_a_path, base_b_path, target_path):
-    """Merge two files and append if possible to new file."""
-    with open(target_path, 'a') as target_file:
-        for base_path in [base_a_path, base_b_path]:
-            with open(base_path, 'r') as base_file:
-                target_file.write(base_file.read())
-
-
-def _create_list_on_disk(value, length, target_path=None):
-    """Create a numpy array on disk filled with value of ``size``."""
-    target_list = [value] * length
-    pickle.dump(target_list, open(target_path, 'wb'))
-
-
-def _call_it(target, *args):
-    """Invoke ``target`` with ``args``."""
-    target(*args)
-
-
-def _append_val(path, *val):
-    """Append a ``val`` to file at ``path``."""
-    with open(path, 'a') as target_file:
-        for v in val:
-            target_file.write(str(v))
-
-
-def _sum_lists_from_disk(list_a_path, list_b_path, target_path):
-    """Read two lists, add them and save result."""
-    list_a = pickle.load(open(list_a_path, 'rb'))
-    list_b = pickle.load(open(list_b_path, 'rb'))
-    target_list = []
-    for a, b in zip(list_a, list_b):
-        target_list.append(a+b)
-    pickle.dump(target_list, open(target_path, 'wb'))
-
-
-def _div_by_zero():
-    """Divide by zero to raise an exception."""
-    return 1/0
-
-
-def _create_file(target_path, content):
-    """Create a file with contents."""
-    with open(target_path, 'w') as target_file:
-        target_file.write(content)
-
-
-def _create_file_once(target_path, content):
-    """Create a file on the first call, raise an exception on the second."""
-    if hasattr(_create_file_once, 'executed'):
-        raise RuntimeError("this function was called twice")
-    _create_file_once.executed = True
-    with open(target_path, 'w') as target_file:
-        target_file.write(content)
-
-
-def _copy_file_once(base_path, target_path):
-    """Copy base to target on the first call, raise exception on second."""
-    if hasattr(_copy_file_once, 'executed'):
-        raise RuntimeError("this function was called twice")
-    _copy_file_once.executed = True
-    shutil.copyfile(base_path, target_path)
-
-
-def _copy_two_files_once(base_path, target_a_path, target_b_path):
-    """Copy base to target a/b on first call, raise exception on second."""
-    if hasattr(_copy_two_files_once, 'executed'):
-        raise RuntimeError("this function was called twice")
-    _copy_two_files_once.executed = True
-    shutil.copyfile(base_path, target_a_path)
-    shutil.copyfile(base_path, target_b_path)
-
-
-def _log_from_another_process(logger_name, log_message):
-    """Write a log message to a given logger.
-
-    Args:
-        logger_name (string): The string logger name to which ``log_message``
-            will be logged.
-        log_message (string): The string log message to be logged (at INFO
-            level) to the logger at ``logger_name``.
-
-    Returns:
-        ``None``
-
-    """
-    logger = logging.getLogger(logger_name)
-    logger.info(log_message)
-
-
-class TaskGraphTests(unittest.TestCase):
-    """Tests for the taskgraph."""
-
-    def setUp(self):
-        """Create temp workspace directory."""
-        # this lets us delete the workspace after its done no matter the
-        # the rest result
-        self.workspace_dir = tempfile.mkdtemp()
-
-    @retrying.retry(
-        stop_max_attempt_number=N_TEARDOWN_RETRIES,
-        wait_exponential_multiplier=250, wait_exponential_max=MAX_TRY_WAIT_MS)
-    def tearDown(self):
-        """Remove temporary directory."""
-        try:
-            shutil.rmtree(self.workspace_dir)
-        except Exception:
-            LOGGER.exception('error when tearing down.')
-            raise
-
-    def test_version_loaded(self):
-        """TaskGraph: verify we can load the version."""
-        try:
-            import taskgraph
-            # Verifies that there's a version attribute and it has a value.
-            self.assertTrue(len(taskgraph.__version__) > 0)
-        except Exception:
-            self.fail('Could not load the taskgraph version as expected.')
-
-    def test_single_task(self):
-        """TaskGraph: Test a single task."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0, 0.1)
-        # forcing this one to be unicode since there shouldn't be a problem
-        # with that at all...
-        target_path = u'%s' % os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        _ = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            },
-            target_path_list=[target_path])
-        task_graph.close()
-        task_graph.join()
-        result = pickle.load(open(target_path, 'rb'))
-        self.assertEqual(result, [value]*list_len)
-
-    def test_task_hash_source_deleted(self):
-        """TaskGraph: test if old target deleted when hashing duplicate."""
-        target_a_path = os.path.join(self.workspace_dir, 'a.txt')
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        task_a = task_graph.add_task(
-            func=_create_file,
-            args=(target_a_path, 'test value'),
-            target_path_list=[target_a_path],
-            hash_algorithm='md5',
-            copy_duplicate_artifact=True)
-        task_a.join()
-        target_b_path = os.path.join(self.workspace_dir, 'b.txt')
-        _ = task_graph.add_task(
-            func=_create_file,
-            args=(target_b_path, 'test value'),
-            target_path_list=[target_b_path],
-            hash_algorithm='md5',
-            copy_duplicate_artifact=True)
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        os.remove(target_a_path)
-        os.remove(target_b_path)
-
-        target_c_path = os.path.join(self.workspace_dir, 'c.txt')
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        _ = task_graph.add_task(
-            func=_create_file,
-            args=(target_c_path, 'test value'),
-            target_path_list=[target_c_path],
-            hash_algorithm='md5',
-            copy_duplicate_artifact=True)
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_c_path, 'r') as target_file:
-            result = target_file.read()
-        self.assertEqual(result, 'test value')
-
-    def test_task_rel_vs_absolute(self):
-        """TaskGraph: test that relative path equates to absolute."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-
-        target_a_path = os.path.relpath(os.path.join(
-            self.workspace_dir, 'a.txt'), start=self.workspace_dir)
-        target_b_path = os.path.abspath(target_a_path)
-
-        _ = task_graph.add_task(
-           func=_create_file,
-           args=(target_a_path, 'test value'),
-           target_path_list=[target_a_path],
-           hash_algorithm='md5',
-           copy_duplicate_artifact=True,
-           task_name='task a')
-
-        _ = task_graph.add_task(
-           func=_create_file,
-           args=(target_b_path, 'test value'),
-           target_path_list=[target_b_path],
-           hash_algorithm='md5',
-           copy_duplicate_artifact=True,
-           task_name='task b')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        with open(target_a_path, 'r') as a_file:
-            m = hashlib.md5()
-            m.update(a_file.read().encode('utf-8'))
-            a_digest = m.digest()
-        with open(target_b_path, 'r') as b_file:
-            m = hashlib.md5()
-            m.update(b_file.read().encode('utf-8'))
-            b_digest = m.digest()
-        self.assertEqual(a_digest, b_digest)
-
-    def test_timeout_task(self):
-        """TaskGraph: Test timeout functionality."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        _ = task_graph.add_task(
-            func=_long_running_function,
-            args=(5,))
-        task_graph.close()
-        timedout = not task_graph.join(0.5)
-        # this should timeout since function runs for 5 seconds
-        self.assertTrue(timedout)
-
-    def test_precomputed_task(self):
-        """TaskGraph: Test that a task reuses old results."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        _ = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            },
-            target_path_list=[target_path])
-        task_graph.close()
-        task_graph.join()
-        result = pickle.load(open(target_path, 'rb'))
-        self.assertEqual(result, [value]*list_len)
-        result_m_time = os.path.getmtime(target_path)
-        del task_graph
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        _ = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            },
-            target_path_list=[target_path])
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        # taskgraph shouldn't have recomputed the result
-        second_result_m_time = os.path.getmtime(target_path)
-        self.assertEqual(result_m_time, second_result_m_time)
-
-    def test_task_chain(self):
-        """TaskGraph: Test a task chain."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_a_path = os.path.join(self.workspace_dir, 'a.dat')
-        target_b_path = os.path.join(self.workspace_dir, 'b.dat')
-        result_path = os.path.join(self.workspace_dir, 'result.dat')
-        result_2_path = os.path.join(self.workspace_dir, 'result2.dat')
-        value_a = 5
-        value_b = 10
-        list_len = 10
-        task_a = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value_a, list_len),
-            kwargs={
-                'target_path': target_a_path,
-            },
-            target_path_list=[target_a_path])
-        task_b = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value_b, list_len),
-            kwargs={
-                'target_path': target_b_path,
-            },
-            target_path_list=[target_b_path])
-        sum_task = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, target_b_path),
-            kwargs={
-                'target_path': result_path,
-            },
-            target_path_list=[result_path],
-            dependent_task_list=[task_a, task_b])
-        sum_task.join()
-
-        result = pickle.load(open(result_path, 'rb'))
-        self.assertEqual(result, [value_a+value_b]*list_len)
-
-        sum_2_task = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, result_path, result_2_path),
-            target_path_list=[result_2_path],
-            dependent_task_list=[task_a, sum_task])
-        sum_2_task.join()
-        result2 = pickle.load(open(result_2_path, 'rb'))
-        expected_result = [(value_a*2+value_b)]*list_len
-        self.assertEqual(result2, expected_result)
-
-        sum_3_task = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, result_path, result_2_path),
-            target_path_list=[result_2_path],
-            dependent_task_list=[task_a, sum_task])
-        task_graph.close()
-        sum_3_task.join()
-        result3 = pickle.load(open(result_2_path, 'rb'))
-        expected_result = [(value_a*2+value_b)]*list_len
-        self.assertEqual(result3, expected_result)
-        task_graph.join()
-
-    def test_task_chain_single_thread(self):
-        """TaskGraph: Test a single threaded task chain."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_a_path = os.path.join(self.workspace_dir, 'a.dat')
-        target_b_path = os.path.join(self.workspace_dir, 'b.dat')
-        result_path = os.path.join(self.workspace_dir, 'result.dat')
-        result_2_path = os.path.join(self.workspace_dir, 'result2.dat')
-        value_a = 5
-        value_b = 10
-        list_len = 10
-        task_a = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value_a, list_len),
-            kwargs={
-                'target_path': target_a_path,
-            },
-            target_path_list=[target_a_path],
-            task_name='task a')
-        task_b = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value_b, list_len),
-            kwargs={
-                'target_path': target_b_path,
-            },
-            target_path_list=[target_b_path],
-            task_name='task b')
-        sum_task = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, target_b_path),
-            kwargs={
-                'target_path': result_path,
-            },
-            target_path_list=[result_path],
-            dependent_task_list=[task_a, task_b],
-            task_name='task c')
-        sum_task.join()
-
-        result = pickle.load(open(result_path, 'rb'))
-        self.assertEqual(result, [value_a+value_b]*list_len)
-
-        sum_2_task = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, result_path, result_2_path),
-            target_path_list=[result_2_path],
-            dependent_task_list=[task_a, sum_task],
-            task_name='task sum_2')
-        sum_2_task.join()
-        result2 = pickle.load(open(result_2_path, 'rb'))
-        expected_result = [(value_a*2+value_b)]*list_len
-        self.assertEqual(result2, expected_result)
-
-        sum_3_task = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, result_path, result_2_path),
-            target_path_list=[result_2_path],
-            dependent_task_list=[task_a, sum_task],
-            task_name='task sum_3')
-        task_graph.close()
-        sum_3_task.join()
-        result3 = pickle.load(open(result_2_path, 'rb'))
-        expected_result = [(value_a*2+value_b)]*list_len
-        task_graph.join()
-        task_graph = None
-        self.assertEqual(result3, expected_result)
-
-        # we should have 4 completed values in the database, 5 total but one
-        # was a duplicate
-        database_path = os.path.join(
-            self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
-        with sqlite3.connect(database_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM taskgraph_data")
-            result = cursor.fetchall()
-        self.assertEqual(len(result), 4)
-
-    def test_task_broken_chain(self):
-        """TaskGraph: Test a multiprocess chain with exception raised."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 4)
-        target_a_path = os.path.join(self.workspace_dir, 'a.dat')
-        target_b_path = os.path.join(self.workspace_dir, 'b.dat')
-        result_path = os.path.join(self.workspace_dir, 'result.dat')
-        value_a = 5
-        list_len = 10
-        task_a = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value_a, list_len),
-            kwargs={
-                'target_path': target_a_path,
-            },
-            target_path_list=[target_a_path])
-        task_b = task_graph.add_task(
-            func=_div_by_zero,
-            dependent_task_list=[task_a])
-        _ = task_graph.add_task(
-            func=_sum_lists_from_disk,
-            args=(target_a_path, target_b_path),
-            kwargs={
-                'target_path': result_path,
-            },
-            target_path_list=[result_path],
-            dependent_task_list=[task_a, task_b])
-        task_graph.close()
-
-        with self.assertRaises(ZeroDivisionError):
-            task_graph.join()
-
-    def test_broken_task(self):
-        """TaskGraph: Test that a task with an exception won't hang."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
-        _ = task_graph.add_task(
-            func=_div_by_zero, task_name='test_broken_task')
-        task_graph.close()
-        with self.assertRaises(ZeroDivisionError):
-            task_graph.join()
-
-    def test_broken_task_chain(self):
-        """TaskGraph: test dependent tasks fail on ancestor fail."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 4)
-
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        for task_id in range(1):
-            target_path = os.path.join(
-                self.workspace_dir, '1000_%d.dat' % task_id)
-            normal_task = task_graph.add_task(
-                func=_create_list_on_disk,
-                args=(value, list_len),
-                kwargs={'target_path': target_path},
-                target_path_list=[target_path],
-                task_name='create list on disk %d' % task_id)
-            zero_div_task = task_graph.add_task(
-                func=_div_by_zero,
-                dependent_task_list=[normal_task],
-                task_name='test_broken_task_chain_%d' % task_id)
-            target_path = os.path.join(
-                self.workspace_dir, 'after_zerodiv_1000_%d.dat' % task_id)
-            _ = task_graph.add_task(
-                func=_create_list_on_disk,
-                args=(value, list_len),
-                kwargs={'target_path': target_path},
-                dependent_task_list=[zero_div_task],
-                target_path_list=[target_path],
-                task_name='create list on disk after zero div%d' % task_id)
-
-        task_graph.close()
-        with self.assertRaises(ZeroDivisionError):
-            task_graph.join()
-
-    def test_empty_task(self):
-        """TaskGraph: Test an empty task."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        _ = task_graph.add_task()
-        task_graph.close()
-        task_graph.join()
-        # we shouldn't have anything in the database
-        database_path = os.path.join(
-            self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
-        with sqlite3.connect(database_path) as conn:
-            cursor = conn.cursor()
-            cursor.executescript("SELECT * FROM taskgraph_data")
-            result = cursor.fetchall()
-        self.assertEqual(len(result), 0)
-
-    def test_closed_graph(self):
-        """TaskGraph: Test adding to an closed task graph fails."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        task_graph.close()
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        with self.assertRaises(ValueError):
-            _ = task_graph.add_task(
-                func=_create_list_on_disk,
-                args=(value, list_len),
-                kwargs={'target_path': target_path},
-                target_path_list=[target_path])
-        task_graph.join()
-
-    def test_single_task_multiprocessing(self):
-        """TaskGraph: Test a single task with multiprocessing."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        _ = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            },
-            target_path_list=[target_path])
-        task_graph.close()
-        task_graph.join()
-        result = pickle.load(open(target_path, 'rb'))
-        self.assertEqual(result, [value]*list_len)
-
-    def test_get_file_stats(self):
-        """TaskGraph: Test _get_file_stats subroutine."""
-        from taskgraph.Task import _get_file_stats
-        test_dir = os.path.join(self.workspace_dir, 'test_dir')
-        test_file = os.path.join(test_dir, 'test_file.txt')
-        os.mkdir(test_dir)
-        with open(test_file, 'w') as f:
-            f.write('\n')
-        nofile = os.path.join(self.workspace_dir, 'nofile')
-        base_value = [
-            nofile, test_dir, test_file,
-            10, {'a': {'b': test_file}}, {'a': {'b': test_dir, 'foo': 9}}]
-        ignore_dir_result = list(_get_file_stats(
-            base_value, 'sizetimestamp', [], True))
-        # should get two results if we ignore the directories because there's
-        # only two files
-        self.assertEqual(len(ignore_dir_result), 2)
-        dir_result = list(_get_file_stats(
-            base_value, 'sizetimestamp', [], False))
-        # should get four results if we track directories because of two files
-        # and two directories
-        self.assertEqual(len(dir_result), 4)
-
-        result = list(_get_file_stats(nofile, 'sizetimestamp', [], False))
-        self.assertEqual(result, [])
-
-    def test_transient_runs(self):
-        """TaskGraph: ensure that transent tasks reexecute."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        _ = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            })
-        task_graph.close()
-        task_graph.join()
-        task_graph = None
-
-        os.remove(target_path)
-
-        task_graph2 = taskgraph.TaskGraph(self.workspace_dir, -1)
-        _ = task_graph2.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            transient_run=True,
-            kwargs={
-                'target_path': target_path,
-            })
-
-        task_graph2.close()
-        task_graph2.join()
-
-        self.assertTrue(
-            os.path.exists(target_path),
-            "Expected file to exist because taskgraph should have re-run.")
-
-    def test_repeat_targeted_runs(self):
-        """TaskGraph: ensure that repeated runs with targets can join."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        _ = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            },
-            target_path_list=[target_path])
-        task_graph.close()
-        task_graph.join()
-        task_graph = None
-
-        task_graph2 = taskgraph.TaskGraph(self.workspace_dir, -1)
-        task = task_graph2.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={
-                'target_path': target_path,
-            },
-            target_path_list=[target_path])
-        self.assertTrue(task.join(1.0), "join failed after 1 second")
-        task_graph2.close()
-        task_graph2.join()
-
-    def test_task_equality(self):
-        """TaskGraph: test correctness of == and != for Tasks."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_path = os.path.join(self.workspace_dir, '1000.dat')
-        value = 5
-        list_len = 1000
-        task_a = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={'target_path': target_path},
-            target_path_list=[target_path])
-        task_a_same = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value, list_len),
-            kwargs={'target_path': target_path},
-            target_path_list=[target_path])
-        task_b = task_graph.add_task(
-            func=_create_list_on_disk,
-            args=(value+1, list_len),
-            kwargs={'target_path': target_path},
-            target_path_list=[target_path])
-
-        self.assertTrue(task_a == task_a)
-        self.assertTrue(task_a == task_a_same)
-        self.assertTrue(task_a != task_b)
-
-    def test_async_logging(self):
-        """TaskGraph: ensure async logging can execute."""
-        task_graph = taskgraph.TaskGraph(
-            self.workspace_dir, 0, reporting_interval=0.5)
-        _ = task_graph.add_task(
-            func=_long_running_function,
-            args=(1.0,))
-        task_graph.close()
-        task_graph.join()
-        timedout = not task_graph.join(5)
-        # this should not timeout since function runs for 1 second
-        self.assertFalse(timedout, "task timed out")
-
-    def test_scrub(self):
-        """TaskGraph: ensure scrub is not scrubbing base types."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-
-        target_path = os.path.join(self.workspace_dir, 'a.txt')
-        first_task = task_graph.add_task(
-            func=_append_val,
-            args=(target_path, 1, [1], {'x': 1}),
-            task_name='first append')
-
-        second_task = task_graph.add_task(
-            func=_append_val,
-            args=(target_path, 1, [1], {'x': 2}),
-            dependent_task_list=[first_task],
-            task_name='second append')
-
-        _ = task_graph.add_task(
-            func=_append_val,
-            args=(target_path, 1, [2], {'x': 1}),
-            dependent_task_list=[second_task],
-            task_name='third append')
-
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_path, 'r') as target_file:
-            file_value = target_file.read()
-        self.assertEqual("1[1]{'x': 1}1[1]{'x': 2}1[2]{'x': 1}", file_value)
-
-    def test_target_path_order(self):
-        """TaskGraph: ensure target path order doesn't matter."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_a_path = os.path.join(self.workspace_dir, 'a.txt')
-        target_b_path = os.path.join(self.workspace_dir, 'b.txt')
-
-        task_graph.add_task(
-            func=_create_two_files_on_disk,
-            args=("word", target_a_path, target_b_path),
-            target_path_list=[target_a_path, target_b_path])
-
-        task_graph.add_task(
-            func=_create_two_files_on_disk,
-            args=("word", target_a_path, target_b_path),
-            target_path_list=[target_b_path, target_a_path])
-
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_a_path, 'r') as a_file:
-            a_value = a_file.read()
-
-        with open(target_b_path, 'r') as b_file:
-            b_value = b_file.read()
-
-        self.assertEqual(a_value, "word")
-        self.assertEqual(b_value, "word")
-
-    def test_task_hash_when_ready(self):
-        """TaskGraph: ensure tasks don't record execution info until ready."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_a_path = os.path.join(self.workspace_dir, 'a.txt')
-        target_b_path = os.path.join(self.workspace_dir, 'b.txt')
-
-        create_files_task = task_graph.add_task(
-            func=_create_two_files_on_disk,
-            args=("word", target_a_path, target_b_path),
-            target_path_list=[target_a_path, target_b_path])
-
-        target_merged_path = os.path.join(self.workspace_dir, 'merged.txt')
-        task_graph.add_task(
-            func=_merge_and_append_files,
-            args=(target_a_path, target_b_path, target_merged_path),
-            target_path_list=[target_merged_path],
-            dependent_task_list=[create_files_task])
-
-        task_graph.join()
-
-        # this second task shouldn't execute because it's a copy of the first
-        task_graph.add_task(
-            func=_merge_and_append_files,
-            args=(target_a_path, target_b_path, target_merged_path),
-            target_path_list=[target_merged_path],
-            dependent_task_list=[create_files_task])
-
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_merged_path, 'r') as target_file:
-            target_string = target_file.read()
-
-        self.assertEqual(target_string, "wordword")
-
-    def test_multiprocessed_logging(self):
-        """TaskGraph: ensure tasks can log from multiple processes."""
-        logger_name = 'test.task.queuelogger'
-        log_message = 'This is coming from another process'
-        logger = logging.getLogger(logger_name)
-        logger.setLevel(logging.DEBUG)
-        file_log_path = os.path.join(
-            self.workspace_dir, 'test_multiprocessed_logging.log')
-        file_handler = logging.FileHandler(file_log_path)
-        file_handler.setFormatter(
-            logging.Formatter(fmt=':%(processName)s:%(message)s:'))
-        logger.addHandler(file_handler)
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
-        log_task = task_graph.add_task(
-            func=_log_from_another_process,
-            args=(logger_name, log_message))
-        log_task.join()
-        file_handler.flush()
-        task_graph.close()
-        task_graph.join()
-        file_handler.close()
-
-        @retrying.retry(wait_exponential_multiplier=100,
-                        wait_exponential_max=1000,
-                        stop_max_attempt_number=5)
-        def get_name_and_message():
-            with open(file_log_path, 'r') as log_file:
-                message = log_file.read().rstrip()
-            print(message)
-            process_name, logged_message = re.match(
-                ':([^:]*):([^:]*):', message).groups()
-            return process_name, logged_message
-
-        process_name, logged_message = get_name_and_message()
-        self.assertEqual(logged_message, log_message)
-        self.assertNotEqual(
-            process_name, multiprocessing.current_process().name)
-
-    def test_repeated_function(self):
-        """TaskGraph: ensure no reruns if argument is a function."""
-        global _append_val
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        task_graph.add_task(
-            func=_call_it,
-            args=(_append_val, target_path, 1),
-            target_path_list=[target_path],
-            ignore_path_list=[target_path],
-            task_name='first _call_it')
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        # this causes the address to change
-        def _append_val(path, *val):
-            """Append a ``val`` to file at ``path``."""
-            with open(path, 'a') as target_file:
-                for v in val:
-                    target_file.write(str(v))
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        task_graph.add_task(
-            func=_call_it,
-            args=(_append_val, target_path, 1),
-            target_path_list=[target_path],
-            ignore_path_list=[target_path],
-            task_name='second _call_it')
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_path, 'r') as target_file:
-            result = target_file.read()
-
-        # the second call shouldn't happen
-        self.assertEqual(result, '1')
-
-    def test_unix_path_repeated_function(self):
-        """TaskGraph: ensure no reruns if path is unix style."""
-        global _append_val
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_dir = self.workspace_dir + '/foo/bar/rad/'
-        os.makedirs(target_dir)
-        target_path = target_dir + '/testfile.txt'
-        task_graph.add_task(
-            func=_call_it,
-            args=(_append_val, target_path, 1),
-            target_path_list=[target_path],
-            task_name='first _call_it')
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        task_graph.add_task(
-            func=_call_it,
-            args=(_append_val, target_path, 1),
-            target_path_list=[target_path],
-            task_name='second _call_it')
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_path, 'r') as target_file:
-            result = target_file.read()
-
-        # the second call shouldn't happen
-        self.assertEqual(result, '1')
-
-    def test_very_long_string(self):
-        """TaskGraph: ensure that long strings don't case an OSError."""
-        from taskgraph.Task import _get_file_stats
-        # this is a list with two super long strings to try to trick some
-        # os function into thinking it's a path.
-        base_value = [
-            'c:' + r'\\\\\\\\x\\\\\\\\'*2**10 + 'foo',
-            'wfeji3223j8923j9' * 2**10]
-        self.assertEqual(
-            list(_get_file_stats(base_value, 'sizetimestamp', [], True)), [])
-
-    def test_same_contents_duplicate_call(self):
-        """TaskGraph: test that same contents copy target path."""
-        base_file_path = os.path.join(self.workspace_dir, 'base.txt')
-        with open(base_file_path, 'w') as base_file:
-            base_file.write('xxx')
-        base2_file_path = os.path.join(self.workspace_dir, 'base2.txt')
-        shutil.copyfile(base_file_path, base2_file_path)
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        task_graph.add_task(
-            func=_copy_file_once,
-            args=(base_file_path, target_path),
-            target_path_list=[target_path],
-            copy_duplicate_artifact=True,
-            hash_algorithm='md5',
-            task_name='first _copy_file_once')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        alt_target_path = os.path.join(self.workspace_dir, 'alt_testfile.txt')
-        task_graph.add_task(
-            func=_copy_file_once,
-            args=(base2_file_path, alt_target_path),
-            target_path_list=[alt_target_path],
-            copy_duplicate_artifact=True,
-            hash_algorithm='md5',
-            task_name='second _copy_file_once')
-
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_path, 'r') as target_file:
-            contents = target_file.read()
-        self.assertEqual(contents, 'xxx')
-
-        with open(alt_target_path, 'r') as alt_target_file:
-            alt_contents = alt_target_file.read()
-        self.assertEqual(contents, alt_contents)
-
-    def test_duplicate_call(self):
-        """TaskGraph: test that duplicate calls copy target path."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-
-        if hasattr(_create_file_once, 'executed'):
-            del _create_file_once.executed
-
-        task_graph.add_task(
-            func=_create_file_once,
-            args=(target_path, 'test'),
-            target_path_list=[target_path],
-            copy_duplicate_artifact=True,
-            task_name='first _create_file_once')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        alt_target_path = os.path.join(self.workspace_dir, 'alt_testfile.txt')
-        task_graph.add_task(
-            func=_create_file_once,
-            args=(alt_target_path, 'test'),
-            target_path_list=[alt_target_path],
-            copy_duplicate_artifact=True,
-            task_name='second _create_file_once')
-
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_path, 'r') as target_file:
-            contents = target_file.read()
-        self.assertEqual(contents, 'test')
-
-        with open(alt_target_path, 'r') as alt_target_file:
-            alt_contents = alt_target_file.read()
-        self.assertEqual(contents, alt_contents)
-
-    def test_duplicate_call_changed_target(self):
-        """TaskGraph: test that duplicate calls copy target path."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-
-        if hasattr(_create_file_once, 'executed'):
-            del _create_file_once.executed
-
-        task_graph.add_task(
-            func=_create_file_once,
-            args=(target_path, 'test'),
-            target_path_list=[target_path],
-            hash_target_files=False,
-            task_name='first _create_file_once')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        with open(target_path, 'a') as target_file:
-            target_file.write('updated')
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        task_graph.add_task(
-            func=_create_file_once,
-            args=(target_path, 'test'),
-            target_path_list=[target_path],
-            hash_target_files=False,
-            task_name='first _create_file_once')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        with open(target_path, 'r') as result_file:
-            result_contents = result_file.read()
-        self.assertEqual('testupdated', result_contents)
-
-    def test_duplicate_call_modify_timestamp(self):
-        """TaskGraph: test that duplicate call modified stamp recompute."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        task_graph.add_task(
-            func=_create_file,
-            args=(target_path, 'test'),
-            target_path_list=[target_path],
-            copy_duplicate_artifact=True,
-            task_name='first _create_file')
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        with open(target_path, 'w') as target_file:
-            target_file.write('test2')
-        with open(target_path, 'r') as target_file:
-            contents = target_file.read()
-        self.assertEqual(contents, 'test2')
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        task_graph.add_task(
-            func=_create_file,
-            args=(target_path, 'test'),
-            target_path_list=[target_path],
-            copy_duplicate_artifact=True,
-            task_name='second _create_file')
-
-        task_graph.close()
-        task_graph.join()
-
-        with open(target_path, 'r') as target_file:
-            contents = target_file.read()
-        self.assertEqual(contents, 'test')
-
-    def test_different_target_path_list(self):
-        """TaskGraph: duplicate calls with different targets should fail."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        task_graph.add_task(
-            func=_create_list_on_disk,
-            args=('test', 1, target_path),
-            target_path_list=[target_path],
-            task_name='first _create_list_on_disk')
-
-        with self.assertRaises(RuntimeError):
-            # make the same call but with different target path list
-            task_graph.add_task(
-                func=_create_list_on_disk,
-                args=('test', 1, target_path),
-                target_path_list=[target_path, 'test.txt'],
-                task_name='first _create_list_on_disk')
-
-        task_graph.close()
-        task_graph.join()
-
-    def test_terminated_taskgraph(self):
-        """TaskGraph: terminated task graph raises exception correctly."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 4)
-        _ = task_graph.add_task(func=_div_by_zero)
-        with self.assertRaises(ZeroDivisionError):
-            task_graph.join()
-
-        with self.assertRaises(RuntimeError) as cm:
-            _ = task_graph.add_task(func=_div_by_zero)
-        expected_message = "add_task when Taskgraph is terminated"
-        actual_message = str(cm.exception)
-        self.assertTrue(expected_message in actual_message, actual_message)
-
-        task_graph.close()
-        # try closing twice just to mess with coverage
-        task_graph.close()
-
-    def test_type_list_error(self):
-        """TaskGraph: Task not passed to dependent task list."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        with self.assertRaises(ValueError) as cm:
-            task_graph.add_task(
-                func=_create_list_on_disk,
-                args=('test', 1, target_path),
-                target_path_list=[target_path],
-                dependent_task_list=[target_path],
-                task_name='first _create_list_on_disk')
-        expected_message = (
-            "Objects passed to dependent task list that are not tasks")
-        actual_message = str(cm.exception)
-        self.assertTrue(expected_message in actual_message, actual_message)
-
-    def test_target_list_error(self):
-        """TaskGraph: Path not passed to target list."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        with self.assertRaises(ValueError) as cm:
-            task_graph.add_task(
-                func=_create_list_on_disk,
-                args=('test', 1, target_path),
-                target_path_list=[1],
-                task_name='_create_list_on_disk')
-        expected_message = (
-            "Values passed to target_path_list are not strings")
-        actual_message = str(cm.exception)
-        self.assertTrue(expected_message in actual_message, actual_message)
-
-    def test_target_path_missing_file(self):
-        """TaskGraph: func runs, but missing target."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
-        not_target_path = os.path.join(self.workspace_dir, 'not_target.txt')
-        with self.assertRaises(RuntimeError) as cm:
-            task_graph.add_task(
-                func=_create_list_on_disk,
-                args=('test', 1, target_path),
-                target_path_list=[not_target_path],
-                task_name='_create_list_on_disk')
-        expected_message = "Missing expected target path results"
-        actual_message = str(cm.exception)
-        self.assertTrue(expected_message in actual_message, actual_message)
-
-    def test_duplicate_but_different_target(self):
-        """TaskGraph: Two tasks that are identical but for target."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-        base_path = os.path.join(self.workspace_dir, 'base.txt')
-        target_a_path = os.path.join(self.workspace_dir, 'testa.txt')
-        target_b_path = os.path.join(self.workspace_dir, 'testb.txt')
-        target_c_path = os.path.join(self.workspace_dir, 'testc.txt')
-        target_d_path = os.path.join(self.workspace_dir, 'testd.txt')
-        target_e_path = os.path.join(self.workspace_dir, 'teste.txt')
-        target_f_path = os.path.join(self.workspace_dir, 'testf.txt')
-
-        test_string = 'test string'
-        with open(base_path, 'w') as base_file:
-            base_file.write(test_string)
-
-        _ = task_graph.add_task(
-            func=_copy_two_files_once,
-            args=(base_path, target_a_path, target_b_path),
-            copy_duplicate_artifact=True,
-            hash_algorithm='md5',
-            target_path_list=[target_a_path, target_b_path],
-            task_name='copy file ab')
-
-        # this task should copy a to c and b to d
-        _ = task_graph.add_task(
-            func=_copy_two_files_once,
-            args=(base_path, target_c_path, target_d_path),
-            copy_duplicate_artifact=True,
-            hash_algorithm='md5',
-            target_path_list=[target_c_path, target_d_path],
-            task_name='copy file cd')
-
-        # this task should hardlink a to e and b to f if allowed on this OS
-        _ = task_graph.add_task(
-            func=_copy_two_files_once,
-            args=(base_path, target_e_path, target_f_path),
-            copy_duplicate_artifact=True,
-            hardlink_allowed=True,
-            hash_algorithm='md5',
-            target_path_list=[target_e_path, target_f_path],
-            task_name='copy file ef')
-        task_graph.close()
-        task_graph.join()
-
-        for path in (target_a_path, target_b_path, target_c_path,
-                     target_e_path, target_f_path):
-            with open(path, 'r') as target_file:
-                contents = target_file.read()
-            self.assertEqual(contents, test_string)
-
-    def test_modifying_functions_with_copy(self):
-        """TaskGraph: test with copy artifacts and ignore inputs."""
-        n_runs_a = 0
-        n_runs_b = 0
-
-        a_path = os.path.join(self.workspace_dir, 'a.txt')
-        b_path = os.path.join(self.workspace_dir, 'b.txt')
-        volatile_path = os.path.join(self.workspace_dir, 'volatile.txt')
-        d_path = os.path.join(self.workspace_dir, 'd.txt')
-
-        b_path_suffix = os.path.join(self.workspace_dir, 'b_suffix.txt')
-        volatile_path_suffix = os.path.join(
-            self.workspace_dir, 'volatile_suffix.txt')
-        d_path_suffix = os.path.join(self.workspace_dir, 'd_suffix.txt')
-
-        with open(a_path, 'w') as a_file:
-            a_file.write('a file')
-
-        def run_a_batch(a_path, b_path, volatile_path, d_path):
-            def _a(a_path, target_path):
-                nonlocal n_runs_a
-                n_runs_a += 1
-                if not os.path.exists(a_path):
-                    raise RuntimeError("a_path doesn't exist")
-                with open(target_path, 'w') as target_file:
-                    target_file.write('_a result')
-
-            def _b(b_path, volatile_path, target_path):
-                nonlocal n_runs_b
-                n_runs_b += 1
-                if not os.path.exists(a_path):
-                    raise RuntimeError("a_path path doesn't exist")
-                with open(volatile_path, 'w') as volitile_file:
-                    volitile_file.write('_b volatile')
-                with open(target_path, 'w') as target_file:
-                    target_file.write('_b result')
-
-            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
-            task_a = task_graph.add_task(
-                func=_a,
-                args=(a_path, b_path),
-                target_path_list=[b_path],
-                hash_algorithm='md5',
-                copy_duplicate_artifact=True,
-                task_name='_a task')
-            _ = task_graph.add_task(
-                func=_b,
-                args=(b_path, volatile_path, d_path),
-                target_path_list=[d_path],
-                ignore_path_list=[volatile_path],
-                hash_algorithm='md5',
-                copy_duplicate_artifact=True,
-                dependent_task_list=[task_a],
-                task_name='_b task')
-            task_graph.join()
-            task_graph.close()
-            del task_graph
-
-        run_a_batch(a_path, b_path, volatile_path, d_path)
-        run_a_batch(a_path, b_path, volatile_path, d_path)
-        run_a_batch(a_path, b_path_suffix, volatile_path_suffix, d_path_suffix)
-
-        self.assertTrue(n_runs_a == 1)
-        self.assertTrue(n_runs_b == 1)
-
-    def test_expected_path_list(self):
-        """TaskGraph: test expected path list matches actual path list."""
-        def _create_file(target_path, content):
-            with open(target_path, 'w') as target_file:
-                target_file.write(content)
-
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
-        # note it is important this is a relative path that does not
-        # contain the drive letter on Windows.
-        absolute_target_file_path = os.path.join(
-            self.workspace_dir, 'a.txt')
-        relative_path = os.path.relpath(absolute_target_file_path,
-                                        start=self.workspace_dir)
-
-        _ = task_graph.add_task(
-           func=_create_file,
-           args=(relative_path, 'test value'),
-           target_path_list=[relative_path],
-           task_name='create file')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        self.assertTrue('Ran without crashing!')
-
-    def test_kwargs_hashed(self):
-        """TaskGraph: ensure kwargs are considered in determining id hash."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
-
-        task_a = task_graph.add_task(
-            func=_noop_function,
-            kwargs={
-                'content': ['this value: a']},
-            task_name='noop a')
-
-        task_b = task_graph.add_task(
-            func=_noop_function,
-            kwargs={
-                'content': ['this value b']},
-            task_name='noop b')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        self.assertNotEqual(
-            task_a._task_id_hash, task_b._task_id_hash,
-            "task ids should be different since the kwargs are different")
-
-    def test_same_timestamp_and_value(self):
-        """TaskGraph: ensure identical files but filename are noticed."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
-
-        file_a_path = os.path.join(self.workspace_dir, 'file_a.txt')
-        file_b_path = os.path.join(self.workspace_dir, 'file_b.txt')
-
-        with open(file_a_path, 'w') as file_a:
-            file_a.write('a')
-        with open(file_b_path, 'w') as file_b:
-            file_b.write('a')
-
-        os.utime(file_a_path, (0, 0))
-        os.utime(file_b_path, (0, 0))
-
-        task_a = task_graph.add_task(
-            func=_noop_function,
-            kwargs={
-                'path': file_a_path},
-            task_name='noop a')
-
-        task_b = task_graph.add_task(
-            func=_noop_function,
-            kwargs={
-                'path': file_b_path},
-            task_name='noop b')
-
-        task_graph.close()
-        task_graph.join()
-        del task_graph
-
-        self.assertNotEqual(
-            task_a._task_id_hash, task_b._task_id_hash,
-            "task ids should be different since the filenames are different")
-
-    def test_return_value_no_record(self):
-        """TaskGraph: test  ``get`` raises exception if not set to record."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        value_task = task_graph.add_task(
-            func=_noop_function,
-            store_result=False)
-
-        # get wil raise a ValueError because store_result is not True
-        with self.assertRaises(ValueError) as cm:
-            _ = value_task.get()
-        expected_message = 'must set `store_result` to True in `add_task`'
-        actual_message = str(cm.exception)
-        self.assertTrue(expected_message in actual_message, actual_message)
-
-    def test_return_value(self):
-        """TaskGraph: test that ``.get`` behavior works as expected."""
-        if hasattr(_return_value_once, 'executed'):
-            del _return_value_once.executed
-        n_iterations = 3
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0, 0)
-        for iteration_id in range(n_iterations):
-            transient_run = iteration_id == n_iterations-1
-            LOGGER.debug(iteration_id)
-            expected_value = 'a good value'
-            value_task = task_graph.add_task(
-                func=_return_value_once,
-                transient_run=transient_run,
-                store_result=True,
-                args=(expected_value,),
-                task_name=f'{expected_value} iter {iteration_id}')
-            value = value_task.get()
-            self.assertEqual(value, expected_value)
-        task_graph.close()
-        task_graph.join()
-        task_graph = None
-
-        # reset run
-        del _return_value_once.executed
-        for iteration_id in range(n_iterations):
-            LOGGER.debug(iteration_id)
-            task_graph = taskgraph.TaskGraph(self.workspace_dir, 0, 0)
-            expected_value = 'transient run'
-            if iteration_id == 0:
-                value_task = task_graph.add_task(
-                    func=_return_value_once,
-                    transient_run=True,
-                    store_result=True,
-                    args=(expected_value,),
-                    task_name=f'first re-run transient')
-                value = value_task.get()
-                self.assertEqual(value, expected_value)
-            else:
-                with self.assertRaises(RuntimeError):
-                    value_task = task_graph.add_task(
-                        func=_return_value_once,
-                        transient_run=True,
-                        store_result=True,
-                        args=(expected_value,),
-                        task_name=f'expected error {iteration_id}')
-                    value = value_task.get()
-
-            task_graph.close()
-            task_graph.join()
-            task_graph = None
-
-    def test_malformed_taskgraph_database(self):
-        """TaskGraph: Test an empty task."""
-        db_schema_test_list = [
-            '''
-            CREATE TABLE taskgraph_data (
-                bad_name_1 TEXT NOT NULL,
-                bad_name_2 BLOB NOT NULL,
-                bad_name_3 BLOB NOT NULL);
-            ''',
-            '''
-            CREATE TABLE taskgraph_data (
-                task_reexecution_hash TEXT NOT NULL,
-                target_path_stats BLOB NOT NULL);
-            ''',
-            '''
-            CREATE TABLE bad_table_name (
-                task_reexecution_hash TEXT NOT NULL,
-                target_path_stats BLOB NOT NULL,
-                result BLOB NOT NULL,
-                PRIMARY KEY (task_reexecution_hash));
-            '''
-        ]
-
-        for db_schema in db_schema_test_list:
-            database_path = os.path.join(
-                self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
-            if os.path.exists(database_path):
-                os.remove(database_path)
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            cursor.executescript(db_schema)
-            cursor.close()
-            connection.commit()
-            connection.close()
-
-            task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
-            _ = task_graph.add_task()
-            task_graph.close()
-            task_graph.join()
-            del task_graph
-
-            expected_column_name_list = [
-                'task_reexecution_hash', 'target_path_stats', 'result']
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            cursor.execute(f'PRAGMA table_info(taskgraph_data)')
-            result = list(cursor.fetchall())
-            cursor.close()
-            connection.commit()
-            connection.close()
-            for header_line in result:
-                column_name = header_line[1]
-                if column_name not in expected_column_name_list:
-                    raise ValueError(
-                        f'unexpected column name {column_name} in '
-                        'taskgraph_data ')
-            self.assertEqual(len(result), len(expected_column_name_list))
-
-    def test_terminate_log(self):
-        """TaskGraph: test that the logger thread terminates on .join."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1, 5.0)
-        _ = task_graph.add_task()
-        task_graph.join()
-
-        # logger should not terminate until after join, give it enough time
-        # to have a chance to close, but not so long the test hangs
-        task_graph._logging_monitor_thread.join(0.1)
-        self.assertTrue(task_graph._logging_monitor_thread.is_alive())
-        task_graph._execution_monitor_thread.join(0.1)
-        self.assertTrue(task_graph._execution_monitor_thread.is_alive())
-
-        task_graph.close()
-        task_graph.join()
-
-        # 5 seconds should be way too much time to expect the thread to join
-        task_graph._logging_monitor_thread.join(5)
-        self.assertFalse(task_graph._logging_monitor_thread.is_alive())
-        task_graph._execution_monitor_thread.join(5)
-        self.assertFalse(task_graph._execution_monitor_thread.is_alive())
-
-    def test_dictionary_arguments(self):
-        """TaskGraph: test that large dictionary arguments behave well."""
-        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
-        dict_arg = {}
-        x = {None: None}
-        for _ in range(10000):
-            dict_arg[_] = x
-
-        def my_op(dict_arg):
-            pass
-        task_graph.add_task(
-            func=my_op, args=(), kwargs={'dict_arg': dict_arg})
-        task_graph.join()
-        self.assertTrue(True, 'no memory error so everything is fine')
-
-    def test_filter_non_files(self):
-        """TaskGraph: test internal filter non-files function."""
-        from taskgraph.Task import _filter_non_files
-        from taskgraph.Task import _normalize_path
-
-        # Test a passthrough
-        test_dict = {
-            0: {'one': 0, 'two': 1, 'three': 2},
-            1: {'one': 1, 'two': 2, 'three': 3},
-            2: {'one': 2, 'two': 3, 'three': 4}}
-        self.assertEqual(
-            test_dict, _filter_non_files(test_dict, [], [], False))
-
-        # Test combination of files, not existing files, and flags in the
-        # call
-        test_file_a_exists = _normalize_path(os.path.join(
-            self.workspace_dir, 'exists_a.txt'))
-        pathlib.Path(test_file_a_exists).touch()
-        test_file_b_exists = _normalize_path(os.path.join(
-            self.workspace_dir, 'exists_b.txt'))
-        pathlib.Path(test_file_b_exists).touch()
-        test_file_not_a_exists = _normalize_path(os.path.join(
-            self.workspace_dir, 'does_not_exist_a.txt'))
-        test_file_not_b_exists = _normalize_path(os.path.join(
-            self.workspace_dir, 'does_not_exist_b.txt'))
-
-        test_dict = {
-            0: {'one': 0, 'two': 1, 'three': 2},
-            1: {'one': 1, 'two': 2, 'three': 3},
-            2: {'one': 2, 'two': 3, 'three': 4},
-            4: {'bar': test_file_not_a_exists},
-            5: {'foo': test_file_a_exists},
-            6: test_file_b_exists,
-            7: test_file_not_b_exists,
-            8: _normalize_path(self.workspace_dir)}
-
-        expected_result_dict = {
-            0: {'one': 0, 'two': 1, 'three': 2},
-            1: {'one': 1, 'two': 2, 'three': 3},
-            2: {'one': 2, 'two': 3, 'three': 4},
-            4: {'bar': test_file_not_a_exists},
-            5: {'foo': None},
-            6: test_file_b_exists,
-            7: None,
-            8: _normalize_path(self.workspace_dir)}
-
-        self.assertEqual(
-            _filter_non_files(
-                test_dict,
-                [test_file_b_exists],
-                [test_file_not_b_exists],
-                True),
-            expected_result_dict)
-
-        # and test same as above but don't keep directories:
-        expected_result_dict[8] = None
-        self.assertEqual(
-            _filter_non_files(
-                test_dict,
-                [test_file_b_exists],
-                [test_file_not_b_exists],
-                False),
-            expected_result_dict)
-
-
-def Fail(n_tries, result_path):
-    """Create a function that fails after ``n_tries``."""
-    def fail_func():
-        fail_func._n_tries -= 1
-        if fail_func._n_tries > 0:
-            raise ValueError("Fail %d more times", fail_func._n_tries)
-        with open(result_path, 'w') as result_file:
-            result_file.write("finished!")
-    fail_func._n_tries = n_tries
-
-    return fail_func
+"""Tests for taskgraph."""
+import csv
+import gc
+import hashlib
+import importlib
+import io
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import pathlib
+import pickle
+import pstats
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+
+import retrying
+import taskgraph
+from taskgraph import loadtest
+
+LOGGER = logging.getLogger(__name__)
+
+N_TEARDOWN_RETRIES = 5
+MAX_TRY_WAIT_MS = 500
+
+
+def _return_value_once(value):
+    """Return the value passed to it only once."""
+    if hasattr(_return_value_once, 'executed'):
+        raise RuntimeError("this function was called twice")
+    _return_value_once.executed = True
+    return value
+
+
+def _noop_function(**kwargs):
+    """Do nothing except allow kwargs to be passed."""
+    pass
+
+
+def _long_running_function(delay):
+    """Wait for ``delay`` seconds."""
+    time.sleep(delay)
+
+
+def _create_two_files_on_disk(value, target_a_path, target_b_path):
+    """Create two files and write ``value`` and append if possible."""
+    with open(target_a_path, 'a') as a_file:
+        a_file.write(value)
+
+    with open(target_b_path, 'a') as b_file:
+        b_file.write(value)
+
+
+def _merge_and_append_files(base_a_path, base_b_path, target_path):
+    """Merge two files and append if possible to new file."""
+    with open(target_path, 'a') as target_file:
+        for base_path in [base_a_path, base_b_path]:
+            with open(base_path, 'r') as base_file:
+                target_file.write(base_file.read())
+
+
+def _create_list_on_disk(value, length, target_path=None):
+    """Create a numpy array on disk filled with value of ``size``."""
+    target_list = [value] * length
+    pickle.dump(target_list, open(target_path, 'wb'))
+
+
+def _call_it(target, *args):
+    """Invoke ``target`` with ``args``."""
+    target(*args)
+
+
+def _append_val(path, *val):
+    """Append a ``val`` to file at ``path``."""
+    with open(path, 'a') as target_file:
+        for v in val:
+            target_file.write(str(v))
+
+
+def _sum_lists_from_disk(list_a_path, list_b_path, target_path):
+    """Read two lists, add them and save result."""
+    list_a = pickle.load(open(list_a_path, 'rb'))
+    list_b = pickle.load(open(list_b_path, 'rb'))
+    target_list = []
+    for a, b in zip(list_a, list_b):
+        target_list.append(a+b)
+    pickle.dump(target_list, open(target_path, 'wb'))
+
+
+def _sum_lengths(value, other):
+    """Return the sum of the lengths of ``value`` and ``other``."""
+    return len(memoryview(value)) + len(other)
+
+
+def _reverse_bytes(value):
+    """Return ``value`` reversed as a bytearray."""
+    return bytearray(reversed(value))
+
+
+def _reversed_pickle_buffer(value):
+    """Return ``value`` reversed as a PickleBuffer."""
+    return pickle.PickleBuffer(bytearray(reversed(value)))
+
+
+def _write_targets_with_open_target(target_a_path, target_b_path):
+    """Write ``target_a_path`` with ``open_target`` and b with ``open``."""
+    with taskgraph.open_target(target_a_path, 'w') as target_a_file:
+        target_a_file.write('a' * 1000)
+    with open(target_b_path, 'w') as target_b_file:
+        target_b_file.write('b' * 1000)
+
+
+def _allocate_buffer(buffer_size):
+    """Fill a buffer of ``buffer_size`` bytes so it's resident."""
+    buffer = bytearray(buffer_size)
+    for index in range(0, buffer_size, 4096):
+        buffer[index] = 1
+
+
+def _log_many_from_another_process(logger_name, n_messages):
+    """Log ``n_messages`` INFO messages then a WARNING message.
+
+    Args:
+        logger_name (string): name of the logger to log to.
+        n_messages (int): number of INFO messages to log.
+
+    Returns:
+        ``None``
+
+    """
+    logger = logging.getLogger(logger_name)
+    for index in range(n_messages):
+        logger.info('info %d', index)
+    logger.warning('done')
+
+
+def _log_and_wait_for_file(logger_name, path, timeout):
+    """Log an INFO message then wait for ``path`` to exist.
+
+    Args:
+        logger_name (string): name of the logger to log to.
+        path (string): path of a file to wait for.
+        timeout (float): most seconds to wait.
+
+    Returns:
+        ``None``
+
+    """
+    logging.getLogger(logger_name).info('waiting')
+    end_time = time.time() + timeout
+    while not os.path.exists(path) and time.time() < end_time:
+        time.sleep(0.05)
+
+
+def _sum_range(n):
+    """Return the sum of the numbers below ``n``."""
+    return sum(range(n))
+
+
+def _append_file_count(dir_path, target_path):
+    """Append the number of files under ``dir_path`` to ``target_path``."""
+    with open(target_path, 'a') as target_file:
+        target_file.write('%d\n' % sum(
+            len(file_list) for _, _, file_list in os.walk(dir_path)))
+
+
+def _div_by_zero():
+    """Divide by zero to raise an exception."""
+    return 1/0
+
+
+def _create_file(target_path, content):
+    """Create a file with contents."""
+    with open(target_path, 'w') as target_file:
+        target_file.write(content)
+
+
+def _create_file_once(target_path, content):
+    """Create a file on the first call, raise an exception on the second."""
+    if hasattr(_create_file_once, 'executed'):
+        raise RuntimeError("this function was called twice")
+    _create_file_once.executed = True
+    with open(target_path, 'w') as target_file:
+        target_file.write(content)
+
+
+def _copy_file_once(base_path, target_path):
+    """Copy base to target on the first call, raise exception on second."""
+    if hasattr(_copy_file_once, 'executed'):
+        raise RuntimeError("this function was called twice")
+    _copy_file_once.executed = True
+    shutil.copyfile(base_path, target_path)
+
+
+def _copy_two_files_once(base_path, target_a_path, target_b_path):
+    """Copy base to target a/b on first call, raise exception on second."""
+    if hasattr(_copy_two_files_once, 'executed'):
+        raise RuntimeError("this function was called twice")
+    _copy_two_files_once.executed = True
+    shutil.copyfile(base_path, target_a_path)
+    shutil.copyfile(base_path, target_b_path)
+
+
+def _log_from_another_process(logger_name, log_message):
+    """Write a log message to a given logger.
+
+    Args:
+        logger_name (string): The string logger name to which ``log_message``
+            will be logged.
+        log_message (string): The string log message to be logged (at INFO
+            level) to the logger at ``logger_name``.
+
+    Returns:
+        ``None``
+
+    """
+    logger = logging.getLogger(logger_name)
+    logger.info(log_message)
+
+
+class TaskGraphTests(unittest.TestCase):
+    """Tests for the taskgraph."""
+
+    def setUp(self):
+        """Create temp workspace directory."""
+        # this lets us delete the workspace after its done no matter the
+        # the rest result
+        self.workspace_dir = tempfile.mkdtemp()
+
+    @retrying.retry(
+        stop_max_attempt_number=N_TEARDOWN_RETRIES,
+        wait_exponential_multiplier=250, wait_exponential_max=MAX_TRY_WAIT_MS)
+    def tearDown(self):
+        """Remove temporary directory."""
+        try:
+            shutil.rmtree(self.workspace_dir)
+        except Exception:
+            LOGGER.exception('error when tearing down.')
+            raise
+
+    def test_version_loaded(self):
+        """TaskGraph: verify we can load the version."""
+        try:
+            import taskgraph
+            # Verifies that there's a version attribute and it has a value.
+            self.assertTrue(len(taskgraph.__version__) > 0)
+        except Exception:
+            self.fail('Could not load the taskgraph version as expected.')
+
+    def test_single_task(self):
+        """TaskGraph: Test a single task."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0, 0.1)
+        # forcing this one to be unicode since there shouldn't be a problem
+        # with that at all...
+        target_path = u'%s' % os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        _ = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            },
+            target_path_list=[target_path])
+        task_graph.close()
+        task_graph.join()
+        result = pickle.load(open(target_path, 'rb'))
+        self.assertEqual(result, [value]*list_len)
+
+    def test_task_hash_source_deleted(self):
+        """TaskGraph: test if old target deleted when hashing duplicate."""
+        target_a_path = os.path.join(self.workspace_dir, 'a.txt')
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        task_a = task_graph.add_task(
+            func=_create_file,
+            args=(target_a_path, 'test value'),
+            target_path_list=[target_a_path],
+            hash_algorithm='md5',
+            copy_duplicate_artifact=True)
+        task_a.join()
+        target_b_path = os.path.join(self.workspace_dir, 'b.txt')
+        _ = task_graph.add_task(
+            func=_create_file,
+            args=(target_b_path, 'test value'),
+            target_path_list=[target_b_path],
+            hash_algorithm='md5',
+            copy_duplicate_artifact=True)
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        os.remove(target_a_path)
+        os.remove(target_b_path)
+
+        target_c_path = os.path.join(self.workspace_dir, 'c.txt')
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        _ = task_graph.add_task(
+            func=_create_file,
+            args=(target_c_path, 'test value'),
+            target_path_list=[target_c_path],
+            hash_algorithm='md5',
+            copy_duplicate_artifact=True)
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_c_path, 'r') as target_file:
+            result = target_file.read()
+        self.assertEqual(result, 'test value')
+
+    def test_task_rel_vs_absolute(self):
+        """TaskGraph: test that relative path equates to absolute."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+
+        target_a_path = os.path.relpath(os.path.join(
+            self.workspace_dir, 'a.txt'), start=self.workspace_dir)
+        target_b_path = os.path.abspath(target_a_path)
+
+        _ = task_graph.add_task(
+           func=_create_file,
+           args=(target_a_path, 'test value'),
+           target_path_list=[target_a_path],
+           hash_algorithm='md5',
+           copy_duplicate_artifact=True,
+           task_name='task a')
+
+        _ = task_graph.add_task(
+           func=_create_file,
+           args=(target_b_path, 'test value'),
+           target_path_list=[target_b_path],
+           hash_algorithm='md5',
+           copy_duplicate_artifact=True,
+           task_name='task b')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        with open(target_a_path, 'r') as a_file:
+            m = hashlib.md5()
+            m.update(a_file.read().encode('utf-8'))
+            a_digest = m.digest()
+        with open(target_b_path, 'r') as b_file:
+            m = hashlib.md5()
+            m.update(b_file.read().encode('utf-8'))
+            b_digest = m.digest()
+        self.assertEqual(a_digest, b_digest)
+
+    def test_timeout_task(self):
+        """TaskGraph: Test timeout functionality."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        _ = task_graph.add_task(
+            func=_long_running_function,
+            args=(5,))
+        task_graph.close()
+        timedout = not task_graph.join(0.5)
+        # this should timeout since function runs for 5 seconds
+        self.assertTrue(timedout)
+
+    def test_precomputed_task(self):
+        """TaskGraph: Test that a task reuses old results."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        _ = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            },
+            target_path_list=[target_path])
+        task_graph.close()
+        task_graph.join()
+        result = pickle.load(open(target_path, 'rb'))
+        self.assertEqual(result, [value]*list_len)
+        result_m_time = os.path.getmtime(target_path)
+        del task_graph
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        _ = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            },
+            target_path_list=[target_path])
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        # taskgraph shouldn't have recomputed the result
+        second_result_m_time = os.path.getmtime(target_path)
+        self.assertEqual(result_m_time, second_result_m_time)
+
+    def test_task_chain(self):
+        """TaskGraph: Test a task chain."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_a_path = os.path.join(self.workspace_dir, 'a.dat')
+        target_b_path = os.path.join(self.workspace_dir, 'b.dat')
+        result_path = os.path.join(self.workspace_dir, 'result.dat')
+        result_2_path = os.path.join(self.workspace_dir, 'result2.dat')
+        value_a = 5
+        value_b = 10
+        list_len = 10
+        task_a = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value_a, list_len),
+            kwargs={
+                'target_path': target_a_path,
+            },
+            target_path_list=[target_a_path])
+        task_b = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value_b, list_len),
+            kwargs={
+                'target_path': target_b_path,
+            },
+            target_path_list=[target_b_path])
+        sum_task = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, target_b_path),
+            kwargs={
+                'target_path': result_path,
+            },
+            target_path_list=[result_path],
+            dependent_task_list=[task_a, task_b])
+        sum_task.join()
+
+        result = pickle.load(open(result_path, 'rb'))
+        self.assertEqual(result, [value_a+value_b]*list_len)
+
+        sum_2_task = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, result_path, result_2_path),
+            target_path_list=[result_2_path],
+            dependent_task_list=[task_a, sum_task])
+        sum_2_task.join()
+        result2 = pickle.load(open(result_2_path, 'rb'))
+        expected_result = [(value_a*2+value_b)]*list_len
+        self.assertEqual(result2, expected_result)
+
+        sum_3_task = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, result_path, result_2_path),
+            target_path_list=[result_2_path],
+            dependent_task_list=[task_a, sum_task])
+        task_graph.close()
+        sum_3_task.join()
+        result3 = pickle.load(open(result_2_path, 'rb'))
+        expected_result = [(value_a*2+value_b)]*list_len
+        self.assertEqual(result3, expected_result)
+        task_graph.join()
+
+    def test_task_chain_single_thread(self):
+        """TaskGraph: Test a single threaded task chain."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_a_path = os.path.join(self.workspace_dir, 'a.dat')
+        target_b_path = os.path.join(self.workspace_dir, 'b.dat')
+        result_path = os.path.join(self.workspace_dir, 'result.dat')
+        result_2_path = os.path.join(self.workspace_dir, 'result2.dat')
+        value_a = 5
+        value_b = 10
+        list_len = 10
+        task_a = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value_a, list_len),
+            kwargs={
+                'target_path': target_a_path,
+            },
+            target_path_list=[target_a_path],
+            task_name='task a')
+        task_b = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value_b, list_len),
+            kwargs={
+                'target_path': target_b_path,
+            },
+            target_path_list=[target_b_path],
+            task_name='task b')
+        sum_task = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, target_b_path),
+            kwargs={
+                'target_path': result_path,
+            },
+            target_path_list=[result_path],
+            dependent_task_list=[task_a, task_b],
+            task_name='task c')
+        sum_task.join()
+
+        result = pickle.load(open(result_path, 'rb'))
+        self.assertEqual(result, [value_a+value_b]*list_len)
+
+        sum_2_task = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, result_path, result_2_path),
+            target_path_list=[result_2_path],
+            dependent_task_list=[task_a, sum_task],
+            task_name='task sum_2')
+        sum_2_task.join()
+        result2 = pickle.load(open(result_2_path, 'rb'))
+        expected_result = [(value_a*2+value_b)]*list_len
+        self.assertEqual(result2, expected_result)
+
+        sum_3_task = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, result_path, result_2_path),
+            target_path_list=[result_2_path],
+            dependent_task_list=[task_a, sum_task],
+            task_name='task sum_3')
+        task_graph.close()
+        sum_3_task.join()
+        result3 = pickle.load(open(result_2_path, 'rb'))
+        expected_result = [(value_a*2+value_b)]*list_len
+        task_graph.join()
+        task_graph = None
+        self.assertEqual(result3, expected_result)
+
+        # we should have 4 completed values in the database, 5 total but one
+        # was a duplicate
+        database_path = os.path.join(
+            self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
+        with sqlite3.connect(database_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM taskgraph_data")
+            result = cursor.fetchall()
+        self.assertEqual(len(result), 4)
+
+    def test_task_broken_chain(self):
+        """TaskGraph: Test a multiprocess chain with exception raised."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 4)
+        target_a_path = os.path.join(self.workspace_dir, 'a.dat')
+        target_b_path = os.path.join(self.workspace_dir, 'b.dat')
+        result_path = os.path.join(self.workspace_dir, 'result.dat')
+        value_a = 5
+        list_len = 10
+        task_a = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value_a, list_len),
+            kwargs={
+                'target_path': target_a_path,
+            },
+            target_path_list=[target_a_path])
+        task_b = task_graph.add_task(
+            func=_div_by_zero,
+            dependent_task_list=[task_a])
+        _ = task_graph.add_task(
+            func=_sum_lists_from_disk,
+            args=(target_a_path, target_b_path),
+            kwargs={
+                'target_path': result_path,
+            },
+            target_path_list=[result_path],
+            dependent_task_list=[task_a, task_b])
+        task_graph.close()
+
+        with self.assertRaises(ZeroDivisionError):
+            task_graph.join()
+
+    def test_broken_task(self):
+        """TaskGraph: Test that a task with an exception won't hang."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        _ = task_graph.add_task(
+            func=_div_by_zero, task_name='test_broken_task')
+        task_graph.close()
+        with self.assertRaises(ZeroDivisionError):
+            task_graph.join()
+
+    def test_broken_task_chain(self):
+        """TaskGraph: test dependent tasks fail on ancestor fail."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 4)
+
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        for task_id in range(1):
+            target_path = os.path.join(
+                self.workspace_dir, '1000_%d.dat' % task_id)
+            normal_task = task_graph.add_task(
+                func=_create_list_on_disk,
+                args=(value, list_len),
+                kwargs={'target_path': target_path},
+                target_path_list=[target_path],
+                task_name='create list on disk %d' % task_id)
+            zero_div_task = task_graph.add_task(
+                func=_div_by_zero,
+                dependent_task_list=[normal_task],
+                task_name='test_broken_task_chain_%d' % task_id)
+            target_path = os.path.join(
+                self.workspace_dir, 'after_zerodiv_1000_%d.dat' % task_id)
+            _ = task_graph.add_task(
+                func=_create_list_on_disk,
+                args=(value, list_len),
+                kwargs={'target_path': target_path},
+                dependent_task_list=[zero_div_task],
+                target_path_list=[target_path],
+                task_name='create list on disk after zero div%d' % task_id)
+
+        task_graph.close()
+        with self.assertRaises(ZeroDivisionError):
+            task_graph.join()
+
+    def test_empty_task(self):
+        """TaskGraph: Test an empty task."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        _ = task_graph.add_task()
+        task_graph.close()
+        task_graph.join()
+        # we shouldn't have anything in the database
+        database_path = os.path.join(
+            self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
+        with sqlite3.connect(database_path) as conn:
+            cursor = conn.cursor()
+            cursor.executescript("SELECT * FROM taskgraph_data")
+            result = cursor.fetchall()
+        self.assertEqual(len(result), 0)
+
+    def test_closed_graph(self):
+        """TaskGraph: Test adding to an closed task graph fails."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        task_graph.close()
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        with self.assertRaises(ValueError):
+            _ = task_graph.add_task(
+                func=_create_list_on_disk,
+                args=(value, list_len),
+                kwargs={'target_path': target_path},
+                target_path_list=[target_path])
+        task_graph.join()
+
+    def test_single_task_multiprocessing(self):
+        """TaskGraph: Test a single task with multiprocessing."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        _ = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            },
+            target_path_list=[target_path])
+        task_graph.close()
+        task_graph.join()
+        result = pickle.load(open(target_path, 'rb'))
+        self.assertEqual(result, [value]*list_len)
+
+    def test_get_file_stats(self):
+        """TaskGraph: Test _get_file_stats subroutine."""
+        from taskgraph.Task import _get_file_stats
+        test_dir = os.path.join(self.workspace_dir, 'test_dir')
+        test_file = os.path.join(test_dir, 'test_file.txt')
+        os.mkdir(test_dir)
+        with open(test_file, 'w') as f:
+            f.write('\n')
+        nofile = os.path.join(self.workspace_dir, 'nofile')
+        base_value = [
+            nofile, test_dir, test_file,
+            10, {'a': {'b': test_file}}, {'a': {'b': test_dir, 'foo': 9}}]
+        ignore_dir_result = list(_get_file_stats(
+            base_value, 'sizetimestamp', [], True))
+        # should get two results if we ignore the directories because there's
+        # only two files
+        self.assertEqual(len(ignore_dir_result), 2)
+        dir_result = list(_get_file_stats(
+            base_value, 'sizetimestamp', [], False))
+        # should get four results if we track directories because of two files
+        # and two directories
+        self.assertEqual(len(dir_result), 4)
+
+        result = list(_get_file_stats(nofile, 'sizetimestamp', [], False))
+        self.assertEqual(result, [])
+
+    def test_transient_runs(self):
+        """TaskGraph: ensure that transent tasks reexecute."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        _ = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            })
+        task_graph.close()
+        task_graph.join()
+        task_graph = None
+
+        os.remove(target_path)
+
+        task_graph2 = taskgraph.TaskGraph(self.workspace_dir, -1)
+        _ = task_graph2.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            transient_run=True,
+            kwargs={
+                'target_path': target_path,
+            })
+
+        task_graph2.close()
+        task_graph2.join()
+
+        self.assertTrue(
+            os.path.exists(target_path),
+            "Expected file to exist because taskgraph should have re-run.")
+
+    def test_repeat_targeted_runs(self):
+        """TaskGraph: ensure that repeated runs with targets can join."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        _ = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            },
+            target_path_list=[target_path])
+        task_graph.close()
+        task_graph.join()
+        task_graph = None
+
+        task_graph2 = taskgraph.TaskGraph(self.workspace_dir, -1)
+        task = task_graph2.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={
+                'target_path': target_path,
+            },
+            target_path_list=[target_path])
+        self.assertTrue(task.join(1.0), "join failed after 1 second")
+        task_graph2.close()
+        task_graph2.join()
+
+    def test_task_equality(self):
+        """TaskGraph: test correctness of == and != for Tasks."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_path = os.path.join(self.workspace_dir, '1000.dat')
+        value = 5
+        list_len = 1000
+        task_a = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={'target_path': target_path},
+            target_path_list=[target_path])
+        task_a_same = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value, list_len),
+            kwargs={'target_path': target_path},
+            target_path_list=[target_path])
+        task_b = task_graph.add_task(
+            func=_create_list_on_disk,
+            args=(value+1, list_len),
+            kwargs={'target_path': target_path},
+            target_path_list=[target_path])
+
+        self.assertTrue(task_a == task_a)
+        self.assertTrue(task_a == task_a_same)
+        self.assertTrue(task_a != task_b)
+
+    def test_async_logging(self):
+        """TaskGraph: ensure async logging can execute."""
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, 0, reporting_interval=0.5)
+        _ = task_graph.add_task(
+            func=_long_running_function,
+            args=(1.0,))
+        task_graph.close()
+        task_graph.join()
+        timedout = not task_graph.join(5)
+        # this should not timeout since function runs for 1 second
+        self.assertFalse(timedout, "task timed out")
+
+    def test_scrub(self):
+        """TaskGraph: ensure scrub is not scrubbing base types."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+
+        target_path = os.path.join(self.workspace_dir, 'a.txt')
+        first_task = task_graph.add_task(
+            func=_append_val,
+            args=(target_path, 1, [1], {'x': 1}),
+            task_name='first append')
+
+        second_task = task_graph.add_task(
+            func=_append_val,
+            args=(target_path, 1, [1], {'x': 2}),
+            dependent_task_list=[first_task],
+            task_name='second append')
+
+        _ = task_graph.add_task(
+            func=_append_val,
+            args=(target_path, 1, [2], {'x': 1}),
+            dependent_task_list=[second_task],
+            task_name='third append')
+
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_path, 'r') as target_file:
+            file_value = target_file.read()
+        self.assertEqual("1[1]{'x': 1}1[1]{'x': 2}1[2]{'x': 1}", file_value)
+
+    def test_target_path_order(self):
+        """TaskGraph: ensure target path order doesn't matter."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_a_path = os.path.join(self.workspace_dir, 'a.txt')
+        target_b_path = os.path.join(self.workspace_dir, 'b.txt')
+
+        task_graph.add_task(
+            func=_create_two_files_on_disk,
+            args=("word", target_a_path, target_b_path),
+            target_path_list=[target_a_path, target_b_path])
+
+        task_graph.add_task(
+            func=_create_two_files_on_disk,
+            args=("word", target_a_path, target_b_path),
+            target_path_list=[target_b_path, target_a_path])
+
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_a_path, 'r') as a_file:
+            a_value = a_file.read()
+
+        with open(target_b_path, 'r') as b_file:
+            b_value = b_file.read()
+
+        self.assertEqual(a_value, "word")
+        self.assertEqual(b_value, "word")
+
+    def test_task_hash_when_ready(self):
+        """TaskGraph: ensure tasks don't record execution info until ready."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_a_path = os.path.join(self.workspace_dir, 'a.txt')
+        target_b_path = os.path.join(self.workspace_dir, 'b.txt')
+
+        create_files_task = task_graph.add_task(
+            func=_create_two_files_on_disk,
+            args=("word", target_a_path, target_b_path),
+            target_path_list=[target_a_path, target_b_path])
+
+        target_merged_path = os.path.join(self.workspace_dir, 'merged.txt')
+        task_graph.add_task(
+            func=_merge_and_append_files,
+            args=(target_a_path, target_b_path, target_merged_path),
+            target_path_list=[target_merged_path],
+            dependent_task_list=[create_files_task])
+
+        task_graph.join()
+
+        # this second task shouldn't execute because it's a copy of the first
+        task_graph.add_task(
+            func=_merge_and_append_files,
+            args=(target_a_path, target_b_path, target_merged_path),
+            target_path_list=[target_merged_path],
+            dependent_task_list=[create_files_task])
+
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_merged_path, 'r') as target_file:
+            target_string = target_file.read()
+
+        self.assertEqual(target_string, "wordword")
+
+    def test_multiprocessed_logging(self):
+        """TaskGraph: ensure tasks can log from multiple processes."""
+        logger_name = 'test.task.queuelogger'
+        log_message = 'This is coming from another process'
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(logging.DEBUG)
+        file_log_path = os.path.join(
+            self.workspace_dir, 'test_multiprocessed_logging.log')
+        file_handler = logging.FileHandler(file_log_path)
+        file_handler.setFormatter(
+            logging.Formatter(fmt=':%(processName)s:%(message)s:'))
+        logger.addHandler(file_handler)
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        log_task = task_graph.add_task(
+            func=_log_from_another_process,
+            args=(logger_name, log_message))
+        log_task.join()
+        file_handler.flush()
+        task_graph.close()
+        task_graph.join()
+        file_handler.close()
+
+        @retrying.retry(wait_exponential_multiplier=100,
+                        wait_exponential_max=1000,
+                        stop_max_attempt_number=5)
+        def get_name_and_message():
+            with open(file_log_path, 'r') as log_file:
+                message = log_file.read().rstrip()
+            print(message)
+            process_name, logged_message = re.match(
+                ':([^:]*):([^:]*):', message).groups()
+            return process_name, logged_message
+
+        process_name, logged_message = get_name_and_message()
+        self.assertEqual(logged_message, log_message)
+        self.assertNotEqual(
+            process_name, multiprocessing.current_process().name)
+
+    def test_repeated_function(self):
+        """TaskGraph: ensure no reruns if argument is a function."""
+        global _append_val
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        task_graph.add_task(
+            func=_call_it,
+            args=(_append_val, target_path, 1),
+            target_path_list=[target_path],
+            ignore_path_list=[target_path],
+            task_name='first _call_it')
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        # this causes the address to change
+        def _append_val(path, *val):
+            """Append a ``val`` to file at ``path``."""
+            with open(path, 'a') as target_file:
+                for v in val:
+                    target_file.write(str(v))
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        task_graph.add_task(
+            func=_call_it,
+            args=(_append_val, target_path, 1),
+            target_path_list=[target_path],
+            ignore_path_list=[target_path],
+            task_name='second _call_it')
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_path, 'r') as target_file:
+            result = target_file.read()
+
+        # the second call shouldn't happen
+        self.assertEqual(result, '1')
+
+    def test_unix_path_repeated_function(self):
+        """TaskGraph: ensure no reruns if path is unix style."""
+        global _append_val
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_dir = self.workspace_dir + '/foo/bar/rad/'
+        os.makedirs(target_dir)
+        target_path = target_dir + '/testfile.txt'
+        task_graph.add_task(
+            func=_call_it,
+            args=(_append_val, target_path, 1),
+            target_path_list=[target_path],
+            task_name='first _call_it')
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        task_graph.add_task(
+            func=_call_it,
+            args=(_append_val, target_path, 1),
+            target_path_list=[target_path],
+            task_name='second _call_it')
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_path, 'r') as target_file:
+            result = target_file.read()
+
+        # the second call shouldn't happen
+        self.assertEqual(result, '1')
+
+    def test_very_long_string(self):
+        """TaskGraph: ensure that long strings don't case an OSError."""
+        from taskgraph.Task import _get_file_stats
+        # this is a list with two super long strings to try to trick some
+        # os function into thinking it's a path.
+        base_value = [
+            'c:' + r'\\\\\\\\x\\\\\\\\'*2**10 + 'foo',
+            'wfeji3223j8923j9' * 2**10]
+        self.assertEqual(
+            list(_get_file_stats(base_value, 'sizetimestamp', [], True)), [])
+
+    def test_same_contents_duplicate_call(self):
+        """TaskGraph: test that same contents copy target path."""
+        base_file_path = os.path.join(self.workspace_dir, 'base.txt')
+        with open(base_file_path, 'w') as base_file:
+            base_file.write('xxx')
+        base2_file_path = os.path.join(self.workspace_dir, 'base2.txt')
+        shutil.copyfile(base_file_path, base2_file_path)
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        task_graph.add_task(
+            func=_copy_file_once,
+            args=(base_file_path, target_path),
+            target_path_list=[target_path],
+            copy_duplicate_artifact=True,
+            hash_algorithm='md5',
+            task_name='first _copy_file_once')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        alt_target_path = os.path.join(self.workspace_dir, 'alt_testfile.txt')
+        task_graph.add_task(
+            func=_copy_file_once,
+            args=(base2_file_path, alt_target_path),
+            target_path_list=[alt_target_path],
+            copy_duplicate_artifact=True,
+            hash_algorithm='md5',
+            task_name='second _copy_file_once')
+
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_path, 'r') as target_file:
+            contents = target_file.read()
+        self.assertEqual(contents, 'xxx')
+
+        with open(alt_target_path, 'r') as alt_target_file:
+            alt_contents = alt_target_file.read()
+        self.assertEqual(contents, alt_contents)
+
+    def test_duplicate_call(self):
+        """TaskGraph: test that duplicate calls copy target path."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+
+        if hasattr(_create_file_once, 'executed'):
+            del _create_file_once.executed
+
+        task_graph.add_task(
+            func=_create_file_once,
+            args=(target_path, 'test'),
+            target_path_list=[target_path],
+            copy_duplicate_artifact=True,
+            task_name='first _create_file_once')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        alt_target_path = os.path.join(self.workspace_dir, 'alt_testfile.txt')
+        task_graph.add_task(
+            func=_create_file_once,
+            args=(alt_target_path, 'test'),
+            target_path_list=[alt_target_path],
+            copy_duplicate_artifact=True,
+            task_name='second _create_file_once')
+
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_path, 'r') as target_file:
+            contents = target_file.read()
+        self.assertEqual(contents, 'test')
+
+        with open(alt_target_path, 'r') as alt_target_file:
+            alt_contents = alt_target_file.read()
+        self.assertEqual(contents, alt_contents)
+
+    def test_duplicate_call_changed_target(self):
+        """TaskGraph: test that duplicate calls copy target path."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+
+        if hasattr(_create_file_once, 'executed'):
+            del _create_file_once.executed
+
+        task_graph.add_task(
+            func=_create_file_once,
+            args=(target_path, 'test'),
+            target_path_list=[target_path],
+            hash_target_files=False,
+            task_name='first _create_file_once')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        with open(target_path, 'a') as target_file:
+            target_file.write('updated')
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        task_graph.add_task(
+            func=_create_file_once,
+            args=(target_path, 'test'),
+            target_path_list=[target_path],
+            hash_target_files=False,
+            task_name='first _create_file_once')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        with open(target_path, 'r') as result_file:
+            result_contents = result_file.read()
+        self.assertEqual('testupdated', result_contents)
+
+    def test_duplicate_call_modify_timestamp(self):
+        """TaskGraph: test that duplicate call modified stamp recompute."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        task_graph.add_task(
+            func=_create_file,
+            args=(target_path, 'test'),
+            target_path_list=[target_path],
+            copy_duplicate_artifact=True,
+            task_name='first _create_file')
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        with open(target_path, 'w') as target_file:
+            target_file.write('test2')
+        with open(target_path, 'r') as target_file:
+            contents = target_file.read()
+        self.assertEqual(contents, 'test2')
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        task_graph.add_task(
+            func=_create_file,
+            args=(target_path, 'test'),
+            target_path_list=[target_path],
+            copy_duplicate_artifact=True,
+            task_name='second _create_file')
+
+        task_graph.close()
+        task_graph.join()
+
+        with open(target_path, 'r') as target_file:
+            contents = target_file.read()
+        self.assertEqual(contents, 'test')
+
+    def test_different_target_path_list(self):
+        """TaskGraph: duplicate calls with different targets should fail."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        task_graph.add_task(
+            func=_create_list_on_disk,
+            args=('test', 1, target_path),
+            target_path_list=[target_path],
+            task_name='first _create_list_on_disk')
+
+        with self.assertRaises(RuntimeError):
+            # make the same call but with different target path list
+            task_graph.add_task(
+                func=_create_list_on_disk,
+                args=('test', 1, target_path),
+                target_path_list=[target_path, 'test.txt'],
+                task_name='first _create_list_on_disk')
+
+        task_graph.close()
+        task_graph.join()
+
+    def test_terminated_taskgraph(self):
+        """TaskGraph: terminated task graph raises exception correctly."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 4)
+        _ = task_graph.add_task(func=_div_by_zero)
+        with self.assertRaises(ZeroDivisionError):
+            task_graph.join()
+
+        with self.assertRaises(RuntimeError) as cm:
+            _ = task_graph.add_task(func=_div_by_zero)
+        expected_message = "add_task when Taskgraph is terminated"
+        actual_message = str(cm.exception)
+        self.assertTrue(expected_message in actual_message, actual_message)
+
+        task_graph.close()
+        # try closing twice just to mess with coverage
+        task_graph.close()
+
+    def test_type_list_error(self):
+        """TaskGraph: Task not passed to dependent task list."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        with self.assertRaises(ValueError) as cm:
+            task_graph.add_task(
+                func=_create_list_on_disk,
+                args=('test', 1, target_path),
+                target_path_list=[target_path],
+                dependent_task_list=[target_path],
+                task_name='first _create_list_on_disk')
+        expected_message = (
+            "Objects passed to dependent task list that are not tasks")
+        actual_message = str(cm.exception)
+        self.assertTrue(expected_message in actual_message, actual_message)
+
+    def test_target_list_error(self):
+        """TaskGraph: Path not passed to target list."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        with self.assertRaises(ValueError) as cm:
+            task_graph.add_task(
+                func=_create_list_on_disk,
+                args=('test', 1, target_path),
+                target_path_list=[1],
+                task_name='_create_list_on_disk')
+        expected_message = (
+            "Values passed to target_path_list are not strings")
+        actual_message = str(cm.exception)
+        self.assertTrue(expected_message in actual_message, actual_message)
+
+    def test_target_path_missing_file(self):
+        """TaskGraph: func runs, but missing target."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        target_path = os.path.join(self.workspace_dir, 'testfile.txt')
+        not_target_path = os.path.join(self.workspace_dir, 'not_target.txt')
+        with self.assertRaises(RuntimeError) as cm:
+            task_graph.add_task(
+                func=_create_list_on_disk,
+                args=('test', 1, target_path),
+                target_path_list=[not_target_path],
+                task_name='_create_list_on_disk')
+        expected_message = "Missing expected target path results"
+        actual_message = str(cm.exception)
+        self.assertTrue(expected_message in actual_message, actual_message)
+
+    def test_duplicate_but_different_target(self):
+        """TaskGraph: Two tasks that are identical but for target."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+        base_path = os.path.join(self.workspace_dir, 'base.txt')
+        target_a_path = os.path.join(self.workspace_dir, 'testa.txt')
+        target_b_path = os.path.join(self.workspace_dir, 'testb.txt')
+        target_c_path = os.path.join(self.workspace_dir, 'testc.txt')
+        target_d_path = os.path.join(self.workspace_dir, 'testd.txt')
+        target_e_path = os.path.join(self.workspace_dir, 'teste.txt')
+        target_f_path = os.path.join(self.workspace_dir, 'testf.txt')
+
+        test_string = 'test string'
+        with open(base_path, 'w') as base_file:
+            base_file.write(test_string)
+
+        _ = task_graph.add_task(
+            func=_copy_two_files_once,
+            args=(base_path, target_a_path, target_b_path),
+            copy_duplicate_artifact=True,
+            hash_algorithm='md5',
+            target_path_list=[target_a_path, target_b_path],
+            task_name='copy file ab')
+
+        # this task should copy a to c and b to d
+        _ = task_graph.add_task(
+            func=_copy_two_files_once,
+            args=(base_path, target_c_path, target_d_path),
+            copy_duplicate_artifact=True,
+            hash_algorithm='md5',
+            target_path_list=[target_c_path, target_d_path],
+            task_name='copy file cd')
+
+        # this task should hardlink a to e and b to f if allowed on this OS
+        _ = task_graph.add_task(
+            func=_copy_two_files_once,
+            args=(base_path, target_e_path, target_f_path),
+            copy_duplicate_artifact=True,
+            hardlink_allowed=True,
+            hash_algorithm='md5',
+            target_path_list=[target_e_path, target_f_path],
+            task_name='copy file ef')
+        task_graph.close()
+        task_graph.join()
+
+        for path in (target_a_path, target_b_path, target_c_path,
+                     target_e_path, target_f_path):
+            with open(path, 'r') as target_file:
+                contents = target_file.read()
+            self.assertEqual(contents, test_string)
+
+    def test_modifying_functions_with_copy(self):
+        """TaskGraph: test with copy artifacts and ignore inputs."""
+        n_runs_a = 0
+        n_runs_b = 0
+
+        a_path = os.path.join(self.workspace_dir, 'a.txt')
+        b_path = os.path.join(self.workspace_dir, 'b.txt')
+        volatile_path = os.path.join(self.workspace_dir, 'volatile.txt')
+        d_path = os.path.join(self.workspace_dir, 'd.txt')
+
+        b_path_suffix = os.path.join(self.workspace_dir, 'b_suffix.txt')
+        volatile_path_suffix = os.path.join(
+            self.workspace_dir, 'volatile_suffix.txt')
+        d_path_suffix = os.path.join(self.workspace_dir, 'd_suffix.txt')
+
+        with open(a_path, 'w') as a_file:
+            a_file.write('a file')
+
+        def run_a_batch(a_path, b_path, volatile_path, d_path):
+            def _a(a_path, target_path):
+                nonlocal n_runs_a
+                n_runs_a += 1
+                if not os.path.exists(a_path):
+                    raise RuntimeError("a_path doesn't exist")
+                with open(target_path, 'w') as target_file:
+                    target_file.write('_a result')
+
+            def _b(b_path, volatile_path, target_path):
+                nonlocal n_runs_b
+                n_runs_b += 1
+                if not os.path.exists(a_path):
+                    raise RuntimeError("a_path path doesn't exist")
+                with open(volatile_path, 'w') as volitile_file:
+                    volitile_file.write('_b volatile')
+                with open(target_path, 'w') as target_file:
+                    target_file.write('_b result')
+
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
+            task_a = task_graph.add_task(
+                func=_a,
+                args=(a_path, b_path),
+                target_path_list=[b_path],
+                hash_algorithm='md5',
+                copy_duplicate_artifact=True,
+                task_name='_a task')
+            _ = task_graph.add_task(
+                func=_b,
+                args=(b_path, volatile_path, d_path),
+                target_path_list=[d_path],
+                ignore_path_list=[volatile_path],
+                hash_algorithm='md5',
+                copy_duplicate_artifact=True,
+                dependent_task_list=[task_a],
+                task_name='_b task')
+            task_graph.join()
+            task_graph.close()
+            del task_graph
+
+        run_a_batch(a_path, b_path, volatile_path, d_path)
+        run_a_batch(a_path, b_path, volatile_path, d_path)
+        run_a_batch(a_path, b_path_suffix, volatile_path_suffix, d_path_suffix)
+
+        self.assertTrue(n_runs_a == 1)
+        self.assertTrue(n_runs_b == 1)
+
+    def test_expected_path_list(self):
+        """TaskGraph: test expected path list matches actual path list."""
+        def _create_file(target_path, content):
+            with open(target_path, 'w') as target_file:
+                target_file.write(content)
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
+        # note it is important this is a relative path that does not
+        # contain the drive letter on Windows.
+        absolute_target_file_path = os.path.join(
+            self.workspace_dir, 'a.txt')
+        relative_path = os.path.relpath(absolute_target_file_path,
+                                        start=self.workspace_dir)
+
+        _ = task_graph.add_task(
+           func=_create_file,
+           args=(relative_path, 'test value'),
+           target_path_list=[relative_path],
+           task_name='create file')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        self.assertTrue('Ran without crashing!')
+
+    def test_kwargs_hashed(self):
+        """TaskGraph: ensure kwargs are considered in determining id hash."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
+
+        task_a = task_graph.add_task(
+            func=_noop_function,
+            kwargs={
+                'content': ['this value: a']},
+            task_name='noop a')
+
+        task_b = task_graph.add_task(
+            func=_noop_function,
+            kwargs={
+                'content': ['this value b']},
+            task_name='noop b')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        self.assertNotEqual(
+            task_a._task_id_hash, task_b._task_id_hash,
+            "task ids should be different since the kwargs are different")
+
+    def test_same_timestamp_and_value(self):
+        """TaskGraph: ensure identical files but filename are noticed."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1, 0)
+
+        file_a_path = os.path.join(self.workspace_dir, 'file_a.txt')
+        file_b_path = os.path.join(self.workspace_dir, 'file_b.txt')
+
+        with open(file_a_path, 'w') as file_a:
+            file_a.write('a')
+        with open(file_b_path, 'w') as file_b:
+            file_b.write('a')
+
+        os.utime(file_a_path, (0, 0))
+        os.utime(file_b_path, (0, 0))
+
+        task_a = task_graph.add_task(
+            func=_noop_function,
+            kwargs={
+                'path': file_a_path},
+            task_name='noop a')
+
+        task_b = task_graph.add_task(
+            func=_noop_function,
+            kwargs={
+                'path': file_b_path},
+            task_name='noop b')
+
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        self.assertNotEqual(
+            task_a._task_id_hash, task_b._task_id_hash,
+            "task ids should be different since the filenames are different")
+
+    def test_return_value_no_record(self):
+        """TaskGraph: test  ``get`` raises exception if not set to record."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        value_task = task_graph.add_task(
+            func=_noop_function,
+            store_result=False)
+
+        # get wil raise a ValueError because store_result is not True
+        with self.assertRaises(ValueError) as cm:
+            _ = value_task.get()
+        expected_message = 'must set `store_result` to True in `add_task`'
+        actual_message = str(cm.exception)
+        self.assertTrue(expected_message in actual_message, actual_message)
+
+    def test_return_value(self):
+        """TaskGraph: test that ``.get`` behavior works as expected."""
+        if hasattr(_return_value_once, 'executed'):
+            del _return_value_once.executed
+        n_iterations = 3
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 0, 0)
+        for iteration_id in range(n_iterations):
+            transient_run = iteration_id == n_iterations-1
+            LOGGER.debug(iteration_id)
+            expected_value = 'a good value'
+            value_task = task_graph.add_task(
+                func=_return_value_once,
+                transient_run=transient_run,
+                store_result=True,
+                args=(expected_value,),
+                task_name=f'{expected_value} iter {iteration_id}')
+            value = value_task.get()
+            self.assertEqual(value, expected_value)
+        task_graph.close()
+        task_graph.join()
+        task_graph = None
+
+        # reset run
+        del _return_value_once.executed
+        for iteration_id in range(n_iterations):
+            LOGGER.debug(iteration_id)
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, 0, 0)
+            expected_value = 'transient run'
+            if iteration_id == 0:
+                value_task = task_graph.add_task(
+                    func=_return_value_once,
+                    transient_run=True,
+                    store_result=True,
+                    args=(expected_value,),
+                    task_name=f'first re-run transient')
+                value = value_task.get()
+                self.assertEqual(value, expected_value)
+            else:
+                with self.assertRaises(RuntimeError):
+                    value_task = task_graph.add_task(
+                        func=_return_value_once,
+                        transient_run=True,
+                        store_result=True,
+                        args=(expected_value,),
+                        task_name=f'expected error {iteration_id}')
+                    value = value_task.get()
+
+            task_graph.close()
+            task_graph.join()
+            task_graph = None
+
+    def test_malformed_taskgraph_database(self):
+        """TaskGraph: Test an empty task."""
+        db_schema_test_list = [
+            '''
+            CREATE TABLE taskgraph_data (
+                bad_name_1 TEXT NOT NULL,
+                bad_name_2 BLOB NOT NULL,
+                bad_name_3 BLOB NOT NULL);
+            ''',
+            '''
+            CREATE TABLE taskgraph_data (
+                task_reexecution_hash TEXT NOT NULL,
+                target_path_stats BLOB NOT NULL);
+            ''',
+            '''
+            CREATE TABLE bad_table_name (
+                task_reexecution_hash TEXT NOT NULL,
+                target_path_stats BLOB NOT NULL,
+                result BLOB NOT NULL,
+                PRIMARY KEY (task_reexecution_hash));
+            '''
+        ]
+
+        for db_schema in db_schema_test_list:
+            database_path = os.path.join(
+                self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
+            if os.path.exists(database_path):
+                os.remove(database_path)
+            connection = sqlite3.connect(database_path)
+            cursor = connection.cursor()
+            cursor.executescript(db_schema)
+            cursor.close()
+            connection.commit()
+            connection.close()
+
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, 0)
+            _ = task_graph.add_task()
+            task_graph.close()
+            task_graph.join()
+            del task_graph
+
+            expected_column_name_list = [
+                'task_reexecution_hash', 'target_path_stats', 'result']
+            connection = sqlite3.connect(database_path)
+            cursor = connection.cursor()
+            cursor.execute(f'PRAGMA table_info(taskgraph_data)')
+            result = list(cursor.fetchall())
+            cursor.close()
+            connection.commit()
+            connection.close()
+            for header_line in result:
+                column_name = header_line[1]
+                if column_name not in expected_column_name_list:
+                    raise ValueError(
+                        f'unexpected column name {column_name} in '
+                        'taskgraph_data ')
+            self.assertEqual(len(result), len(expected_column_name_list))
+
+    def test_terminate_log(self):
+        """TaskGraph: test that the logger thread terminates on .join."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1, 5.0)
+        _ = task_graph.add_task()
+        task_graph.join()
+
+        # logger should not terminate until after join, give it enough time
+        # to have a chance to close, but not so long the test hangs
+        task_graph._logging_monitor_thread.join(0.1)
+        self.assertTrue(task_graph._logging_monitor_thread.is_alive())
+        task_graph._execution_monitor_thread.join(0.1)
+        self.assertTrue(task_graph._execution_monitor_thread.is_alive())
+
+        task_graph.close()
+        task_graph.join()
+
+        # 5 seconds should be way too much time to expect the thread to join
+        task_graph._logging_monitor_thread.join(5)
+        self.assertFalse(task_graph._logging_monitor_thread.is_alive())
+        task_graph._execution_monitor_thread.join(5)
+        self.assertFalse(task_graph._execution_monitor_thread.is_alive())
+
+    def test_dictionary_arguments(self):
+        """TaskGraph: test that large dictionary arguments behave well."""
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        dict_arg = {}
+        x = {None: None}
+        for _ in range(10000):
+            dict_arg[_] = x
+
+        def my_op(dict_arg):
+            pass
+        task_graph.add_task(
+            func=my_op, args=(), kwargs={'dict_arg': dict_arg})
+        task_graph.join()
+        self.assertTrue(True, 'no memory error so everything is fine')
+
+    def test_filter_non_files(self):
+        """TaskGraph: test internal filter non-files function."""
+        from taskgraph.Task import _filter_non_files
+        from taskgraph.Task import _normalize_path
+
+        # Test a passthrough
+        test_dict = {
+            0: {'one': 0, 'two': 1, 'three': 2},
+            1: {'one': 1, 'two': 2, 'three': 3},
+            2: {'one': 2, 'two': 3, 'three': 4}}
+        self.assertEqual(
+            test_dict, _filter_non_files(test_dict, [], [], False))
+
+        # Test combination of files, not existing files, and flags in the
+        # call
+        test_file_a_exists = _normalize_path(os.path.join(
+            self.workspace_dir, 'exists_a.txt'))
+        pathlib.Path(test_file_a_exists).touch()
+        test_file_b_exists = _normalize_path(os.path.join(
+            self.workspace_dir, 'exists_b.txt'))
+        pathlib.Path(test_file_b_exists).touch()
+        test_file_not_a_exists = _normalize_path(os.path.join(
+            self.workspace_dir, 'does_not_exist_a.txt'))
+        test_file_not_b_exists = _normalize_path(os.path.join(
+            self.workspace_dir, 'does_not_exist_b.txt'))
+
+        test_dict = {
+            0: {'one': 0, 'two': 1, 'three': 2},
+            1: {'one': 1, 'two': 2, 'three': 3},
+            2: {'one': 2, 'two': 3, 'three': 4},
+            4: {'bar': test_file_not_a_exists},
+            5: {'foo': test_file_a_exists},
+            6: test_file_b_exists,
+            7: test_file_not_b_exists,
+            8: _normalize_path(self.workspace_dir)}
+
+        expected_result_dict = {
+            0: {'one': 0, 'two': 1, 'three': 2},
+            1: {'one': 1, 'two': 2, 'three': 3},
+            2: {'one': 2, 'two': 3, 'three': 4},
+            4: {'bar': test_file_not_a_exists},
+            5: {'foo': None},
+            6: test_file_b_exists,
+            7: None,
+            8: _normalize_path(self.workspace_dir)}
+
+        self.assertEqual(
+            _filter_non_files(
+                test_dict,
+                [test_file_b_exists],
+                [test_file_not_b_exists],
+                True),
+            expected_result_dict)
+
+        # and test same as above but don't keep directories:
+        expected_result_dict[8] = None
+        self.assertEqual(
+            _filter_non_files(
+                test_dict,
+                [test_file_b_exists],
+                [test_file_not_b_exists],
+                False),
+            expected_result_dict)
+
+    def test_func_fingerprint_cache(self):
+        """TaskGraph: test function fingerprints are cached by code object."""
+        from taskgraph.Task import _FUNC_FINGERPRINT_CACHE
+        from taskgraph.Task import _get_func_fingerprint
+
+        _FUNC_FINGERPRINT_CACHE.clear()
+        # closures made in a loop are distinct objects but share a code
+        # object so they should only occupy a single cache entry
+        func_list = [lambda x, y=y: x+y for y in range(100)]
+        fingerprint_set = set([
+            _get_func_fingerprint(func, 'source', False)
+            for func in func_list])
+        self.assertEqual(len(fingerprint_set), 1)
+        self.assertEqual(len(_FUNC_FINGERPRINT_CACHE), 1)
+
+        # functions from the same file and line that only differ in a
+        # constant must not share a cache entry
+        fingerprint_set = set()
+        for value in range(2):
+            namespace = {}
+            exec(compile(
+                'def func():\n    return %d\n' % value, '<string>', 'exec'),
+                namespace)
+            fingerprint_set.add(
+                _get_func_fingerprint(namespace['func'], 'source', False))
+        self.assertEqual(len(fingerprint_set), 2)
+
+        # stripped and unstripped source are cached separately
+        stripped_source = _get_func_fingerprint(
+            _create_file, 'source', True)
+        self.assertNotIn(' ', stripped_source)
+        self.assertIn(' ', _get_func_fingerprint(
+            _create_file, 'source', False))
+
+        with self.assertRaises(ValueError):
+            _get_func_fingerprint(_create_file, 'not a mode', False)
+
+    def test_func_fingerprint_bytecode(self):
+        """TaskGraph: test bytecode function fingerprints."""
+        from taskgraph.Task import _get_func_fingerprint
+
+        create_file_fingerprint = _get_func_fingerprint(
+            _create_file, 'bytecode', False)
+        self.assertEqual(
+            create_file_fingerprint,
+            _get_func_fingerprint(_create_file, 'bytecode', False))
+        self.assertNotEqual(
+            create_file_fingerprint,
+            _get_func_fingerprint(_create_file_once, 'bytecode', False))
+        # builtins have neither source nor bytecode
+        self.assertEqual(_get_func_fingerprint(len, 'bytecode', False), '')
+
+        # code without source should fall back to a bytecode fingerprint
+        namespace = {}
+        exec('def no_source_func(x):\n    return x + 1\n', namespace)
+        no_source_func = namespace['no_source_func']
+        self.assertEqual(
+            _get_func_fingerprint(no_source_func, 'source', False),
+            _get_func_fingerprint(no_source_func, 'bytecode', False))
+
+        target_path = os.path.join(self.workspace_dir, 'a.txt')
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        task_graph.add_task(
+            func=_create_file,
+            args=(target_path, 'content'),
+            target_path_list=[target_path],
+            func_fingerprint_mode='bytecode')
+        task_graph.close()
+        task_graph.join()
+        with open(target_path, 'r') as target_file:
+            self.assertEqual(target_file.read(), 'content')
+
+    def test_is_picklable(self):
+        """TaskGraph: test picklability check without pickling."""
+        from taskgraph.Task import _is_picklable
+
+        self_referencing_list = [1, 'a']
+        self_referencing_list.append(self_referencing_list)
+        for picklable_value in [
+                None, 1, 2.5, 'a', b'b', {'a': [1, (2, 3)], 4: {5}},
+                self_referencing_list, pathlib.Path('a'), _create_file]:
+            self.assertTrue(_is_picklable(picklable_value), picklable_value)
+        for unpicklable_value in [
+                lambda: None, [1, {'a': lambda: None}],
+                threading.Lock()]:
+            self.assertFalse(
+                _is_picklable(unpicklable_value), unpicklable_value)
+
+    def test_serialized_payload(self):
+        """TaskGraph: test call payloads are serialized for dispatch."""
+        from taskgraph.Task import _call_serialized
+        from taskgraph.Task import _serialize_payload
+
+        large_buffer = bytearray(b'x' * 2**20)
+        if sys.version_info >= (3, 8):
+            # objects like numpy arrays expose their data as a PickleBuffer
+            # which should be sent out of band rather than in the payload
+            payload, buffer_list = _serialize_payload(
+                _sum_lengths, (pickle.PickleBuffer(large_buffer),),
+                {'other': b'abc'})
+            self.assertLess(len(payload), len(large_buffer))
+            self.assertEqual(len(buffer_list), 1)
+            self.assertEqual(
+                _call_serialized(payload, buffer_list), len(large_buffer)+3)
+
+            # buffers under the threshold are pickled in band
+            payload, buffer_list = _serialize_payload(
+                _sum_lengths, (pickle.PickleBuffer(large_buffer),),
+                {'other': pickle.PickleBuffer(bytearray(b'abc'))},
+                out_of_band_threshold=1024)
+            self.assertEqual(len(buffer_list), 1)
+            self.assertEqual(buffer_list[0].nbytes, len(large_buffer))
+            self.assertEqual(
+                _call_serialized(payload, buffer_list), len(large_buffer)+3)
+
+        payload, buffer_list = _serialize_payload(
+            _sum_lengths, (large_buffer,), {'other': b'abc'})
+        self.assertEqual(
+            _call_serialized(payload, buffer_list), len(large_buffer)+3)
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        sum_task = task_graph.add_task(
+            func=_sum_lengths, args=(large_buffer,),
+            kwargs={'other': b'abc'}, store_result=True)
+        self.assertEqual(sum_task.get(), len(large_buffer)+3)
+        task_graph.close()
+        task_graph.join()
+
+    @unittest.skipIf(
+        sys.version_info < (3, 8), 'shared memory requires python 3.8+')
+    def test_shared_memory_transport(self):
+        """TaskGraph: test large args and results use shared memory."""
+        from taskgraph.Task import _load_serialized_result
+        from taskgraph.Task import _serialize_payload
+        from taskgraph.Task import _share_buffer
+        from taskgraph.Task import _SharedMemoryHandle
+        from taskgraph.Task import _call_serialized
+        from taskgraph.Task import _SerializedResult
+
+        large_value = bytearray(os.urandom(2**16))
+        payload, buffer_list = _serialize_payload(
+            _reverse_bytes, (large_value,), {})
+        shared_memory_list = []
+        shared_payload = _share_buffer(payload, 1024, shared_memory_list)
+        self.assertIsInstance(shared_payload, _SharedMemoryHandle)
+        self.assertEqual(len(shared_memory_list), 1)
+        # small buffers stay on the pipe
+        self.assertEqual(
+            _share_buffer(b'small', 1024, shared_memory_list), b'small')
+        self.assertEqual(len(shared_memory_list), 1)
+
+        serialized_result = _call_serialized(
+            shared_payload, buffer_list, 1024, True)
+        shared_memory_list[0].close()
+        shared_memory_list[0].unlink()
+        self.assertIsInstance(serialized_result, _SerializedResult)
+        self.assertIsInstance(serialized_result.payload, _SharedMemoryHandle)
+        self.assertEqual(
+            _load_serialized_result(serialized_result),
+            bytearray(reversed(large_value)))
+        # the result block should have been freed when it was loaded
+        from multiprocessing import shared_memory
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=serialized_result.payload.name)
+
+        # out-of-band results are mapped rather than copied, the memory
+        # stays valid after the block is unlinked
+        payload, buffer_list = _serialize_payload(
+            _reversed_pickle_buffer, (large_value,), {})
+        serialized_result = _call_serialized(payload, buffer_list, 1024)
+        self.assertEqual(len(serialized_result.buffer_list), 1)
+        result_view = _load_serialized_result(serialized_result)
+        self.assertIsInstance(result_view, memoryview)
+        self.assertEqual(
+            result_view.tobytes(), bytes(reversed(large_value)))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(
+                name=serialized_result.buffer_list[0].name)
+        result_view.release()
+
+        # if a block can't be read the rest are still freed
+        shared_memory_list = []
+        buffer_handle = _share_buffer(
+            large_value, 1024, shared_memory_list)
+        shared_memory_list[0].close()
+        with self.assertRaises(FileNotFoundError):
+            _load_serialized_result(_SerializedResult(
+                _SharedMemoryHandle('taskgraph_missing_block', 1024),
+                [buffer_handle]))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=buffer_handle.name)
+
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, 1, shared_memory_threshold=1024)
+        reverse_task = task_graph.add_task(
+            func=_reverse_bytes, args=(large_value,), store_result=True)
+        self.assertEqual(
+            reverse_task.get(), bytearray(reversed(large_value)))
+        task_graph.close()
+        task_graph.join()
+
+    def test_result_store(self):
+        """TaskGraph: test large results are kept out of the database."""
+        if hasattr(_return_value_once, 'executed'):
+            del _return_value_once.executed
+        large_value = 'x' * 1000
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, -1, result_store_threshold=100)
+        large_task = task_graph.add_task(
+            func=_return_value_once, args=(large_value,), store_result=True,
+            task_name='large')
+        small_task = task_graph.add_task(
+            func=_sum_lengths, args=(b'a', b'b'), store_result=True)
+        self.assertEqual(large_task.get(), large_value)
+        self.assertEqual(small_task.get(), 2)
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        database_path = os.path.join(
+            self.workspace_dir, taskgraph._TASKGRAPH_DATABASE_FILENAME)
+        with sqlite3.connect(database_path) as connection:
+            result_list = [
+                result for (result,) in connection.execute(
+                    'SELECT result FROM taskgraph_data')]
+        self.assertEqual(
+            sorted([len(result) < 100 for result in result_list]),
+            [True, True])
+        store_dir = os.path.join(self.workspace_dir, 'taskgraph_result_store')
+        stored_file_list = [
+            os.path.join(dir_path, filename)
+            for dir_path, _, filename_list in os.walk(store_dir)
+            for filename in filename_list]
+        self.assertEqual(len(stored_file_list), 1)
+
+        # rerun is precalculated and loads the stored result on ``get``,
+        # ``_return_value_once`` would raise an exception if called again
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, -1, result_store_threshold=100)
+        large_task = task_graph.add_task(
+            func=_return_value_once, args=(large_value,), store_result=True,
+            task_name='large')
+        self.assertFalse(large_task._result_loaded)
+        self.assertEqual(large_task.get(), large_value)
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        # if the stored result is gone the task should reexecute
+        os.remove(stored_file_list[0])
+        del _return_value_once.executed
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, -1, result_store_threshold=100)
+        large_task = task_graph.add_task(
+            func=_return_value_once, args=(large_value,), store_result=True,
+            task_name='large')
+        self.assertTrue(hasattr(_return_value_once, 'executed'))
+        self.assertEqual(large_task.get(), large_value)
+        task_graph.close()
+        task_graph.join()
+
+    def test_result_store_eviction(self):
+        """TaskGraph: test result store evicts least recently used."""
+        from taskgraph.Task import _ResultStore
+        store_dir = os.path.join(self.workspace_dir, 'store')
+        result_store = _ResultStore(store_dir, 0, 2000)
+        # random bytes don't compress so each is ~1000 bytes on disk
+        value_list = [os.urandom(1000) for _ in range(3)]
+        blob_list = []
+        for index, value in enumerate(value_list):
+            blob_list.append(result_store.dump(value))
+            # force a distinct and increasing access order
+            os.utime(
+                result_store._result_path(
+                    result_store._digest(blob_list[-1])),
+                (index, index))
+        self.assertFalse(result_store.is_available(blob_list[0]))
+        self.assertTrue(result_store.is_available(blob_list[2]))
+        self.assertEqual(result_store.load(blob_list[2]), value_list[2])
+
+        # a new store should measure what's already on disk
+        self.assertLessEqual(
+            _ResultStore(store_dir, 0, 2000)._store_size, 2000)
+
+    def test_lazy_result_loading(self):
+        """TaskGraph: test precalculated results are loaded on ``get``."""
+        if hasattr(_return_value_once, 'executed'):
+            del _return_value_once.executed
+        value = {'a': [1, 2, 3]}
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        value_task = task_graph.add_task(
+            func=_return_value_once, args=(value,), store_result=True)
+        self.assertEqual(value_task.get(keep_result=False), value)
+        # recorded in the database so the in-memory copy can be dropped
+        self.assertFalse(value_task._result_loaded)
+        self.assertIsNone(value_task._result)
+        self.assertEqual(value_task.get(), value)
+        self.assertTrue(value_task._result_loaded)
+        task_graph.close()
+        task_graph.join()
+        del task_graph
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        value_task = task_graph.add_task(
+            func=_return_value_once, args=(value,), store_result=True)
+        # precalculated, but nothing is unpickled until ``get``
+        self.assertFalse(value_task._result_loaded)
+        self.assertEqual(value_task.get(), value)
+        self.assertEqual(value_task.get(), value)
+        task_graph.close()
+        task_graph.join()
+
+        # transient results aren't in the database so are always kept
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        transient_task = task_graph.add_task(
+            func=_sum_lengths, args=(b'a', b'bc'), store_result=True,
+            transient_run=True)
+        self.assertEqual(transient_task.get(keep_result=False), 3)
+        self.assertEqual(transient_task.get(), 3)
+        task_graph.close()
+        task_graph.join()
+
+    def test_copy_files(self):
+        """TaskGraph: test every copy strategy copies file contents."""
+        # ``taskgraph.Task`` is the class, so get the module directly
+        task_module = importlib.import_module('taskgraph.Task')
+
+        # shrink the chunk size so files are copied in several chunks
+        original_chunk_size = task_module._COPY_CHUNK_SIZE
+        task_module._COPY_CHUNK_SIZE = 1000
+        try:
+            source_contents_list = [
+                os.urandom(size) for size in [0, 10, 1000, 4321]]
+            source_path_list = []
+            for index, contents in enumerate(source_contents_list):
+                source_path = os.path.join(
+                    self.workspace_dir, f'source_{index}.bin')
+                with open(source_path, 'wb') as source_file:
+                    source_file.write(contents)
+                source_path_list.append(source_path)
+            for copy_strategy in task_module._VALID_COPY_STRATEGIES:
+                for hardlink_allowed in [True, False]:
+                    target_path_list = [
+                        os.path.join(
+                            self.workspace_dir,
+                            f'{copy_strategy}_{hardlink_allowed}_{index}')
+                        for index in range(len(source_path_list))]
+                    task_module._copy_files(
+                        list(zip(source_path_list, target_path_list)),
+                        copy_strategy, hardlink_allowed)
+                    for target_path, contents in zip(
+                            target_path_list, source_contents_list):
+                        with open(target_path, 'rb') as target_file:
+                            self.assertEqual(target_file.read(), contents)
+        finally:
+            task_module._COPY_CHUNK_SIZE = original_chunk_size
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        with self.assertRaises(ValueError):
+            task_graph.add_task(func=_noop_function, copy_strategy='nope')
+
+    def test_copy_duplicate_artifact_strategy(self):
+        """TaskGraph: test copy_duplicate_artifact with a copy strategy."""
+        if hasattr(_copy_file_once, 'executed'):
+            del _copy_file_once.executed
+        base_path = os.path.join(self.workspace_dir, 'base.txt')
+        with open(base_path, 'w') as base_file:
+            base_file.write('base contents')
+        target_path_list = [
+            os.path.join(self.workspace_dir, f'target_{index}.txt')
+            for index in range(2)]
+        for target_path in target_path_list:
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+            task_graph.add_task(
+                func=_copy_file_once,
+                args=(base_path, target_path),
+                target_path_list=[target_path],
+                copy_duplicate_artifact=True,
+                hash_algorithm='md5',
+                copy_strategy='buffered')
+            task_graph.close()
+            task_graph.join()
+            del task_graph
+            with open(target_path, 'r') as target_file:
+                self.assertEqual(target_file.read(), 'base contents')
+        # other tests expect ``_copy_file_once`` to be unused
+        del _copy_file_once.executed
+
+    def test_artifact_store(self):
+        """TaskGraph: test duplicate artifacts restored from the store."""
+        if hasattr(_create_file_once, 'executed'):
+            del _create_file_once.executed
+        target_path_list = [
+            os.path.join(self.workspace_dir, f'target_{index}.txt')
+            for index in range(3)]
+        for target_path in target_path_list:
+            task_graph = taskgraph.TaskGraph(
+                self.workspace_dir, -1, artifact_store=True)
+            # ``_create_file_once`` raises an exception if it's called twice
+            task_graph.add_task(
+                func=_create_file_once,
+                args=(target_path, 'contents'),
+                target_path_list=[target_path],
+                copy_duplicate_artifact=True,
+                hash_algorithm='md5')
+            task_graph.close()
+            task_graph.join()
+            del task_graph
+            with open(target_path, 'r') as target_file:
+                self.assertEqual(target_file.read(), 'contents')
+            # the store should make the original unnecessary
+            os.remove(target_path)
+        del _create_file_once.executed
+
+    def test_artifact_store_modified_hardlink(self):
+        """TaskGraph: test artifact store rejects modified hardlinks."""
+        from taskgraph.Task import _ArtifactStore
+        from taskgraph.Task import _hash_file
+
+        artifact_store = _ArtifactStore(
+            os.path.join(self.workspace_dir, 'store'))
+        source_path = os.path.join(self.workspace_dir, 'source.txt')
+        with open(source_path, 'w') as source_file:
+            source_file.write('original')
+        fingerprint = _hash_file(source_path, 'md5')
+        # non-content fingerprints can't be stored
+        artifact_store.ingest(source_path, 'sizetimestamp', 'x')
+        self.assertIsNone(artifact_store.get_path('sizetimestamp', 'x'))
+
+        artifact_store.ingest(source_path, 'md5', fingerprint)
+        entry_path = artifact_store.get_path('md5', fingerprint)
+        with open(entry_path, 'r') as entry_file:
+            self.assertEqual(entry_file.read(), 'original')
+        if os.path.samefile(entry_path, source_path):
+            # hardlinked, so modifying the source modifies the entry
+            time.sleep(0.01)
+            with open(source_path, 'a') as source_file:
+                source_file.write(' modified')
+            self.assertIsNone(artifact_store.get_path('md5', fingerprint))
+
+    def test_artifact_store_restore_not_hardlinked(self):
+        """TaskGraph: test targets restored from the store aren't linked."""
+        task_module = importlib.import_module('taskgraph.Task')
+        target_path_list = [
+            os.path.join(self.workspace_dir, f'target_{index}.txt')
+            for index in range(2)]
+        for target_path in target_path_list:
+            task_graph = taskgraph.TaskGraph(
+                self.workspace_dir, -1, artifact_store=True)
+            task_graph.add_task(
+                func=_create_file,
+                args=(target_path, 'contents'),
+                target_path_list=[target_path],
+                copy_duplicate_artifact=True,
+                hardlink_allowed=True,
+                hash_algorithm='md5')
+            task_graph.close()
+            task_graph.join()
+        artifact_store = task_graph._artifact_store
+        fingerprint = task_module._hash_file(target_path_list[0], 'md5')
+        entry_path = artifact_store.get_path('md5', fingerprint)
+        self.assertFalse(os.path.samefile(entry_path, target_path_list[1]))
+        with open(target_path_list[1], 'a') as target_file:
+            target_file.write(' modified')
+        self.assertEqual(
+            task_module._hash_file(entry_path, 'md5'), fingerprint)
+
+    def test_artifact_store_max_size(self):
+        """TaskGraph: test least recently used artifacts are evicted."""
+        task_module = importlib.import_module('taskgraph.Task')
+        artifact_store = task_module._ArtifactStore(
+            os.path.join(self.workspace_dir, 'store'), max_size=25)
+        fingerprint_list = []
+        for index in range(3):
+            source_path = os.path.join(
+                self.workspace_dir, f'source_{index}.txt')
+            with open(source_path, 'w') as source_file:
+                source_file.write(f'{index}' * 10)
+            fingerprint_list.append(
+                task_module._hash_file(source_path, 'md5'))
+            if index == 2:
+                # the first entry is used so the second is evicted
+                self.assertIsNotNone(
+                    artifact_store.get_path('md5', fingerprint_list[0]))
+                time.sleep(0.05)
+            artifact_store.ingest(source_path, 'md5', fingerprint_list[-1])
+            time.sleep(0.05)
+        self.assertEqual(
+            [artifact_store.get_path('md5', fingerprint) is not None
+             for fingerprint in fingerprint_list], [True, False, True])
+        # the size is rebuilt from the files when the store is opened
+        self.assertEqual(
+            task_module._ArtifactStore(
+                os.path.join(self.workspace_dir, 'store'),
+                max_size=25)._store_size, 20)
+
+    def test_artifact_store_without_fcntl(self):
+        """TaskGraph: test artifact store without reflink support."""
+        from unittest import mock
+        task_module = importlib.import_module('taskgraph.Task')
+
+        artifact_store = task_module._ArtifactStore(
+            os.path.join(self.workspace_dir, 'store'))
+        source_path = os.path.join(self.workspace_dir, 'source.txt')
+        with open(source_path, 'w') as source_file:
+            source_file.write('original')
+        fingerprint = task_module._hash_file(source_path, 'md5')
+        # ``_reflink`` returns without creating its target on platforms
+        # without fcntl
+        with mock.patch.object(task_module, 'HAS_FCNTL', False):
+            artifact_store.ingest(source_path, 'md5', fingerprint)
+        entry_path = artifact_store.get_path('md5', fingerprint)
+        self.assertIsNotNone(entry_path)
+        with open(entry_path, 'r') as entry_file:
+            self.assertEqual(entry_file.read(), 'original')
+
+    def test_copy_verified_artifacts(self):
+        """TaskGraph: test artifacts are verified while they are copied."""
+        from unittest import mock
+        task_module = importlib.import_module('taskgraph.Task')
+
+        source_path = os.path.join(self.workspace_dir, 'source.bin')
+        with open(source_path, 'wb') as source_file:
+            source_file.write(os.urandom(2**16))
+        fingerprint = task_module._hash_file(source_path, 'md5')
+        target_path = os.path.join(self.workspace_dir, 'target.bin')
+
+        with mock.patch.object(
+                task_module, '_hash_file',
+                wraps=task_module._hash_file) as hash_file_mock:
+            target_stats = task_module._copy_verified_artifacts(
+                [(source_path, 'md5', fingerprint)], [target_path],
+                'buffered', False, None)
+            # a buffered copy hashes as it reads so nothing is rehashed
+            self.assertEqual(hash_file_mock.call_count, 0)
+        self.assertEqual(target_stats, [(target_path, 'md5', fingerprint)])
+        self.assertEqual(
+            task_module._hash_file(target_path, 'md5'), fingerprint)
+
+        # a changed source should not be reported as copied
+        with open(source_path, 'ab') as source_file:
+            source_file.write(b'changed')
+        for copy_strategy in ['auto', 'buffered']:
+            self.assertIsNone(task_module._copy_verified_artifacts(
+                [(source_path, 'md5', fingerprint)], [target_path],
+                copy_strategy, False, None))
+        for copy_strategy in ['auto', 'kernel']:
+            # a changed artifact must not be hardlinked, the task would
+            # overwrite it through the link when it reexecutes
+            hardlink_path = os.path.join(
+                self.workspace_dir, f'hardlink_{copy_strategy}.bin')
+            self.assertIsNone(task_module._copy_verified_artifacts(
+                [(source_path, 'md5', fingerprint)], [hardlink_path],
+                copy_strategy, True, None))
+            self.assertFalse(os.path.exists(hardlink_path))
+        # an artifact can't be copied onto itself
+        self.assertIsNone(task_module._copy_verified_artifacts(
+            [(source_path, 'md5', fingerprint)], [source_path],
+            'auto', False, None))
+
+        # other strategies verify the artifact then copy with _copy_files
+        fingerprint = task_module._hash_file(source_path, 'md5')
+        with mock.patch.object(
+                task_module, '_copy_files',
+                wraps=task_module._copy_files) as copy_files_mock:
+            target_stats = task_module._copy_verified_artifacts(
+                [(source_path, 'md5', fingerprint)], [target_path],
+                'kernel', False, None)
+            copy_files_mock.assert_any_call(
+                [(source_path, target_path)], 'kernel', False)
+        self.assertEqual(target_stats, [(target_path, 'md5', fingerprint)])
+        self.assertEqual(
+            task_module._hash_file(target_path, 'md5'), fingerprint)
+
+    def test_open_target(self):
+        """TaskGraph: test targets written with open_target aren't reread."""
+        from unittest import mock
+        task_module = importlib.import_module('taskgraph.Task')
+
+        # outside a task this is ordinary ``open``
+        plain_path = os.path.join(self.workspace_dir, 'plain.txt')
+        with taskgraph.open_target(plain_path, 'w') as plain_file:
+            plain_file.write('plain')
+            self.assertIsInstance(plain_file.buffer.raw, io.FileIO)
+
+        # fingerprints are only kept by the call that recorded them and
+        # the tracking ends even if the function raises
+        _, target_fingerprint_map = task_module._call_with_target_tracking(
+            'md5', _write_targets_with_open_target,
+            (plain_path, os.path.join(self.workspace_dir, 'b.txt')), {})
+        self.assertEqual(
+            list(target_fingerprint_map),
+            [task_module._normalize_path(plain_path)])
+        with self.assertRaises(ZeroDivisionError):
+            task_module._call_with_target_tracking(
+                'md5', _div_by_zero, (), {})
+        self.assertIsNone(task_module._TASK_CONTEXT.hash_algorithm)
+        self.assertIsNone(task_module._TASK_CONTEXT.target_fingerprint_map)
+
+        for n_workers in [-1, 1]:
+            target_a_path = os.path.join(
+                self.workspace_dir, f'a_{n_workers}.txt')
+            target_b_path = os.path.join(
+                self.workspace_dir, f'b_{n_workers}.txt')
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, n_workers)
+            with mock.patch.object(
+                    task_module, '_hash_file',
+                    wraps=task_module._hash_file) as hash_file_mock:
+                task_graph.add_task(
+                    func=_write_targets_with_open_target,
+                    args=(target_a_path, target_b_path),
+                    target_path_list=[target_a_path, target_b_path],
+                    hash_algorithm='md5')
+                task_graph.close()
+                task_graph.join()
+                # only the target written with ``open`` is hashed after
+                hashed_path_list = [
+                    call[0][0] for call in hash_file_mock.call_args_list]
+            self.assertNotIn(
+                task_module._normalize_path(target_a_path), hashed_path_list)
+            self.assertIn(
+                task_module._normalize_path(target_b_path), hashed_path_list)
+            del task_graph
+
+            # the recorded fingerprint should match a full hash
+            with sqlite3.connect(os.path.join(
+                    self.workspace_dir,
+                    taskgraph._TASKGRAPH_DATABASE_FILENAME)) as connection:
+                stats_list = [
+                    stats for stats_blob, in connection.execute(
+                        'SELECT target_path_stats FROM taskgraph_data')
+                    for stats in pickle.loads(stats_blob)]
+            for path, hash_algorithm, fingerprint in stats_list:
+                self.assertEqual(
+                    fingerprint, task_module._hash_file(path, hash_algorithm))
+
+    def test_blake2b_tree_hash(self):
+        """TaskGraph: test 'blake2b_tree' parallel and streaming agree."""
+        task_module = importlib.import_module('taskgraph.Task')
+        original_leaf_size = task_module._BLAKE2B_TREE_LEAF_SIZE
+        task_module._BLAKE2B_TREE_LEAF_SIZE = 64
+        try:
+            for file_size in [0, 1, 64, 65, 128, 1000]:
+                file_path = os.path.join(
+                    self.workspace_dir, '%d.bin' % file_size)
+                data = os.urandom(file_size)
+                with open(file_path, 'wb') as test_file:
+                    test_file.write(data)
+                hash_func = task_module._new_hash('blake2b_tree')
+                # uneven updates to cross leaf boundaries
+                for index in range(0, file_size, 37):
+                    hash_func.update(data[index:index+37])
+                self.assertEqual(
+                    task_module._hash_file(file_path, 'blake2b_tree'),
+                    hash_func.hexdigest())
+            self.assertNotEqual(
+                task_module._hash_file(
+                    os.path.join(self.workspace_dir, '64.bin'),
+                    'blake2b_tree'),
+                task_module._hash_file(
+                    os.path.join(self.workspace_dir, '65.bin'),
+                    'blake2b_tree'))
+        finally:
+            task_module._BLAKE2B_TREE_LEAF_SIZE = original_leaf_size
+
+    def test_register_hash_algorithm(self):
+        """TaskGraph: test a registered hash algorithm fingerprints files."""
+        task_module = importlib.import_module('taskgraph.Task')
+        taskgraph.register_hash_algorithm(
+            'test_md5', lambda: hashlib.md5())
+        try:
+            target_path = os.path.join(self.workspace_dir, 'target.txt')
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+            task_graph.add_task(
+                func=_create_file,
+                args=(target_path, 'test value'),
+                target_path_list=[target_path],
+                hash_algorithm='test_md5',
+                task_name='registered hash')
+            task_graph.close()
+            task_graph.join()
+            self.assertEqual(
+                task_module._hash_file(target_path, 'test_md5'),
+                hashlib.md5(b'test value').hexdigest())
+        finally:
+            del task_module._HASH_ALGORITHM_REGISTRY['test_md5']
+
+    def test_sampled_hash(self):
+        """TaskGraph: test 'sampled' fingerprints size and sampled blocks."""
+        task_module = importlib.import_module('taskgraph.Task')
+        block_size = task_module._SAMPLED_HASH_BLOCK_SIZE
+        file_path = os.path.join(self.workspace_dir, 'large.bin')
+        data = bytearray(os.urandom(block_size * 64))
+        with open(file_path, 'wb') as large_file:
+            large_file.write(data)
+        base_hash = task_module._hash_file(file_path, 'sampled')
+        self.assertTrue(base_hash.startswith('%d:' % len(data)))
+
+        # changing the tail is detected even with the same timestamp
+        file_stat = os.stat(file_path)
+        data[-1] ^= 0xff
+        with open(file_path, 'wb') as large_file:
+            large_file.write(data)
+        os.utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+        self.assertNotEqual(
+            task_module._hash_file(file_path, 'sampled'), base_hash)
+
+        # a byte between sampled blocks is not, that's the trade-off
+        data[-1] ^= 0xff
+        data[block_size + 1] ^= 0xff
+        with open(file_path, 'wb') as large_file:
+            large_file.write(data)
+        self.assertEqual(
+            task_module._hash_file(file_path, 'sampled'), base_hash)
+
+        # small files are hashed completely
+        small_path = os.path.join(self.workspace_dir, 'small.bin')
+        with open(small_path, 'wb') as small_file:
+            small_file.write(b'a' * (block_size + 10))
+        small_hash = task_module._hash_file(small_path, 'sampled')
+        with open(small_path, 'wb') as small_file:
+            small_file.write(b'a' * block_size + b'b' * 10)
+        self.assertNotEqual(
+            task_module._hash_file(small_path, 'sampled'), small_hash)
+
+    @unittest.skipIf(
+        not importlib.import_module('taskgraph.Task').HAS_INOTIFY,
+        'inotify is not available')
+    def test_file_watcher(self):
+        """TaskGraph: test watched fingerprints are invalidated by changes."""
+        task_module = importlib.import_module('taskgraph.Task')
+        file_watcher = task_module._FileWatcher()
+        sub_dir = os.path.join(self.workspace_dir, 'sub_dir')
+        os.makedirs(sub_dir)
+        file_path = task_module._normalize_path(
+            os.path.join(sub_dir, 'file.txt'))
+        with open(file_path, 'w') as test_file:
+            test_file.write('first')
+        self.assertEqual(
+            file_watcher.hash_file(file_path, 'md5'),
+            hashlib.md5(b'first').hexdigest())
+        self.assertIn(file_path, file_watcher._fingerprint_map)
+
+        with open(file_path, 'w') as test_file:
+            test_file.write('second')
+        self.assertEqual(
+            file_watcher.hash_file(file_path, 'md5'),
+            hashlib.md5(b'second').hexdigest())
+
+        # moving the watched directory invalidates files in it
+        os.rename(sub_dir, os.path.join(self.workspace_dir, 'moved_dir'))
+        os.makedirs(sub_dir)
+        with open(file_path, 'w') as test_file:
+            test_file.write('third')
+        self.assertEqual(
+            file_watcher.hash_file(file_path, 'md5'),
+            hashlib.md5(b'third').hexdigest())
+
+    def test_watch_files(self):
+        """TaskGraph: test tasks reexecute on changes with watch_files."""
+        input_path = os.path.join(self.workspace_dir, 'input.txt')
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        with open(input_path, 'w') as input_file:
+            input_file.write('first')
+        if hasattr(_copy_file_once, 'executed'):
+            del _copy_file_once.executed
+        for expected_value in ['first', 'first', 'second']:
+            if expected_value == 'second':
+                with open(input_path, 'w') as input_file:
+                    input_file.write('second')
+                # the change is expected to reexecute the task
+                del _copy_file_once.executed
+            task_graph = taskgraph.TaskGraph(
+                self.workspace_dir, -1, watch_files=True)
+            task_graph.add_task(
+                func=_copy_file_once,
+                args=(input_path, target_path),
+                target_path_list=[target_path],
+                hash_algorithm='md5',
+                task_name='copy input')
+            task_graph.close()
+            task_graph.join()
+            with open(target_path, 'r') as target_file:
+                self.assertEqual(target_file.read(), expected_value)
+        del _copy_file_once.executed
+
+    def test_directory_fingerprint_tree(self):
+        """TaskGraph: test 'tree' directory fingerprints see nested files."""
+        task_module = importlib.import_module('taskgraph.Task')
+        tile_dir = os.path.join(self.workspace_dir, 'tiles')
+        nested_dir = os.path.join(tile_dir, 'a', 'b')
+        os.makedirs(nested_dir)
+        os.makedirs(os.path.join(tile_dir, 'c'))
+        nested_path = os.path.join(nested_dir, 'tile.txt')
+        for path in [nested_path, os.path.join(tile_dir, 'c', 'tile.txt')]:
+            with open(path, 'w') as tile_file:
+                tile_file.write('tile')
+        target_path = os.path.join(self.workspace_dir, 'count.txt')
+
+        def _run_graph():
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+            task_graph.add_task(
+                func=_append_file_count,
+                args=(tile_dir, target_path),
+                target_path_list=[target_path],
+                ignore_directories=False,
+                directory_fingerprint_mode='tree',
+                hash_algorithm='md5',
+                task_name='count tiles')
+            task_graph.close()
+            task_graph.join()
+            with open(target_path, 'r') as target_file:
+                return target_file.read().split()
+
+        self.assertEqual(_run_graph(), ['2'])
+        tree_hash = task_module._hash_directory(tile_dir, 'md5')
+        self.assertEqual(_run_graph(), ['2'])
+
+        # modifying a nested file doesn't touch the top directory's mtime
+        with open(nested_path, 'w') as tile_file:
+            tile_file.write('modified tile')
+        self.assertNotEqual(
+            task_module._hash_directory(tile_dir, 'md5'), tree_hash)
+        self.assertEqual(_run_graph(), ['2', '2'])
+
+        with open(os.path.join(nested_dir, 'new.txt'), 'w') as tile_file:
+            tile_file.write('tile')
+        self.assertEqual(_run_graph(), ['2', '2', '3'])
+
+        with self.assertRaises(ValueError):
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+            try:
+                task_graph.add_task(
+                    func=_append_file_count,
+                    args=(tile_dir, target_path),
+                    directory_fingerprint_mode='deep')
+            finally:
+                task_graph.close()
+                task_graph.join()
+
+    def test_reuse_upstream_fingerprints(self):
+        """TaskGraph: test downstream tasks reuse upstream fingerprints."""
+        task_module = importlib.import_module('taskgraph.Task')
+        base_path = os.path.join(self.workspace_dir, 'base.txt')
+        intermediate_path = os.path.join(
+            self.workspace_dir, 'intermediate.txt')
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        with open(base_path, 'w') as base_file:
+            base_file.write('base')
+
+        original_hash_file = task_module._hash_file
+        hashed_path_list = []
+
+        def _counting_hash_file(file_path, *args, **kwargs):
+            hashed_path_list.append(file_path)
+            return original_hash_file(file_path, *args, **kwargs)
+
+        def _run_graph():
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+            upstream_task = task_graph.add_task(
+                func=_create_file,
+                args=(intermediate_path, 'intermediate'),
+                target_path_list=[intermediate_path],
+                hash_algorithm='md5',
+                task_name='upstream')
+            task_graph.add_task(
+                func=_merge_and_append_files,
+                args=(intermediate_path, base_path, target_path),
+                target_path_list=[target_path],
+                dependent_task_list=[upstream_task],
+                hash_algorithm='md5',
+                reuse_upstream_fingerprints=True,
+                task_name='downstream')
+            task_graph.close()
+            task_graph.join()
+            with open(target_path, 'r') as target_file:
+                return target_file.read()
+
+        task_module._hash_file = _counting_hash_file
+        try:
+            self.assertEqual(_run_graph(), 'intermediatebase')
+            del hashed_path_list[:]
+            # a warm run verifies the intermediate file once, for upstream
+            self.assertEqual(_run_graph(), 'intermediatebase')
+            self.assertEqual(
+                hashed_path_list.count(
+                    task_module._normalize_path(intermediate_path)), 1)
+            self.assertIn(
+                task_module._normalize_path(base_path), hashed_path_list)
+        finally:
+            task_module._hash_file = original_hash_file
+
+    def test_plan_only(self):
+        """TaskGraph: test plan_only reports tasks that would execute."""
+        base_path = os.path.join(self.workspace_dir, 'base.txt')
+        intermediate_path = os.path.join(
+            self.workspace_dir, 'intermediate.txt')
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        with open(base_path, 'w') as base_file:
+            base_file.write('base')
+
+        def _add_tasks(task_graph):
+            upstream_task = task_graph.add_task(
+                func=_merge_and_append_files,
+                args=(base_path, base_path, intermediate_path),
+                target_path_list=[intermediate_path],
+                task_name='upstream')
+            task_graph.add_task(
+                func=_merge_and_append_files,
+                args=(intermediate_path, base_path, target_path),
+                target_path_list=[target_path],
+                dependent_task_list=[upstream_task],
+                task_name='downstream')
+            task_graph.close()
+            self.assertTrue(task_graph.join())
+            return task_graph
+
+        plan_report = _add_tasks(
+            taskgraph.TaskGraph(self.workspace_dir, 1, plan_only=True)).plan()
+        self.assertEqual(plan_report['execute_count'], 2)
+        self.assertEqual(plan_report['unknown_runtime_count'], 2)
+        self.assertFalse(os.path.exists(intermediate_path))
+
+        task_graph = _add_tasks(taskgraph.TaskGraph(self.workspace_dir, -1))
+        with self.assertRaises(ValueError):
+            task_graph.plan()
+        plan_report = _add_tasks(
+            taskgraph.TaskGraph(self.workspace_dir, -1, plan_only=True)).plan()
+        self.assertEqual(plan_report['precalculated_count'], 2)
+        self.assertEqual(plan_report['estimated_runtime'], 0)
+
+        with open(base_path, 'w') as base_file:
+            base_file.write('changed base')
+        plan_report = _add_tasks(
+            taskgraph.TaskGraph(self.workspace_dir, -1, plan_only=True)).plan()
+        self.assertEqual(plan_report['execute_count'], 2)
+        self.assertEqual(plan_report['unknown_runtime_count'], 0)
+        upstream_report, downstream_report = plan_report['task_list']
+        self.assertIn('no previous run', upstream_report['reason'])
+        self.assertIn(upstream_report['task_name'],
+                      downstream_report['reason'])
+        self.assertGreaterEqual(upstream_report['estimated_runtime'], 0)
+        with open(target_path, 'r') as target_file:
+            self.assertEqual(target_file.read(), 'basebasebase')
+
+    def test_plan_only_del(self):
+        """TaskGraph: test plan_only graphs with workers clean up quietly."""
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        log_handler = logging.handlers.BufferingHandler(capacity=100)
+        log_handler.setLevel(logging.ERROR)
+        taskgraph_logger = logging.getLogger('taskgraph')
+        taskgraph_logger.addHandler(log_handler)
+        try:
+            task_graph = taskgraph.TaskGraph(
+                self.workspace_dir, 2, reporting_interval=1.0,
+                plan_only=True)
+            task_graph.add_task(
+                func=_create_file,
+                args=(target_path, 'contents'),
+                target_path_list=[target_path])
+            task_graph.close()
+            task_graph.join()
+            del task_graph
+            gc.collect()
+        finally:
+            taskgraph_logger.removeHandler(log_handler)
+        self.assertEqual(
+            [record.getMessage() for record in log_handler.buffer], [])
+
+    def test_stats(self):
+        """TaskGraph: test per task phase timing and export."""
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        for n_workers, precalculated in [(1, False), (-1, True)]:
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, n_workers)
+            task_graph.add_task(
+                func=_create_file,
+                args=(target_path, 'test value'),
+                target_path_list=[target_path],
+                hash_algorithm='md5',
+                task_name='create file')
+            task_graph.close()
+            task_graph.join()
+            stats = task_graph.stats()
+            task_stats = stats['task_list'][0]
+            self.assertEqual(task_stats['precalculated'], precalculated)
+            self.assertIsNotNone(task_stats['input_fingerprint'])
+            self.assertIsNotNone(task_stats['db_lookup'])
+            if precalculated:
+                self.assertIsNotNone(task_stats['target_verify'])
+                self.assertIsNone(task_stats['execute'])
+            else:
+                self.assertIsNotNone(task_stats['queue_wait'])
+                self.assertGreaterEqual(
+                    task_stats['execute'], task_stats['func'])
+                self.assertIsNotNone(task_stats['target_fingerprint'])
+                self.assertIsNotNone(task_stats['db_write'])
+            self.assertGreaterEqual(
+                task_stats['total'], task_stats['db_lookup'])
+            self.assertEqual(
+                stats['phase_total_map']['db_lookup'],
+                task_stats['db_lookup'])
+
+        json_path = os.path.join(self.workspace_dir, 'stats.json')
+        task_graph.export_stats(json_path)
+        with open(json_path, 'r') as json_file:
+            self.assertEqual(json.load(json_file), task_graph.stats())
+        csv_path = os.path.join(self.workspace_dir, 'stats.csv')
+        task_graph.export_stats(csv_path, file_format='csv')
+        with open(csv_path, 'r', newline='') as csv_file:
+            row_list = list(csv.DictReader(csv_file))
+        self.assertEqual(len(row_list), 1)
+        self.assertEqual(row_list[0]['precalculated'], 'True')
+        self.assertEqual(row_list[0]['execute'], '')
+        with self.assertRaises(ValueError):
+            task_graph.export_stats(csv_path, file_format='xml')
+
+    def test_trace_path(self):
+        """TaskGraph: test a Chrome trace is written once on join."""
+        from unittest import mock
+        base_path = os.path.join(self.workspace_dir, 'base.txt')
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        trace_path = os.path.join(self.workspace_dir, 'trace.json')
+        for n_workers in [1, -1]:
+            task_graph = taskgraph.TaskGraph(
+                self.workspace_dir, n_workers, trace_path=trace_path)
+            base_task = task_graph.add_task(
+                func=_create_file,
+                args=(base_path, 'base'),
+                target_path_list=[base_path],
+                task_name='base')
+            task_graph.add_task(
+                func=_merge_and_append_files,
+                args=(base_path, base_path, target_path),
+                target_path_list=[target_path],
+                dependent_task_list=[base_task],
+                task_name='merge')
+            with mock.patch.object(
+                    task_graph, '_build_trace',
+                    wraps=task_graph._build_trace) as build_trace_mock:
+                task_graph.join()
+                self.assertEqual(build_trace_mock.call_count, 0)
+                task_graph.close()
+                task_graph.join()
+                task_graph.join()
+                self.assertEqual(build_trace_mock.call_count, 1)
+            with open(trace_path, 'r') as trace_file:
+                event_list = json.load(trace_file)['traceEvents']
+            task_span_list = [
+                event for event in event_list
+                if event['ph'] == 'X' and event['cat'] == 'task']
+            self.assertEqual(
+                [event['name'] for event in task_span_list],
+                ['base (0)', 'merge (1)'])
+            flow_list = [
+                event for event in event_list if event['ph'] in 'sf']
+            self.assertEqual(len(flow_list), 2)
+            if n_workers > 0:
+                func_span_list = [
+                    event for event in event_list
+                    if event['ph'] == 'X' and event['cat'] == 'func']
+                self.assertEqual(len(func_span_list), 2)
+                self.assertNotEqual(
+                    func_span_list[0]['pid'], task_span_list[0]['pid'])
+            else:
+                # everything was precalculated the second time
+                self.assertEqual(len([
+                    event for event in event_list
+                    if event['name'] == 'precalculated']), 2)
+
+    def test_metrics(self):
+        """TaskGraph: test metrics are served over HTTP and to a textfile."""
+        target_path = os.path.join(self.workspace_dir, 'target.txt')
+        textfile_path = os.path.join(self.workspace_dir, 'taskgraph.prom')
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, -1, metrics_port=0,
+            metrics_textfile_path=textfile_path)
+        task_graph.add_task(
+            func=_create_file,
+            args=(target_path, 'test value'),
+            target_path_list=[target_path],
+            task_name='create file')
+        with urllib.request.urlopen('http://%s:%d/metrics' % (
+                task_graph.metrics_address)) as response:
+            metrics = response.read().decode('utf-8')
+        self.assertIn('taskgraph_tasks_completed_total 1.0', metrics)
+        self.assertIn('taskgraph_tasks_precalculated_total 0.0', metrics)
+        self.assertIn(
+            'taskgraph_task_execute_seconds_bucket{le="+Inf"} 1.0', metrics)
+        self.assertIn('# TYPE taskgraph_ready_queue_depth gauge', metrics)
+        task_graph.close()
+        task_graph.join()
+        with open(textfile_path, 'r') as textfile:
+            self.assertIn(
+                'taskgraph_tasks_completed_total 1.0', textfile.read())
+
+    def test_monitor_status(self):
+        """TaskGraph: test monitor throughput, ETA and straggler report."""
+        task_module = importlib.import_module('taskgraph.Task')
+        plan_graph = taskgraph.TaskGraph(
+            self.workspace_dir, -1, plan_only=True)
+        slow_task_id_hash = plan_graph.add_task(
+            func=time.sleep, args=(2.5,), task_name='slow')._task_id_hash
+        database_path = plan_graph._task_database_path
+        task_module._execute_sqlite(
+            "INSERT INTO task_runtime_history "
+            "(runtime_history_key, task_name, timestamp, runtime) "
+            "VALUES (?, ?, ?, ?)", database_path, mode='modify',
+            execute='many', argument_list=[
+                ('other', 'other', time.time(), runtime) for runtime in range(
+                    task_module._RUNTIME_HISTORY_LENGTH + 2)] + [
+                (slow_task_id_hash, 'slow', time.time(), 0.1)])
+        runtime_history_map = task_module._load_runtime_history(
+            database_path)
+        # the two oldest runtimes are dropped from the history
+        self.assertEqual(
+            runtime_history_map['other'],
+            (task_module._RUNTIME_HISTORY_LENGTH + 3) / 2)
+        self.assertEqual(runtime_history_map[slow_task_id_hash], 0.1)
+
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, 1, reporting_interval=3600)
+        start_time = time.time()
+        task_graph.add_task(func=time.sleep, args=(2.5,), task_name='slow')
+        time.sleep(0.5)
+        # waits for the slow task and has no history
+        task_graph.add_task(
+            func=time.sleep, args=(0.1,), task_name='waiting')
+        time.sleep(1.0)
+        status = task_graph._monitor_status(start_time)
+        self.assertEqual(status['added'], 2)
+        self.assertEqual(status['active'], 1)
+        self.assertIsNone(status['cache_hit_rate'])
+        # the slow task is past its median so only the waiting task is
+        # left, estimated with the mean of the history
+        self.assertAlmostEqual(
+            status['eta'], sum(runtime_history_map.values()) / 2)
+        self.assertEqual(len(status['straggler_list']), 1)
+        self.assertEqual(status['straggler_list'][0][0], 'slow (0)')
+        task_graph.close()
+        task_graph.join()
+        status = task_graph._monitor_status(start_time)
+        self.assertEqual(status['completed'], 2)
+        self.assertEqual(status['cache_hit_rate'], 0.0)
+        self.assertEqual(status['eta'], 0.0)
+        self.assertEqual(status['straggler_list'], [])
+        self.assertGreater(status['throughput'], 0)
+        # the slow task's runtime is added to its history
+        runtime_history_map = task_module._load_runtime_history(
+            database_path)
+        self.assertEqual(len(runtime_history_map), 3)
+        self.assertGreater(runtime_history_map[slow_task_id_hash], 1.0)
+
+    def test_profile_workers(self):
+        """TaskGraph: test worker profiles are aggregated by function."""
+        task_graph = taskgraph.TaskGraph(
+            self.workspace_dir, 2, profile_workers=True)
+        for index in range(4):
+            task_graph.add_task(
+                func=_sum_range, args=(10000 + index,),
+                task_name='sum %d' % index)
+        task_graph.close()
+        task_graph.join()
+        profile_list = task_graph.profile_stats(sort_key='ncalls')
+        sum_profile = [
+            profile for profile in profile_list
+            if profile['function'].endswith('(_sum_range)')][0]
+        self.assertEqual(sum_profile['ncalls'], 4)
+        self.assertGreater(sum_profile['cumtime'], 0)
+        self.assertEqual(len(task_graph.profile_stats(limit=1)), 1)
+        with self.assertRaises(ValueError):
+            task_graph.profile_stats(sort_key='percall')
+
+        profile_path = os.path.join(self.workspace_dir, 'profile.prof')
+        task_graph.export_profile(profile_path)
+        stats = pstats.Stats(profile_path)
+        self.assertTrue(any(
+            function_name == '_sum_range'
+            for _, _, function_name in stats.stats))
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        task_graph.add_task(func=_sum_range, args=(10,), task_name='sum')
+        task_graph.close()
+        task_graph.join()
+        self.assertEqual(task_graph.profile_stats(), [])
+
+    def test_resource_usage(self):
+        """TaskGraph: test worker resource usage is recorded per task."""
+        task_module = importlib.import_module('taskgraph.Task')
+        buffer_size = 2**26
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+        task_graph.add_task(
+            func=_allocate_buffer, args=(buffer_size,),
+            task_name='allocate')
+        task_graph.close()
+        task_graph.join()
+        task_stats = task_graph.stats()['task_list'][0]
+        self.assertGreaterEqual(task_stats['user_time'], 0)
+        self.assertGreaterEqual(task_stats['system_time'], 0)
+        self.assertGreaterEqual(task_stats['max_rss'], buffer_size)
+        database_result = task_module._execute_sqlite(
+            'SELECT task_name, max_rss FROM task_runtime_history',
+            task_graph._task_database_path, mode='read_only', fetch='all')
+        self.assertEqual(
+            database_result,
+            [(task_stats['task_name'], task_stats['max_rss'])])
+
+        task_graph = taskgraph.TaskGraph(self.workspace_dir, -1)
+        task_graph.add_task(
+            func=_allocate_buffer, args=(1,), task_name='allocate')
+        task_graph.close()
+        task_graph.join()
+        self.assertIsNone(task_graph.stats()['task_list'][0]['max_rss'])
+        database_result = task_module._execute_sqlite(
+            'SELECT max_rss FROM task_runtime_history ORDER BY rowid',
+            task_graph._task_database_path, mode='read_only', fetch='all')
+        self.assertEqual(database_result[-1], (None,))
+
+    @unittest.skipUnless(
+        sys.platform.startswith('linux'),
+        'peak resident set size is only measured on Linux')
+    @unittest.skipUnless(
+        sys.platform.startswith('linux'),
+        'peak resident set size is only measured on Linux')
+    def test_resource_usage_large_parent(self):
+        """TaskGraph: test a worker's peak memory isn't its parent's."""
+        buffer_size = 2**28
+        # a spawned worker's ``ru_maxrss`` starts at the resident set size
+        # of its parent, so the parent holds a large buffer while the
+        # workers are started
+        script = (
+            'import multiprocessing, sys, time\n'
+            'import taskgraph\n'
+            'if __name__ == "__main__":\n'
+            '    multiprocessing.set_start_method("spawn")\n'
+            f'    parent_buffer = bytearray({buffer_size})\n'
+            f'    parent_buffer[::4096] = b"1" * ({buffer_size} // 4096)\n'
+            '    task_graph = taskgraph.TaskGraph(sys.argv[1], 1)\n'
+            '    task_graph.add_task(func=time.sleep, args=(0,))\n'
+            '    task_graph.close()\n'
+            '    task_graph.join()\n'
+            '    print(task_graph.stats()["task_list"][0]["max_rss"])\n')
+        script_result = subprocess.run(
+            [sys.executable, '-c', script, self.workspace_dir],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertLess(
+            int(script_result.stdout.splitlines()[-1]), buffer_size // 2)
+
+    def test_worker_log_batching(self):
+        """TaskGraph: test worker logs are batched and filtered by level."""
+        logger_name = 'test.task.batchlogger'
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(logging.DEBUG)
+        message_list = []
+        handler = logging.Handler()
+        handler.emit = lambda record: message_list.append(
+            record.getMessage())
+        logger.addHandler(handler)
+        try:
+            for worker_log_level in [logging.NOTSET, logging.WARNING]:
+                task_graph = taskgraph.TaskGraph(
+                    self.workspace_dir, 1, worker_log_level=worker_log_level)
+                task_graph.add_task(
+                    func=_log_many_from_another_process,
+                    args=(logger_name, 100), task_name='log',
+                    transient_run=True)
+                task_graph.close()
+                task_graph.join()
+                task_graph._logging_monitor_thread.join(5)
+        finally:
+            logger.removeHandler(handler)
+        # every message is sent in order, then only the warning
+        self.assertEqual(
+            message_list,
+            ['info %d' % index for index in range(100)] + ['done', 'done'])
+
+    def test_worker_log_batch_interval(self):
+        """TaskGraph: test batched worker logs are sent while func runs."""
+        task_module = importlib.import_module('taskgraph.Task')
+        logger_name = 'test.task.batchintervallogger'
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(logging.DEBUG)
+        message_event = threading.Event()
+        handler = logging.Handler()
+        handler.emit = lambda record: message_event.set()
+        logger.addHandler(handler)
+        signal_path = os.path.join(self.workspace_dir, 'signal.txt')
+        try:
+            task_graph = taskgraph.TaskGraph(self.workspace_dir, 1)
+            task = task_graph.add_task(
+                func=_log_and_wait_for_file,
+                args=(logger_name, signal_path, 30.0),
+                task_name='log and wait', transient_run=True)
+            # the INFO message arrives while ``func`` is still waiting
+            self.assertTrue(message_event.wait(
+                20 * task_module._LOG_BATCH_INTERVAL))
+            self.assertFalse(task.task_done_executing_event.is_set())
+            with open(signal_path, 'w'):
+                pass
+            task_graph.close()
+            task_graph.join()
+        finally:
+            logger.removeHandler(handler)
+
+    def test_load_test(self):
+        """TaskGraph: test synthetic graphs run cold then warm."""
+        self.assertEqual(
+            loadtest.build_dag('diamond', 7, width=2),
+            [[], [0], [0], [1, 2], [3], [3], [4, 5]])
+        self.assertEqual(loadtest.build_dag('chain', 3), [[], [0], [1]])
+        for dependency_list in [
+                loadtest.build_dag(shape, 20)
+                for shape in loadtest.DAG_SHAPE_LIST]:
+            self.assertEqual(len(dependency_list), 20)
+            for index, upstream_index_list in enumerate(dependency_list):
+                self.assertTrue(all(
+                    upstream_index < index
+                    for upstream_index in upstream_index_list))
+        with self.assertRaises(ValueError):
+            loadtest.build_dag('star', 10)
+
+        result = loadtest.run_load_test(
+            self.workspace_dir, shape='random', n_tasks=20, n_workers=1,
+            task_duration=0.01, file_size=1024)
+        self.assertEqual(result['cold']['executed_count'], 20)
+        self.assertEqual(result['warm']['precalculated_count'], 20)
+        self.assertGreaterEqual(
+            result['cold']['task_time'], result['cold']['critical_path_time'])
+        self.assertGreater(result['cold']['worker_utilization'], 0)
+        self.assertLessEqual(result['cold']['worker_utilization'], 1)
+
+    @unittest.skipIf(
+        sys.version_info < (3, 7), '-X importtime requires Python 3.7')
+    def test_import_time(self):
+        """TaskGraph: test heavy modules aren't imported with taskgraph."""
+        import_result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import taskgraph'],
+            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        imported_module_set = set(
+            line.split('|')[-1].strip()
+            for line in import_result.stderr.splitlines()
+            if line.startswith('import time:'))
+        self.assertIn('taskgraph.Task', imported_module_set)
+        for module_name in [
+                'pkg_resources', 'sqlite3', 'inspect', 'pprint',
+                'multiprocessing.pool', 'http.server', 'logging.handlers',
+                'cProfile', 'statistics', 'concurrent.futures',
+                'taskgraph._metrics_server']:
+            self.assertNotIn(module_name, imported_module_set)
+
+        # classes that need those modules import them when they're created
+        task_module = importlib.import_module('taskgraph.Task')
+        with task_module.NonDaemonicPool(1) as worker_pool:
+            self.assertEqual(worker_pool.apply(_sum_range, (10,)), 45)
+
+
+def Fail(n_tries, result_path):
+    """Create a function that fails after ``n_tries``."""
+    def fail_func():
+        fail_func._n_tries -= 1
+        if fail_func._n_tries > 0:
+            raise ValueError("Fail %d more times", fail_func._n_tries)
+        with open(result_path, 'w') as result_file:
+            result_file.write("finished!")
+    fail_func._n_tries = n_tries
+
+    return fail_func